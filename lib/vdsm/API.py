@@ -86,6 +86,7 @@ USER_SHUTDOWN_MESSAGE = 'System going down'
 
 
 throttledlog.throttle('getAllVmStats', 100)
+throttledlog.throttle('getChangedVmStats', 100)
 throttledlog.throttle('getStats', 100)
 
 
@@ -1408,6 +1409,22 @@ class Global(APIBase):
         return {'status': doneCode,
                 'statsList': logutils.Suppressed(statsList)}
 
+    @api.logged(on="api.host")
+    def getChangedVmStats(self, cursor=None):
+        """
+        Get statistics of running VMs changed since cursor.
+        """
+        hooks.before_get_all_vm_stats()
+        changes = self._cif.getChangedVmStats(cursor)
+        changes['statsList'] = hooks.after_get_all_vm_stats(
+            changes['statsList'])
+        throttledlog.info('getChangedVmStats',
+                          "Current getChangedVmStats: full=%s changed=%d "
+                          "removed=%d", changes['full'],
+                          len(changes['statsList']), len(changes['removed']))
+        return {'status': doneCode,
+                'changes': logutils.Suppressed(changes)}
+
     @api.logged(on="api.host")
     def getAllVmIoTunePolicies(self):
         """
@@ -1444,6 +1461,19 @@ class Global(APIBase):
         throttledlog.info('getStats', "Current getStats: %s", info)
         return {'status': doneCode, 'info': logutils.Suppressed(info)}
 
+    @api.logged(on="api.host")
+    def getStatsHistory(self, window=0, metrics=(), vmList=()):
+        """
+        Report the minimum, average, maximum and percentiles of host and VM
+        statistics over the last window seconds.
+        """
+        history = {
+            'host': sampling.host_history.aggregate(window, metrics),
+            'vms': sampling.vm_history.aggregate(vmList, window, metrics),
+        }
+        return {'status': doneCode,
+                'history': logutils.Suppressed(history)}
+
     @api.logged(on="api.host")
     def setLogLevel(self, level, name=''):
         """
@@ -1532,6 +1562,13 @@ class Global(APIBase):
         found = jobs.info(job_type=job_type, job_ids=job_ids)
         return response.success(jobs=found)
 
+    def getRpcStats(self):
+        """
+        Return statistics of the JSON-RPC server.
+        """
+        stats = self._cif.servers['jsonrpc'].server.stats.info()
+        return response.success(stats=stats)
+
     @api.logged(on="api.host")
     def getConvertedVm(self, jobid):
         return v2v.get_converted_vm(jobid)
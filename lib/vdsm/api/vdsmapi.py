@@ -26,8 +26,8 @@ import json
 import logging
 import os
 import six
+import threading
 
-from vdsm import utils
 from vdsm.common.compat import Enum, pickle
 from vdsm.common.logutils import Suppressed
 from yajsonrpc.exception import JsonRpcInvalidParamsError
@@ -45,15 +45,55 @@ PRIMITIVE_TYPES = {'boolean': lambda value: isinstance(value, bool),
                    'uint': lambda value: isinstance(value, int) and value >= 0}
 TYPE_KEYS = list(PRIMITIVE_TYPES.keys())
 
+# Primitive types checked only by isinstance().
+_PRIMITIVE_CLASSES = {'boolean': bool,
+                      'float': float,
+                      'int': int,
+                      'long': six.integer_types + (float,),
+                      'string': six.string_types}
+
 
 DEFAULT_VALUES = {'{}': {},
                   '()': (),
                   '[]': []}
 
+# Concurrency class of methods without a "concurrency" key.
+DEFAULT_CONCURRENCY = 'default'
+
 
 _log_inconsistency = logging.getLogger("schema.inconsistency").debug
 
 
+def _type_key(param):
+    # Primitive types are strings; other types are cached by identity.
+    if isinstance(param, six.string_types):
+        return param
+    return id(param)
+
+
+class _Names(frozenset):
+    """
+    Set of names supporting lookup of unhashable keys.
+    """
+
+    def unknown(self, keys):
+        """
+        Return a list of keys not in this set.
+        """
+        try:
+            return [key for key in keys if key not in self]
+        except TypeError:
+            # Not a dict; an unhashable key cannot be a name.
+            return [key for key in keys
+                    if not any(key == name for name in self)]
+
+
+def _error_validator(error):
+    def _raise_error(value, identifier):
+        raise error
+    return _raise_error
+
+
 class SchemaNotFound(Exception):
     pass
 
@@ -127,32 +167,33 @@ class Schema(object):
 
     log = logging.getLogger("SchemaCache")
 
-    def __init__(self, schema_types, strict_mode):
+    def __init__(self, schema_types, strict_mode, lazy=False):
         """
         Constructs schema object based on an iterable of schema type
         enumerations and a mode which determines request/response
         validation behavior. Usually it is based on api_strict_mode
         property from config.py
+
+        If lazy is True, schema files are loaded in order on the first lookup
+        of a method or type not found in the loaded files, so a method from
+        the first file does not load the rest.
         """
         self._strict_mode = strict_mode
         self._methods = {}
         self._types = {}
-        try:
-            for schema_type in schema_types:
-                with io.open(schema_type.path(), 'rb') as f:
-                    loaded_schema = pickle.loads(f.read())
-
-                types = loaded_schema.pop('types')
-                self._types.update(types)
-                self._methods.update(loaded_schema)
-        except EnvironmentError:
-            raise SchemaNotFound("Unable to find API schema file")
+        self._lock = threading.Lock()
+        self._validators = {}
+        self._args_validators = {}
+        self._load_lock = threading.Lock()
+        self._pending = [schema_type.path() for schema_type in schema_types]
+        if not lazy:
+            self._load_all()
 
     @staticmethod
     def vdsm_api(strict_mode, *args, **kwargs):
-        schema_types = {SchemaType.VDSM_API}
+        schema_types = [SchemaType.VDSM_API]
         if kwargs.pop('with_gluster', False):
-            schema_types.add(SchemaType.VDSM_API_GLUSTER)
+            schema_types.append(SchemaType.VDSM_API_GLUSTER)
         return Schema(schema_types, strict_mode, *args, **kwargs)
 
     @staticmethod
@@ -184,11 +225,25 @@ class Schema(object):
         try:
             return self._methods[rep.id]
         except KeyError:
-            raise MethodNotFound(rep.id)
+            pass
+        while self._load_next():
+            if rep.id in self._methods:
+                return self._methods[rep.id]
+        raise MethodNotFound(rep.id)
 
     @property
     def get_methods(self):
-        return utils.picklecopy(self._methods)
+        self._load_all()
+        return list(self._methods)
+
+    def get_concurrency(self, rep):
+        """
+        Return the concurrency class of a method. Methods of different
+        classes are served by separate executors, so slow calls of one class
+        cannot delay calls of another class.
+        """
+        method = self.get_method(rep)
+        return method.get('concurrency', DEFAULT_CONCURRENCY)
 
     def get_method_description(self, rep):
         method = self.get_method(rep)
@@ -198,17 +253,42 @@ class Schema(object):
         try:
             return self._types[type_name]
         except KeyError:
-            raise TypeNotFound(type_name)
+            pass
+        while self._load_next():
+            if type_name in self._types:
+                return self._types[type_name]
+        raise TypeNotFound(type_name)
 
     @property
     def get_types(self):
-        return utils.picklecopy(self._types)
+        self._load_all()
+        return list(self._types)
 
-    def _check_primitive_type(self, t, value, name):
-        condition = PRIMITIVE_TYPES.get(t)
-        if not condition(value):
-            self._report_inconsistency('Parameter %s is not %s type'
-                                       % (name, t))
+    def _load_all(self):
+        while self._load_next():
+            pass
+
+    def _load_next(self):
+        """
+        Load the next pending schema file. Returns False if all files were
+        loaded.
+        """
+        with self._load_lock:
+            if not self._pending:
+                return False
+            path = self._pending[0]
+            self.log.debug("Loading schema %s", path)
+            try:
+                with io.open(path, 'rb') as f:
+                    loaded_schema = pickle.loads(f.read())
+            except EnvironmentError:
+                raise SchemaNotFound("Unable to find API schema file")
+
+            types = loaded_schema.pop('types')
+            self._types.update(types)
+            self._methods.update(loaded_schema)
+            del self._pending[0]
+            return True
 
     def _report_inconsistency(self, message):
         if self._strict_mode:
@@ -218,191 +298,335 @@ class Schema(object):
 
     def verify_args(self, rep, args):
         try:
+            arg_names, params = self._get_args_validator(rep)
+
             # check whether there are extra parameters
-            unknown_args = [key for key in args if key not in
-                            self.get_arg_names(rep)]
+            unknown_args = arg_names.unknown(args)
             if unknown_args:
                 self._report_inconsistency('Following parameters %s were not'
                                            ' recognized' % (unknown_args))
 
             # verify types of provided parameters
+            for name, optional, validator in params:
+                arg = args.get(name)
+                if arg is None:
+                    # check if missing paramter was defined as optional
+                    if not optional:
+                        self._report_inconsistency(
+                            'Required parameter %s is not '
+                            'provided when calling %s' % (name, rep.id))
+                    continue
+                validator(arg, rep.id)
+        except JsonRpcInvalidParamsError:
+            raise
+        except Exception:
+            self._report_inconsistency('Unexpected issue with request type'
+                                       ' verification for %s' % rep.id)
+
+    def verify_retval(self, rep, ret):
+        try:
+            ret_args = self.get_ret_param(rep)
+
+            if ret_args:
+                if isinstance(ret, Suppressed):
+                    ret = ret.value
+                self._verify_type(ret_args.get('type'), ret, rep.id)
+        except JsonRpcInvalidParamsError:
+            raise
+        except Exception:
+            self._report_inconsistency('Unexpected issue with response type'
+                                       ' verification for %s' % rep.id)
+
+    def verify_event_params(self, sub_id, args):
+        rep = EventRep(sub_id)
+        try:
+            # due to issue with vm status changes key names (vm_ids)
+            # we are not able to find unknown params
             for param in self.get_args(rep):
                 name = param.get('name')
+                if name == 'no_name':
+                    for key, value in six.iteritems(args):
+                        if key == "notify_time":
+                            continue
+                        self._verify_type(param, {key: value}, rep.id)
+                    continue
                 arg = args.get(name)
                 if arg is None:
-                    # check if missing paramter was defined as optional
                     if 'defaultvalue' not in param:
                         self._report_inconsistency(
                             'Required parameter %s is not '
-                            'provided when calling %s' % (name, rep.id))
+                            'provided when sending %s' % (name, rep.id))
                     continue
                 self._verify_type(param, arg, rep.id)
         except JsonRpcInvalidParamsError:
             raise
         except Exception:
-            self._report_inconsistency('Unexpected issue with request type'
+            self._report_inconsistency('Unexpected issue with event type'
                                        ' verification for %s' % rep.id)
 
     def _verify_type(self, param, value, identifier):
+        self._get_validator(param)(value, identifier)
+
+    # Compiling validators
+    #
+    # Walking the schema for every call and return value is too slow for
+    # large values like Host.getAllVmStats result. Instead, each schema type
+    # is compiled once into a validator, a function accepting a value and an
+    # identifier used in error messages. Validators are compiled on the first
+    # use and cached by the identity of the schema type.
+    #
+    # SchemaInconsistencyFormatter looks up the validators frames by name, and
+    # reads the t, t_type and arg locals. Validators keep these names, and
+    # bind t and t_type as default arguments to make them frame locals.
+
+    def _get_args_validator(self, rep):
+        """
+        Return a tuple (arg_names, params), where params is a list of
+        (name, optional, validator) tuples for method rep.
+        """
+        validator = self._args_validators.get(rep.id)
+        if validator is None:
+            params = [(param.get('name'),
+                       'defaultvalue' in param,
+                       self._get_validator(param))
+                      for param in self.get_args(rep)]
+            validator = (_Names(self.get_arg_names(rep)), params)
+            self._args_validators[rep.id] = validator
+        return validator
+
+    def _get_validator(self, param):
+        validator = self._validators.get(_type_key(param))
+        if validator is None:
+            with self._lock:
+                compiled = {}
+                validator = self._compile_type(param, compiled)
+                self._validators.update(compiled)
+        return validator
+
+    def _compile(self, key, compile_func, compiled, *args):
+        """
+        Compile a validator using compile_func(*args, compiled), adding it to
+        compiled. compiled holds the validators compiled since _get_validator
+        was called; they are published when compilation is complete.
+        """
+        validator = self._validators.get(key) or compiled.get(key)
+        if validator is not None:
+            return validator
+
+        # A type may refer to itself. Until the type is compiled, refer to it
+        # using a validator calling the compiled validator.
+        cell = []
+        compiled[key] = lambda value, identifier: cell[0](value, identifier)
+        try:
+            validator = compile_func(*(args + (compiled,)))
+        except Exception as e:
+            # Report invalid schema only when it is used, like the schema
+            # walking code used to do.
+            validator = _error_validator(e)
+        cell.append(validator)
+        compiled[key] = validator
+        return validator
+
+    def _compile_type(self, param, compiled):
+        return self._compile(
+            _type_key(param), self._do_compile_type, compiled, param)
+
+    def _do_compile_type(self, param, compiled):
+        report = self._report_inconsistency
+
         # check whether a parameter is in a list
         if isinstance(param, list):
-            if not isinstance(value, list):
-                self._report_inconsistency('Parameter %s is not a list'
-                                           % (value))
-            for a in value:
-                self._verify_type(param[0], a, identifier)
-            return
+            item_validator = self._compile_type(param[0], compiled)
+
+            def _verify_list(value, identifier):
+                if not isinstance(value, list):
+                    report('Parameter %s is not a list' % (value))
+                for a in value:
+                    item_validator(a, identifier)
+
+            return _verify_list
+
         # check whether a parameter is defined as primitive type
         elif param in TYPE_KEYS:
-            self._check_primitive_type(param, value, param)
-            return
+            return self._compile_primitive_type(param, param)
 
         # get type and name
         name = param.get('name')
         t = param.get('type')
         if t == 'dict':
             # it seems that there is no other way to have it fixed
-            self._report_inconsistency(
-                'Unsupported type %s in %s please fix' % (t, identifier))
+            def _verify_dict(value, identifier):
+                report('Unsupported type %s in %s please fix'
+                       % (t, identifier))
+
+            return _verify_dict
 
         # check whether it is a primitive type
         elif t in TYPE_KEYS:
-            self._check_primitive_type(t, value, name)
+            return self._compile_primitive_type(t, name)
 
-        else:
-            # if type is a string call type verification method
-            if isinstance(t, six.string_types):
-                self._verify_complex_type(t, param, value, name, identifier)
+        # if type is a string compile a complex type
+        elif isinstance(t, six.string_types):
+            return self._compile_complex_type(param, name, compiled)
 
-            # if type is in a list we need to get the type and call
-            # type verification method
-            elif isinstance(t, list):
+        # if type is in a list we need to get the type and compile it
+        elif isinstance(t, list):
+            item_validator = self._compile_type(t[0], compiled)
+
+            def _verify_sequence(value, identifier):
                 if not isinstance(value, (list, tuple)):
-                    self._report_inconsistency('Parameter %s is not a sequence'
-                                               % (value))
+                    report('Parameter %s is not a sequence' % (value))
                 for a in value:
-                    self._verify_type(t[0], a, identifier)
-            else:
-                # call complex type verification
-                self._verify_complex_type(t.get('type'), t, value, name,
-                                          identifier)
+                    item_validator(a, identifier)
+
+            return _verify_sequence
+
+        else:
+            return self._compile_complex_type(t, name, compiled)
 
-    def _verify_complex_type(self, t_type, t, arg, name, identifier):
+    def _compile_primitive_type(self, t, name):
+        report = self._report_inconsistency
+        classes = _PRIMITIVE_CLASSES.get(t)
+
+        if classes is not None:
+            # Avoid calling the condition for the common types.
+            def _check_primitive_type(value, identifier, t=t):
+                if not isinstance(value, classes):
+                    report('Parameter %s is not %s type' % (name, t))
+
+            return _check_primitive_type
+
+        condition = PRIMITIVE_TYPES.get(t)
+
+        def _check_primitive_type(value, identifier, t=t):
+            if not condition(value):
+                report('Parameter %s is not %s type' % (name, t))
+
+        return _check_primitive_type
+
+    def _compile_complex_type(self, t, name, compiled):
         """
-        This method verify whether argument value align with different
-        types we support such as: alias, map, union, enum and object.
+        Compile a validator for types we support such as: alias, map, union,
+        enum and object.
         """
+        # The name is used only by alias, but is part of the key since the
+        # same type may be used for parameters with different names.
+        return self._compile(
+            ("complex", id(t), name), self._do_compile_complex_type,
+            compiled, t, name)
+
+    def _do_compile_complex_type(self, t, name, compiled):
+        report = self._report_inconsistency
+        t_type = t.get('type')
+
         if t_type == 'alias':
             # if alias we need to check sourcetype
-            self._check_primitive_type(t.get('sourcetype'), arg, name)
+            return self._compile_primitive_type(t.get('sourcetype'), name)
+
         elif t_type == 'map':
             # if map we need to check key and value types
-            for key, value in six.iteritems(arg):
-                self._verify_type(t.get('key-type'), key, identifier)
-                self._verify_type(t.get('value-type'), value, identifier)
+            key_validator = self._compile_type(t.get('key-type'), compiled)
+            value_validator = self._compile_type(t.get('value-type'),
+                                                 compiled)
+
+            def _verify_complex_type(arg, identifier, t_type=t_type):
+                for key, value in six.iteritems(arg):
+                    key_validator(key, identifier)
+                    value_validator(value, identifier)
+
+            return _verify_complex_type
+
         elif t_type == 'union':
             # if union we need to check whether parameter matches on of the
             # values defined
+            union_name = t.get('name')
+            members = []
             for value in t.get('values'):
-                props = value.get('properties')
-                prop_names = [prop.get('name') for prop in props]
-                if not [key for key in arg if key not in prop_names]:
-                    self._verify_complex_type(value.get('type'), value, arg,
-                                              name, identifier)
-                    return
-            self._report_inconsistency('Provided parameters %s do not match'
-                                       ' any of union %s values'
-                                       % (arg, t.get('name')))
+                try:
+                    props = value.get('properties')
+                    prop_names = _Names(prop.get('name') for prop in props)
+                except Exception as e:
+                    # Fail only if this value is checked.
+                    members.append((None, _error_validator(e)))
+                    continue
+                validator = self._compile_complex_type(value, name, compiled)
+                members.append((prop_names, validator))
+
+            def _verify_complex_type(arg, identifier, t_type=t_type):
+                for prop_names, validator in members:
+                    if prop_names is None or not prop_names.unknown(arg):
+                        validator(arg, identifier)
+                        return
+                report('Provided parameters %s do not match any of union %s'
+                       ' values' % (arg, union_name))
+
+            return _verify_complex_type
+
         elif t_type == 'enum':
             # if enum we need to check whether provided parameter is in values
-            if arg not in t.get('values'):
-                self._report_inconsistency('Provided value "%s" not'
-                                           ' defined in %s enum for'
-                                           ' %s' % (arg,
-                                                    t.get('name'),
-                                                    identifier))
+            enum_name = t.get('name')
+            values = t.get('values')
+
+            def _verify_complex_type(arg, identifier, t_type=t_type):
+                if arg not in values:
+                    report('Provided value "%s" not defined in %s enum for'
+                           ' %s' % (arg, enum_name, identifier))
+
+            return _verify_complex_type
+
         else:
             # if custom time (object) we need to check whether all the
             # properties match values provided
-            self._verify_object_type(t, arg, identifier)
+            return self._compile_object_type(t, compiled)
 
-    def _verify_object_type(self, t, arg, identifier):
+    def _compile_object_type(self, t, compiled):
+        report = self._report_inconsistency
         props = t.get('properties')
-        prop_names = [prop.get('name') for prop in props]
-        # check if there are any extra prarameters
-        unknown_props = [key for key in arg
-                         if key not in prop_names]
-        if unknown_props:
-            if 'any_string' in prop_names:
-                return
-            self._report_inconsistency('Following parameters %s were not'
-                                       ' recognized' % (unknown_props))
-        # iterate over properties
+        prop_names = _Names(prop.get('name') for prop in props)
+        any_string = 'any_string' in prop_names
+
+        checks = []
         for prop in props:
             p_name = prop.get('name')
-            a = arg.get(p_name)
-
+            validator = self._compile_type(prop, compiled)
             # check whether parameter is defined as optional and
             # check default type
             if 'defaultvalue' in prop:
                 value = prop.get('defaultvalue')
-                if value == 'needs updating':
-                    self._report_inconsistency(
-                        'No default value specified for %s parameter in'
-                        ' %s' % (p_name, identifier))
-                if value == 'no-default':
-                    continue
-                if a is None or a == value:
-                    continue
+                checks.append((p_name, validator, True, value,
+                               value == 'needs updating',
+                               value == 'no-default'))
             else:
-                if a is None:
-                    self._report_inconsistency(
-                        'Required property %s is not provided when calling'
-                        ' %s' % (p_name, identifier))
-                    continue
-            # call type verification
-            self._verify_type(prop, a, identifier)
+                checks.append((p_name, validator, False, None, False, False))
 
-    def verify_retval(self, rep, ret):
-        try:
-            ret_args = self.get_ret_param(rep)
-
-            if ret_args:
-                if isinstance(ret, Suppressed):
-                    ret = ret.value
-                self._verify_type(ret_args.get('type'), ret, rep.id)
-        except JsonRpcInvalidParamsError:
-            raise
-        except Exception:
-            self._report_inconsistency('Unexpected issue with response type'
-                                       ' verification for %s' % rep.id)
-
-    def verify_event_params(self, sub_id, args):
-        rep = EventRep(sub_id)
-        try:
-            # due to issue with vm status changes key names (vm_ids)
-            # we are not able to find unknown params
-            for param in self.get_args(rep):
-                name = param.get('name')
-                if name == 'no_name':
-                    for key, value in six.iteritems(args):
-                        if key == "notify_time":
-                            continue
-                        self._verify_type(param, {key: value}, rep.id)
-                    continue
-                arg = args.get(name)
-                if arg is None:
-                    if 'defaultvalue' not in param:
-                        self._report_inconsistency(
-                            'Required parameter %s is not '
-                            'provided when sending %s' % (name, rep.id))
+        def _verify_object_type(arg, identifier, t=t):
+            # check if there are any extra prarameters
+            unknown_props = prop_names.unknown(arg)
+            if unknown_props:
+                if any_string:
+                    return
+                report('Following parameters %s were not recognized'
+                       % (unknown_props))
+            # iterate over properties
+            for (p_name, validator, optional, value, needs_updating,
+                    no_default) in checks:
+                a = arg.get(p_name)
+                if optional:
+                    if needs_updating:
+                        report('No default value specified for %s parameter'
+                               ' in %s' % (p_name, identifier))
+                    if no_default:
+                        continue
+                    if a is None or a == value:
+                        continue
+                elif a is None:
+                    report('Required property %s is not provided when'
+                           ' calling %s' % (p_name, identifier))
                     continue
-                self._verify_type(param, arg, rep.id)
-        except JsonRpcInvalidParamsError:
-            raise
-        except Exception:
-            self._report_inconsistency('Unexpected issue with event type'
-                                       ' verification for %s' % rep.id)
+                # call type verification
+                validator(a, identifier)
+
+        return _verify_object_type
 
     def _get_arg_dict(self, arg_type, name, params_dict):
         '''
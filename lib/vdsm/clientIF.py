@@ -49,6 +49,7 @@ from vdsm.virt import events
 from vdsm.virt import migration
 from vdsm.virt import recovery
 from vdsm.virt import secret
+from vdsm.virt import statsdelta
 from vdsm.virt import vmstatus
 from vdsm.virt.vmchannels import Listener
 from vdsm.virt.vmdevices.storage import DISK_TYPE
@@ -114,6 +115,7 @@ class clientIF(object):
         self._subscriptions = defaultdict(list)
         self._scheduler = scheduler
         self._unknown_vm_ids = set()
+        self._vm_stats_tracker = statsdelta.Tracker()
         if _glusterEnabled:
             self.gluster = gapi.GlusterApi()
         else:
@@ -566,11 +568,15 @@ class clientIF(object):
         return {'status': doneCode, 'alignment': aligning}
 
     def createVm(self, vmParams, vmRecover=False):
+        if vmRecover:
+            # Building the Vm object parses the domain XML and metadata, and
+            # does not need the lock. Recovery creates many VMs concurrently.
+            vm = Vm(self, vmParams, vmRecover)
         with self.vm_start_stop_lock:
             if not vmRecover:
                 if vmParams['vmId'] in self.vmContainer:
                     return errCode['exist']
-            vm = Vm(self, vmParams, vmRecover)
+                vm = Vm(self, vmParams, vmRecover)
             ret = vm.run()
             if not response.is_error(ret):
                 with self.vm_container_lock:
@@ -580,6 +586,13 @@ class clientIF(object):
     def getAllVmStats(self):
         return [v.getStats() for v in self.getVMs().values()]
 
+    def getChangedVmStats(self, cursor=None):
+        """
+        Return the stats of VMs changed since cursor, see
+        vdsm.virt.statsdelta.
+        """
+        return self._vm_stats_tracker.update(self.getAllVmStats(), cursor)
+
     def getAllVmIoTunePolicies(self):
         vm_io_tune_policies = {}
         for v in self.getVMs().values():
@@ -603,7 +616,8 @@ class clientIF(object):
         function.retry(self._recoverExistingVms, sleep=5)
 
     def _recoverExistingVms(self):
-        start_time = vdsm.common.time.monotonic_time()
+        clock = vdsm.common.time.Clock()
+        clock.start("total")
         try:
             self.log.debug('recovery: started')
 
@@ -614,10 +628,11 @@ class clientIF(object):
                       numa.cpu_topology().cores)
             migration.SourceThread.ongoingMigrations.bound = mog
 
-            recovery.all_domains(self)
+            recovery.all_domains(self, clock)
 
             # recover stage 3: waiting for domains to go up
-            self._waitForDomainsUp()
+            with clock.run("domains_up"):
+                self._waitForDomainsUp()
 
             self._recovery = False
 
@@ -625,12 +640,14 @@ class clientIF(object):
             # and then prepare all volumes.
             # Actually, we need it just to get the resources for future
             # volumes manipulations
-            self._waitForStoragePool()
+            with clock.run("storage_pool"):
+                self._waitForStoragePool()
 
-            self._preparePathsForRecoveredVMs()
+            with clock.run("prepare_paths"):
+                self._preparePathsForRecoveredVMs()
 
-            self.log.info('recovery: completed in %is',
-                          vdsm.common.time.monotonic_time() - start_time)
+            clock.stop("total")
+            self.log.info('recovery: completed %s', clock)
 
         except:
             self.log.exception("recovery: failed")
@@ -729,7 +746,9 @@ class clientIF(object):
     def _preparePathsForRecoveredVMs(self):
         vm_objects = list(self.getVMs().values())
         num_vm_objects = len(vm_objects)
-        for idx, vm_obj in enumerate(vm_objects):
+
+        def prepare(item):
+            idx, vm_obj = item
             # Let's recover as much VMs as possible
             try:
                 # Do not prepare volumes when system goes down
@@ -743,6 +762,13 @@ class clientIF(object):
                     "recovery [%d/%d]: failed for vm %s",
                     idx + 1, num_vm_objects, vm_obj.id)
 
+        # Preparing a drive waits for storage, so preparing the drives of
+        # many VMs concurrently is much faster.
+        for _ in concurrent.tmap(prepare, enumerate(vm_objects),
+                                 max_workers=recovery.max_workers(),
+                                 name="recovery/prepare"):
+            pass
+
     def _prepare_network_drive(self, drive, res):
         """
         Fills drive object for network drives with network-specific data.
@@ -20,7 +20,6 @@
 from __future__ import absolute_import
 from __future__ import division
 
-import distutils.spawn
 import errno
 import io
 import logging
@@ -64,6 +63,8 @@ class CommandPath(object):
                     break
             else:
                 if self._search_path:
+                    # Importing distutils is slow, and rarely needed.
+                    import distutils.spawn
                     self._cmd = distutils.spawn.find_executable(self.name)
                 if self._cmd is None:
                     raise OSError(errno.ENOENT,
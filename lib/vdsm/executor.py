@@ -110,6 +110,8 @@ class Executor(object):
         self._workers = set()
         self._lock = threading.Lock()
         self._running = False
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
 
     def __repr__(self):
         return "<Executor %s workers=%d max_workers=%s %s at 0x%x>" % (
@@ -144,6 +146,24 @@ class Executor(object):
         for worker in workers:
             worker.join()
 
+    def collect_stats(self):
+        """
+        Return a dict with the number of queued tasks, and the number of
+        tasks started and their average and maximum queue time in seconds,
+        since the last call.
+        """
+        with self._stats_lock:
+            started = self._started
+            total = self._queue_time_total
+            maximum = self._queue_time_max
+            self._reset_stats()
+        return {
+            "queued": len(self._tasks),
+            "started": started,
+            "queue_time_avg": total / started if started else 0.0,
+            "queue_time_max": maximum,
+        }
+
     def dispatch(self, callable, timeout=None, discard=True):
         """
         Dispatches a new task to the executor.
@@ -245,8 +265,24 @@ class Executor(object):
             raise NotRunning()
         return task
 
+    def _task_started(self, task):
+        """
+        Called from the worker thread before running a task.
+        """
+        queue_time = task.queue_time
+        with self._stats_lock:
+            self._started += 1
+            self._queue_time_total += queue_time
+            if queue_time > self._queue_time_max:
+                self._queue_time_max = queue_time
+
     # Private
 
+    def _reset_stats(self):
+        self._started = 0
+        self._queue_time_total = 0.0
+        self._queue_time_max = 0.0
+
     def _add_worker(self):
         name = "%s/%d" % (self.name, self._worker_id)
         self._worker_id += 1
@@ -311,6 +347,7 @@ class _Worker(object):
         with self._lock:
             self._scheduled_check = self._check_after(task.timeout)
         self._task = task
+        self._executor._task_started(task)
         try:
             task()
         except Exception:
@@ -378,8 +415,18 @@ class Task(object):
         self._callable = callable
         self.timeout = timeout
         self.discard = discard
+        self._queued = time.monotonic_time()
         self._start = None
 
+    @property
+    def queue_time(self):
+        """
+        Time in seconds the task waited in the queue, or is still waiting if
+        it was not started yet.
+        """
+        end = time.monotonic_time() if self._start is None else self._start
+        return end - self._queued
+
     @property
     def duration(self):
         if self._start is None:
@@ -437,6 +484,9 @@ class TaskQueue(object):
             id(self)
         )
 
+    def __len__(self):
+        return len(self._tasks)
+
     def put(self, task):
         """
         Put a new task in the queue.
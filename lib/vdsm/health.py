@@ -28,6 +28,7 @@ import threading
 
 from vdsm.common import concurrent
 from vdsm.common import cpuarch
+from vdsm.storage import chaincache
 from vdsm.storage import lvm
 
 from . config import config
@@ -94,6 +95,7 @@ class Monitor(object):
         self._check_garbage()
         self._check_resources()
         self._check_lvm_stats()
+        self._check_chain_cache_stats()
         self._report_stats()
 
     def _check_garbage(self):
@@ -130,6 +132,13 @@ class Monitor(object):
         self.log.info("LVM cache hit ratio: %.2f%% (hits: %d misses: %d)",
                       stats["hit_ratio"], stats["hits"], stats["misses"])
 
+    def _check_chain_cache_stats(self):
+        stats = chaincache.cache_stats()
+        self.log.info("Volume chain cache hit ratio: %.2f%% (hits: %d "
+                      "misses: %d invalidations: %d chains: %d)",
+                      stats["hit_ratio"], stats["hits"], stats["misses"],
+                      stats["invalidations"], stats["chains"])
+
     def _report_stats(self):
         prefix = "hosts.vdsm"
         report = {}
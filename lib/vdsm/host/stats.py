@@ -39,6 +39,17 @@ NETSTATS_BOUND = 2 ** 32
 SMALLEST_INTERVAL = 1e-5
 
 
+# Metrics recorded in the stats history.
+HISTORY_METRICS = (
+    'cpuUser',
+    'cpuSys',
+    'cpuIdle',
+    'cpuLoad',
+    'memUsed',
+    'cpuUserVdsmd',
+    'cpuSysVdsmd',
+)
+
 _clock = time.monotonic_time
 _start_time = 0
 
@@ -70,6 +81,45 @@ def produce(first_sample, last_sample):
         return stats
 
     stats.update(get_interfaces_stats())
+    stats.update(_cpu_stats(first_sample, last_sample, interval))
+    stats['memUsed'] = last_sample.memUsed
+    stats['hugepages'] = last_sample.hugepages
+    stats['anonHugePages'] = last_sample.anonHugePages
+    stats['cpuLoad'] = last_sample.cpuLoad
+
+    stats['diskStats'] = last_sample.diskStats
+    stats['thpState'] = last_sample.thpState
+
+    if _boot_time():
+        stats['bootTime'] = _boot_time()
+
+    stats['numaNodeMemFree'] = last_sample.numaNodeMem.nodesMemSample
+    stats['cpuStatistics'] = _get_cpu_core_stats(
+        first_sample, last_sample)
+
+    stats['v2vJobs'] = v2v.get_jobs_status()
+    return stats
+
+
+def history_values(first_sample, last_sample):
+    """
+    Return the values of HISTORY_METRICS, as numbers.
+    """
+    interval = last_sample.timestamp - first_sample.timestamp
+    if interval < SMALLEST_INTERVAL:
+        return {}
+
+    values = _cpu_stats(first_sample, last_sample, interval)
+    values['memUsed'] = last_sample.memUsed
+    try:
+        values['cpuLoad'] = float(last_sample.cpuLoad)
+    except ValueError:
+        pass
+    return values
+
+
+def _cpu_stats(first_sample, last_sample, interval):
+    stats = {}
 
     jiffies = (
         last_sample.pidcpu.user - first_sample.pidcpu.user
@@ -90,22 +140,7 @@ def produce(first_sample, last_sample):
     stats['cpuSys'] = jiffies / interval / last_sample.ncpus
     stats['cpuIdle'] = max(0.0,
                            100.0 - stats['cpuUser'] - stats['cpuSys'])
-    stats['memUsed'] = last_sample.memUsed
-    stats['hugepages'] = last_sample.hugepages
-    stats['anonHugePages'] = last_sample.anonHugePages
-    stats['cpuLoad'] = last_sample.cpuLoad
 
-    stats['diskStats'] = last_sample.diskStats
-    stats['thpState'] = last_sample.thpState
-
-    if _boot_time():
-        stats['bootTime'] = _boot_time()
-
-    stats['numaNodeMemFree'] = last_sample.numaNodeMem.nodesMemSample
-    stats['cpuStatistics'] = _get_cpu_core_stats(
-        first_sample, last_sample)
-
-    stats['v2vJobs'] = v2v.get_jobs_status()
     return stats
 
 
@@ -62,10 +62,13 @@ class InvalidCall(Exception):
 class DynamicBridge(object):
     def __init__(self):
         api_strict_mode = config.getboolean('devel', 'api_strict_mode')
+        lazy = config.getboolean('rpc', 'lazy_api_schema')
         self._schema = vdsmapi.Schema.vdsm_api(api_strict_mode,
-                                               with_gluster=_glusterEnabled)
+                                               with_gluster=_glusterEnabled,
+                                               lazy=lazy)
 
-        self._event_schema = vdsmapi.Schema.vdsm_events(api_strict_mode)
+        self._event_schema = vdsmapi.Schema.vdsm_events(api_strict_mode,
+                                                        lazy=lazy)
 
         self._threadLocal = threading.local()
         self.log = logging.getLogger('DynamicBridge')
@@ -110,6 +113,18 @@ class DynamicBridge(object):
             raise exception.JsonRpcMethodNotFoundError(method=method)
         return partial(self._dynamicMethod, className, methodName)
 
+    def concurrency(self, method):
+        """
+        Return the concurrency class of method. Unknown methods use the
+        default class; calling them fails anyway.
+        """
+        try:
+            className, methodName = method.split('.', 1)
+            return self._schema.get_concurrency(
+                vdsmapi.MethodRep(className, methodName))
+        except (vdsmapi.MethodNotFound, ValueError):
+            return vdsmapi.DEFAULT_CONCURRENCY
+
     def _convert_class_name(self, name):
         """
         The schema has a different name for the 'Global' namespace.  Until
@@ -343,6 +358,7 @@ command_info = {
     'Host_getHardwareInfo': {'ret': 'info'},
     'Host_getLVMVolumeGroups': {'ret': 'vglist'},
     'Host_getStats': {'ret': 'info'},
+    'Host_getStatsHistory': {'ret': 'history'},
     'Host_getStorageDomains': {'ret': 'domlist'},
     'Host_getStorageRepoStats': {'ret': Host_getStorageRepoStats_Ret},
     'Host_hostdevListByCaps': {'ret': 'deviceList'},
@@ -350,6 +366,7 @@ command_info = {
     'Host_getVMList': {'call': Host_getVMList_Call, 'ret': 'vmList'},
     'Host_getVMFullList': {'call': Host_getVMFullList_Call, 'ret': 'vmList'},
     'Host_getAllVmStats': {'ret': 'statsList'},
+    'Host_getChangedVmStats': {'ret': 'changes'},
     'Host_getAllVmIoTunePolicies': {'ret': 'io_tune_policies_dict'},
     'Host_setupNetworks': {'ret': 'status'},
     'Host_setKsmTune': {'ret': 'status'},
@@ -433,6 +450,7 @@ command_info = {
     'Volume_measure': {'ret': 'result'},
     'Host_getAllTasks': {'ret': 'tasks'},
     'Host_getJobs': {'ret': 'jobs'},
+    'Host_getRpcStats': {'ret': 'stats'},
     'Lease_create': {'ret': 'uuid'},
     'Lease_delete': {'ret': 'uuid'},
     'Lease_rebuild_leases': {'ret': 'uuid'},
@@ -16,13 +16,14 @@
 
 from __future__ import absolute_import
 from __future__ import division
-import functools
 import logging
 
 from yajsonrpc import JsonRpcServer
 from yajsonrpc.stompserver import StompReactor
 
 from vdsm import executor
+from vdsm import metrics
+from vdsm.api import vdsmapi
 from vdsm.common import concurrent
 from vdsm.config import config
 
@@ -31,22 +32,36 @@ from vdsm.config import config
 _TIMEOUT = config.getint('rpc', 'worker_timeout')
 _THREADS = config.getint('rpc', 'worker_threads')
 _TASK_PER_WORKER = config.getint('rpc', 'tasks_per_worker')
-_TASKS = _THREADS * _TASK_PER_WORKER
+
+# Workers of each concurrency class declared in the schema. Methods of the
+# default class use the "jsonrpc" executor.
+_CONCURRENCY_THREADS = {
+    vdsmapi.DEFAULT_CONCURRENCY: _THREADS,
+    'fast': config.getint('rpc', 'fast_worker_threads'),
+    'storage': config.getint('rpc', 'storage_worker_threads'),
+}
 
 
 class BindingJsonRpc(object):
     log = logging.getLogger('BindingJsonRpc')
 
     def __init__(self, bridge, subs, timeout, scheduler, cif):
-        self._executor = executor.Executor(name="jsonrpc",
-                                           workers_count=_THREADS,
-                                           max_tasks=_TASKS,
-                                           scheduler=scheduler)
+        self._executors = {}
+        for name, threads in _CONCURRENCY_THREADS.items():
+            if name == vdsmapi.DEFAULT_CONCURRENCY:
+                executor_name = "jsonrpc"
+            else:
+                executor_name = "jsonrpc/" + name
+            self._executors[name] = executor.Executor(
+                name=executor_name,
+                workers_count=threads,
+                max_tasks=threads * _TASK_PER_WORKER,
+                scheduler=scheduler)
         self._bridge = bridge
-        self._server = JsonRpcServer(
-            bridge, timeout, cif,
-            functools.partial(self._executor.dispatch,
-                              timeout=_TIMEOUT, discard=False))
+        self._scheduler = scheduler
+        self._stats_timeout = timeout
+        self._stats_call = None
+        self._server = JsonRpcServer(bridge, timeout, cif, self._dispatch)
         self._reactor = StompReactor(subs)
         self.startReactor()
 
@@ -64,8 +79,14 @@ class BindingJsonRpc(object):
     def bridge(self):
         return self._bridge
 
+    @property
+    def server(self):
+        return self._server
+
     def start(self):
-        self._executor.start()
+        for e in self._executors.values():
+            e.start()
+        self._schedule_stats()
 
         t = concurrent.thread(self._server.serve_requests,
                               name='JsonRpcServer')
@@ -78,6 +99,60 @@ class BindingJsonRpc(object):
         t.start()
 
     def stop(self):
+        if self._stats_call:
+            self._stats_call.cancel()
         self._server.stop()
         self._reactor.stop()
-        self._executor.stop()
+        for e in self._executors.values():
+            e.stop()
+
+    def _dispatch(self, task):
+        concurrency = self._concurrency(task.method)
+        try:
+            e = self._executors[concurrency]
+        except KeyError:
+            e = self._executors[vdsmapi.DEFAULT_CONCURRENCY]
+        e.dispatch(task, timeout=_TIMEOUT, discard=False)
+
+    def _concurrency(self, method):
+        # Bridges without concurrency classes run all methods in the default
+        # executor.
+        get_concurrency = getattr(self._bridge, "concurrency", None)
+        if get_concurrency is None:
+            return vdsmapi.DEFAULT_CONCURRENCY
+        return get_concurrency(method)
+
+    def _schedule_stats(self):
+        self._stats_call = self._scheduler.schedule(
+            self._stats_timeout, self._report_stats)
+
+    def _report_stats(self):
+        try:
+            self._send_stats()
+        finally:
+            self._schedule_stats()
+
+    def _send_stats(self):
+        prefix = "hosts.vdsm.jsonrpc"
+        report = {}
+        for name, e in sorted(self._executors.items()):
+            stats = e.collect_stats()
+            self.log.debug("Executor %s: queued=%d started=%d "
+                           "queue_time_avg=%.3f queue_time_max=%.3f",
+                           e.name, stats["queued"], stats["started"],
+                           stats["queue_time_avg"], stats["queue_time_max"])
+            for key, value in stats.items():
+                report["%s.%s.%s" % (prefix, name, key)] = value
+
+        rpc_stats = self._server.stats.collect()
+        report["%s.in_flight" % prefix] = rpc_stats["in_flight"]
+        for method, stats in rpc_stats["methods"].items():
+            method_prefix = "%s.method.%s" % (prefix, method)
+            for key, value in stats.items():
+                if isinstance(value, dict):
+                    for hkey, hvalue in value.items():
+                        report["%s.%s.%s" % (method_prefix, key, hkey)] = \
+                            hvalue
+                else:
+                    report["%s.%s" % (method_prefix, key)] = value
+        metrics.send(report)
@@ -71,9 +71,11 @@ class SSLSocket(object):
             raise ValueError("nbytes is greater than the length of the buffer")
         else:
             readlen = nbytes
-        data = self.recv(readlen, flags)
-        datalen = len(data)
-        memview[:datalen] = data
+        if not self._data:
+            return self.sock.recv_into(memview, readlen)
+        datalen = min(len(self._data), readlen)
+        memview[:datalen] = self._data[:datalen]
+        self._data = self._data[datalen:]
         return datalen
 
     def pending(self):
@@ -22,6 +22,7 @@ from __future__ import absolute_import
 
 import errno
 import functools
+import io
 import logging
 import mmap
 import os
@@ -40,6 +41,7 @@ import six
 from vdsm.common import concurrent
 from vdsm.common import exception
 from vdsm.common import proc
+from vdsm.common.osutils import uninterruptible
 from vdsm.common.threadlocal import vars
 from vdsm.common.units import KiB, MiB
 from vdsm.config import config
@@ -156,6 +158,9 @@ METADATA_BASE_V5 = MiB
 # Size of metadata slot in v5
 METADATA_SLOT_SIZE_V5 = 8 * KiB
 
+# Maximum size of a single read when reading volumes metadata in bulk.
+METADATA_READ_SIZE = 8 * MiB
+
 
 def encodePVInfo(pvInfo):
     return (
@@ -253,6 +258,156 @@ def _occupied_metadata_slots(sdUUID):
     return occupiedSlots
 
 
+def _read_metadata_blocks(path, offsets, read_size=METADATA_READ_SIZE):
+    """
+    Read volume metadata blocks at sorted offsets from the metadata volume.
+
+    The blocks are read using direct I/O in the current process, using one
+    read for all the blocks fitting in read_size bytes, and skipping areas
+    without any block. The data is read into a page aligned buffer allocated
+    once, and only the used part of every block is copied from the buffer.
+
+    Yields (offset, data) tuples, where data is the content of the block up
+    to the first NUL byte.
+    """
+    if not offsets:
+        return
+
+    span = offsets[-1] + sc.METADATA_SIZE - offsets[0]
+    buf = mmap.mmap(-1, min(read_size, span), mmap.MAP_SHARED)
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+        with io.FileIO(fd, "r", closefd=True) as f:
+            i = 0
+            while i < len(offsets):
+                start = offsets[i]
+
+                # Include all the blocks fitting in this read.
+                end = i + 1
+                while (end < len(offsets) and
+                       offsets[end] + sc.METADATA_SIZE - start <= len(buf)):
+                    end += 1
+                size = offsets[end - 1] + sc.METADATA_SIZE - start
+
+                f.seek(start)
+                pos = 0
+                with memoryview(buf) as view:
+                    while pos < size:
+                        n = uninterruptible(f.readinto, view[pos:size])
+                        if n == 0:
+                            raise se.MiscBlockReadIncomplete(
+                                path, start, size)
+                        pos += n
+
+                for offset in offsets[i:end]:
+                    block_start = offset - start
+                    block_end = block_start + sc.METADATA_SIZE
+                    nul = buf.find(b"\0", block_start, block_end)
+                    if nul != -1:
+                        block_end = nul
+                    yield offset, buf[block_start:block_end]
+
+                i = end
+    finally:
+        buf.close()
+
+
+class MetadataSlots(object):
+    """
+    Bitmap of occupied volume metadata slots in a block storage domain.
+
+    Finding the occupied slots requires parsing the metadata tag of all the
+    LVs in the VG. To avoid this when creating a volume, we seed the bitmap
+    from the LV tags and update it when allocating and releasing slots.
+
+    The bitmap is valid as long as the VG was not modified by another host.
+    We detect this by comparing the change in the VG seqno with the number of
+    changes made by this host (see lvm.local_changes()). A slot of a volume
+    removed on this host without releasing it is considered occupied until
+    the bitmap is seeded again.
+
+    The caller is responsible for locking.
+    """
+
+    def __init__(self, sd_uuid):
+        self._sd_uuid = sd_uuid
+        self._occupied = 0
+        # VG seqno and local changes when the bitmap was last validated.
+        self._seqno = None
+        self._changes = None
+
+    def allocate(self, first_slot):
+        """
+        Return the first free slot starting at first_slot.
+        """
+        if not self._validate():
+            self._seed()
+
+        # Treat slots before first_slot as occupied and find the lowest
+        # clear bit.
+        occupied = self._occupied | ((1 << first_slot) - 1)
+        free = ~occupied & (occupied + 1)
+        slot = free.bit_length() - 1
+
+        log.debug("Found free slot %s in VG %s", slot, self._sd_uuid)
+        return slot
+
+    def occupy(self, slot):
+        """
+        Mark slot as occupied after tagging the new volume LV.
+        """
+        self._occupied |= 1 << slot
+
+    def release(self, slot):
+        """
+        Mark slot as free after removing the volume LV.
+        """
+        self._occupied &= ~(1 << slot)
+
+    def invalidate(self):
+        self._seqno = None
+
+    def _validate(self):
+        # Read the seqno before the local changes, so a local change
+        # modifying the VG after reading the seqno is counted in the next
+        # validation.
+        seqno = self._vg_seqno()
+        changes = lvm.local_changes(self._sd_uuid)
+
+        valid = (
+            seqno is not None and
+            self._seqno is not None and
+            changes.failed == self._changes.failed and
+            seqno - self._seqno == changes.modified - self._changes.modified
+        )
+
+        if not valid:
+            log.debug("VG %s was modified (seqno %s -> %s, local changes "
+                      "%s -> %s), reloading metadata slots",
+                      self._sd_uuid, self._seqno, seqno, self._changes,
+                      changes)
+
+        self._seqno = seqno
+        self._changes = changes
+        return valid
+
+    def _seed(self):
+        occupied = 0
+        for slot in _occupied_metadata_slots(self._sd_uuid):
+            occupied |= 1 << slot
+        self._occupied = occupied
+
+    def _vg_seqno(self):
+        # The VG is reloaded only if it was invalidated, for example after
+        # creating the new volume LV. This is much cheaper than reloading the
+        # LVs on a big domain.
+        try:
+            return int(lvm.getVG(self._sd_uuid).seqno)
+        except (se.VolumeGroupDoesNotExist, AttributeError, TypeError,
+                ValueError):
+            return None
+
+
 def parse_lv_tags(lv):
     image = None
     parent = None
@@ -309,7 +464,8 @@ def deleteVolumes(sdUUID, vols):
     lvm.removeLVs(sdUUID, vols)
 
 
-def zeroImgVolumes(sdUUID, imgUUID, volUUIDs, discard):
+def zeroImgVolumes(manifest, imgUUID, volUUIDs, discard):
+    sdUUID = manifest.sdUUID
     taskid = vars.task.id
     task = vars.task
 
@@ -337,7 +493,7 @@ def zeroImgVolumes(sdUUID, imgUUID, volUUIDs, discard):
 
         try:
             log.debug('Removing volume %s task %s', volUUID, taskid)
-            deleteVolumes(sdUUID, (volUUID,))
+            manifest.removeVolumeLVs((volUUID,))
         except se.CannotRemoveLogicalVolume as e:
             log.exception("Removing volume %s task %s failed: %s",
                           volUUID, taskid, e)
@@ -430,6 +586,9 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
         # BlockStorageDomain. The lock should not be used elsewhere.
         self.metadata_lock = threading.Lock()
 
+        # Protected by _lvTagMetaSlotLock.
+        self._metadata_slots = MetadataSlots(sdUUID)
+
     @classmethod
     def special_volumes(cls, version):
         if cls.supports_external_leases(version):
@@ -725,7 +884,7 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
                     lvm.deactivateLVs(sdUUID, (volUUID,))
 
             self.log.debug('Removing volume %s task %s', volUUID, taskid)
-            deleteVolumes(sdUUID, (volUUID,))
+            self.removeVolumeLVs((volUUID,))
 
             self.log.debug('Purge volume thread finished for '
                            'volume %s task %s', volUUID, taskid)
@@ -804,26 +963,48 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
 
     @contextmanager
     def acquireVolumeMetadataSlot(self, vol_name):
+        """
+        Allocate a free metadata slot for volume vol_name. The caller must
+        tag the volume LV with the slot before exiting the context.
+        """
         # TODO: Check if the lock is needed when using
         # getVolumeMetadataOffsetFromPvMapping()
         with self._lvTagMetaSlotLock:
-            yield self._getFreeMetadataSlot()
-
-    def _getFreeMetadataSlot(self):
-        occupied_slots = _occupied_metadata_slots(self.sdUUID)
-        free_slot = self._first_available_slot()
-
-        # We have these cases:
-        # slot > free_slot: free_slot is free, use it.
-        # slot == free_slot: free_slot is occupied, try next slot (slot + 1).
-        # slot < free_slot: impossible.
-        for slot in occupied_slots:
-            if slot > free_slot:
-                break
-            free_slot = slot + 1
+            slot = self._metadata_slots.allocate(
+                self._first_available_slot())
+            try:
+                yield slot
+            except:
+                # The slot may be used or not.
+                self._metadata_slots.invalidate()
+                raise
+            self._metadata_slots.occupy(slot)
 
-        self.log.debug("Found free slot %s in VG %s", free_slot, self.sdUUID)
-        return free_slot
+    def releaseVolumeMetadataSlot(self, slot):
+        """
+        Release the metadata slot of a volume after removing the volume LV.
+        """
+        with self._lvTagMetaSlotLock:
+            self._metadata_slots.release(slot)
+
+    def removeVolumeLVs(self, volUUIDs):
+        """
+        Remove the LVs of volumes volUUIDs and release their metadata slots.
+        """
+        slots = []
+        for volUUID in volUUIDs:
+            try:
+                lv = lvm.getLV(self.sdUUID, volUUID)
+            except se.LogicalVolumeDoesNotExistError:
+                continue
+            slot = parse_lv_tags(lv).mdslot
+            if slot is not None:
+                slots.append(slot)
+
+        deleteVolumes(self.sdUUID, volUUIDs)
+
+        for slot in slots:
+            self.releaseVolumeMetadataSlot(slot)
 
     def _first_available_slot(self):
         version = self.getVersion()
@@ -1187,6 +1368,9 @@ class BlockStorageDomain(sd.StorageDomain):
         with self._manifest.acquireVolumeMetadataSlot(vol_name) as slot:
             yield slot
 
+    def releaseVolumeMetadataSlot(self, slot):
+        self._manifest.releaseVolumeMetadataSlot(slot)
+
     def readMetadataMapping(self):
         return self._manifest.readMetadataMapping()
 
@@ -1292,7 +1476,7 @@ class BlockStorageDomain(sd.StorageDomain):
         toZero = self._manifest._getImgExclusiveVols(imgUUID, volsImgs)
         self._manifest.markForDelVols(sdUUID, imgUUID, toZero,
                                       sc.ZEROED_IMAGE_PREFIX)
-        zeroImgVolumes(sdUUID, imgUUID, toZero, discard)
+        zeroImgVolumes(self._manifest, imgUUID, toZero, discard)
         self.rmDCImgDir(imgUUID, volsImgs)
 
     def deactivateImage(self, imgUUID):
@@ -1765,23 +1949,17 @@ class BlockStorageDomain(sd.StorageDomain):
         if len(slots) == 0:
             return slots_md
 
-        # Slots are sorted in an increasing order,
-        # find slots start and end offsets to read from metadata.
-        start_offset = self._manifest.metadata_offset(slots[0])
-        end_offset = self._manifest.metadata_offset(
-            slots[-1]) + sc.METADATA_SIZE
-
-        # Read the metadata from starting offset to last offset end.
+        # Slots are sorted in an increasing order, so are the offsets.
+        version = self.getVersion()
+        offsets = [self._manifest.metadata_offset(slot, version)
+                   for slot in slots]
         path = self._manifest.metadata_volume_path()
-        raw_md = misc.readblock(path, start_offset, end_offset - start_offset)
+        blocks = _read_metadata_blocks(path, offsets)
 
         # Parse metadata per slot.
-        for slot in slots:
-            offset = self._manifest.metadata_offset(slot) - start_offset
-            slot_raw_md = raw_md[offset:offset + sc.METADATA_SIZE]
-
+        for slot, (offset, data) in zip(slots, blocks):
             try:
-                md_lines = slot_raw_md.rstrip(b"\0").splitlines()
+                md_lines = data.splitlines()
                 slot_md = VolumeMetadata.from_lines(md_lines).dump()
                 slot_md["status"] = sc.VOL_STATUS_OK
             except Exception as e:
@@ -30,6 +30,7 @@ from vdsm.common.threadlocal import vars
 from vdsm.common.units import MiB
 from vdsm.config import config
 from vdsm.storage import blockdev
+from vdsm.storage import chaincache
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
 from vdsm.storage import lvm
@@ -263,6 +264,7 @@ class BlockVolumeManifest(volume.VolumeManifest):
         using the volume.
         """
         self.setMetaParam(sc.PUUID, puuid)
+        chaincache.invalidate_image(self.sdUUID, self.imgUUID)
 
     def setParentTag(self, puuid):
         """
@@ -270,6 +272,7 @@ class BlockVolumeManifest(volume.VolumeManifest):
         LV metadata it may only be performed by an SPM.
         """
         self.changeVolumeTag(sc.TAG_PREFIX_PARENT, puuid)
+        chaincache.invalidate_image(self.sdUUID, self.imgUUID)
 
     def setImage(self, imgUUID):
         """
@@ -316,6 +319,31 @@ class BlockVolumeManifest(volume.VolumeManifest):
         lvs = lvm.lvsByTag(sdUUID, "%s%s" % (sc.TAG_PREFIX_IMAGE, imgUUID))
         return [lv.name for lv in lvs]
 
+    @classmethod
+    def getImageVolumeParents(cls, sdUUID, imgUUID):
+        """
+        Return a dict mapping the image volumes UUIDs to their parent UUIDs,
+        not including the shared base (template). The parents are read from
+        the volumes LV tags.
+        """
+        lvs = lvm.lvsByTag(sdUUID, "%s%s" % (sc.TAG_PREFIX_IMAGE, imgUUID))
+        parents = {}
+        for lv in lvs:
+            parents[lv.name] = None
+            for tag in lv.tags:
+                if tag.startswith(sc.TAG_PREFIX_PARENT):
+                    parents[lv.name] = tag[len(sc.TAG_PREFIX_PARENT):]
+                    break
+        return parents
+
+    @classmethod
+    def supports_chain_cache(cls):
+        """
+        The volumes parents are available in the lvm cache, so validating a
+        cached chain does not read the volumes metadata.
+        """
+        return True
+
     @classmethod
     def calculate_volume_alloc_size(
             cls, preallocate, vol_format, capacity, initial_size):
@@ -641,7 +669,7 @@ class BlockVolume(volume.Volume):
                                 sc.REMOVED_IMAGE_PREFIX)
 
         try:
-            lvm.removeLVs(self.sdUUID, (self.volUUID,))
+            manifest.removeVolumeLVs((self.volUUID,))
         except se.CannotRemoveLogicalVolume as e:
             self.log.exception("Failed to delete volume %s/%s. The "
                                "logical volume must be removed manually.",
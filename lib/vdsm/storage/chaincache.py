@@ -0,0 +1,191 @@
+#
+# Copyright 2026 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Cache of image volume chains.
+
+Building the chain of an image requires reading the metadata of all the
+volumes in the image, looking for the leaf, and walking up the parents.
+The cache keeps the ordered volume ids of the chain, so the next lookup
+creates only the volume objects.
+
+A cached chain is used only if the image volumes and their parents did not
+change since the chain was built, so chains modified by another host (e.g.
+the SPM adding a snapshot or removing a merged volume) are rebuilt.
+
+Chains are cached only on block domains, where the parents are read from the
+LV tags kept in the lvm cache (see Volume.getImageVolumeParents). On file
+domains validating a chain would read the metadata of all the image volumes,
+costing more than building the chain from a volume.
+
+Flows modifying a chain on this host invalidate the image explicitly, and
+domain level changes invalidate all the chains of the domain by increasing
+the domain generation.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import logging
+import threading
+
+from collections import namedtuple
+
+log = logging.getLogger("storage.chaincache")
+
+_Entry = namedtuple("_Entry", "generation,parents,chain")
+
+
+class ChainCache(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {(sd_id, img_id): _Entry}
+        self._chains = {}
+        # {sd_id: generation}
+        self._generations = {}
+        # Increased on every invalidation, so a chain built while the image
+        # was modified is not added to the cache.
+        self._version = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def version(self):
+        """
+        Return the cache version, to be passed to add() after building a
+        chain.
+        """
+        with self._lock:
+            return self._version
+
+    def get(self, sd_id, img_id, parents):
+        """
+        Return the cached chain of image img_id as a tuple of volume ids
+        sorted from base to leaf, or None if the chain is not cached.
+
+        parents is the current dict mapping the image volumes to their
+        parents (see Volume.getImageVolumeParents); if the image volumes or
+        their parents were modified since the chain was cached, the chain is
+        dropped.
+        """
+        with self._lock:
+            entry = self._chains.get((sd_id, img_id))
+            if entry is None:
+                self._misses += 1
+                return None
+
+            if (entry.generation != self._generations.get(sd_id, 0) or
+                    entry.parents != frozenset(parents.items())):
+                del self._chains[(sd_id, img_id)]
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            return entry.chain
+
+    def add(self, sd_id, img_id, parents, chain, version):
+        """
+        Add chain of image img_id, built when the image volumes had parents,
+        if the cache was not invalidated since version was returned.
+        """
+        with self._lock:
+            if version != self._version:
+                log.debug("Cache invalidated while building image %s/%s "
+                          "chain, not caching", sd_id, img_id)
+                return
+
+            self._chains[(sd_id, img_id)] = _Entry(
+                generation=self._generations.get(sd_id, 0),
+                parents=frozenset(parents.items()),
+                chain=tuple(chain))
+
+    def invalidate_image(self, sd_id, img_id):
+        log.debug("Invalidating image %s/%s chain", sd_id, img_id)
+        with self._lock:
+            self._version += 1
+            self._invalidations += 1
+            self._chains.pop((sd_id, img_id), None)
+
+    def invalidate_domain(self, sd_id):
+        log.debug("Invalidating domain %s chains", sd_id)
+        with self._lock:
+            self._version += 1
+            self._invalidations += 1
+            self._generations[sd_id] = self._generations.get(sd_id, 0) + 1
+
+    def clear(self):
+        log.debug("Clearing chains")
+        with self._lock:
+            self._version += 1
+            self._invalidations += 1
+            self._chains.clear()
+
+    def info(self):
+        with self._lock:
+            calls = self._hits + self._misses
+            hit_ratio = (100 * self._hits / calls) if calls > 0 else 0
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": hit_ratio,
+                "invalidations": self._invalidations,
+                "chains": len(self._chains),
+            }
+
+    def clear_stats(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._invalidations = 0
+
+
+_cache = ChainCache()
+
+
+def version():
+    return _cache.version()
+
+
+def get(sd_id, img_id, parents):
+    return _cache.get(sd_id, img_id, parents)
+
+
+def add(sd_id, img_id, parents, chain, version):
+    _cache.add(sd_id, img_id, parents, chain, version)
+
+
+def invalidate_image(sd_id, img_id):
+    _cache.invalidate_image(sd_id, img_id)
+
+
+def invalidate_domain(sd_id):
+    _cache.invalidate_domain(sd_id)
+
+
+def clear():
+    _cache.clear()
+
+
+def cache_stats():
+    return _cache.info()
+
+
+def clear_stats():
+    _cache.clear_stats()
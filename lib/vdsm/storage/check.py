@@ -142,6 +142,17 @@ class CheckService(object):
     def is_checking(self, path):
         return path in self._checkers
 
+    def call_later(self, delay, callback, *args):
+        """
+        Call callback with args after delay seconds in the check thread. May
+        be called from any thread.
+
+        Note that callback is invoked in the check thread, and must not block,
+        as it will block all checkers.
+        """
+        self._loop.call_soon_threadsafe(
+            self._loop.call_later, delay, callback, *args)
+
 
 # Checker state
 IDLE = "idle"
@@ -33,6 +33,7 @@ from vdsm.common.compat import glob_escape
 from vdsm.common.marks import deprecated
 from vdsm.common.threadlocal import vars
 from vdsm.common.units import MiB
+from vdsm.storage import chaincache
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
 from vdsm.storage import fallocate
@@ -664,6 +665,7 @@ class FileVolume(volume.Volume):
         using the volume.
         """
         self.setMetaParam(sc.PUUID, puuid)
+        chaincache.invalidate_image(self.sdUUID, self.imgUUID)
 
     def setParentTag(self, puuid):
         """
@@ -151,6 +151,8 @@ def v3DomainConverter(repoPath, hostId, domain, isMsd):
                           vol.volUUID, newMetaSlot)
                 vol.changeVolumeTag(sc.TAG_PREFIX_MD, str(newMetaSlot))
 
+            domain.releaseVolumeMetadataSlot(metaSlot)
+
     try:
         if isMsd:
             log.debug("Acquiring the cluster lock for domain %s with "
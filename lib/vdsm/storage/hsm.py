@@ -3578,6 +3578,7 @@ class HSM(object):
         domains = frozenset(domains)
         repoStats = {}
         statsGenTime = time.time()
+        checkLatency = domainMonitor.getCheckLatency()
 
         for sdUUID, domStatus in domainMonitor.getDomainsStatus():
             if domains and sdUUID not in domains:
@@ -3623,6 +3624,11 @@ class HSM(object):
                 'isoprefix': domStatus.isoPrefix,
             }
 
+            latency = checkLatency.get(sdUUID)
+            if latency is not None:
+                repoStats[sdUUID]['result']['checkLatency'] = \
+                    '%.3f' % latency
+
         return repoStats
 
     @public
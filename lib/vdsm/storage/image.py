@@ -32,6 +32,7 @@ from vdsm.common import logutils
 from vdsm.common.marks import deprecated
 from vdsm.common.threadlocal import vars
 from vdsm.common.units import MiB
+from vdsm.storage import chaincache
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
 from vdsm.storage import glance
@@ -158,7 +159,6 @@ class Image:
         Return the chain of volumes of image as a sorted list
         (not including a shared base (template) if any)
         """
-        chain = []
         volclass = sdCache.produce(sdUUID).getVolumeClass()
 
         # Use volUUID when provided
@@ -170,11 +170,47 @@ class Image:
             #       one volume
             if srcVol.isShared():
                 return [srcVol]
+        else:
+            srcVol = None
+
+        if not volclass.supports_chain_cache():
+            return self._buildChain(volclass, sdUUID, imgUUID, srcVol)
+
+        # Find all volumes of image and their parents
+        parents = volclass.getImageVolumeParents(sdUUID, imgUUID)
+        uuidlist = list(parents)
+
+        version = chaincache.version()
+        cached = chaincache.get(sdUUID, imgUUID, parents)
+        if cached is not None and volUUID:
+            # Use the part of the chain ending at volUUID. A template volume
+            # is not part of the cached chain.
+            if volUUID in cached:
+                cached = cached[:cached.index(volUUID) + 1]
+            else:
+                cached = None
+
+        if cached is not None:
+            return [volclass(self.repoPath, sdUUID, imgUUID, vol)
+                    for vol in cached]
+
+        chain = self._buildChain(volclass, sdUUID, imgUUID, srcVol, uuidlist)
+
+        # A chain starting at the leaf is the complete chain.
+        if uuidlist and (not volUUID or chain[-1].isLeaf()):
+            chaincache.add(sdUUID, imgUUID, parents,
+                           [vol.volUUID for vol in chain], version)
+
+        return chain
+
+    def _buildChain(self, volclass, sdUUID, imgUUID, srcVol, uuidlist=None):
+        chain = []
 
         # Find all the volumes when volUUID is not provided
-        else:
-            # Find all volumes of image
-            uuidlist = volclass.getImageVolumes(sdUUID, imgUUID)
+        if srcVol is None:
+            if uuidlist is None:
+                # Find all volumes of image
+                uuidlist = volclass.getImageVolumes(sdUUID, imgUUID)
 
             if not uuidlist:
                 raise se.ImageDoesNotExistInSD(imgUUID, sdUUID)
@@ -68,7 +68,7 @@ PV_FIELDS = ("uuid,name,size,vg_name,vg_uuid,pe_start,pe_count,"
 PV_FIELDS_LEN = len(PV_FIELDS.split(","))
 
 VG_FIELDS = ("uuid,name,attr,size,free,extent_size,extent_count,free_count,"
-             "tags,vg_mda_size,vg_mda_free,lv_count,pv_count,pv_name")
+             "tags,vg_mda_size,vg_mda_free,lv_count,pv_count,seqno,pv_name")
 VG_FIELDS_LEN = len(VG_FIELDS.split(","))
 
 LV_FIELDS = "uuid,name,vg_name,attr,size,seg_start_pe,devices,tags"
@@ -211,6 +211,10 @@ PVS_CMD = ("pvs",) + LVM_FLAGS + ("-o", PV_FIELDS)
 VGS_CMD = ("vgs",) + LVM_FLAGS + ("-o", VG_FIELDS)
 LVS_CMD = ("lvs",) + LVM_FLAGS + ("-o", LV_FIELDS)
 
+# Read only commands reporting lvm objects. Concurrent calls with the same
+# arguments are coalesced to single command.
+REPORT_COMMANDS = frozenset(("pvs", "vgs", "lvs"))
+
 # FIXME we must use different METADATA_USER ownership for qemu-unreadable
 # metadata volumes
 USER_GROUP = constants.DISKIMAGE_USER + ":" + constants.DISKIMAGE_GROUP
@@ -412,15 +416,22 @@ class LVMCache(object):
     RETRY_DELAY = 0.1
     RETRY_BACKUP_OFF = 2
 
-    def __init__(self, cmd_runner=LVMRunner(), cache_lvs=False):
+    def __init__(self, cmd_runner=LVMRunner(), cache_lvs=False,
+                 incremental=False):
         """
         Arguemnts:
             cmd_runner (LVMRunner): used to run LVM command
             cache_lvs (bool): use LVs cache when looking up LVs. False by
                 defualt since it works only on the SPM.
+            incremental (bool): when cache_lvs is False, reload VG LVs only
+                if the VG metadata sequence number has changed since the
+                last reload. This is safe on any host, since any change in
+                the VG metadata, on this host or on another host, bumps the
+                VG seqno.
         """
         self._runner = cmd_runner
         self._cache_lvs = cache_lvs
+        self._incremental = incremental
         self._read_only_lock = rwlock.RWLock()
         self._read_only = False
         self._filter = None
@@ -428,12 +439,18 @@ class LVMCache(object):
         self._filterLock = threading.Lock()
         self._lock = threading.Lock()
         self._cmd_sem = threading.BoundedSemaphore(self.MAX_COMMANDS)
+        # Concurrent identical reporting commands and concurrent reloads of
+        # the same VG LVs are coalesced to single command.
+        self._coalescer = misc.Coalescer()
         self._stalepv = True
         self._stalevg = True
         self._freshlv = set()
         self._pvs = {}
         self._vgs = {}
         self._lvs = {}
+        # VG seqno seen before the last full reload of the VG LVs, used in
+        # incremental mode to detect if the VG LVs need a reload.
+        self._lvs_seqno = {}
         self._stats = CacheStats()
 
     @property
@@ -487,6 +504,13 @@ class LVMCache(object):
         self.flush()
 
     def cmd(self, cmd, devices=tuple()):
+        if cmd[0] in REPORT_COMMANDS:
+            key = ("cmd", tuple(cmd), tuple(devices))
+            return self._coalescer.run(key, self._run_cmd, cmd, devices)
+
+        return self._run_cmd(cmd, devices)
+
+    def _run_cmd(self, cmd, devices):
         # Take a shared lock, so set_read_only() can wait for commands using
         # the previous mode.
         with self._cmd_sem, self._read_only_lock.shared:
@@ -556,6 +580,7 @@ class LVMCache(object):
         if pvNames:
             cmd.extend(pvNames)
 
+        self.stats.reload()
         rc, out, err = self.cmd(cmd)
 
         with self._lock:
@@ -628,6 +653,7 @@ class LVMCache(object):
         if vgNames:
             cmd.extend(vgNames)
 
+        self.stats.reload()
         rc, out, err = self.cmd(cmd, self._getVGDevs(vgNames))
 
         with self._lock:
@@ -685,6 +711,7 @@ class LVMCache(object):
                     del self._vgs[name]
                     # Remove fresh lvs indication of the vg removed from cache.
                     self._freshlv.discard(name)
+                    self._lvs_seqno.pop(name, None)
 
             # If we updated all the VGs drop stale flag
             if not vgName:
@@ -693,14 +720,28 @@ class LVMCache(object):
         return updatedVGs
 
     def _reloadlvs(self, vgName, lvNames=None):
+        lvNames = normalize_args(lvNames)
+        if lvNames:
+            return self._loadlvs(vgName, lvNames)
+
+        # Many threads may try to reload the same VG at the same time, for
+        # example when preparing many images. Reload the VG LVs once for all
+        # of them.
+        return self._coalescer.run(("lvs", vgName), self._loadlvs, vgName)
+
+    def _loadlvs(self, vgName, lvNames=()):
         cmd = list(LVS_CMD)
 
-        lvNames = normalize_args(lvNames)
         if lvNames:
             cmd.extend("%s/%s" % (vgName, lvName) for lvName in lvNames)
         else:
             cmd.append(vgName)
 
+        # Take the seqno before running the command. If the VG is modified
+        # while we run lvs, the next lookup will reload the LVs again.
+        seqno = self._cached_seqno(vgName)
+
+        self.stats.reload()
         rc, out, err = self.cmd(cmd, self._getVGDevs((vgName,)))
 
         with self._lock:
@@ -727,6 +768,9 @@ class LVMCache(object):
 
                 return updatedLVs
 
+            added = 0
+            changed = 0
+
             for line in out:
                 fields = [field.strip() for field in line.split(SEPARATOR)]
                 if len(fields) != LV_FIELDS_LEN:
@@ -735,8 +779,17 @@ class LVMCache(object):
                 lv = LV.fromlvm(*fields)
                 # For LV we are only interested in its first extent
                 if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
-                    updatedLVs[(lv.vg_name, lv.name)] = lv
+                    key = (lv.vg_name, lv.name)
+                    # Modify only the entries that changed, so a reload of a
+                    # mostly unchanged VG does not rebuild the cache.
+                    old_lv = self._lvs.get(key)
+                    if old_lv is None:
+                        added += 1
+                        self._lvs[key] = lv
+                    elif old_lv != lv:
+                        changed += 1
+                        self._lvs[key] = lv
+                    updatedLVs[key] = lv
 
             # Determine if there are stale LVs
             if lvNames:
@@ -748,15 +801,22 @@ class LVMCache(object):
                             if (v == vgName) and
                             ((vgName, lvName) not in updatedLVs)]
 
+            removed = 0
             for lvName in staleLVs:
                 if (vgName, lvName) in self._lvs:
                     log.warning("Removing stale lv: %s/%s", vgName, lvName)
                     del self._lvs[(vgName, lvName)]
+                    removed += 1
 
             if not lvNames:
                 self._freshlv.add(vgName)
+                if seqno is None:
+                    self._lvs_seqno.pop(vgName, None)
+                else:
+                    self._lvs_seqno[vgName] = seqno
 
-            log.debug("lvs reloaded")
+            log.debug("lvs reloaded: vg=%s added=%d changed=%d removed=%d",
+                      vgName, added, changed, removed)
 
         return updatedLVs
 
@@ -765,6 +825,7 @@ class LVMCache(object):
         Used only during bootstrap.
         """
         cmd = list(LVS_CMD)
+        self.stats.reload()
         rc, out, err = self.cmd(cmd)
 
         if rc == 0:
@@ -782,6 +843,10 @@ class LVMCache(object):
             with self._lock:
                 self._lvs = new_lvs
                 self._freshlv = {vg_name for vg_name, _ in self._lvs}
+                self._lvs_seqno = {
+                    vg_name: vg.seqno
+                    for vg_name, vg in self._vgs.items()
+                    if vg_name in self._freshlv and not vg.is_stale()}
 
         return self._lvs.copy()
 
@@ -813,6 +878,7 @@ class LVMCache(object):
             self._stalevg = True
             self._vgs.clear()
             self._freshlv = set()
+            self._lvs_seqno.clear()
 
     def _invalidatelvs(self, vgName, lvNames=None):
         lvNames = normalize_args(lvNames)
@@ -831,6 +897,7 @@ class LVMCache(object):
     def _invalidateAllLvs(self):
         with self._lock:
             self._freshlv = set()
+            self._lvs_seqno.clear()
             self._lvs.clear()
 
     def _removelvs(self, vgName, lvNames=None):
@@ -991,16 +1058,41 @@ class LVMCache(object):
         return lvs
 
     def _lvs_needs_reload(self, vg_name):
-        # TODO: Return True only if VG has changed.
-        if not self._cache_lvs:
+        if not (self._cache_lvs or self._incremental):
             return True
 
         if vg_name not in self._freshlv:
             return True
 
-        return any(lv.is_stale()
-                   for (vgn, _), lv in self._lvs.items()
-                   if vgn == vg_name)
+        if any(lv.is_stale()
+               for (vgn, _), lv in self._lvs.items()
+               if vgn == vg_name):
+            return True
+
+        if self._cache_lvs:
+            return False
+
+        return self._vg_changed(vg_name)
+
+    def _vg_changed(self, vg_name):
+        """
+        Return True if the VG metadata was modified since the last full
+        reload of the VG LVs.
+
+        Reloading the VG is much cheaper than reloading the LVs, since vgs
+        reports one line per PV, while lvs reports one line per LV segment.
+        """
+        vg = self._reloadvgs(vg_name).get(vg_name)
+        if vg is None or vg.is_stale():
+            return True
+
+        return vg.seqno != self._lvs_seqno.get(vg_name)
+
+    def _cached_seqno(self, vg_name):
+        vg = self._vgs.get(vg_name)
+        if vg is None or vg.is_stale():
+            return None
+        return vg.seqno
 
 
 class CacheStats(object):
@@ -1009,6 +1101,7 @@ class CacheStats(object):
         self._lock = threading.Lock()
         self._hits = 0
         self._misses = 0
+        self._reloads = 0
 
     def info(self):
         with self._lock:
@@ -1017,13 +1110,15 @@ class CacheStats(object):
             return {
                 "hits": self._hits,
                 "misses": self._misses,
-                "hit_ratio": hit_ratio
+                "hit_ratio": hit_ratio,
+                "reloads": self._reloads,
             }
 
     def clear(self):
         with self._lock:
             self._hits = 0
             self._misses = 0
+            self._reloads = 0
 
     def miss(self):
         with self._lock:
@@ -1033,8 +1128,51 @@ class CacheStats(object):
         with self._lock:
             self._hits += 1
 
+    def reload(self):
+        with self._lock:
+            self._reloads += 1
+
 
-_lvminfo = LVMCache()
+VGChanges = namedtuple("VGChanges", "modified,failed")
+
+
+class LocalChanges(object):
+    """
+    Count VG metadata changes made by this host.
+
+    Every successful lvm command modifying the VG metadata increases the VG
+    seqno at least by one, so comparing the seqno with the number of local
+    changes tells if the VG was modified by another host.
+
+    A change is counted before running the command, so the counter never
+    lags behind the seqno. A failed command may or may not have modified
+    the VG, so failures are counted separately, and a user seeing a new
+    failure must assume that the VG was modified by someone else.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changes = {}
+
+    def modifying(self, vg_name):
+        with self._lock:
+            c = self._changes.get(vg_name, VGChanges(0, 0))
+            self._changes[vg_name] = c._replace(modified=c.modified + 1)
+
+    def failed(self, vg_name):
+        with self._lock:
+            c = self._changes.get(vg_name, VGChanges(0, 0))
+            self._changes[vg_name] = c._replace(failed=c.failed + 1)
+
+    def get(self, vg_name):
+        with self._lock:
+            return self._changes.get(vg_name, VGChanges(0, 0))
+
+
+_lvminfo = LVMCache(
+    incremental=config.getboolean("irs", "lvm_incremental_refresh"))
+
+_local_changes = LocalChanges()
 
 
 def bootstrap(skiplvs=()):
@@ -1573,12 +1711,14 @@ def createLV(vgName, lvName, size, activate=True, contiguous=False,
     cmd.extend(("--name", lvName, vgName))
     if device is not None:
         cmd.append(_fqpvname(device))
+    _local_changes.modifying(vgName)
     rc, out, err = _lvminfo.cmd(cmd, _lvminfo._getVGDevs((vgName, )))
 
     if rc == 0:
         _lvminfo._invalidatevgs(vgName)
         _lvminfo._invalidatelvs(vgName, lvName)
     else:
+        _local_changes.failed(vgName)
         raise se.CannotCreateLogicalVolume(vgName, lvName, err)
 
     # TBD: Need to explore the option of running lvcreate w/o devmapper
@@ -1617,6 +1757,7 @@ def removeLVs(vgName, lvNames):
     cmd.extend(LVM_NOBACKUP)
     for lvName in lvNames:
         cmd.append("%s/%s" % (vgName, lvName))
+    _local_changes.modifying(vgName)
     rc, out, err = _lvminfo.cmd(cmd, _lvminfo._getVGDevs((vgName, )))
     if rc == 0:
         # Remove the LV from the cache
@@ -1626,6 +1767,7 @@ def removeLVs(vgName, lvNames):
     else:
         # Otherwise LV info needs to be refreshed
         _lvminfo._invalidatelvs(vgName, lvNames)
+        _local_changes.failed(vgName)
         raise se.CannotRemoveLogicalVolume(vgName, str(lvNames), err)
 
 
@@ -1651,6 +1793,7 @@ def extendLV(vgName, lvName, size_mb):
     log.info("Extending LV %s/%s to %s megabytes", vgName, lvName, size_mb)
     cmd = ("lvextend",) + LVM_NOBACKUP
     cmd += ("--size", "%sm" % (size_mb,), "%s/%s" % (vgName, lvName))
+    _local_changes.modifying(vgName)
     rc, out, err = _lvminfo.cmd(cmd, _lvminfo._getVGDevs((vgName,)))
 
     # Invalidate vg and lv to ensure cached metadata is correct if we need to
@@ -1659,6 +1802,8 @@ def extendLV(vgName, lvName, size_mb):
     _lvminfo._invalidatelvs(vgName, lvName)
 
     if rc != 0:
+        _local_changes.failed(vgName)
+
         # Reload lv to get updated size.
         lv = getLV(vgName, lvName)
         lv_extents = int(lv.size) // extent_size
@@ -1773,6 +1918,17 @@ def _refreshLVs(vgName, lvNames):
         raise se.LogicalVolumeRefreshError("%s failed" % list2cmdline(cmd))
 
 
+def local_changes(vgName):
+    """
+    Return VGChanges tuple with the number of VG metadata changes made by
+    this host since vdsm was started.
+
+    modified: number of commands modifying the VG metadata
+    failed: number of commands that failed, possibly modifying the VG
+    """
+    return _local_changes.get(vgName)
+
+
 def changeLVsTags(vg, lvs, delTags=(), addTags=()):
     log.info("Change LVs tags (vg=%s, lvs=%s, delTags=%s, addTags=%s)",
              vg, lvs, delTags, addTags)
@@ -1790,13 +1946,18 @@ def changeLVsTags(vg, lvs, delTags=(), addTags=()):
     for tag in addTags:
         attrs.extend(('--addtag', tag))
 
+    _local_changes.modifying(vg)
     try:
         changelv(vg, lvs, attrs)
     except se.StorageException as e:
+        _local_changes.failed(vg)
         raise se.LogicalVolumeReplaceTagError(
             'lvs: `%s` add: `%s` del: `%s` (%s)' %
             (lvs, ", ".join(addTags), ", ".join(delTags), e))
 
+    # Changing tags modifies the VG metadata.
+    _lvminfo._invalidatevgs(vg)
+
 
 #
 # Helper functions
@@ -21,17 +21,24 @@
 from __future__ import absolute_import
 from __future__ import division
 
+import collections
+import io
+import mmap
 import os
 import errno
 import time
 import threading
 import struct
 import logging
+import math
 
 import uuid
+import zlib
 
 from six.moves import queue
 
+from vdsm.common.osutils import uninterruptible
+from vdsm.common.time import monotonic_time
 from vdsm.common.units import KiB
 from vdsm.config import config
 from vdsm.storage import misc
@@ -39,7 +46,6 @@ from vdsm.storage import task
 from vdsm.storage.exception import InvalidParameterException
 from vdsm.storage.threadPool import ThreadPool
 
-from vdsm import constants
 from vdsm.common import concurrent
 
 __author__ = "ayalb"
@@ -61,10 +67,27 @@ SLOTS_PER_MAILBOX = int(MAILBOX_SIZE // MESSAGE_SIZE)
 # Last message slot is reserved for metadata (checksum, extendable mailbox,
 # etc)
 MESSAGES_PER_MAILBOX = SLOTS_PER_MAILBOX - 1
+# Offset of the domain UUID in a message.
+MESSAGE_DOMAIN_OFFSET = 5
+
+# Adler-32 "A" component is 1 + sum of all bytes modulo 65521. Summing up to
+# 256 bytes (256 * 255 = 65280) cannot overflow the modulo, so we can use
+# zlib.adler32() to compute the exact sum of every chunk in C.
+ADLER_MOD = 65521
+CHECKSUM_CHUNK = 256
 
 
 def checksum(data):
-    csum = sum(bytearray(data))
+    """
+    Return the sum of all bytes in data, trimmed to CHECKSUM_BYTES.
+
+    Equivalent to sum(bytearray(data)), but about 4 times faster.
+    """
+    csum = 0
+    with memoryview(data) as view:
+        for i in range(0, len(view), CHECKSUM_CHUNK):
+            chunk = view[i:i + CHECKSUM_CHUNK]
+            csum += (zlib.adler32(chunk) & 0xffff) - 1
     # Trim sum to be CHECKSUM_BYTES bytes long
     return csum & (2**(CHECKSUM_BYTES * 8) - 1)
 
@@ -88,8 +111,75 @@ def runTask(args):
     ctask.prepare(cmd, *args)
 
 
-def _mboxExecCmd(*args, **kwargs):
-    return misc.execCmd(*args, **kwargs)
+def active_poll_interval(monitor_interval):
+    """
+    Return the interval for checking mail while extend requests are
+    outstanding. Never longer than the monitor interval, so tests using short
+    monitor interval keep their timing.
+    """
+    interval = config.getfloat('irs', 'mailbox_active_poll_interval')
+    return min(monitor_interval, interval)
+
+
+class MailboxFile(object):
+    """
+    Read and write mailbox data using direct I/O in the current process.
+
+    Data is transferred through a page aligned mmap buffer, as required for
+    direct I/O, allocated once and reused for all operations. The file is
+    opened for every operation, so we do not keep the mailbox volume open
+    between checks.
+    """
+
+    def __init__(self, path, size):
+        self._path = path
+        self._size = size
+        self._buf = mmap.mmap(-1, size, mmap.MAP_SHARED)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._path
+
+    def read(self, offset, size):
+        """
+        Read size bytes at offset, returning the bytes read. May return less
+        data if the file is too short.
+        """
+        assert size <= self._size
+        with self._lock:
+            fd = os.open(self._path, os.O_RDONLY | os.O_DIRECT)
+            with io.FileIO(fd, "r", closefd=True) as f:
+                f.seek(offset, os.SEEK_SET)
+                pos = 0
+                with memoryview(self._buf) as view:
+                    while pos < size:
+                        nread = uninterruptible(f.readinto, view[pos:size])
+                        if nread == 0:
+                            break  # EOF
+                        pos += nread
+            return self._buf[:pos]
+
+    def write(self, offset, data):
+        """
+        Write data at offset. Returns when the device reports that the
+        transfer has completed.
+        """
+        size = len(data)
+        assert size <= self._size
+        with self._lock:
+            self._buf[:size] = data
+            fd = os.open(self._path, os.O_WRONLY | os.O_DIRECT)
+            with io.FileIO(fd, "w", closefd=True) as f:
+                f.seek(offset, os.SEEK_SET)
+                pos = 0
+                with memoryview(self._buf) as view:
+                    while pos < size:
+                        pos += uninterruptible(f.write, view[pos:size])
+
+    def close(self):
+        with self._lock:
+            self._buf.close()
 
 
 class SPM_Extend_Message:
@@ -213,6 +303,7 @@ class HSM_Mailbox:
         if str(msg.pool) != self._poolID:
             raise ValueError('PoolID does not correspond to Mailbox pool')
         self._queue.put(msg)
+        self._mailman.wakeup()
 
     def stop(self):
         if self._mailman:
@@ -239,27 +330,16 @@ class HSM_MailMonitor(object):
         self._queue = queue
         self._activeMessages = {}
         self._monitorInterval = monitorInterval
+        self._activeInterval = active_poll_interval(monitorInterval)
+        self._wakeupEvent = threading.Event()
         self._hostID = int(hostID)
         self._used_slots_array = [0] * MESSAGES_PER_MAILBOX
         self._outgoingMail = EMPTYMAILBOX
         self._incomingMail = EMPTYMAILBOX
         # TODO: add support for multiple paths (multiple mailboxes)
-        self._inCmd = [constants.EXT_DD,
-                       'if=' + str(inbox),
-                       'iflag=direct,fullblock',
-                       'bs=' + str(MAILBOX_SIZE),
-                       'count=1',
-                       'skip=' + str(self._hostID)
-                       ]
-        self._outCmd = [constants.EXT_DD,
-                        'of=' + str(outbox),
-                        'iflag=fullblock',
-                        'oflag=direct',
-                        'conv=notrunc',
-                        'bs=' + str(MAILBOX_SIZE),
-                        'count=1',
-                        'seek=' + str(self._hostID)
-                        ]
+        self._mailboxOffset = self._hostID * MAILBOX_SIZE
+        self._inFile = MailboxFile(inbox, MAILBOX_SIZE)
+        self._outFile = MailboxFile(outbox, MAILBOX_SIZE)
         self._init = False
         self._initMailbox()  # Read initial mailbox state
         self._msgCounter = 0
@@ -270,17 +350,26 @@ class HSM_MailMonitor(object):
 
     def _initMailbox(self):
         # Sync initial incoming mail state with storage view
-        (rc, out, err) = _mboxExecCmd(self._inCmd, raw=True)
-        if rc == 0:
-            self._incomingMail = out
-            self._init = True
-        else:
+        try:
+            out = self._inFile.read(self._mailboxOffset, MAILBOX_SIZE)
+        except EnvironmentError as e:
             self.log.warning("HSM_MailboxMonitor - Could not initialize "
                              "mailbox, will not accept requests until init "
-                             "succeeds")
+                             "succeeds: %s", e)
+        else:
+            self._incomingMail = out
+            self._init = True
 
     def immStop(self):
         self._stop = True
+        self._wakeupEvent.set()
+
+    def wakeup(self):
+        """
+        Wake up the monitor thread waiting for replies, so new messages are
+        sent without waiting for the next check.
+        """
+        self._wakeupEvent.set()
 
     def wait(self, timeout=None):
         self._thread.join(timeout=timeout)
@@ -301,13 +390,9 @@ class HSM_MailMonitor(object):
             if newMsgs[start:start + 1] == b"\0":
                 continue
 
-            for j in range(start, start + MESSAGE_SIZE):
-                if newMsgs[j] != self._incomingMail[j]:
-                    break
-
-            # If search exhausted then message hasn't changed since last read
-            # and can be skipped
-            if j == (start + MESSAGE_SIZE - 1):
+            # If message hasn't changed since last read it can be skipped
+            newMsg = newMsgs[start:start + MESSAGE_SIZE]
+            if newMsg == self._incomingMail[start:start + MESSAGE_SIZE]:
                 continue
 
             #
@@ -317,8 +402,6 @@ class HSM_MailMonitor(object):
             #
             rc = True
 
-            newMsg = newMsgs[start:start + MESSAGE_SIZE]
-
             if newMsg == CLEAN_MESSAGE:
                 del self._activeMessages[i]
                 self._used_slots_array[i] = 0
@@ -366,11 +449,7 @@ class HSM_MailMonitor(object):
 
     def _checkForMail(self):
         # self.log.debug("HSM_MailMonitor - checking for mail")
-        # self.log.debug("Running command: " + str(self._inCmd))
-        (rc, in_mail, err) = misc.execCmd(self._inCmd, raw=True)
-        if rc:
-            raise RuntimeError("_handleResponses.Could not read mailbox - rc "
-                               "%s" % rc)
+        in_mail = self._inFile.read(self._mailboxOffset, MAILBOX_SIZE)
         if (len(in_mail) != MAILBOX_SIZE):
             raise RuntimeError("_handleResponses.Could not read mailbox - len "
                                "%s != %s" % (len(in_mail), MAILBOX_SIZE))
@@ -378,13 +457,17 @@ class HSM_MailMonitor(object):
         return self._handleResponses(in_mail)
 
     def _sendMail(self):
-        self.log.info("HSM_MailMonitor sending mail to SPM - " +
-                      str(self._outCmd))
+        self.log.info("HSM_MailMonitor sending mail to SPM - %s offset=%d",
+                      self._outFile.name, self._mailboxOffset)
         pChk = packed_checksum(
             self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES])
         self._outgoingMail = \
             self._outgoingMail[0:MAILBOX_SIZE - CHECKSUM_BYTES] + pChk
-        _mboxExecCmd(self._outCmd, data=self._outgoingMail)
+        try:
+            self._outFile.write(self._mailboxOffset, self._outgoingMail)
+        except EnvironmentError:
+            self.log.error("HSM_MailMonitor couldn't send mail to SPM",
+                           exc_info=True)
 
     def _handleMessage(self, message):
         # TODO: add support for multiple mailboxes
@@ -483,14 +566,16 @@ class HSM_MailMonitor(object):
                         self._sendMail()
 
                     # If there are active messages waiting for SPM reply, wait
-                    # a few seconds before performing another IO op
+                    # a short time before performing another IO op. A new
+                    # message wakes us up so it is sent immediately.
                     if self._activeMessages and not self._stop:
                         # If recurring failures then sleep for one minute
                         # before retrying
                         if (failures > 9):
                             time.sleep(60)
                         else:
-                            time.sleep(self._monitorInterval)
+                            self._wakeupEvent.wait(self._activeInterval)
+                            self._wakeupEvent.clear()
 
                 except:
                     self.log.error("HSM_MailboxMonitor - Incoming mail"
@@ -501,12 +586,168 @@ class HSM_MailMonitor(object):
                           "thread stopped, clearing outgoing mail")
             self._outgoingMail = EMPTYMAILBOX
             self._sendMail()  # Clear outgoing mailbox
+            self._inFile.close()
+            self._outFile.close()
+
+
+_Request = collections.namedtuple(
+    "_Request", "host, domain, func, args, start")
+
+
+class RequestScheduler(object):
+    """
+    Schedule SPM mailbox requests on a thread pool.
+
+    Requests are served in round robin order between hosts, so a host with
+    many requests cannot starve other hosts. The number of running requests
+    is limited to max_running, so requests wait here and not in the thread
+    pool queue. The number of running requests for the same domain is limited
+    to max_per_domain, since LVM serializes changes in the same VG.
+    """
+
+    log = logging.getLogger('storage.MailBox.RequestScheduler')
+
+    # Number of recent requests used for computing latency percentiles.
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, tp, max_running, max_per_domain):
+        self._tp = tp
+        self._max_running = max_running
+        self._max_per_domain = max_per_domain
+        self._lock = threading.Lock()
+        # Waiting requests per host id.
+        self._waiting = {}
+        # Host ids with waiting requests in round robin order.
+        self._hosts = collections.deque()
+        self._running = 0
+        self._running_per_domain = collections.Counter()
+        self._latency = collections.deque(maxlen=self.LATENCY_SAMPLES)
+        self._completed = 0
+
+    def schedule(self, host, domain, func, args):
+        """
+        Schedule func(args) to run in the thread pool.
+        """
+        req = _Request(host, domain, func, args, monotonic_time())
+        with self._lock:
+            if host not in self._waiting:
+                self._waiting[host] = collections.deque()
+                self._hosts.append(host)
+            self._waiting[host].append(req)
+            ready = self._next_requests()
+        self._start(ready)
+
+    def pending(self):
+        """
+        Return the number of waiting and running requests.
+        """
+        with self._lock:
+            return self._running + sum(
+                len(q) for q in self._waiting.values())
+
+    def info(self):
+        """
+        Return scheduler statistics. Latency is the time from scheduling a
+        request until it completes, for the last LATENCY_SAMPLES requests.
+        """
+        with self._lock:
+            waiting = sum(len(q) for q in self._waiting.values())
+            running = self._running
+            completed = self._completed
+            samples = sorted(self._latency)
+        return {
+            "waiting": waiting,
+            "running": running,
+            "completed": completed,
+            "latency": {
+                "p50": percentile(samples, 50),
+                "p90": percentile(samples, 90),
+                "p99": percentile(samples, 99),
+                "max": samples[-1] if samples else 0.0,
+            },
+        }
+
+    def _next_requests(self):
+        """
+        Take the requests that can start now, one request from every host on
+        each round. Must be called with the lock held.
+        """
+        ready = []
+        progress = True
+        while progress:
+            progress = False
+            for _ in range(len(self._hosts)):
+                if self._running >= self._max_running:
+                    return ready
+                host = self._hosts[0]
+                self._hosts.rotate(-1)
+                req = self._pop_request(host)
+                if req is None:
+                    continue
+                ready.append(req)
+                self._running += 1
+                self._running_per_domain[req.domain] += 1
+                progress = True
+        return ready
+
+    def _pop_request(self, host):
+        """
+        Pop the first request of host that can run now. Must be called right
+        after rotating host to the end of the hosts queue.
+        """
+        requests = self._waiting[host]
+        for i, req in enumerate(requests):
+            if self._running_per_domain[req.domain] < self._max_per_domain:
+                del requests[i]
+                if not requests:
+                    del self._waiting[host]
+                    self._hosts.pop()
+                return req
+        return None
+
+    def _start(self, ready):
+        for req in ready:
+            if not self._tp.queueTask(str(uuid.uuid4()), self._run, req):
+                self.log.error("Cannot queue request %s from host %s",
+                               req.args, req.host)
+                self._done(req)
+
+    def _run(self, req):
+        try:
+            req.func(req.args)
+        finally:
+            self._done(req)
+
+    def _done(self, req):
+        with self._lock:
+            self._running -= 1
+            self._running_per_domain[req.domain] -= 1
+            if self._running_per_domain[req.domain] == 0:
+                del self._running_per_domain[req.domain]
+            self._latency.append(monotonic_time() - req.start)
+            self._completed += 1
+            ready = self._next_requests()
+        self._start(ready)
+
+
+def percentile(samples, p):
+    """
+    Return the p percentile of sorted samples using the nearest rank method,
+    or 0.0 if there are no samples.
+    """
+    if not samples:
+        return 0.0
+    rank = max(1, int(math.ceil(p / 100.0 * len(samples))))
+    return samples[rank - 1]
 
 
 class SPM_MailMonitor:
 
     log = logging.getLogger('storage.MailBox.SpmMailMonitor')
 
+    # Interval in seconds for logging request statistics.
+    STATS_INTERVAL = 60
+
     def registerMessageType(self, messageType, callback):
         self._messageTypes[messageType] = callback
 
@@ -527,6 +768,10 @@ class SPM_MailMonitor:
         waitTimeout = wait_timeout(monitorInterval)
         maxTasks = config.getint('irs', 'max_tasks')
         self.tp = ThreadPool("mailbox-spm", tpSize, waitTimeout, maxTasks)
+        self._scheduler = RequestScheduler(
+            self.tp, tpSize,
+            config.getint('irs', 'mailbox_max_requests_per_domain'))
+        self._lastStats = (monotonic_time(), 0)
         self._inbox = inbox
         if not os.path.exists(self._inbox):
             self.log.error("SPM_MailMonitor create failed - inbox %s does not "
@@ -542,31 +787,25 @@ class SPM_MailMonitor:
         self._numHosts = int(maxHostID)
         self._outMailLen = MAILBOX_SIZE * self._numHosts
         self._monitorInterval = monitorInterval
+        self._activeInterval = active_poll_interval(monitorInterval)
+        # Set if writing the outgoing mail failed, so we retry on the next
+        # check.
+        self._sendFailed = False
         # TODO: add support for multiple paths (multiple mailboxes)
         self._outgoingMail = self._outMailLen * b"\0"
         self._incomingMail = self._outgoingMail
-        self._inCmd = ['dd',
-                       'if=' + str(self._inbox),
-                       'iflag=direct,fullblock',
-                       'count=1'
-                       ]
-        self._outCmd = ['dd',
-                        'of=' + str(self._outbox),
-                        'oflag=direct',
-                        'iflag=fullblock',
-                        'conv=notrunc',
-                        'count=1'
-                        ]
+        self._inFile = MailboxFile(self._inbox, self._outMailLen)
+        self._outFile = MailboxFile(self._outbox, self._outMailLen)
         self._outLock = threading.Lock()
         self._inLock = threading.Lock()
         # Clear outgoing mail
-        self.log.debug("SPM_MailMonitor - clearing outgoing mail, command is: "
-                       "%s", self._outCmd)
-        cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-        (rc, out, err) = _mboxExecCmd(cmd, data=self._outgoingMail)
-        if rc:
-            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail, "
-                             "dd failed")
+        self.log.debug("SPM_MailMonitor - clearing outgoing mail %s",
+                       self._outbox)
+        try:
+            self._outFile.write(0, self._outgoingMail)
+        except EnvironmentError as e:
+            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail: "
+                             "%s", e)
 
         self._thread = concurrent.thread(
             self._run, name="mailbox-spm", log=self.log)
@@ -605,13 +844,30 @@ class SPM_MailMonitor:
             return False  # Ignore messages of empty mailbox
         return True
 
+    def _changedMailboxes(self, newMail):
+        """
+        Yield the hosts whose mailbox changed since last read.
+
+        Comparing the entire mailbox is much cheaper than checking the
+        messages, and most mailboxes do not change between reads.
+        """
+        for host in range(self._numHosts):
+            start = host * MAILBOX_SIZE
+            end = start + MAILBOX_SIZE
+            if newMail[start:end] != self._incomingMail[start:end]:
+                yield host
+
     def _handleRequests(self, newMail):
 
         send = False
 
-        # run through all messages and check if new messages have arrived
-        # (since last read)
-        for host in range(0, self._numHosts):
+        # In the common case nothing changed since last read.
+        if newMail == self._incomingMail:
+            return send
+
+        # run through all messages in changed mailboxes and check if new
+        # messages have arrived (since last read)
+        for host in self._changedMailboxes(newMail):
             # Check mailbox checksum
             mailboxStart = host * MAILBOX_SIZE
 
@@ -656,16 +912,10 @@ class SPM_MailMonitor:
                     send = True
                     continue
 
-                # Message isn't empty, check if its new
-                isMessageNew = False
-                for j in range(msgStart, msgStart + MESSAGE_SIZE):
-                    if newMail[j] != self._incomingMail[j]:
-                        isMessageNew = True
-                        break
-
-                # If search exhausted, i.e. message hasn't changed since last
-                # read, it can be skipped
-                if not isMessageNew:
+                # Message isn't empty, if it hasn't changed since last read,
+                # it can be skipped
+                if newMsg == self._incomingMail[msgStart:
+                                                msgStart + MESSAGE_SIZE]:
                     continue
 
                 # We only get here if there is a novel request
@@ -674,17 +924,14 @@ class SPM_MailMonitor:
                     if msgType in self._messageTypes:
                         # Use message class to process request according to
                         # message specific logic
-                        id = str(uuid.uuid4())
                         self.log.debug("SPM_MailMonitor: processing request: "
-                                       "%s" % repr(newMail[
-                                           msgStart:msgStart + MESSAGE_SIZE]))
-                        res = self.tp.queueTask(
-                            id, runTask, (self._messageTypes[msgType], msgId,
-                                          newMail[msgStart:
-                                                  msgStart + MESSAGE_SIZE])
-                        )
-                        if not res:
-                            raise Exception()
+                                       "%s" % repr(newMsg))
+                        domainStart = msgStart + MESSAGE_DOMAIN_OFFSET
+                        domain = newMail[domainStart:
+                                         domainStart + PACKED_UUID_SIZE]
+                        self._scheduler.schedule(
+                            host, domain, runTask,
+                            (self._messageTypes[msgType], msgId, newMsg))
                     else:
                         self.log.error("SPM_MailMonitor: unknown message type "
                                        "encountered: %s", msgType)
@@ -706,30 +953,31 @@ class SPM_MailMonitor:
         # incomingMail is not changed during checkForMail
         with self._inLock:
             # self.log.debug("SPM_MailMonitor -_checking for mail")
-            cmd = self._inCmd + ['bs=' + str(self._outMailLen)]
-            # self.log.debug("SPM_MailMonitor - reading incoming mail, "
-            #               "command: " + str(cmd))
-            (rc, in_mail, err) = misc.execCmd(cmd, raw=True)
-            if rc:
+            try:
+                in_mail = self._inFile.read(0, self._outMailLen)
+            except EnvironmentError as e:
                 raise IOError(errno.EIO, "_handleRequests._checkForMail - "
-                              "Could not read mailbox: %s" % self._inbox)
+                              "Could not read mailbox: %s: %s" %
+                              (self._inbox, e))
 
             if (len(in_mail) != (self._outMailLen)):
-                self.log.error('SPM_MailMonitor: _checkForMail - dd succeeded '
-                               'but read %d bytes instead of %d, cannot check '
+                self.log.error('SPM_MailMonitor: _checkForMail - read '
+                               '%d bytes instead of %d, cannot check '
                                'mail.  Read mail contains: %s', len(in_mail),
                                self._outMailLen, repr(in_mail[:80]))
                 raise RuntimeError("_handleRequests._checkForMail - Could not "
                                    "read mailbox")
             # self.log.debug("Parsing inbox content: %s", in_mail)
-            if self._handleRequests(in_mail):
+            if self._handleRequests(in_mail) or self._sendFailed:
                 with self._outLock:
-                    cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-                    (rc, out, err) = _mboxExecCmd(cmd,
-                                                  data=self._outgoingMail)
-                    if rc:
+                    try:
+                        self._outFile.write(0, self._outgoingMail)
+                    except EnvironmentError as e:
+                        self._sendFailed = True
                         self.log.warning("SPM_MailMonitor couldn't write "
-                                         "outgoing mail, dd failed")
+                                         "outgoing mail: %s", e)
+                    else:
+                        self._sendFailed = False
 
     def sendReply(self, msgID, msg):
         # Lock is acquired in order to make sure that
@@ -742,14 +990,37 @@ class SPM_MailMonitor:
             mailboxOffset = (msgID // SLOTS_PER_MAILBOX) * MAILBOX_SIZE
             mailbox = self._outgoingMail[mailboxOffset:
                                          mailboxOffset + MAILBOX_SIZE]
-            cmd = self._outCmd + ['bs=' + str(MAILBOX_SIZE),
-                                  'seek=' + str(mailboxOffset // MAILBOX_SIZE)]
-            # self.log.debug("Running command: %s, for message id: %s",
-            #               str(cmd), str(msgID))
-            (rc, out, err) = _mboxExecCmd(cmd, data=mailbox)
-            if rc:
+            try:
+                self._outFile.write(mailboxOffset, mailbox)
+            except EnvironmentError as e:
+                self._sendFailed = True
                 self.log.error("SPM_MailMonitor: sendReply - couldn't send "
-                               "reply, dd failed")
+                               "reply: %s", e)
+
+    def _logStats(self):
+        """
+        Log request statistics every STATS_INTERVAL seconds, if requests were
+        completed since the last report.
+        """
+        now = monotonic_time()
+        last_time, last_completed = self._lastStats
+        if now - last_time < self.STATS_INTERVAL:
+            return
+        info = self._scheduler.info()
+        if info["completed"] != last_completed:
+            self.log.info("SPM_MailMonitor requests: waiting=%(waiting)s "
+                          "running=%(running)s completed=%(completed)s "
+                          "latency=%(latency)s", info)
+        self._lastStats = (now, info["completed"])
+
+    def _pollInterval(self):
+        """
+        Check more often while requests wait for a reply. Requests already
+        answered do not count, even if the host did not clear them yet.
+        """
+        if self._scheduler.pending():
+            return self._activeInterval
+        return self._monitorInterval
 
     def _run(self):
         try:
@@ -758,10 +1029,13 @@ class SPM_MailMonitor:
                     self._checkForMail()
                 except:
                     self.log.error("Error checking for mail", exc_info=True)
-                time.sleep(self._monitorInterval)
+                self._logStats()
+                time.sleep(self._pollInterval())
         finally:
             self._stopped = True
             self.tp.joinAll()
+            self._inFile.close()
+            self._outFile.close()
             self.log.info("SPM_MailMonitor - Incoming mail monitoring thread "
                           "stopped")
 
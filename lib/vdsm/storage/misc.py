@@ -372,6 +372,64 @@ class SamplingMethod(object):
         return self.__lastResult
 
 
+class Coalescer(object):
+    """
+    Coalesce concurrent calls with the same key into a single call, sharing
+    the result with all callers.
+
+    Like SamplingMethod, a caller arriving while a call is running waits for
+    the next call, so the result is never older than the caller request. All
+    callers arriving during the same running call share the next call.
+
+    Unlike SamplingMethod, calls are grouped by key, so calls with different
+    keys run concurrently. If the call fails, the thread running the call
+    gets the exception, and the threads waiting for the result retry the
+    call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def run(self, key, func, *args):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _CoalescerEntry()
+            entry.users += 1
+        try:
+            while True:
+                if entry.barrier.enter():
+                    try:
+                        result = func(*args)
+                    except BaseException:
+                        entry.result = None
+                        raise
+                    else:
+                        entry.result = result
+                        return result
+                    finally:
+                        entry.barrier.exit()
+
+                # Someone else got the result for us, unless the call failed.
+                result = entry.result
+                if result is not None:
+                    return result
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.users == 0:
+                    del self._entries[key]
+
+
+class _CoalescerEntry(object):
+
+    def __init__(self):
+        self.barrier = DynamicBarrier()
+        self.result = None
+        self.users = 0
+
+
 def samplingmethod(func):
     sm = SamplingMethod(func)
 
@@ -21,12 +21,15 @@
 from __future__ import absolute_import
 
 import logging
+import random
 import threading
 import time
 
+from six.moves import queue
 
 from vdsm import utils
 from vdsm.common import concurrent
+from vdsm.common.time import monotonic_time
 from vdsm.config import config
 from vdsm.storage import check
 from vdsm.storage import clusterlock
@@ -152,6 +155,15 @@ class DomainMonitor(object):
             "storage.DomainMonitor.onDomainStateChange", sync=False)
         self._checker = check.CheckService()
         self._checker.start()
+        # If monitor_workers is 0, every domain is monitored by its own thread.
+        # Otherwise all domains are checked by a fixed number of workers.
+        workers = config.getint("irs", "monitor_workers")
+        if workers > 0:
+            jitter = interval * config.getfloat("irs", "monitor_jitter")
+            self._pool = MonitorPool(self._checker, workers, jitter, interval)
+            self._pool.start()
+        else:
+            self._pool = None
 
     @property
     def domains(self):
@@ -191,12 +203,21 @@ class DomainMonitor(object):
                 return
 
             log.info("Start monitoring %s", sdUUID)
-            monitor = MonitorThread(
-                sdUUID,
-                hostId,
-                self._interval,
-                self.onDomainStateChange,
-                self._checker)
+            if self._pool:
+                monitor = PooledMonitor(
+                    sdUUID,
+                    hostId,
+                    self._interval,
+                    self.onDomainStateChange,
+                    self._checker,
+                    self._pool)
+            else:
+                monitor = MonitorThread(
+                    sdUUID,
+                    hostId,
+                    self._interval,
+                    self.onDomainStateChange,
+                    self._checker)
             monitor.poolDomain = poolDomain
             monitor.start()
             # The domain should be added only after it successfully started.
@@ -221,6 +242,15 @@ class DomainMonitor(object):
             return [(sdUUID, monitor.getStatus()) for sdUUID, monitor in
                     self._monitors.items()]
 
+    def getCheckLatency(self):
+        """
+        Return the time in seconds spent in the last check of every monitored
+        domain, or None if the domain was not checked yet.
+        """
+        with self._lock:
+            return {sdUUID: monitor.checkLatency for sdUUID, monitor in
+                    self._monitors.items()}
+
     def getHostStatus(self, domains):
         status = {}
         for sdUUID, hostId in domains.items():
@@ -252,6 +282,8 @@ class DomainMonitor(object):
             self._shutting_down = True
 
         self._stopMonitors(list(self._monitors.values()), shutdown=True)
+        if self._pool:
+            self._pool.stop()
         self._checker.stop()
 
     def _stopMonitors(self, monitors, shutdown=False):
@@ -306,6 +338,8 @@ class MonitorThread(object):
         self.refreshTime = \
             config.getfloat("irs", "repo_stats_cache_refresh_timeout")
         self.wasShutdown = False
+        # Time in seconds spent in the last domain check cycle.
+        self.checkLatency = None
         # Used for synchronizing during the tests
         self.cycleCallback = _NULL_CALLBACK
 
@@ -341,10 +375,16 @@ class MonitorThread(object):
         finally:
             log.debug("Domain monitor for %s stopped (shutdown=%s)",
                       self.sdUUID, self.wasShutdown)
-            self._stopCheckingPath()
-            if self._shouldReleaseHostId():
-                self._releaseHostId()
-            self._teardownDomain()
+            self._teardownMonitor()
+
+    def _teardownMonitor(self):
+        """
+        Called when the monitor stops, must not raise!
+        """
+        self._stopCheckingPath()
+        if self._shouldReleaseHostId():
+            self._releaseHostId()
+        self._teardownDomain()
 
     # Setting up
 
@@ -353,18 +393,24 @@ class MonitorThread(object):
         Set up the monitor, retrying on failures. Returns when the monitor is
         ready.
         """
-        while True:
-            try:
-                self._setupMonitor()
-                return
-            except Exception as e:
-                log.exception("Setting up monitor for %s failed", self.sdUUID)
-                domain_status = DomainStatus(error=e)
-                status = Status(self.status._path_status, domain_status)
-                self._updateStatus(status)
-                self.cycleCallback()
-                if self.stopEvent.wait(self.interval):
-                    raise utils.Canceled
+        while not self._trySetupMonitor():
+            if self.stopEvent.wait(self.interval):
+                raise utils.Canceled
+
+    def _trySetupMonitor(self):
+        """
+        Try to set up the monitor once. Returns True if the monitor is ready.
+        """
+        try:
+            self._setupMonitor()
+            return True
+        except Exception as e:
+            log.exception("Setting up monitor for %s failed", self.sdUUID)
+            domain_status = DomainStatus(error=e)
+            status = Status(self.status._path_status, domain_status)
+            self._updateStatus(status)
+            self.cycleCallback()
+            return False
 
     def _setupMonitor(self):
         # Pick up changes in the domain, for example, domain upgrade.
@@ -407,15 +453,23 @@ class MonitorThread(object):
         Monitor the domain peroidically until the monitor is stopped.
         """
         while True:
-            try:
-                self._monitorDomain()
-            except Exception:
-                log.exception("Domain monitor for %s failed", self.sdUUID)
-            finally:
-                self.cycleCallback()
+            self._monitorCycle()
             if self.stopEvent.wait(self.interval):
                 raise utils.Canceled
 
+    def _monitorCycle(self):
+        start = monotonic_time()
+        try:
+            self._monitorDomain()
+        except Exception:
+            log.exception("Domain monitor for %s failed", self.sdUUID)
+        finally:
+            self.checkLatency = monotonic_time() - start
+            if self.checkLatency > self.interval:
+                log.warning("Checking domain %s took %.2f seconds",
+                            self.sdUUID, self.checkLatency)
+            self.cycleCallback()
+
     def _monitorDomain(self):
         # Pick up changes in the domain, for example, domain upgrade.
         if self._shouldRefreshDomain():
@@ -607,5 +661,195 @@ class MonitorThread(object):
         self.domain = None
 
 
+class MonitorPool(object):
+    """
+    Run domain monitor cycles on a fixed number of worker threads.
+
+    Cycles are scheduled using the check service event loop, so the number of
+    threads does not depend on the number of monitored domains. A random
+    delay of up to jitter seconds is added to every scheduled cycle, so
+    checks of domains started at the same time do not stay aligned.
+
+    A cycle may block for a long time on inaccessible storage. If a cycle
+    does not complete within timeout seconds, the worker running it is
+    detached from the pool and a new worker is started, so other domains are
+    still checked. The detached worker exits when the blocked cycle
+    completes. Since a monitor schedules the next cycle only when the
+    current cycle completes, a blocked domain uses at most one thread, like
+    a domain monitored by its own thread.
+    """
+
+    def __init__(self, checker, workers, jitter, timeout):
+        self._checker = checker
+        self._workers = workers
+        self._jitter = jitter
+        self._timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._count = 0
+        self._threads = []
+
+    def start(self):
+        log.info("Starting domain monitor pool with %d workers",
+                 self._workers)
+        with self._lock:
+            for _ in range(self._workers):
+                self._startWorker()
+
+    def stop(self):
+        log.info("Stopping domain monitor pool")
+        with self._lock:
+            self._stopping = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(_STOP)
+        for t in threads:
+            t.join()
+
+    def schedule(self, delay, func):
+        """
+        Run func in a worker thread after delay seconds, adding random jitter.
+        """
+        delay += random.uniform(0, self._jitter)
+        self._checker.call_later(delay, self._queue.put, func)
+
+    def dispatch(self, func):
+        """
+        Run func in a worker thread as soon as possible.
+        """
+        self._queue.put(func)
+
+    def _startWorker(self):
+        # Must be called when holding the lock.
+        t = concurrent.thread(
+            self._run, log=log, name="monitor/%d" % self._count)
+        self._count += 1
+        t.start()
+        self._threads.append(t)
+
+    def _run(self):
+        while True:
+            func = self._queue.get()
+            if func is _STOP:
+                return
+
+            call = _PoolCall(func, threading.current_thread())
+            self._checker.call_later(self._timeout, self._checkBlocked, call)
+            try:
+                func()
+            except Exception:
+                log.exception("Unhandled error in %s", func)
+
+            with self._lock:
+                call.done = True
+                if call.detached:
+                    log.info("Blocked call %s completed, worker %s exiting",
+                             func, call.thread.name)
+                    return
+
+    def _checkBlocked(self, call):
+        """
+        Called in the check thread after a call timeout, must not block.
+        """
+        with self._lock:
+            if call.done or self._stopping:
+                return
+            log.warning("Call %s blocked for more than %.2f seconds, "
+                        "replacing worker %s", call.func, self._timeout,
+                        call.thread.name)
+            call.detached = True
+            self._threads.remove(call.thread)
+            self._startWorker()
+
+
+class _PoolCall(object):
+
+    __slots__ = ("func", "thread", "done", "detached")
+
+    def __init__(self, func, thread):
+        self.func = func
+        self.thread = thread
+        self.done = False
+        self.detached = False
+
+
+_STOP = object()
+
+# PooledMonitor states
+WAITING = "waiting"
+RUNNING = "running"
+STOPPED = "stopped"
+
+
+class PooledMonitor(MonitorThread):
+    """
+    Domain monitor running its cycles in a MonitorPool instead of a thread.
+
+    A monitor has at most one cycle waiting or running in the pool. When
+    stopped while waiting for the next cycle, the monitor is torn down
+    immediately in the pool; when stopped during a cycle, it is torn down
+    when the cycle completes.
+    """
+
+    def __init__(self, sdUUID, hostId, interval, changeEvent, checker, pool):
+        super(PooledMonitor, self).__init__(
+            sdUUID, hostId, interval, changeEvent, checker)
+        self.thread = None
+        self.pool = pool
+        self.ready = False
+        self.state = WAITING
+        self.stateLock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        log.debug("Domain monitor for %s started", self.sdUUID)
+        self.pool.schedule(0, self._cycle)
+
+    def stop(self, shutdown=False):
+        super(PooledMonitor, self).stop(shutdown=shutdown)
+        with self.stateLock:
+            if self.state is not WAITING:
+                return
+            # The next cycle will find the monitor stopped and do nothing.
+            self.state = RUNNING
+        self.pool.dispatch(self._stopCompleted)
+
+    def join(self):
+        self.stopped.wait()
+
+    def _cycle(self):
+        with self.stateLock:
+            if self.state is not WAITING:
+                return
+            self.state = RUNNING
+
+        try:
+            if not self.stopEvent.is_set():
+                if self.ready or self._trySetupMonitor():
+                    self.ready = True
+                    self._monitorCycle()
+        except utils.Canceled:
+            log.debug("Domain monitor for %s canceled", self.sdUUID)
+
+        with self.stateLock:
+            if not self.stopEvent.is_set():
+                self.state = WAITING
+                self.pool.schedule(self.interval, self._cycle)
+                return
+
+        self._stopCompleted()
+
+    def _stopCompleted(self):
+        log.debug("Domain monitor for %s stopped (shutdown=%s)",
+                  self.sdUUID, self.wasShutdown)
+        try:
+            self._teardownMonitor()
+        finally:
+            with self.stateLock:
+                self.state = STOPPED
+            self.stopped.set()
+
+
 def _NULL_CALLBACK():
     pass
@@ -35,6 +35,7 @@ from vdsm.common.marks import deprecated
 from vdsm.common.threadlocal import vars
 from vdsm.common.units import MiB, GiB
 from vdsm.config import config
+from vdsm.storage import chaincache
 from vdsm.storage import clusterlock
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
@@ -849,10 +850,16 @@ class StorageDomain(object):
         return self._manifest.getVAllocSize(imgUUID, volUUID)
 
     def deleteImage(self, sdUUID, imgUUID, volsImgs):
-        self._manifest.deleteImage(sdUUID, imgUUID, volsImgs)
+        try:
+            self._manifest.deleteImage(sdUUID, imgUUID, volsImgs)
+        finally:
+            chaincache.invalidate_image(sdUUID, imgUUID)
 
     def purgeImage(self, sdUUID, imgUUID, volsImgs, discard):
-        self._manifest.purgeImage(sdUUID, imgUUID, volsImgs, discard)
+        try:
+            self._manifest.purgeImage(sdUUID, imgUUID, volsImgs, discard)
+        finally:
+            chaincache.invalidate_image(sdUUID, imgUUID)
 
     def getAllImages(self):
         return self._manifest.getAllImages()
@@ -1007,10 +1014,14 @@ class StorageDomain(object):
         """
         Create a new volume
         """
-        return self.getVolumeClass().create(
-            self._getRepoPath(), self.sdUUID, imgUUID, capacity, volFormat,
-            preallocate, diskType, volUUID, desc, srcImgUUID, srcVolUUID,
-            initial_size=initial_size, add_bitmaps=add_bitmaps)
+        try:
+            return self.getVolumeClass().create(
+                self._getRepoPath(), self.sdUUID, imgUUID, capacity,
+                volFormat, preallocate, diskType, volUUID, desc, srcImgUUID,
+                srcVolUUID, initial_size=initial_size,
+                add_bitmaps=add_bitmaps)
+        finally:
+            chaincache.invalidate_image(self.sdUUID, imgUUID)
 
     def getMDPath(self):
         return self._manifest.getMDPath()
@@ -1335,6 +1346,7 @@ class StorageDomain(object):
         self._manifest.refreshDirTree()
 
     def refresh(self):
+        chaincache.invalidate_domain(self.sdUUID)
         self._manifest.refresh()
 
     def extend(self, devlist, force):
@@ -28,6 +28,7 @@ import logging
 import threading
 
 from vdsm import utils
+from vdsm.storage import chaincache
 from vdsm.storage import exception as se
 from vdsm.storage import lvm
 from vdsm.storage import misc
@@ -199,6 +200,7 @@ class StorageDomainCache:
         self.log.info("Clearing storage domain cache")
         with self._syncroot:
             lvm.invalidateCache()
+            chaincache.clear()
             self.__domainCache.clear()
 
     def manuallyAddDomain(self, domain):
@@ -209,6 +211,7 @@ class StorageDomainCache:
 
     def manuallyRemoveDomain(self, sdUUID):
         self.log.info("Removing domain %s from storage domain cache", sdUUID)
+        chaincache.invalidate_domain(sdUUID)
         with self._syncroot:
             try:
                 del self.__domainCache[sdUUID]
@@ -30,6 +30,7 @@ from vdsm.common.marks import deprecated
 from vdsm.common.threadlocal import vars
 
 from vdsm.storage import bitmaps
+from vdsm.storage import chaincache
 from vdsm.storage import clusterlock
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
@@ -358,12 +359,14 @@ class VolumeManifest(object):
     def setLeaf(self):
         self.setMetaParam(sc.VOLTYPE, sc.type2name(sc.LEAF_VOL))
         self.voltype = sc.type2name(sc.LEAF_VOL)
+        chaincache.invalidate_image(self.sdUUID, self.imgUUID)
         self.setrw(rw=True)
         return self.voltype
 
     def setInternal(self):
         self.setMetaParam(sc.VOLTYPE, sc.type2name(sc.INTERNAL_VOL))
         self.voltype = sc.type2name(sc.INTERNAL_VOL)
+        chaincache.invalidate_image(self.sdUUID, self.imgUUID)
         self.setrw(rw=False)
         return self.voltype
 
@@ -411,6 +414,7 @@ class VolumeManifest(object):
     def setShared(self):
         self.setMetaParam(sc.VOLTYPE, sc.type2name(sc.SHARED_VOL))
         self.voltype = sc.type2name(sc.SHARED_VOL)
+        chaincache.invalidate_image(self.sdUUID, self.imgUUID)
         self.setrw(rw=False)
         return self.voltype
 
@@ -735,6 +739,10 @@ class VolumeManifest(object):
     def getImageVolumes(cls, sdUUID, imgUUID):
         raise NotImplementedError
 
+    @classmethod
+    def getImageVolumeParents(cls, sdUUID, imgUUID):
+        raise NotImplementedError
+
     @classmethod
     def newVolumeLease(cls, metaId, sdUUID, volUUID):
         raise NotImplementedError
@@ -855,6 +863,13 @@ class VolumeManifest(object):
         """
         return False
 
+    @classmethod
+    def supports_chain_cache(cls):
+        """
+        Return True if image chains can be cached, see chaincache.
+        """
+        return False
+
 
 class Volume(object):
     log = logging.getLogger('storage.Volume')
@@ -1565,6 +1580,10 @@ class Volume(object):
     def getImageVolumes(cls, sdUUID, imgUUID):
         return cls.manifestClass.getImageVolumes(sdUUID, imgUUID)
 
+    @classmethod
+    def getImageVolumeParents(cls, sdUUID, imgUUID):
+        return cls.manifestClass.getImageVolumeParents(sdUUID, imgUUID)
+
     def _extendSizeRaw(self, newSize):
         raise NotImplementedError
 
@@ -1583,6 +1602,10 @@ class Volume(object):
     def zero_initialized(cls):
         return cls.manifestClass.zero_initialized()
 
+    @classmethod
+    def supports_chain_cache(cls):
+        return cls.manifestClass.supports_chain_cache()
+
 
 class VolumeLease(guarded.AbstractLock):
     """
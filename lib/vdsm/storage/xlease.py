@@ -494,6 +494,9 @@ class Record(object):
 # Record with empty values, mark a free record in the index.
 EMPTY_RECORD = Record("", 0)
 
+# Storage format of a free record.
+EMPTY_RECORD_BYTES = EMPTY_RECORD.bytes()
+
 
 class LeasesVolume(object):
     """
@@ -643,7 +646,7 @@ class LeasesVolume(object):
         """
         log.debug("Getting all leases for lockspace %r", self.lockspace)
         leases = {}
-        for recnum in range(MAX_RECORDS):
+        for recnum in self._index.used_records():
             # Bad records will raise InvalidRecord and fail the request.
             # For dump API usage we would want to keep going over the next
             # readable records and log the exception.
@@ -800,6 +803,11 @@ class VolumeIndex(object):
     Index maintaining volume metadata and the mapping from lease id to lease
     offset.
 
+    The records are kept in a buffer in storage format. To make lookups and
+    allocations fast, we keep a mapping from lease id to record number, and a
+    bitmap of free records. They are built when loading the index, and
+    updated when writing records.
+
     Arguments:
         offset (int): offset of the index in the underlying volume
         block_size (int): storage logical block size
@@ -809,32 +817,41 @@ class VolumeIndex(object):
         self._offset = offset
         self._block_size = block_size
         self._buf = mmap.mmap(-1, INDEX_SIZE, mmap.MAP_SHARED)
+        # Lookup key (see LOOKUP_STRUCT) to record number.
+        self._lookup = {}
+        # Lookup key of every record, or None for records without a lease.
+        self._keys = [None] * MAX_RECORDS
+        # Bit n is set if record n is free.
+        self._free = 0
+        self._build_lookup()
 
     def find_record(self, lease_id):
         """
         Search for lease_id record. Returns record number if found, -1
         otherwise.
         """
-        prefix = LOOKUP_STRUCT.pack(lease_id.encode("ascii"))
-
-        # TODO: continue search if offset is not aligned to record size.
-        offset = self._buf.find(prefix, RECORD_BASE)
-        if offset == -1:
-            return -1
-
-        return self._record_number(offset)
+        key = LOOKUP_STRUCT.pack(lease_id.encode("ascii"))
+        return self._lookup.get(key, -1)
 
     def find_free_record(self):
         """
         Find the first free record. Returns record number if found, -1
         otherwise.
         """
-        # TODO: continue search if offset is not aligned to record size.
-        offset = self._buf.find(EMPTY_RECORD.bytes(), RECORD_BASE)
-        if offset == -1:
+        if self._free == 0:
             return -1
 
-        return self._record_number(offset)
+        # Isolate the lowest set bit.
+        return (self._free & -self._free).bit_length() - 1
+
+    def used_records(self):
+        """
+        Return sorted list of record numbers which are not free. Used records
+        may be invalid.
+        """
+        free = self._free
+        return [recnum for recnum in range(MAX_RECORDS)
+                if not free >> recnum & 1]
 
     def read_record(self, recnum):
         """
@@ -854,8 +871,10 @@ class VolumeIndex(object):
         storage.
         """
         offset = self._record_offset(recnum)
+        data = record.bytes()
         self._buf.seek(offset)
-        self._buf.write(record.bytes())
+        self._buf.write(data)
+        self._update_lookup(recnum, data)
 
     def read_metadata(self):
         """
@@ -887,6 +906,7 @@ class VolumeIndex(object):
         nread = file.pread(self._offset, self._buf)
         if nread < len(self._buf):
             raise TruncatedIndex(len(self._buf), nread)
+        self._build_lookup()
 
     def dump(self, file):
         """
@@ -932,12 +952,52 @@ class VolumeIndex(object):
     def close(self):
         self._buf.close()
 
+    def _build_lookup(self):
+        """
+        Build the lookup table and free records bitmap from the buffer.
+        """
+        self._lookup = {}
+        self._keys = [None] * MAX_RECORDS
+        self._free = 0
+        for recnum in range(MAX_RECORDS):
+            offset = self._record_offset(recnum)
+            self._update_lookup(recnum, self._buf[offset:offset + RECORD_SIZE])
+
+    def _update_lookup(self, recnum, data):
+        """
+        Update the lookup table and free records bitmap after record recnum
+        was changed to data.
+        """
+        old_key = self._keys[recnum]
+        if old_key is not None:
+            self._keys[recnum] = None
+            if self._lookup.get(old_key) == recnum:
+                del self._lookup[old_key]
+                # Another record may have the same lease id.
+                try:
+                    self._lookup[old_key] = self._keys.index(old_key)
+                except ValueError:
+                    pass
+
+        if data == EMPTY_RECORD_BYTES:
+            self._free |= 1 << recnum
+            return
+
+        self._free &= ~(1 << recnum)
+
+        # Records without a lease id cannot be found.
+        if data[:1] == b"\0":
+            return
+
+        key = data[:LOOKUP_STRUCT.size]
+        self._keys[recnum] = key
+        # If several records have the same lease id, find the first.
+        if self._lookup.get(key, MAX_RECORDS) > recnum:
+            self._lookup[key] = recnum
+
     def _record_offset(self, recnum):
         return RECORD_BASE + recnum * RECORD_SIZE
 
-    def _record_number(self, offset):
-        return (offset - RECORD_BASE) // RECORD_SIZE
-
 
 class ChangeBlock(object):
     """
@@ -0,0 +1,303 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Compact storage for libvirt bulk stats samples.
+
+libvirt reports the bulk stats of a domain as a flat dict, keyed by strings
+like "block.3.rd.bytes". Most of the keys are the same in every sample of
+the same domain, so keeping the dicts duplicates the keys and allocates an
+int object per value.
+
+A Layout holds the keys of a sample once, and is shared by all samples with
+the same keys. A Sample keeps the integer values in an array, and the other
+values (e.g. disk names and paths) in a tuple, and provides a read only
+mapping interface, so code using the dicts can use samples unchanged.
+
+When a sample is linked to the previous sample of the same domain, the
+changes of all counters are computed at once, and the index of the disks and
+nics are looked up once per sample instead of once per getStats call.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import operator
+import threading
+
+from array import array
+from collections.abc import Mapping
+
+# Interned layouts. Domains usually share few layouts, but hot plugging disks
+# and nics creates new ones; this is only a bound on memory.
+MAX_LAYOUTS = 4096
+
+_INT64_MIN = -2**63
+_INT64_MAX = 2**63 - 1
+
+
+def _is_counter(value):
+    # bool is an int, but we must not return 1 for True.
+    return (type(value) is int and
+            _INT64_MIN <= value <= _INT64_MAX)
+
+
+def _getter(positions):
+    """
+    Return a function returning a tuple with the items at positions.
+    """
+    if not positions:
+        return lambda values: ()
+    if len(positions) == 1:
+        pos = positions[0]
+        return lambda values: (values[pos],)
+    return operator.itemgetter(*positions)
+
+
+class Layout(object):
+    """
+    The keys of a sample, and where each value is stored.
+    """
+
+    __slots__ = ("keys", "index", "_counters", "_values", "_getters")
+
+    def __init__(self, keys, values):
+        self.keys = keys
+        # key -> position in counters, or ~position in values.
+        self.index = {}
+        counters = []
+        others = []
+        for pos, (key, value) in enumerate(zip(keys, values)):
+            if _is_counter(value):
+                self.index[key] = len(counters)
+                counters.append(pos)
+            else:
+                self.index[key] = ~len(others)
+                others.append(pos)
+        self._counters = _getter(counters)
+        self._values = _getter(others)
+        # (prefix, fields) -> getter, or None
+        self._getters = {}
+
+    def getter(self, prefix, fields):
+        """
+        Return a function returning the counters "prefix.field" for all
+        fields from a counters array, or None if some of them are not
+        counters in this layout.
+        """
+        key = (prefix, fields)
+        try:
+            return self._getters[key]
+        except KeyError:
+            pass
+        positions = []
+        for field in fields:
+            pos = self.index.get("%s.%s" % (prefix, field), -1)
+            if pos < 0:
+                getter = None
+                break
+            positions.append(pos)
+        else:
+            getter = _getter(positions)
+        self._getters[key] = getter
+        return getter
+
+    def pack(self, stats):
+        """
+        Return a Sample with the values of stats, which must have the keys
+        of this layout, in the same order.
+
+        Raises TypeError or OverflowError if a counter of this layout is not
+        a 64 bit integer in stats.
+        """
+        values = tuple(stats.values())
+        return Sample(self, array("q", self._counters(values)),
+                      self._values(values))
+
+
+class Sample(Mapping):
+    """
+    Read only mapping with the values of a bulk stats sample.
+    """
+
+    __slots__ = ("layout", "counters", "values", "_base", "_deltas",
+                 "_reverse")
+
+    def __init__(self, layout, counters, values):
+        self.layout = layout
+        self.counters = counters
+        self.values = values
+        self._base = None
+        self._deltas = None
+        self._reverse = {}
+
+    def __getitem__(self, key):
+        pos = self.layout.index[key]
+        if pos >= 0:
+            return self.counters[pos]
+        return self.values[~pos]
+
+    def __contains__(self, key):
+        return key in self.layout.index
+
+    def __iter__(self):
+        return iter(self.layout.keys)
+
+    def __len__(self):
+        return len(self.layout.keys)
+
+    def link(self, base):
+        """
+        Link this sample to base, the previous sample of the same domain,
+        computing the changes of all counters since base.
+
+        The link to the previous sample of base is dropped, so samples do
+        not keep older samples alive.
+        """
+        base._base = None
+        base._deltas = None
+        if base.layout is not self.layout:
+            return
+        try:
+            self._deltas = array(
+                "q", map(operator.sub, self.counters, base.counters))
+        except OverflowError:
+            return
+        self._base = base
+        if self.values == base.values:
+            # Same disks and nics; share the values and the reverse maps.
+            self.values = base.values
+            self._reverse = base._reverse
+
+    def delta(self, base, key):
+        """
+        Return the change of the counter key since base.
+
+        Raises KeyError if key is missing in either sample.
+        """
+        deltas = self._deltas
+        if deltas is not None and base is self._base:
+            pos = self.layout.index[key]
+            if pos >= 0:
+                return deltas[pos]
+        return self[key] - base[key]
+
+    def group_values(self, prefix, fields):
+        """
+        Return a tuple with the counters "prefix.field" for all fields, or
+        None if some of them are missing.
+        """
+        getter = self.layout.getter(prefix, fields)
+        if getter is None:
+            return None
+        return getter(self.counters)
+
+    def group_deltas(self, base, prefix, fields):
+        """
+        Return a tuple with the changes of the counters "prefix.field" since
+        base for all fields, or None if some of them are missing, or the
+        changes since base were not computed.
+        """
+        deltas = self._deltas
+        if deltas is None or base is not self._base:
+            return None
+        getter = self.layout.getter(prefix, fields)
+        if getter is None:
+            return None
+        return getter(deltas)
+
+    def reverse_map(self, group):
+        """
+        Return a dict mapping the names of the group members to their
+        indexes. The returned dict is cached and must not be modified.
+        """
+        name_to_idx = self._reverse.get(group)
+        if name_to_idx is None:
+            name_to_idx = reverse_map(self, group)
+            self._reverse[group] = name_to_idx
+        return name_to_idx
+
+
+class Packer(object):
+    """
+    Pack bulk stats dicts into samples, interning the layouts.
+    """
+
+    def __init__(self, max_layouts=MAX_LAYOUTS):
+        self._max_layouts = max_layouts
+        self._lock = threading.Lock()
+        self._layouts = {}
+
+    def pack(self, stats):
+        keys = tuple(stats)
+        layout = self._layouts.get(keys)
+        if layout is None:
+            layout = Layout(keys, tuple(stats.values()))
+            with self._lock:
+                if len(self._layouts) >= self._max_layouts:
+                    self._layouts.clear()
+                layout = self._layouts.setdefault(keys, layout)
+        try:
+            return layout.pack(stats)
+        except (TypeError, OverflowError):
+            # A value changed its type, or does not fit in 64 bits. Keep
+            # this sample on its own layout.
+            return Layout(keys, tuple(stats.values())).pack(stats)
+
+    def pack_batch(self, bulk_stats):
+        """
+        Pack a batch of {vm_id: stats} and return {vm_id: sample}. Stats
+        which are not dicts are kept as is.
+        """
+        return {vm_id: self.pack(stats) if isinstance(stats, dict) else stats
+                for vm_id, stats in bulk_stats.items()}
+
+    def __len__(self):
+        return len(self._layouts)
+
+
+def link_batch(batch, last_batch):
+    """
+    Link the samples in batch to the samples of the same vms in last_batch,
+    computing the changes of all counters of all vms at once.
+    """
+    for vm_id, sample in batch.items():
+        base = last_batch.get(vm_id)
+        if isinstance(sample, Sample) and isinstance(base, Sample):
+            sample.link(base)
+
+
+def reverse_map(stats, group):
+    """
+    Return a dict mapping the names of the group members (e.g. "block" or
+    "net") in stats to their indexes.
+    """
+    name_to_idx = {}
+    for idx in range(stats.get('%s.count' % group, 0)):
+        try:
+            name = stats['%s.%d.name' % (group, idx)]
+        except KeyError:
+            # Bulk stats accumulate what they can get, raising errors
+            # only in the critical cases. This includes fundamental
+            # attributes like names, so count has to be considered
+            # an upper bound more like a precise indicator.
+            pass
+        else:
+            name_to_idx[name] = idx
+    return name_to_idx
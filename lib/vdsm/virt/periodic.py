@@ -41,6 +41,7 @@ from vdsm.config import config
 from vdsm.virt import migration
 from vdsm.virt import recovery
 from vdsm.virt import sampling
+from vdsm.virt import statsstream
 from vdsm.virt import virdomain
 from vdsm.virt import vmstatus
 from vdsm.virt.externaldata import ExternalDataKind
@@ -485,12 +486,14 @@ def _create(cif, scheduler):
                 sampling.VMBulkstatsMonitor(
                     libvirtconnection.get(cif),
                     cif.getVMs,
-                    sampling.stats_cache),
+                    sampling.stats_cache,
+                    publisher=statsstream.Publisher(
+                        cif, config.getint('vars', 'vm_sample_interval'))),
                 config.getint('vars', 'vm_sample_interval'),
                 scheduler),
 
             Operation(
-                sampling.HostMonitor(cif=cif),
+                sampling.HostMonitor(cif=cif, history=sampling.host_history),
                 config.getint('vars', 'host_sample_stats_interval'),
                 scheduler,
                 timeout=config.getint('vars', 'host_sample_stats_interval'),
@@ -22,11 +22,15 @@ from __future__ import absolute_import
 from __future__ import division
 
 import logging
+import os
 
 import libvirt
 
+from vdsm.common import concurrent
 from vdsm.common import libvirtconnection
 from vdsm.common import response
+from vdsm.common.time import Clock
+from vdsm.config import config
 from vdsm.virt import vmchannels
 from vdsm.virt import vmstatus
 from vdsm.virt import vmxml
@@ -38,7 +42,7 @@ def _is_external_vm(dom_xml):
             not vmxml.has_vdsm_metadata(dom_xml))
 
 
-def _is_ignored_vm(dom_uuid, dom_obj, dom_xml):
+def _is_ignored_vm(dom_uuid, dom_obj, dom_xml, external):
     """
     Return true iff the given VM should never be displayed to users.
 
@@ -46,7 +50,7 @@ def _is_ignored_vm(dom_uuid, dom_obj, dom_xml):
     """
     if vmxml.has_channel(dom_xml, vmchannels.GUESTFS_DEVICE_NAME):
         return True
-    if _is_external_vm(dom_xml):
+    if external:
         try:
             state, reason = dom_obj.state(0)
         except libvirt.libvirtError as e:
@@ -60,27 +64,53 @@ def _is_ignored_vm(dom_uuid, dom_obj, dom_xml):
     return False
 
 
-def _list_domains():
+def max_workers():
+    """
+    Return the maximum number of threads used for recovery.
+    """
+    workers = config.getint('vars', 'recovery_workers')
+    if workers < 1:
+        workers = os.sysconf('SC_NPROCESSORS_ONLN')
+    return workers
+
+
+def _list_domains(max_workers=1):
     conn = libvirtconnection.get()
+    # Getting the domain XML is a libvirt call per domain; using several
+    # workers keeps more calls in flight.
+    results = list(concurrent.tmap(
+        _describe_domain, conn.listAllDomains(), max_workers=max_workers,
+        name="recovery/list"))
     domains = []
-    for dom_obj in conn.listAllDomains():
-        dom_uuid = 'unknown'
-        try:
-            dom_uuid = dom_obj.UUIDString()
-            logging.debug("Found domain %s", dom_uuid)
-            dom_xml = dom_obj.XMLDesc(0)
-        except libvirt.libvirtError as e:
-            if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
-                logging.exception("domain %s is dead", dom_uuid)
-            else:
-                raise
-        else:
-            if _is_ignored_vm(dom_uuid, dom_obj, dom_xml):
-                continue
-            domains.append((dom_obj, dom_xml, _is_external_vm(dom_xml),))
+    for res in results:
+        if not res.succeeded:
+            raise res.value
+        if res.value is not None:
+            domains.append(res.value)
     return domains
 
 
+def _describe_domain(dom_obj):
+    """
+    Return (dom_obj, dom_xml, external) tuple, or None if the domain is dead
+    or should be ignored.
+    """
+    dom_uuid = 'unknown'
+    try:
+        dom_uuid = dom_obj.UUIDString()
+        logging.debug("Found domain %s", dom_uuid)
+        dom_xml = dom_obj.XMLDesc(0)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+            logging.exception("domain %s is dead", dom_uuid)
+            return None
+        raise
+    external = _is_external_vm(dom_xml)
+    if _is_ignored_vm(dom_uuid, dom_obj, dom_xml, external):
+        return None
+    return dom_obj, dom_xml, external
+
+
 def _recover_domain(cif, vm_id, dom_xml, external):
     external_str = " (external)" if external else ""
     cif.log.debug("recovery: trying with VM%s %s", external_str, vm_id)
@@ -112,27 +142,58 @@ def _recovery_params(vm_id, dom_xml, external):
     return params
 
 
-def all_domains(cif):
-    doms = _list_domains()
+def all_domains(cif, clock=None):
+    """
+    Recover the domains running on the host, recording the time of the
+    "list" and "recover" phases in clock.
+
+    Domains are listed and recovered by up to max_workers() threads, so the
+    libvirt calls and the creation of Vm objects for many domains overlap.
+    """
+    if clock is None:
+        clock = Clock()
+    workers = max_workers()
+
+    with clock.run("list"):
+        doms = _list_domains(workers)
     num_doms = len(doms)
-    for idx, (dom_obj, dom_xml, external) in enumerate(doms):
-        vm_id = dom_obj.UUIDString()
-        if _recover_domain(cif, vm_id, dom_xml, external):
-            cif.log.info(
-                'recovery [1:%d/%d]: recovered domain %s',
-                idx + 1, num_doms, vm_id)
-        elif external:
-            cif.log.info("Failed to recover external domain: %s" % (vm_id,))
-        else:
-            cif.log.info(
-                'recovery [1:%d/%d]: loose domain %s found, killing it.',
-                idx + 1, num_doms, vm_id)
-            try:
-                dom_obj.destroy()
-            except libvirt.libvirtError:
-                cif.log.exception(
-                    'recovery [1:%d/%d]: failed to kill loose domain %s',
+    cif.log.info("recovery: found %d domains, using %d workers",
+                 num_doms, workers)
+
+    with clock.run("recover"):
+        results = concurrent.tmap(
+            lambda dom: _recover_listed_domain(cif, *dom),
+            doms, max_workers=workers, name="recovery")
+        for idx, res in enumerate(results):
+            if not res.succeeded:
+                cif.log.error(
+                    'recovery [1:%d/%d]: unexpected error: %s',
+                    idx + 1, num_doms, res.value)
+                continue
+            dom_obj, vm_id, external, recovered = res.value
+            if recovered:
+                cif.log.info(
+                    'recovery [1:%d/%d]: recovered domain %s',
+                    idx + 1, num_doms, vm_id)
+            elif external:
+                cif.log.info("Failed to recover external domain: %s" %
+                             (vm_id,))
+            else:
+                cif.log.info(
+                    'recovery [1:%d/%d]: loose domain %s found, killing it.',
                     idx + 1, num_doms, vm_id)
+                try:
+                    dom_obj.destroy()
+                except libvirt.libvirtError:
+                    cif.log.exception(
+                        'recovery [1:%d/%d]: failed to kill loose domain %s',
+                        idx + 1, num_doms, vm_id)
+
+
+def _recover_listed_domain(cif, dom_obj, dom_xml, external):
+    vm_id = dom_obj.UUIDString()
+    recovered = _recover_domain(cif, vm_id, dom_xml, external)
+    return dom_obj, vm_id, external, recovered
 
 
 def lookup_external_vms(cif):
@@ -149,7 +210,7 @@ def lookup_external_vms(cif):
                 logging.exception("Failed to retrieve external VM: %s", vm_id)
                 cif.add_unknown_vm_id(vm_id)
                 continue
-        if _is_ignored_vm(vm_id, dom_obj, dom_xml):
+        if _is_ignored_vm(vm_id, dom_obj, dom_xml, _is_external_vm(dom_xml)):
             continue
         logging.debug("Recovering external domain: %s", vm_id)
         if _recover_domain(cif, vm_id, dom_xml, True):
@@ -44,6 +44,10 @@ from vdsm.common.units import KiB, MiB
 from vdsm.config import config
 from vdsm.constants import P_VDSM_RUN
 from vdsm.host import api as hostapi
+from vdsm.host import stats as hoststats
+from vdsm.virt import bulkstats
+from vdsm.virt import statshistory
+from vdsm.virt import vmstats
 from vdsm.virt.utils import ExpiringCache
 
 
@@ -52,6 +56,7 @@ if not os.path.exists(_THP_STATE_PATH):
     _THP_STATE_PATH = '/sys/kernel/mm/redhat_transparent_hugepage/enabled'
 _METRICS_ENABLED = config.getboolean('metrics', 'enabled')
 _NOWAIT_ENABLED = config.getboolean('vars', 'nowait_domain_stats')
+_HISTORY_SIZE = config.getint('vars', 'stats_history_size')
 
 
 class TotalCpuSample(object):
@@ -278,16 +283,26 @@ class StatsCache(object):
     to take the sample timestamp BEFORE to start the possibly-blocking call.
     If we take the timestamp after the call, we have no means to distinguish
     between a well behaving call and an unblocked stuck call.
+
+    Samples are stored as bulkstats.Sample, sharing the stats keys between
+    samples of vms with the same devices, and keeping the values in arrays.
+    The changes of the counters since the previous sample are computed for
+    all vms when a sample is added.
+
+    If history is specified, the vmstats.HISTORY_METRICS of every vm are
+    appended to it when a sample is added.
     """
 
     _log = logging.getLogger("virt.sampling.StatsCache")
 
-    def __init__(self, clock=vdsm.common.time.monotonic_time):
+    def __init__(self, clock=vdsm.common.time.monotonic_time, history=None):
         self._clock = clock
+        self._history = history
         self._lock = threading.Lock()
         self._samples = SampleWindow(size=2, timefn=self._clock)
         self._last_sample_time = 0
         self._vm_last_timestamp = defaultdict(int)
+        self._packer = bulkstats.Packer()
 
     def add(self, vmid):
         """
@@ -304,6 +319,8 @@ class StatsCache(object):
         """
         with self._lock:
             del self._vm_last_timestamp[vmid]
+        if self._history is not None:
+            self._history.remove(vmid)
 
     def get(self, vmid):
         """
@@ -360,17 +377,43 @@ class StatsCache(object):
         returned by unblocked stuck calls, to avoid overwrite fresh data
         with stale one.
         """
+        bulk_stats = self._packer.pack_batch(bulk_stats)
         with self._lock:
             last_sample_time = self._last_sample_time
             if monotonic_ts >= last_sample_time:
+                _, last_batch = self._samples.last()
+                if last_batch is not None:
+                    bulkstats.link_batch(bulk_stats, last_batch)
                 self._samples.append(bulk_stats)
                 self._last_sample_time = monotonic_ts
 
                 self._update_ts(bulk_stats, monotonic_ts)
+                first_batch, last_batch, interval = self._samples.stats()
             else:
                 self._log.warning(
                     'dropped stale old sample: sampled %f stored %f',
                     monotonic_ts, last_sample_time)
+                return
+
+        if self._history is not None and first_batch is not None:
+            self._update_history(first_batch, last_batch, interval,
+                                 monotonic_ts)
+
+    def _update_history(self, first_batch, last_batch, interval,
+                        monotonic_ts):
+        for vm_id, last_sample in six.iteritems(last_batch):
+            first_sample = first_batch.get(vm_id)
+            if first_sample is None or vm_id not in self._vm_last_timestamp:
+                # Removed from the cache.
+                continue
+            try:
+                values = vmstats.history_values(
+                    first_sample, last_sample, interval)
+            except Exception:
+                self._log.exception("Error computing stats history of vm %s",
+                                    vm_id)
+            else:
+                self._history.append(vm_id, values, monotonic_ts)
 
     def _update_ts(self, bulk_stats, monotonic_ts):
         # FIXME: this is expected to be costly performance-wise.
@@ -378,7 +421,9 @@ class StatsCache(object):
             self._vm_last_timestamp[vmid] = monotonic_ts
 
 
-stats_cache = StatsCache()
+vm_history = statshistory.HistoryMap(vmstats.HISTORY_METRICS, _HISTORY_SIZE)
+
+stats_cache = StatsCache(history=vm_history)
 
 
 # this value can be tricky to tune.
@@ -403,10 +448,11 @@ BULK_STATS_TYPES = (
 
 class VMBulkstatsMonitor(object):
     def __init__(self, conn, get_vms, stats_cache,
-                 stats_types=BULK_STATS_TYPES, ttl=_TTL):
+                 stats_types=BULK_STATS_TYPES, ttl=_TTL, publisher=None):
         self._conn = conn
         self._get_vms = get_vms
         self._stats_cache = stats_cache
+        self._publisher = publisher
         self._stats_types = stats_types
         self._skip_doms = ExpiringCache(ttl)
         self._sampling = threading.Semaphore()  # used as glorified counter
@@ -451,6 +497,11 @@ class VMBulkstatsMonitor(object):
                 'sampled timestamp %r elapsed %.3f acquired %r domains %s',
                 timestamp, self._stats_cache.clock() - timestamp, acquired,
                 'all' if fast_path else len(responsive_doms))
+            if self._publisher is not None:
+                try:
+                    self._publisher(self._get_vms, self._stats_cache)
+                except Exception:
+                    self._log.exception("vm stats publishing failed")
 
     def _get_responsive_doms(self):
         vms = self._get_vms()
@@ -474,18 +525,27 @@ HOST_STATS_AVERAGING_WINDOW = 2
 
 host_samples = SampleWindow(size=HOST_STATS_AVERAGING_WINDOW)
 
+host_history = statshistory.History(hoststats.HISTORY_METRICS, _HISTORY_SIZE)
+
 
 class HostMonitor(object):
 
-    def __init__(self, samples=host_samples, cif=None):
+    def __init__(self, samples=host_samples, cif=None, history=None):
         self._samples = samples
         self._pid = os.getpid()
         self._cif = cif
+        self._history = history
 
     def __call__(self):
         sample = HostSample(self._pid)
         self._samples.append(sample)
 
+        if self._history is not None:
+            _, previous = self._samples.last(nth=2)
+            if previous is not None:
+                self._history.append(
+                    hoststats.history_values(previous, sample))
+
         if self._cif and _METRICS_ENABLED:
             stats = hostapi.get_stats(self._cif, self._samples.stats())
             hostapi.send_metrics(stats)
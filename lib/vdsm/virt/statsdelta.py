@@ -0,0 +1,166 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Tracking changes in VM stats.
+
+Host.getAllVmStats returns the stats of all VMs. A client polling the stats
+can use Host.getChangedVmStats instead, passing the cursor returned by the
+previous call. The reply includes only the stats of VMs changed since the
+cursor, and the ids of VMs removed since then.
+
+Every VM has a generation: the value of a host wide counter when its stats
+changed. A cursor is the value of the counter when it was returned, so the
+VMs changed since the cursor are the VMs with a larger generation.
+
+elapsedTime, statusTime and the sampleTime of every network interface
+change on every call, so they are not compared. They are reported only with
+other changes.
+
+The stats of all VMs are still produced and compared on every call, so the
+CPU cost of a call grows with the number of VMs. Only the reply, and the
+work done on it (e.g. hooks, encoding and sending), grows with the number
+of changed VMs.
+
+If the cursor is not known, for example a cursor from a previous vdsm run,
+or too old to know which VMs were removed since then, the reply includes the
+stats of all VMs, and "full" is True. The client should drop the VMs not
+included in the reply.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import collections
+import threading
+import uuid
+
+# Stats changing on every call.
+VOLATILE = frozenset(("elapsedTime", "statusTime"))
+
+# Network interface stats changing on every call.
+VOLATILE_NIC = frozenset(("sampleTime",))
+
+# Number of removed VMs to remember. Clients using older cursors get the
+# stats of all VMs.
+MAX_REMOVED = 1000
+
+
+class Tracker(object):
+
+    def __init__(self, max_removed=MAX_REMOVED):
+        self._max_removed = max_removed
+        self._lock = threading.Lock()
+        # Cursors of another tracker are not valid.
+        self._id = uuid.uuid4().hex[:8]
+        self._generation = 0
+        # vm_id -> (generation, compared stats)
+        self._vms = {}
+        # vm_id -> generation when the vm was removed, oldest first.
+        self._removed = collections.OrderedDict()
+        # Cursors older than this may have missed removed VMs.
+        self._oldest = 0
+
+    def update(self, stats_list, cursor=None):
+        """
+        Update the tracker with the current stats of all VMs, and return the
+        changes since cursor:
+
+            {
+                "cursor": cursor for the next call,
+                "full": True if statsList includes all VMs,
+                "statsList": stats of VMs changed since cursor,
+                "removed": ids of VMs removed since cursor,
+            }
+        """
+        with self._lock:
+            self._update(stats_list)
+            since = self._parse(cursor)
+            if since is None:
+                changed = list(stats_list)
+                removed = []
+            else:
+                changed = [stats for stats in stats_list
+                           if self._vms[stats["vmId"]][0] > since]
+                removed = [vm_id for vm_id, gen in self._removed.items()
+                           if gen > since]
+            return {
+                "cursor": "%s:%d" % (self._id, self._generation),
+                "full": since is None,
+                "statsList": changed,
+                "removed": removed,
+            }
+
+    def _update(self, stats_list):
+        generation = self._generation + 1
+        changes = False
+        seen = set()
+
+        for stats in stats_list:
+            vm_id = stats["vmId"]
+            seen.add(vm_id)
+            current = _compared(stats)
+            last = self._vms.get(vm_id)
+            if last is None or last[1] != current:
+                self._vms[vm_id] = (generation, current)
+                self._removed.pop(vm_id, None)
+                changes = True
+
+        for vm_id in list(self._vms):
+            if vm_id not in seen:
+                del self._vms[vm_id]
+                self._removed[vm_id] = generation
+                changes = True
+
+        while len(self._removed) > self._max_removed:
+            _, gen = self._removed.popitem(last=False)
+            self._oldest = gen
+
+        if changes:
+            self._generation = generation
+
+    def _parse(self, cursor):
+        """
+        Return the generation of cursor, or None if the cursor is not valid.
+        """
+        if cursor is None:
+            return None
+        try:
+            tracker_id, generation = cursor.split(":", 1)
+            generation = int(generation)
+        except (AttributeError, ValueError):
+            return None
+        if tracker_id != self._id:
+            return None
+        if generation > self._generation or generation < self._oldest:
+            return None
+        return generation
+
+
+def _compared(stats):
+    """
+    Return the stats compared to detect changes, without the volatile stats.
+    """
+    compared = {k: v for k, v in stats.items() if k not in VOLATILE}
+    network = compared.get("network")
+    if network:
+        compared["network"] = {
+            name: {k: v for k, v in nic.items() if k not in VOLATILE_NIC}
+            for name, nic in network.items()}
+    return compared
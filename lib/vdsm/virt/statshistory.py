@@ -0,0 +1,190 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+History of host and VM stats.
+
+The stats caches keep only the last two samples, enough to compute the
+current rates. A History keeps the last N values of a fixed set of metrics in
+preallocated arrays, so clients can get the minimum, average, maximum and
+percentiles of the metrics over a window, instead of polling the current
+stats at the sampling interval.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import math
+import threading
+
+from array import array
+
+from vdsm.common.time import monotonic_time
+
+PERCENTILES = (50, 90, 99)
+
+_NAN = float("nan")
+
+
+class History(object):
+    """
+    Ring buffer with the last size values of metrics.
+    """
+
+    def __init__(self, metrics, size, clock=monotonic_time):
+        self._metrics = tuple(metrics)
+        self._size = size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._times = array("d", [0.0]) * size
+        self._columns = {name: array("d", [_NAN]) * size
+                         for name in self._metrics}
+        # Number of samples appended since the history was created.
+        self._count = 0
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def append(self, values, timestamp=None):
+        """
+        Append a sample of the metrics. Metrics missing in values are
+        recorded as missing, and are not included in the aggregates.
+        """
+        if self._size == 0:
+            return
+        if timestamp is None:
+            timestamp = self._clock()
+        with self._lock:
+            pos = self._count % self._size
+            self._times[pos] = timestamp
+            for name, column in self._columns.items():
+                column[pos] = values.get(name, _NAN)
+            self._count += 1
+
+    def aggregate(self, window=None, metrics=None):
+        """
+        Return the aggregates of metrics over the samples appended in the
+        last window seconds, or all samples if window is not specified:
+
+            {name: {"count": 3, "min": 1.0, "avg": 2.0, "max": 3.0,
+                    "p50": 2.0, "p90": 3.0, "p99": 3.0}}
+
+        Unknown metrics are ignored.
+        """
+        if metrics:
+            metrics = [name for name in metrics if name in self._columns]
+        else:
+            metrics = self._metrics
+        with self._lock:
+            positions = self._window(window)
+            samples = {name: [self._columns[name][pos] for pos in positions]
+                       for name in metrics}
+        # Missing values are NaN, not equal to themselves.
+        return {name: summary([v for v in values if v == v])
+                for name, values in samples.items()}
+
+    def _window(self, window):
+        """
+        Return the positions of the samples in window, newest first. Must be
+        called when holding the lock.
+        """
+        available = min(self._count, self._size)
+        newest = self._count - 1
+        positions = [(newest - i) % self._size for i in range(available)]
+        if window:
+            since = self._clock() - window
+            for i, pos in enumerate(positions):
+                if self._times[pos] < since:
+                    del positions[i:]
+                    break
+        return positions
+
+
+class HistoryMap(object):
+    """
+    Histories of the same metrics for many items (e.g. VMs). The history of
+    an item is allocated when the first sample is appended.
+    """
+
+    def __init__(self, metrics, size, clock=monotonic_time):
+        self._metrics = tuple(metrics)
+        self._size = size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._histories = {}
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def append(self, key, values, timestamp=None):
+        if self._size == 0:
+            return
+        history = self._histories.get(key)
+        if history is None:
+            with self._lock:
+                history = self._histories.get(key)
+                if history is None:
+                    history = History(self._metrics, self._size, self._clock)
+                    self._histories[key] = history
+        history.append(values, timestamp)
+
+    def remove(self, key):
+        with self._lock:
+            self._histories.pop(key, None)
+
+    def aggregate(self, keys=None, window=None, metrics=None):
+        """
+        Return {key: aggregates} for keys, or for all items if keys are not
+        specified. Unknown keys are ignored.
+        """
+        with self._lock:
+            if keys:
+                histories = {key: self._histories[key] for key in keys
+                             if key in self._histories}
+            else:
+                histories = dict(self._histories)
+        return {key: history.aggregate(window, metrics)
+                for key, history in histories.items()}
+
+
+def summary(values):
+    """
+    Return the count, minimum, average, maximum and percentiles of values.
+    """
+    if not values:
+        info = {"count": 0, "min": 0.0, "avg": 0.0, "max": 0.0}
+        for p in PERCENTILES:
+            info["p%d" % p] = 0.0
+        return info
+
+    values = sorted(values)
+    count = len(values)
+    info = {
+        "count": count,
+        "min": values[0],
+        "avg": math.fsum(values) / count,
+        "max": values[-1],
+    }
+    for p in PERCENTILES:
+        # Nearest rank.
+        rank = max(int(math.ceil(p / 100 * count)), 1)
+        info["p%d" % p] = values[rank - 1]
+    return info
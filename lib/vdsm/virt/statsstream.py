@@ -0,0 +1,195 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+"""
+Streaming of VM stats to STOMP subscriptions.
+
+Instead of polling Host.getAllVmStats, clients can subscribe to the VM stats
+destination. After each VM sampling, the stats of all VMs are produced once,
+and sent to the subscriptions as a |virt|VM_stats| event.
+
+A subscription can use these SUBSCRIBE frame headers:
+
+    vdsm-stats-interval: Minimal number of seconds between events. Since
+        events are sent only after sampling, the interval is rounded to the
+        sampling interval. The default is to send an event after every
+        sampling.
+
+    vdsm-stats-fields: Comma separated list of stats to send, e.g.
+        "cpuUser,cpuSys,disks". The vmId is always sent. The default is to
+        send all the stats.
+
+Subscriptions with the same fields share the same encoded message.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import logging
+import threading
+import weakref
+
+from vdsm.common.time import monotonic_time
+from vdsm.config import config
+from vdsm.virt import vmstats
+from yajsonrpc import Notification
+from yajsonrpc import stomp
+
+EVENT_ID = '|virt|VM_stats|no_id'
+
+
+class Publisher(object):
+    """
+    Publish VM stats to the subscriptions to destination, sent by the
+    jsonrpc server of cif.
+    """
+
+    def __init__(self, cif, sample_interval,
+                 destination=config.get('addresses', 'vm_stats_queue'),
+                 clock=monotonic_time):
+        self._cif = cif
+        self._sample_interval = sample_interval
+        self._destination = destination
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Subscription options and last event time, dropped when the
+        # subscription is removed.
+        self._state = weakref.WeakKeyDictionary()
+        self._log = logging.getLogger("virt.statsstream.Publisher")
+
+    @property
+    def destination(self):
+        return self._destination
+
+    def __call__(self, get_vms, stats_cache):
+        """
+        Send the current stats in stats_cache of the VMs returned by get_vms
+        to the subscriptions due for an event.
+        """
+        json_binding = self._json_binding()
+        if json_binding is None:
+            return
+
+        server = json_binding.reactor.server
+        subscriptions = server.subscriptions.find(self._destination)
+        if not subscriptions:
+            return
+
+        groups = self._due(subscriptions)
+        if not groups:
+            return
+
+        batch = stats_cache.get_batch()
+        if not batch:
+            return
+
+        stats_list = produce(get_vms(), batch)
+
+        for fields, group in groups.items():
+            if fields is None:
+                selected = stats_list
+            else:
+                selected = [{k: v for k, v in stats.items()
+                             if k in fields or k == 'vmId'}
+                            for stats in stats_list]
+
+            def send(message, group=group):
+                server.send(message, self._destination, subscriptions=group)
+
+            try:
+                notification = Notification(
+                    EVENT_ID, send, json_binding.bridge.event_schema)
+                notification.emit({'statsList': selected})
+            except Exception:
+                self._log.exception("Cannot send VM stats to %d "
+                                    "subscriptions", len(group))
+
+    def _json_binding(self):
+        if not self._cif.ready:
+            return None
+        return self._cif.servers.get('jsonrpc')
+
+    def _due(self, subscriptions):
+        """
+        Return the subscriptions due for an event, grouped by fields.
+        """
+        now = self._clock()
+        # Sampling is not exact, avoid skipping a sample taken a bit too
+        # early.
+        slack = self._sample_interval / 2
+        groups = {}
+        with self._lock:
+            for sub in subscriptions:
+                if sub.client.is_closed():
+                    continue
+                state = self._state.get(sub)
+                if state is None:
+                    state = self._state[sub] = _SubscriptionState(
+                        sub, self._log)
+                elif now - state.last_sent + slack < state.interval:
+                    continue
+                state.last_sent = now
+                groups.setdefault(state.fields, []).append(sub)
+        return groups
+
+
+class _SubscriptionState(object):
+
+    __slots__ = ('interval', 'fields', 'last_sent')
+
+    def __init__(self, sub, log):
+        headers = sub.headers
+        self.interval = 0
+        self.fields = None
+        self.last_sent = None
+
+        value = headers.get(stomp.Headers.STATS_INTERVAL)
+        if value:
+            try:
+                self.interval = max(int(value), 0)
+            except ValueError:
+                log.warning("Ignoring invalid %s header %r for "
+                            "subscription %s", stomp.Headers.STATS_INTERVAL,
+                            value, sub.id)
+
+        value = headers.get(stomp.Headers.STATS_FIELDS)
+        if value:
+            fields = frozenset(f.strip() for f in value.split(','))
+            self.fields = fields - {''} or None
+
+
+def produce(vms, batch):
+    """
+    Return the stats of the VMs in batch, as reported by Host.getAllVmStats.
+    """
+    log = logging.getLogger("virt.statsstream")
+    stats_list = []
+    for vm_id, sample in batch.items():
+        vm = vms.get(vm_id)
+        if vm is None:
+            continue
+        try:
+            stats = vmstats.translate(vmstats.produce(
+                vm, sample.first_value, sample.last_value, sample.interval))
+        except Exception:
+            log.exception("Error producing stats for VM %s", vm_id)
+            continue
+        stats['vmId'] = vm_id
+        stats_list.append(stats)
+    return stats_list
@@ -379,6 +379,8 @@ class Vm(object):
         self.cif = cif
         self._custom = {'vmId': self.id}
         self._exit_info = {}
+        # name -> (domain descriptor, stats), see _domain_stats().
+        self._domain_stats_cache = {}
         self._cluster_version = None
         self._pause_time = None
         self._guest_agent_api_version = None
@@ -1840,12 +1842,25 @@ class Vm(object):
         Please note that some values are provided by client (engine)
         but can change as a result of interaction with libvirt
         """
-        stats = {
+        return self._domain_stats('config', lambda domain: {
             'vmId': self.id,
-            'vmName': self.name,
-            'vmType': self._domain.vm_type(),
+            'vmName': domain.name,
+            'vmType': domain.vm_type(),
             'kvmEnable': 'true',
-            'acpiEnable': 'true' if self.acpi_enabled() else 'false'}
+            'acpiEnable': 'true' if domain.acpi_enabled() else 'false'})
+
+    def _domain_stats(self, name, produce):
+        """
+        Return the stats returned by produce(domain), computed again only
+        when the domain descriptor is replaced. The returned dict must not be
+        modified.
+        """
+        domain = self._domain
+        cached = self._domain_stats_cache.get(name)
+        if cached is not None and cached[0] is domain:
+            return cached[1]
+        stats = produce(domain)
+        self._domain_stats_cache[name] = (domain, stats)
         return stats
 
     def _getRunningVmStats(self):
@@ -2064,7 +2079,8 @@ class Vm(object):
         return self.migrateStatus()['progress']
 
     def _getGraphicsStats(self):
-        return {'displayInfo': vmdevices.graphics.display_info(self.domain)}
+        return self._domain_stats('graphics', lambda domain: {
+            'displayInfo': vmdevices.graphics.display_info(domain)})
 
     def _getGuestStats(self):
         stats = self.guestAgent.getGuestInfo()
@@ -29,12 +29,21 @@ import six
 from vdsm.common.time import monotonic_time
 from vdsm.utils import convertToStr
 
+from vdsm.virt import bulkstats
 from vdsm.virt.utils import isVdsmImage
 
 
 _log = logging.getLogger('virt.vmstats')
 
 
+# Disk counters used to compute rates and latencies.
+_DISK_COUNTERS = ('rd.bytes', 'wr.bytes',
+                  'rd.reqs', 'wr.reqs', 'fl.reqs',
+                  'rd.times', 'wr.times', 'fl.times')
+
+_DISK_IOPS_BYTES = ('rd.reqs', 'wr.reqs', 'rd.bytes', 'wr.bytes')
+
+
 def produce(vm, first_sample, last_sample, interval):
     """
     Translates vm samples into stats.
@@ -53,6 +62,68 @@ def produce(vm, first_sample, last_sample, interval):
     return stats
 
 
+# Metrics recorded in the stats history.
+HISTORY_METRICS = (
+    'cpuUser',
+    'cpuSys',
+    'memUsage',
+    'diskReadRate',
+    'diskWriteRate',
+    'diskReadOps',
+    'diskWriteOps',
+    'netRxRate',
+    'netTxRate',
+)
+
+
+def history_values(first_sample, last_sample, interval):
+    """
+    Return the values of HISTORY_METRICS, as numbers. Disk and network rates
+    are the totals of all the disks and nics in both samples, per second.
+    """
+    if interval <= 0:
+        return {}
+
+    values = {}
+
+    stats = {}
+    if cpu(stats, first_sample, last_sample, interval) is not None:
+        values['cpuUser'] = stats['cpuUser']
+        values['cpuSys'] = stats['cpuSys']
+
+    available = last_sample.get('balloon.available', 0)
+    if available and 'balloon.unused' in last_sample:
+        values['memUsage'] = (
+            100 * (available - last_sample['balloon.unused']) / available)
+
+    for group, metrics in (
+            ('block', (('diskReadRate', 'rd.bytes'),
+                       ('diskWriteRate', 'wr.bytes'),
+                       ('diskReadOps', 'rd.reqs'),
+                       ('diskWriteOps', 'wr.reqs'))),
+            ('net', (('netRxRate', 'rx.bytes'),
+                     ('netTxRate', 'tx.bytes')))):
+        first_indexes = _find_bulk_stats_reverse_map(first_sample, group)
+        last_indexes = _find_bulk_stats_reverse_map(last_sample, group)
+        totals = dict.fromkeys((name for name, _ in metrics), 0)
+        for device, last_index in last_indexes.items():
+            first_index = first_indexes.get(device)
+            if first_index is None:
+                continue
+            for name, field in metrics:
+                try:
+                    totals[name] += _delta(
+                        first_sample, '%s.%d.%s' % (group, first_index, field),
+                        last_sample, '%s.%d.%s' % (group, last_index, field))
+                except KeyError:
+                    pass
+        if last_indexes:
+            for name, total in totals.items():
+                values[name] = total / interval
+
+    return values
+
+
 def translate(vm_stats):
     stats = {}
 
@@ -136,13 +207,14 @@ def cpu(stats, first_sample, last_sample, interval):
         stats['cpuUsage'] = str(last_sample['cpu.system'] +
                                 last_sample['cpu.user'])
 
-        cpu_sys = ((last_sample['cpu.user'] - first_sample['cpu.user']) +
-                   (last_sample['cpu.system'] - first_sample['cpu.system']))
+        cpu_sys = (_delta(first_sample, 'cpu.user', last_sample, 'cpu.user') +
+                   _delta(first_sample, 'cpu.system',
+                          last_sample, 'cpu.system'))
         stats['cpuSys'] = _usage_percentage(cpu_sys, interval)
 
         if all('cpu.time' in s for s in samples):
             stats['cpuUser'] = _usage_percentage(
-                ((last_sample['cpu.time'] - first_sample['cpu.time']) -
+                (_delta(first_sample, 'cpu.time', last_sample, 'cpu.time') -
                  cpu_sys),
                 interval)
 
@@ -353,22 +425,41 @@ def disk_info(vm_drive):
 
 
 def _disk_rate(first_sample, first_index, last_sample, last_index, interval):
+    deltas = _disk_deltas(first_sample, first_index, last_sample, last_index)
+    if deltas is not None:
+        return {
+            'readRate': str(deltas[0] / interval),
+            'writeRate': str(deltas[1] / interval),
+        }
+
     stats = {}
 
     for name, mode in (("readRate", "rd"), ("writeRate", "wr")):
         first_key = 'block.%d.%s.bytes' % (first_index, mode)
         last_key = 'block.%d.%s.bytes' % (last_index, mode)
         try:
-            first_value = first_sample[first_key]
-            last_value = last_sample[last_key]
+            value = _delta(first_sample, first_key, last_sample, last_key)
         except KeyError:
             continue
-        stats[name] = str((last_value - first_value) / interval)
+        stats[name] = str(value / interval)
 
     return stats
 
 
 def _disk_latency(first_sample, first_index, last_sample, last_index):
+    deltas = _disk_deltas(first_sample, first_index, last_sample, last_index)
+    if deltas is not None:
+        stats = {}
+        for name, operations, elapsed_time in (
+                ('readLatency', deltas[2], deltas[5]),
+                ('writeLatency', deltas[3], deltas[6]),
+                ('flushLatency', deltas[4], deltas[7])):
+            if operations:
+                stats[name] = str(elapsed_time / operations)
+            else:
+                stats[name] = '0'
+        return stats
+
     stats = {}
 
     for name, mode in (('readLatency', 'rd'),
@@ -377,10 +468,10 @@ def _disk_latency(first_sample, first_index, last_sample, last_index):
         try:
             last_key = "block.%d.%s" % (last_index, mode)
             first_key = "block.%d.%s" % (first_index, mode)
-            operations = (last_sample[last_key + ".reqs"] -
-                          first_sample[first_key + ".reqs"])
-            elapsed_time = (last_sample[last_key + ".times"] -
-                            first_sample[first_key + ".times"])
+            operations = _delta(first_sample, first_key + ".reqs",
+                                last_sample, last_key + ".reqs")
+            elapsed_time = _delta(first_sample, first_key + ".times",
+                                  last_sample, last_key + ".times")
         except KeyError:
             continue
         if operations:
@@ -392,6 +483,17 @@ def _disk_latency(first_sample, first_index, last_sample, last_index):
 
 
 def _disk_iops_bytes(first_sample, first_index, last_sample, last_index):
+    if isinstance(last_sample, bulkstats.Sample):
+        values = last_sample.group_values(
+            'block.%d' % last_index, _DISK_IOPS_BYTES)
+        if values is not None:
+            return {
+                'readOps': str(values[0]),
+                'writeOps': str(values[1]),
+                'readBytes': str(values[2]),
+                'writtenBytes': str(values[3]),
+            }
+
     stats = {}
 
     for name, mode, field in (('readOps', 'rd', 'reqs'),
@@ -408,24 +510,37 @@ def _disk_iops_bytes(first_sample, first_index, last_sample, last_index):
     return stats
 
 
+def _disk_deltas(first_sample, first_index, last_sample, last_index):
+    """
+    Return the changes of the _DISK_COUNTERS of a disk, if they were computed
+    when the sample was added to the cache, None otherwise.
+    """
+    if (first_index != last_index or
+            not isinstance(last_sample, bulkstats.Sample)):
+        return None
+    return last_sample.group_deltas(
+        first_sample, 'block.%d' % last_index, _DISK_COUNTERS)
+
+
 def _usage_percentage(val, interval):
     return 100 * val / interval / 1000 ** 3
 
 
+def _delta(first_sample, first_key, last_sample, last_key):
+    """
+    Return the change of a counter between the samples. Raise KeyError if the
+    counter is missing.
+    """
+    if first_key == last_key and isinstance(last_sample, bulkstats.Sample):
+        # Computed when the sample was added to the cache.
+        return last_sample.delta(first_sample, last_key)
+    return last_sample[last_key] - first_sample[first_key]
+
+
 def _find_bulk_stats_reverse_map(stats, group):
-    name_to_idx = {}
-    for idx in six.moves.xrange(stats.get('%s.count' % group, 0)):
-        try:
-            name = stats['%s.%d.name' % (group, idx)]
-        except KeyError:
-            # Bulk stats accumulate what they can get, raising errors
-            # only in the critical cases. This includes fundamental
-            # attributes like names, so count has to be considered
-            # an upper bound more like a precise indicator.
-            pass
-        else:
-            name_to_idx[name] = idx
-    return name_to_idx
+    if isinstance(stats, bulkstats.Sample):
+        return stats.reverse_map(group)
+    return bulkstats.reverse_map(stats, group)
 
 
 def memory(stats, first_sample, last_sample, interval):
@@ -26,7 +26,10 @@ from vdsm.common.threadlocal import vars
 from vdsm.common.time import monotonic_time, event_time
 from vdsm.common.password import protect_passwords, unprotect_passwords
 
+from yajsonrpc import attachment
+from yajsonrpc import codec
 from yajsonrpc import exception
+from yajsonrpc import rpcstats
 
 __all__ = ["betterAsyncore", "stompserver", "stomp"]
 
@@ -48,7 +51,7 @@ class JsonRpcRequest(object):
     @classmethod
     def decode(cls, msg):
         try:
-            obj = json.loads(msg)
+            obj = codec.get().loads(msg)
         except:
             raise exception.JsonRpcParseError()
 
@@ -122,9 +125,26 @@ class JsonRpcResponse(object):
         res = self.toDict()
         return json.dumps(res)
 
+    def iterencode(self):
+        """
+        Encode the response using the configured codec, yielding UTF-8
+        encoded parts. A list result is encoded item by item.
+        """
+        jsoncodec = codec.get()
+        if self.error is not None:
+            yield jsoncodec.dumps(self.toDict())
+            return
+
+        yield b'{"jsonrpc": "2.0", "id": '
+        yield jsoncodec.dumps(self.id)
+        yield b', "result": '
+        for part in jsoncodec.iterencode(self.result):
+            yield part
+        yield b'}'
+
     @staticmethod
     def decode(msg):
-        obj = json.loads(msg)
+        obj = codec.get().loads(msg)
         return JsonRpcResponse.fromRawObject(obj)
 
     @staticmethod
@@ -188,13 +208,17 @@ class Notification(object):
 
 
 class _JsonRpcServeRequestContext(object):
-    def __init__(self, client, server_address, context):
+    def __init__(self, client, server_address, context, received=None,
+                 stats=None):
         self._requests = []
         self._client = client
         self._server_address = server_address
         self._context = context
+        self._received = received
+        self._stats = stats
         self._counter = 0
         self._requests = {}
+        self._methods = {}
         self._responses = []
 
     def setRequests(self, requests):
@@ -202,6 +226,7 @@ class _JsonRpcServeRequestContext(object):
             if not request.isNotification():
                 self._counter += 1
                 self._requests[request.id] = request
+                self._methods[request.id] = request.method
 
         self.sendReply()
 
@@ -217,26 +242,85 @@ class _JsonRpcServeRequestContext(object):
     def context(self):
         return self._context
 
+    @property
+    def received(self):
+        """
+        Monotonic time when the message was received.
+        """
+        return self._received
+
+    @property
+    def client_host(self):
+        return getattr(self._context, "client_host", None) or "unknown"
+
     def sendReply(self):
         if len(self._requests) > 0:
             return
 
         encodedObjects = []
+        responseIds = []
+        attachments = []
+        threshold = self._attachment_threshold()
         for response in self._responses:
+            extracted = []
+            if threshold and response.error is None:
+                response.result = attachment.extract(
+                    response.result, threshold, extracted)
             try:
-                encodedObjects.append(response.encode())
+                encoded = list(response.iterencode())
             except:  # Error encoding data
                 response = JsonRpcResponse(None,
                                            exception.JsonRpcInternalError(),
                                            response.id)
-                encodedObjects.append(response.encode())
+                encoded = list(response.iterencode())
+                extracted = []
+            attachments.extend(extracted)
+            encodedObjects.append(encoded)
+            responseIds.append(response.id)
+            if self._stats is not None:
+                self._reply_sent(response.id, encoded, extracted)
 
         if len(encodedObjects) == 1:
-            data = encodedObjects[0]
+            parts = encodedObjects[0]
+        else:
+            parts = [b'[']
+            for i, encoded in enumerate(encodedObjects):
+                if i:
+                    parts.append(b',')
+                parts.extend(encoded)
+            parts.append(b']')
+
+        # Large replies are sent as a list of chunks, used as the body of the
+        # STOMP frame without joining them.
+        data = codec.join(parts)
+
+        # The response ids are passed with the encoded data, so the client
+        # can route the reply without decoding it.
+        if attachments:
+            self._client.send(data, response_ids=responseIds,
+                              attachments=attachments)
         else:
-            data = '[' + ','.join(encodedObjects) + ']'
+            self._client.send(data, response_ids=responseIds)
 
-        self._client.send(data.encode('utf-8'))
+    def _attachment_threshold(self):
+        """
+        Return the attachment threshold of the clients receiving the reply,
+        or 0 if attachments are not supported.
+        """
+        get_threshold = getattr(self._client, "attachment_threshold", None)
+        if get_threshold is None:
+            return 0
+        return get_threshold([response.id for response in self._responses])
+
+    def _reply_sent(self, response_id, encoded, attachments):
+        method = self._methods.get(response_id)
+        if method is None:
+            # Error response to an invalid request.
+            return
+        size = sum(len(part) for part in encoded)
+        for _, value in attachments:
+            size += len(value)
+        self._stats.reply_sent(method, size)
 
     def addResponse(self, response):
         self._responses.append(response)
@@ -260,6 +344,10 @@ class JsonRpcTask(object):
         self._ctx = ctx
         self._req = req
 
+    @property
+    def method(self):
+        return self._req.method
+
     def __call__(self):
         self._handler(self._ctx, self._req)
 
@@ -285,9 +373,21 @@ class JsonRpcServer(object):
         self._timeout = timeout
         self._next_report = monotonic_time() + self._timeout
         self._counter = 0
+        self._stats = rpcstats.RpcStats(known_method=self._known_method)
+
+    @property
+    def stats(self):
+        return self._stats
 
     def queueRequest(self, req):
-        self._workQueue.put_nowait(req)
+        self._workQueue.put_nowait((monotonic_time(), req))
+
+    def _known_method(self, method):
+        try:
+            self._bridge.dispatch(method)
+        except exception.JsonRpcMethodNotFoundError:
+            return False
+        return True
 
     """
     Aggregates number of requests received by vdsm. Each request from
@@ -303,10 +403,20 @@ class JsonRpcServer(object):
             self._counter = 0
 
     def _serveRequest(self, ctx, req):
+        client_host = getattr(ctx, "client_host", "unknown")
         start_time = monotonic_time()
-        response = self._handle_request(req, ctx)
+        self._stats.request_started(req.method, start_time - ctx.received)
+        try:
+            response = self._handle_request(req, ctx)
+        except:
+            self._stats.request_done(
+                req.method, client_host, monotonic_time() - start_time,
+                error=True)
+            raise
         duration = monotonic_time() - start_time
         error = getattr(response, "error", None)
+        self._stats.request_done(
+            req.method, client_host, duration, error=error is not None)
         if error is not None:
             self.log.info("RPC call %s failed (error %s) in %.2f seconds",
                           req.method, error.code, duration)
@@ -367,18 +477,21 @@ class JsonRpcServer(object):
     @traceback(log=log)
     def serve_requests(self):
         while True:
-            obj = self._workQueue.get()
-            if obj is None:
+            item = self._workQueue.get()
+            if item is None:
                 break
 
-            self._parseMessage(obj)
+            received, obj = item
+            self._parseMessage(obj, received)
 
-    def _parseMessage(self, obj):
+    def _parseMessage(self, obj, received):
         client, server_address, context, msg = obj
-        ctx = _JsonRpcServeRequestContext(client, server_address, context)
+        ctx = _JsonRpcServeRequestContext(
+            client, server_address, context, received=received,
+            stats=self._stats)
 
         try:
-            rawRequests = json.loads(msg)
+            rawRequests = codec.get().loads(msg)
         except:
             ctx.addResponse(JsonRpcResponse(
                 None, exception.JsonRpcParseError(), None))
@@ -421,6 +534,8 @@ class JsonRpcServer(object):
             self._runRequest(ctx, request)
 
     def _runRequest(self, ctx, request):
+        client_host = getattr(ctx, "client_host", "unknown")
+        self._stats.request_received(request.method, client_host)
         if self._threadFactory is None:
             self._serveRequest(ctx, request)
         else:
@@ -429,8 +544,12 @@ class JsonRpcServer(object):
                     JsonRpcTask(self._serveRequest, ctx, request)
                 )
             except vdsmexception.ContextException as e:
+                self._stats.request_done(
+                    request.method, client_host, None, error=True)
                 ctx.requestDone(JsonRpcResponse(None, e, request.id))
             except Exception as e:
+                self._stats.request_done(
+                    request.method, client_host, None, error=True)
                 self.log.exception("could not serve request %s", request)
                 ctx.requestDone(
                     JsonRpcResponse(
@@ -0,0 +1,157 @@
+# Copyright (C) 2019 Red Hat Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+"""
+Sending large values of JSON-RPC replies outside of the JSON message.
+
+A client supporting attachments adds the "vdsm-attachments" header to the
+STOMP CONNECT frame. If attachments are enabled (rpc:attachment_threshold is
+not 0), the server adds the same header to the CONNECTED frame, with the
+threshold as the value.
+
+When replying to such a client, strings and bytes values in the result with
+at least threshold bytes are replaced with a reference:
+
+    {"$attachment": "42"}
+
+Every value is sent as a separate MESSAGE frame before the reply, with the
+"vdsm-attachment-id" header. The frame body is the raw value, so it is not
+escaped by the JSON encoder, and bytes do not need to be base64 encoded.
+The "content-type" header tells if the value is text or binary. The reply
+frame lists the attachment ids in the "vdsm-attachments" header.
+
+The client keeps received attachments until the reply referencing them
+arrives, and replaces the references when decoding the reply.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import itertools
+
+import six
+
+from vdsm.common.compat import json
+
+from . import stomp
+
+REF = "$attachment"
+
+TEXT = "text/plain; charset=utf-8"
+BINARY = "application/octet-stream"
+
+_ids = itertools.count()
+
+
+def extract(obj, threshold, attachments):
+    """
+    Return obj, replacing strings and bytes values with at least threshold
+    bytes with references. The values are appended to attachments as (id,
+    value) tuples.
+
+    obj is not modified; containers holding values are copied.
+    """
+    if isinstance(obj, (six.text_type, six.binary_type)):
+        # A text value has at least len(obj) UTF-8 encoded bytes.
+        if len(obj) < threshold:
+            return obj
+        att_id = str(next(_ids))
+        attachments.append((att_id, obj))
+        return {REF: att_id}
+
+    if isinstance(obj, dict):
+        copy = None
+        for key, value in six.iteritems(obj):
+            new = extract(value, threshold, attachments)
+            if new is not value:
+                if copy is None:
+                    copy = dict(obj)
+                copy[key] = new
+        return obj if copy is None else copy
+
+    if isinstance(obj, (list, tuple)):
+        copy = None
+        for i, value in enumerate(obj):
+            new = extract(value, threshold, attachments)
+            if new is not value:
+                if copy is None:
+                    copy = list(obj)
+                copy[i] = new
+        return obj if copy is None else copy
+
+    return obj
+
+
+def frames(attachments, headers):
+    """
+    Return a MESSAGE stomp.FanoutFrame for every attachment, using headers.
+    """
+    result = []
+    for att_id, value in attachments:
+        frame_headers = dict(headers)
+        frame_headers[stomp.Headers.ATTACHMENT_ID] = att_id
+        if isinstance(value, six.text_type):
+            frame_headers[stomp.Headers.CONTENT_TYPE] = TEXT
+        else:
+            frame_headers[stomp.Headers.CONTENT_TYPE] = BINARY
+        # The frame encodes text to UTF-8.
+        result.append(
+            stomp.FanoutFrame(stomp.Command.MESSAGE, frame_headers, value))
+    return result
+
+
+def ids(attachments):
+    """
+    Return the value of the reply "vdsm-attachments" header.
+    """
+    return ",".join(att_id for att_id, _ in attachments)
+
+
+def value(frame):
+    """
+    Return the value sent in an attachment frame.
+    """
+    if frame.headers.get(stomp.Headers.CONTENT_TYPE) == TEXT:
+        return frame.body.decode("utf-8")
+    return frame.body
+
+
+class Message(object):
+    """
+    A received message referencing attachments.
+    """
+
+    def __init__(self, data, attachments):
+        self.data = data
+        self.attachments = attachments
+
+    def _resolve(self, obj):
+        if len(obj) == 1 and REF in obj:
+            try:
+                return self.attachments[obj[REF]]
+            except (KeyError, TypeError):
+                pass
+        return obj
+
+    def decode(self):
+        return json.loads(self.data, object_hook=self._resolve)
+
+
+def decode(message):
+    """
+    Decode a received message, replacing attachment references.
+    """
+    if isinstance(message, Message):
+        return message.decode()
+    return json.loads(message)
@@ -21,14 +21,21 @@ from __future__ import division
 
 import asyncore
 import errno
+import heapq
+import itertools
 import logging
+import select
 import socket
 import ssl
+import threading
+
+from collections import deque
 
 import six
 
 from vdsm import sslutils
 from vdsm.common.eventfd import EventFD
+from vdsm.common.time import monotonic_time
 
 
 _BLOCKING_IO_ERRORS = (errno.EAGAIN, errno.EALREADY, errno.EINPROGRESS,
@@ -142,9 +149,53 @@ class Dispatcher(asyncore.dispatcher):
             else:
                 raise
 
+    def recv_into(self, buffer):
+        """
+        Receive data into buffer, returning the number of bytes received, 0 if
+        the connection was closed, or None if no data is available.
+        """
+        try:
+            nbytes = self.socket.recv_into(buffer)
+            if nbytes == 0:
+                # a closed connection is indicated by signaling
+                # a read condition, and having recv_into() return 0.
+                self.handle_close()
+            return nbytes
+        except sslutils.SSLError as e:
+            if e.errno == ssl.SSL_ERROR_WANT_READ:
+                return None
+            self._log.debug('SSL error receiving from %s: %s', self, e)
+            self.handle_close()
+            return 0
+        except socket.error as why:
+            if why.args[0] in _BLOCKING_IO_ERRORS:
+                return None
+            elif why.args[0] in asyncore._DISCONNECTED:
+                self.handle_close()
+                return 0
+            else:
+                raise
+
     def send(self, data):
+        return self._send(self.socket.send, data)
+
+    def sendmsg(self, buffers):
+        """
+        Send a list of buffers using one system call, returning the number of
+        bytes sent.
+
+        SSL sockets do not support sendmsg(), so the buffers are joined and
+        sent using send().
+        """
+        sock = self.socket
+        if isinstance(sock, (sslutils.SSLSocket, ssl.SSLSocket)):
+            data = buffers[0] if len(buffers) == 1 else b"".join(buffers)
+            return self._send(sock.send, data)
+        return self._send(sock.sendmsg, buffers)
+
+    def _send(self, send, data):
         try:
-            result = self.socket.send(data)
+            result = send(data)
             if result == -1:
                 return 0
             return result
@@ -219,18 +270,84 @@ class AsyncoreEvent(asyncore.file_dispatcher):
         asyncore.file_dispatcher.close(self)
 
 
+# When no dispatcher needs to be checked earlier, the reactor wakes up after
+# this timeout and checks all dispatchers, like asyncore.loop().
+_DEFAULT_TIMEOUT = 30.0
+
+
+class _DispatcherMap(dict):
+    """
+    Map file descriptors to dispatchers, notifying the reactor when a
+    dispatcher is added or removed. Dispatchers add and remove themselves
+    using asyncore.dispatcher.add_channel() and del_channel(), possibly from
+    other threads.
+    """
+
+    def __init__(self, reactor):
+        dict.__init__(self)
+        self._reactor = reactor
+
+    def __setitem__(self, fd, dispatcher):
+        dict.__setitem__(self, fd, dispatcher)
+        self._reactor._dispatcher_added(dispatcher)
+
+    def __delitem__(self, fd):
+        with self._reactor._lock:
+            dict.__delitem__(self, fd)
+            self._reactor._unregister(fd)
+
+
 class Reactor(object):
     """
     map dictionary maps sock.fileno() to channels to watch. We add channels to
     it by running add_dispatcher and removing by remove_dispatcher.
-    It is used by asyncore loop to know which channels events to track.
 
-    We use eventfd as mechanism to trigger processing when needed.
+    Channels are watched using level triggered epoll. The events a channel is
+    interested in are updated using its readable() and writable() methods:
+
+    - when the channel is added
+    - after handling the channel events
+    - when the channel check interval expires
+    - when wakeup() is called with the channel
+
+    Calling wakeup() without a channel, and the default timeout, update all
+    channels. The check intervals are kept in a heap, so the reactor does not
+    need to check every channel on every iteration.
+
+    SSL sockets may have buffered data that epoll does not report. Such
+    channels are read again without waiting for an event.
+
+    We use eventfd as mechanism to trigger processing when needed. Wakeups
+    are coalesced; when many channels are woken up before the reactor thread
+    runs, for example when sending an event to many clients, the eventfd is
+    written once.
     """
 
+    _log = logging.getLogger("vds.Reactor")
+
     def __init__(self):
-        self._map = {}
+        self._lock = threading.Lock()
+        self._epoll = select.epoll()
+        # Registered events mask by fd.
+        self._events = {}
+        # Channels to update, added by other threads.
+        self._pending = deque()
+        self._update_all = False
+        self._next_update_all = monotonic_time() + _DEFAULT_TIMEOUT
+        # Heap of (deadline, seq, dispatcher), and the (deadline, seq) of the
+        # current timer of every dispatcher.
+        self._deadlines = []
+        self._timers = {}
+        self._seq = itertools.count()
+        # Channels with buffered data.
+        self._ready = []
+        self._map = _DispatcherMap(self)
         self._is_running = False
+        self._thread = None
+        # Set when the eventfd was written since the reactor started updating
+        # the dispatchers.
+        self._wakeup_pending = False
+        self._wakeupEvent = None
         self._wakeupEvent = AsyncoreEvent(self._map)
 
     def create_dispatcher(self, sock, impl=None):
@@ -238,29 +355,179 @@ class Reactor(object):
 
     def process_requests(self):
         self._is_running = True
+        self._thread = threading.current_thread()
         while self._is_running:
-            asyncore.loop(
-                timeout=self._get_timeout(self._map),
-                use_poll=True,
-                map=self._map,
-                count=1,
-            )
+            # Must be cleared before updating, so changes made after the
+            # update wake up the reactor.
+            self._wakeup_pending = False
+            self._update_dispatchers()
+            self._handle_events(self._poll())
 
         for dispatcher in list(six.viewvalues(self._map)):
             dispatcher.close()
 
         self._map.clear()
+        with self._lock:
+            self._epoll.close()
+
+    def _poll(self):
+        try:
+            return self._epoll.poll(self._get_timeout())
+        except (IOError, OSError) as e:
+            # Python 2 does not retry on EINTR.
+            if e.errno != errno.EINTR:
+                raise
+            return []
+
+    def _get_timeout(self):
+        if self._ready:
+            return 0
+        deadline = self._next_update_all
+        if self._deadlines:
+            deadline = min(self._deadlines[0][0], deadline)
+        return max(deadline - monotonic_time(), 0)
+
+    def _handle_events(self, events):
+        ready, self._ready = self._ready, []
+        for dispatcher in ready:
+            if self._is_current(dispatcher):
+                asyncore.readwrite(dispatcher, select.EPOLLIN)
+                self._pending.append(dispatcher)
+
+        for fd, flags in events:
+            dispatcher = self._map.get(fd)
+            if dispatcher is None:
+                continue
+            asyncore.readwrite(dispatcher, flags)
+            self._pending.append(dispatcher)
+
+    def _update_dispatchers(self):
+        now = monotonic_time()
+
+        if self._update_all or now >= self._next_update_all:
+            self._update_all = False
+            self._next_update_all = now + _DEFAULT_TIMEOUT
+            self._pending.clear()
+            self._pending.extend(list(six.viewvalues(self._map)))
+
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, seq, dispatcher = heapq.heappop(self._deadlines)
+            if self._timers.get(dispatcher) == (deadline, seq):
+                del self._timers[dispatcher]
+                self._pending.append(dispatcher)
+
+        # Other threads may add channels while we update; they will wake us
+        # up, so update only the channels added so far.
+        updated = set()
+        for _ in range(len(self._pending)):
+            dispatcher = self._pending.popleft()
+            if dispatcher not in updated:
+                updated.add(dispatcher)
+                self._update(dispatcher, now)
+
+    def _update(self, dispatcher, now):
+        if not self._is_current(dispatcher):
+            self._timers.pop(dispatcher, None)
+            return
+
+        check_interval = getattr(dispatcher, "next_check_interval", None)
+        interval = check_interval() if check_interval else None
+
+        events = 0
+        if dispatcher.readable():
+            events |= select.EPOLLIN | select.EPOLLPRI
+        if dispatcher.writable() and not dispatcher.accepting:
+            events |= select.EPOLLOUT
+
+        # The checks above may close the channel.
+        with self._lock:
+            if not self._is_current(dispatcher):
+                self._timers.pop(dispatcher, None)
+                return
+            self._register(dispatcher._fileno, events)
+
+        if interval is not None and interval >= 0:
+            self._schedule(dispatcher, now + interval)
+
+        if events & select.EPOLLIN and self._has_buffered_data(dispatcher):
+            self._ready.append(dispatcher)
+
+    def _is_current(self, dispatcher):
+        fd = dispatcher._fileno
+        return fd is not None and self._map.get(fd) is dispatcher
+
+    def _schedule(self, dispatcher, deadline):
+        # Keep only the earliest timer. If the deadline moved later, the
+        # current timer will update the channel, scheduling a new timer.
+        timer = self._timers.get(dispatcher)
+        if timer is not None and timer[0] <= deadline:
+            return
+        timer = (deadline, next(self._seq))
+        self._timers[dispatcher] = timer
+        heapq.heappush(self._deadlines, timer + (dispatcher,))
+
+    def _has_buffered_data(self, dispatcher):
+        pending = getattr(dispatcher.socket, "pending", None)
+        return pending is not None and pending() > 0
+
+    def _register(self, fd, events):
+        # Must be called with _lock held.
+        old = self._events.get(fd, 0)
+        if events == old:
+            return
+        if events == 0:
+            self._unregister(fd)
+            return
+        try:
+            if old == 0:
+                self._epoll.register(fd, events)
+            else:
+                self._epoll.modify(fd, events)
+        except (IOError, OSError) as e:
+            if e.errno == errno.EEXIST:
+                self._epoll.modify(fd, events)
+            elif e.errno == errno.ENOENT:
+                self._epoll.register(fd, events)
+            else:
+                raise
+        self._events[fd] = events
+
+    def _unregister(self, fd):
+        # Must be called with _lock held.
+        if self._events.pop(fd, 0) == 0:
+            return
+        try:
+            self._epoll.unregister(fd)
+        except (IOError, OSError, ValueError) as e:
+            # The fd was closed, or the reactor was stopped.
+            self._log.debug("Error unregistering fd %d: %s", fd, e)
 
-    def _get_timeout(self, map):
-        timeout = 30.0
-        for disp in list(six.viewvalues(self._map)):
-            if hasattr(disp, "next_check_interval"):
-                interval = disp.next_check_interval()
-                if interval is not None and interval >= 0:
-                    timeout = min(interval, timeout)
-        return timeout
+    def _dispatcher_added(self, dispatcher):
+        self._pending.append(dispatcher)
+        if self._wakeupEvent is not None:
+            self._wakeup_thread()
+
+    def wakeup(self, dispatcher=None):
+        """
+        Wake up the reactor, updating the events of dispatcher, or of all
+        dispatchers if dispatcher is None.
+        """
+        if dispatcher is None:
+            self._update_all = True
+        else:
+            self._pending.append(dispatcher)
+        self._wakeup_thread()
 
-    def wakeup(self):
+    def _wakeup_thread(self):
+        # The reactor thread updates the dispatchers before polling, so it
+        # does not need to wake up itself.
+        if threading.current_thread() is self._thread:
+            return
+        # Another thread woke up the reactor, and it did not update the
+        # dispatchers yet.
+        if self._wakeup_pending:
+            return
+        self._wakeup_pending = True
         self._wakeupEvent.set()
 
     def stop(self):
@@ -0,0 +1,170 @@
+# Copyright (C) 2019 Red Hat Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+"""
+JSON codecs used by the JSON-RPC server.
+
+The codec is selected using the rpc:json_codec configuration option:
+
+json    vdsm.common.compat.json (simplejson if available, otherwise the
+        standard library json module). This is the default.
+
+ujson   ujson module.
+
+orjson  orjson module.
+
+If the selected codec is not available, the json codec is used.
+
+All codecs encode to UTF-8 bytes. Large lists are encoded item by item into
+chunks of about CHUNK_SIZE bytes, so a large reply is never joined into a
+single string. The chunks can be used as the body of a STOMP frame.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import logging
+
+from vdsm.common.compat import json
+from vdsm.common.units import KiB
+from vdsm.config import config
+
+CHUNK_SIZE = 64 * KiB
+
+log = logging.getLogger("jsonrpc.codec")
+
+
+class JsonCodec(object):
+
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        """
+        Encode obj to UTF-8 encoded JSON.
+        """
+        return json.dumps(obj).encode("utf-8")
+
+    def iterencode(self, obj):
+        """
+        Encode obj, yielding UTF-8 encoded parts. Items of a list are encoded
+        separately, so a large list is not encoded into a single string.
+        """
+        if isinstance(obj, (list, tuple)):
+            yield b"["
+            for i, item in enumerate(obj):
+                if i:
+                    yield b","
+                yield self.dumps(item)
+            yield b"]"
+        else:
+            yield self.dumps(obj)
+
+
+class UjsonCodec(JsonCodec):
+
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def loads(self, data):
+        return self._ujson.loads(data)
+
+    def dumps(self, obj):
+        return self._ujson.dumps(
+            obj, escape_forward_slashes=False).encode("utf-8")
+
+
+class OrjsonCodec(JsonCodec):
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+        # JSON-RPC results may use integers as dict keys.
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def dumps(self, obj):
+        return self._orjson.dumps(obj, option=self._option)
+
+
+_CODECS = {c.name: c for c in (JsonCodec, UjsonCodec, OrjsonCodec)}
+
+_codec = None
+
+
+def create(name):
+    """
+    Create a codec by name.
+
+    Raises ValueError if name is unknown, or ImportError if the codec module
+    is not available.
+    """
+    try:
+        codec_class = _CODECS[name]
+    except KeyError:
+        raise ValueError("Unknown JSON codec %r" % name)
+    return codec_class()
+
+
+def get():
+    """
+    Return the configured codec.
+    """
+    global _codec
+    if _codec is None:
+        name = config.get("rpc", "json_codec")
+        try:
+            _codec = create(name)
+        except (ValueError, ImportError) as e:
+            log.warning("Cannot use JSON codec %r (%s), using json", name, e)
+            _codec = JsonCodec()
+        else:
+            log.info("Using JSON codec %r", name)
+    return _codec
+
+
+def join(parts, chunk_size=CHUNK_SIZE):
+    """
+    Join encoded parts into chunks of at least chunk_size bytes, except the
+    last chunk.
+
+    Returns bytes if all parts fit in one chunk, otherwise a list of bytes.
+    """
+    chunks = []
+    buf = []
+    size = 0
+    for part in parts:
+        buf.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            chunks.append(b"".join(buf))
+            buf = []
+            size = 0
+
+    if not chunks:
+        return b"".join(buf)
+
+    if buf:
+        chunks.append(b"".join(buf))
+
+    return chunks
@@ -22,8 +22,8 @@ import six
 from six.moves import queue
 from threading import Lock, Event
 
-from vdsm.common.compat import json
 
+from yajsonrpc import attachment
 from yajsonrpc import \
     exception, \
     CALL_TIMEOUT, \
@@ -219,7 +219,7 @@ class JsonRpcClient(object):
 
     def _handleMessage(self, message, event_queue=None):
         try:
-            mobj = json.loads(message)
+            mobj = attachment.decode(message)
         except ValueError:
             self.log.warning(
                 "Received message is not a valid JSON: %r",
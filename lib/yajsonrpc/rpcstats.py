@@ -0,0 +1,307 @@
+# Copyright (C) 2019 Red Hat Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+"""
+JSON-RPC server statistics.
+
+For every method the server records how long requests waited before running
+(queue time), how long they ran (run time), and the size of the replies. The
+values are recorded in log-linear histograms, like HdrHistogram: a value is
+counted in a bucket whose width is at most 1/8 of the value, so percentiles
+are reported with 12.5% precision, using a small constant amount of work per
+value.
+
+The statistics are cumulative since the server was started. collect() returns
+the statistics since the previous call, for reporting metrics.
+
+Method names are sent by the clients. To keep the statistics bounded, methods
+not known to the server are recorded under UNKNOWN_METHOD.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import threading
+
+import six
+
+# A value is recorded in one of 2**_SUB_BITS sub buckets of its power of 2.
+_SUB_BITS = 3
+_SUB_BUCKETS = 1 << _SUB_BITS
+
+# Values smaller than this have their own bucket.
+_LINEAR = 2 * _SUB_BUCKETS
+
+PERCENTILES = (50, 90, 99)
+
+# Durations are recorded in microseconds and reported in seconds.
+_USEC = 1000000
+
+# Statistics of all unknown or invalid methods.
+UNKNOWN_METHOD = "_unknown"
+
+
+def _index(value):
+    if value < _LINEAR:
+        return value
+    shift = value.bit_length() - _SUB_BITS - 1
+    return (shift << _SUB_BITS) + (value >> shift)
+
+
+def _upper(index):
+    """
+    Return the largest value recorded in bucket index.
+    """
+    if index < _LINEAR:
+        return index
+    shift = (index >> _SUB_BITS) - 1
+    mantissa = index - (shift << _SUB_BITS)
+    return ((mantissa + 1) << shift) - 1
+
+
+class Histogram(object):
+    """
+    Histogram of non-negative integer values.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    def record(self, value):
+        index = _index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def copy(self):
+        h = Histogram()
+        h.count = self.count
+        h.total = self.total
+        h.max = self.max
+        h.buckets = dict(self.buckets)
+        return h
+
+    def __sub__(self, other):
+        """
+        Return a histogram of the values recorded since other was copied
+        from this histogram. The maximum value is estimated using the
+        largest bucket.
+        """
+        h = Histogram()
+        h.count = self.count - other.count
+        h.total = self.total - other.total
+        for index, count in six.iteritems(self.buckets):
+            count -= other.buckets.get(index, 0)
+            if count:
+                h.buckets[index] = count
+        if h.buckets:
+            h.max = min(_upper(max(h.buckets)), self.max)
+        return h
+
+    def percentile(self, p):
+        """
+        Return the value below which p percent of the values fall.
+        """
+        if self.count == 0:
+            return 0
+        target = self.count * p / 100
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(_upper(index), self.max)
+        return self.max
+
+    def info(self, scale=1):
+        """
+        Return a dict reporting the histogram. Values are divided by scale.
+        """
+        info = {
+            "count": self.count,
+            "avg": self.total / self.count / scale if self.count else 0.0,
+            "max": self.max / scale,
+        }
+        for p in PERCENTILES:
+            info["p%d" % p] = self.percentile(p) / scale
+        return info
+
+
+class _MethodStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.queue_time = Histogram()
+        self.run_time = Histogram()
+        self.reply_size = Histogram()
+
+    def copy(self):
+        s = _MethodStats()
+        s.requests = self.requests
+        s.errors = self.errors
+        s.in_flight = self.in_flight
+        s.queue_time = self.queue_time.copy()
+        s.run_time = self.run_time.copy()
+        s.reply_size = self.reply_size.copy()
+        return s
+
+    def __sub__(self, other):
+        s = _MethodStats()
+        s.requests = self.requests - other.requests
+        s.errors = self.errors - other.errors
+        s.in_flight = self.in_flight
+        s.queue_time = self.queue_time - other.queue_time
+        s.run_time = self.run_time - other.run_time
+        s.reply_size = self.reply_size - other.reply_size
+        return s
+
+    def info(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "queue_time": self.queue_time.info(_USEC),
+            "run_time": self.run_time.info(_USEC),
+            "reply_size": self.reply_size.info(),
+        }
+
+
+class _ClientStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+
+    def info(self):
+        return {"requests": self.requests, "in_flight": self.in_flight}
+
+
+class RpcStats(object):
+    """
+    Statistics of a JSON-RPC server, safe to use from multiple threads.
+
+    Methods are called for every request in this order:
+
+        request_received(method, client)
+        request_started(method, queue_time)
+        request_done(method, client, run_time, error)
+
+    If the request could not be run, request_started() is not called, and
+    run_time is None.
+    reply_sent(method, size) is called when the reply is sent.
+
+    If known_method is specified, it is called with a method name not
+    recorded yet, and should return True if the server can run this method.
+    Other methods are recorded as UNKNOWN_METHOD.
+    """
+
+    def __init__(self, known_method=None):
+        self._known_method = known_method
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._clients = {}
+        self._in_flight = 0
+        self._last = {}
+
+    def request_received(self, method, client):
+        with self._lock:
+            self._in_flight += 1
+            m = self._method(method)
+            m.requests += 1
+            m.in_flight += 1
+            c = self._client(client)
+            c.requests += 1
+            c.in_flight += 1
+
+    def request_started(self, method, queue_time):
+        with self._lock:
+            self._method(method).queue_time.record(int(queue_time * _USEC))
+
+    def request_done(self, method, client, run_time, error=False):
+        with self._lock:
+            self._in_flight -= 1
+            m = self._method(method)
+            m.in_flight -= 1
+            if error:
+                m.errors += 1
+            if run_time is not None:
+                m.run_time.record(int(run_time * _USEC))
+            self._client(client).in_flight -= 1
+
+    def reply_sent(self, method, size):
+        with self._lock:
+            self._method(method).reply_size.record(size)
+
+    def info(self):
+        """
+        Return the statistics since the server was started.
+        """
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "methods": {name: m.info()
+                            for name, m in six.iteritems(self._methods)},
+                "clients": {name: c.info()
+                            for name, c in six.iteritems(self._clients)},
+            }
+
+    def collect(self):
+        """
+        Return the statistics of methods called since the last call.
+        """
+        with self._lock:
+            methods = {}
+            for name, m in six.iteritems(self._methods):
+                last = self._last.get(name)
+                if last is not None:
+                    if m.requests == last.requests:
+                        continue
+                    delta = m - last
+                else:
+                    delta = m
+                methods[name] = delta.info()
+                self._last[name] = m.copy()
+            return {"in_flight": self._in_flight, "methods": methods}
+
+    def _method(self, name):
+        try:
+            return self._methods[name]
+        except (KeyError, TypeError):
+            if not self._is_known(name):
+                name = UNKNOWN_METHOD
+            try:
+                return self._methods[name]
+            except KeyError:
+                m = self._methods[name] = _MethodStats()
+                return m
+
+    def _is_known(self, name):
+        if not isinstance(name, six.string_types):
+            return False
+        if self._known_method is None:
+            return True
+        return self._known_method(name)
+
+    def _client(self, name):
+        try:
+            return self._clients[name]
+        except KeyError:
+            c = self._clients[name] = _ClientStats()
+            return c
@@ -16,6 +16,7 @@
 
 from __future__ import absolute_import
 from __future__ import division
+import itertools
 import logging
 import six
 import socket
@@ -24,6 +25,7 @@ from collections import deque
 from vdsm.common import api
 from vdsm.common import pki
 from vdsm.common import time
+from vdsm.common.units import KiB
 from vdsm.sslutils import SSLSocket, SSLContext
 import re
 
@@ -40,6 +42,11 @@ NR_RETRIES = 1
 # This is the value used by engine
 GRACE_PERIOD_FACTOR = 0.2
 
+# Queued frames are coalesced and sent using one system call, up to this
+# number of bytes and buffers.
+WRITE_BATCH_SIZE = 256 * KiB
+WRITE_BATCH_BUFFERS = 64
+
 # https://stomp.github.io/stomp-specification-1.2.html#Value_Encoding
 _RE_ESCAPE_SEQUENCE = re.compile(br"\\(.)")
 
@@ -83,6 +90,10 @@ class Headers(object):
     ACCEPT_VERSION = "accept-version"
     REPLY_TO = "reply-to"
     HEARTBEAT = "heart-beat"
+    ATTACHMENTS = "vdsm-attachments"
+    ATTACHMENT_ID = "vdsm-attachment-id"
+    STATS_INTERVAL = "vdsm-stats-interval"
+    STATS_FIELDS = "vdsm-stats-fields"
 
 
 COMMANDS = tuple(getattr(Command, command)
@@ -107,6 +118,9 @@ class _HeartbeatFrame(object):
     def encode(self):
         return b"\n"
 
+    def encode_chunks(self):
+        return [b"\n"]
+
 
 # There is no reason to have multiple instances
 _heartbeat_frame = _HeartbeatFrame()
@@ -128,10 +142,41 @@ class Frame(object):
 
     # https://stomp.github.io/stomp-specification-1.2.html#Augmented_BNF
     def encode(self):
+        return b"".join(self.encode_chunks())
+
+    def encode_chunks(self):
+        """
+        Encode the frame to a list of bytes.
+
+        The body may be a list of bytes, used for large messages. In this case
+        the body chunks are returned as is, without copying them.
+        """
+        data = self._encode_head()
+        data.append(b"\n")
+        body = self.body
+
+        if isinstance(body, list):
+            return [b"".join(data)] + body + [b"\0"]
+
+        if body is not None:
+            data.append(body)
+
+        data.append(b"\0")
+        return [b"".join(data)]
+
+    def _encode_head(self):
+        """
+        Encode the command and the headers to a list of bytes, without the
+        empty line ending the headers.
+        """
         body = self.body
         # We do it here so we are sure header is up to date
         if body is not None:
-            self.headers[Headers.CONTENT_LENGTH] = str(len(body))
+            if isinstance(body, list):
+                length = sum(len(chunk) for chunk in body)
+            else:
+                length = len(body)
+            self.headers[Headers.CONTENT_LENGTH] = str(length)
 
         data = [encode_value(self.command), b"\n"]
 
@@ -141,13 +186,7 @@ class Frame(object):
             data.append(encode_value(value))
             data.append(b"\n")
 
-        data.append(b"\n")
-
-        if body is not None:
-            data.append(body)
-
-        data.append(b"\0")
-        return b"".join(data)
+        return data
 
     def __repr__(self):
         return "<StompFrame command=%s>" % (repr(self.command))
@@ -156,6 +195,69 @@ class Frame(object):
         return Frame(self.command, self.headers.copy(), self.body)
 
 
+class FanoutFrame(object):
+    """
+    A frame sent to many subscriptions.
+
+    The command, the headers and the body are encoded once. The frame sent to
+    every subscription adds only the subscription header, so sending an event
+    to more subscribers does not encode it again.
+    """
+
+    def __init__(self, command, headers=None, body=None):
+        self._frame = Frame(command, dict(headers or {}), body)
+        self._head = b"".join(self._frame._encode_head())
+        body = self._frame.body
+        if body is None:
+            self._tail = [b"\0"]
+        elif isinstance(body, list):
+            self._tail = body + [b"\0"]
+        else:
+            self._tail = [body, b"\0"]
+
+    def frame(self, sub_id):
+        """
+        Return the frame to send to subscription sub_id.
+        """
+        return _SubscriptionFrame(self, sub_id)
+
+
+class _SubscriptionFrame(object):
+    __slots__ = ("_fanout", "_sub_id")
+
+    def __init__(self, fanout, sub_id):
+        self._fanout = fanout
+        self._sub_id = sub_id
+
+    @property
+    def command(self):
+        return self._fanout._frame.command
+
+    @property
+    def headers(self):
+        # Like the encoded frame, the shared headers win.
+        headers = {Headers.SUBSCRIPTION: self._sub_id}
+        headers.update(self._fanout._frame.headers)
+        return headers
+
+    @property
+    def body(self):
+        return self._fanout._frame.body
+
+    def encode(self):
+        return b"".join(self.encode_chunks())
+
+    def encode_chunks(self):
+        # When a header is repeated, only the first occurrence is used, so
+        # the subscription header is added after the shared headers.
+        subscription = b"".join(
+            (b"subscription:", encode_value(self._sub_id), b"\n\n"))
+        return [self._fanout._head, subscription] + self._fanout._tail
+
+    def __repr__(self):
+        return "<StompFrame command=%s>" % (repr(self.command))
+
+
 def decode_value(s):
     if not isinstance(s, six.binary_type):
         raise ValueError(
@@ -194,10 +296,25 @@ def encode_value(s):
 
 
 class Parser(object):
+    """
+    Incremental STOMP frame parser.
+
+    Received data is appended to a single bytearray, and parsed in place
+    starting at the read offset. Consumed data is dropped from the start of
+    the buffer once per parse() call.
+
+    When a frame has a content-length header and the body was not received
+    yet, a body buffer is allocated. Received data is copied to the body
+    buffer, or received directly into it using body_buffer() and
+    body_received(), so large frames are copied once. The content-length is
+    sent by the peer, so the body buffer is allocated up to
+    _BODY_BUFFER_SIZE bytes, and grown as the body is received.
+    """
     _STATE_CMD = "Parsing command"
     _STATE_HEADER = "Parsing headers"
     _STATE_BODY = "Receiving body"
-    _FRAME_TERMINATOR = b"\x00" if six.PY2 else 0
+    _FRAME_TERMINATOR = 0
+    _BODY_BUFFER_SIZE = 1024**2
 
     def __init__(self):
         self._states = {
@@ -207,27 +324,42 @@ class Parser(object):
         self._frames = deque()
         self._change_state(self._STATE_CMD)
         self._content_length = -1
-        self._flush()
+        self._buffer = bytearray()
+        # Start of the unparsed data in self._buffer.
+        self._offset = 0
+        # Where to continue looking for a terminator in self._buffer, so we
+        # don't search again data received in previous calls.
+        self._scan = 0
+        # Body of the current frame, number of bytes received, and expected
+        # size including the frame terminator, when waiting for a body with
+        # known content length.
+        self._body = None
+        self._body_pos = 0
+        self._body_size = 0
 
     def _change_state(self, new_state):
         self._state = new_state
         self._state_cb = self._states[new_state]
 
-    def _flush(self):
-        self._buffer = b""
-
-    def _write_buffer(self, buff):
-        self._buffer += buff
-
-    def _get_buffer(self):
-        return self._buffer
+    def _compact(self):
+        if self._offset:
+            # Deleting from the start of a bytearray is cheap, the data is not
+            # moved until the buffer is resized.
+            del self._buffer[:self._offset]
+            self._scan = max(0, self._scan - self._offset)
+            self._offset = 0
 
     def _handle_terminator(self, term):
-        res, sep, rest = self._buffer.partition(term)
-        if not sep:
+        end = self._buffer.find(term, max(self._offset, self._scan))
+        if end == -1:
+            self._scan = len(self._buffer)
             return None
 
-        self._buffer = rest
+        with memoryview(self._buffer) as view:
+            res = view[self._offset:end].tobytes()
+
+        self._offset = end + len(term)
+        self._scan = self._offset
 
         return res
 
@@ -296,32 +428,95 @@ class Parser(object):
         return True
 
     def _parse_body_length(self):
-        buf = self._get_buffer()
         cl = self._content_length
-        ndata = len(buf)
-        if ndata < (cl + 1):
+        available = len(self._buffer) - self._offset
+
+        if self._body is None:
+            if available >= cl + 1:
+                # The entire body was received, no need for a body buffer.
+                end = self._offset + cl
+                if self._buffer[end] != self._FRAME_TERMINATOR:
+                    raise RuntimeError("Frame doesn't end with NULL byte")
+                with memoryview(self._buffer) as view:
+                    body = view[self._offset:end].tobytes()
+                self._offset = end + 1
+                self._tmp_frame.body = body
+                self._push_frame()
+                return True
+
+            # Including the frame terminator.
+            self._body_size = cl + 1
+            self._body = bytearray(
+                min(self._body_size, self._BODY_BUFFER_SIZE))
+            self._body_pos = 0
+
+        self._grow_body(available)
+        n = min(available, len(self._body) - self._body_pos)
+        if n:
+            with memoryview(self._buffer) as src, \
+                    memoryview(self._body) as dst:
+                dst[self._body_pos:self._body_pos + n] = \
+                    src[self._offset:self._offset + n]
+            self._offset += n
+            self._body_pos += n
+
+        if self._body_pos < self._body_size:
             return False
 
-        if buf[cl] != self._FRAME_TERMINATOR:
-            raise RuntimeError("Frame doesn't end with NULL byte")
-
-        self._flush()
-        self._write_buffer(buf[cl + 1:])
-        body = buf[:cl]
+        self._complete_body()
+        return True
 
-        self._tmp_frame.body = body
+    def _grow_body(self, needed):
+        """
+        Grow the body buffer if it has less than needed free bytes. The
+        buffer size is at least doubled, up to the expected body size.
+        """
+        if len(self._body) - self._body_pos >= needed:
+            return
+        size = min(self._body_size, max(len(self._body) * 2,
+                                        self._body_pos + needed))
+        self._body += bytearray(size - len(self._body))
+
+    def _complete_body(self):
+        body = self._body
+        self._body = None
+        if body[-1] != self._FRAME_TERMINATOR:
+            raise RuntimeError("Frame doesn't end with NULL byte")
+        with memoryview(body) as view:
+            self._tmp_frame.body = view[:-1].tobytes()
         self._push_frame()
 
-        return True
-
     @property
     def pending(self):
         return len(self._frames)
 
     def parse(self, data):
-        self._write_buffer(data)
+        self._buffer += data
         while self._state_cb():
             pass
+        self._compact()
+
+    def body_buffer(self):
+        """
+        Return a memoryview of the missing part of the current frame body, or
+        None if the parser is not waiting for a body with known length.
+
+        The caller can receive data directly into the returned buffer, and
+        must call body_received() with the number of bytes received.
+        """
+        if self._body is None:
+            return None
+        self._grow_body(1)
+        return memoryview(self._body)[self._body_pos:]
+
+    def body_received(self, nbytes):
+        """
+        Called after receiving nbytes into the buffer returned by
+        body_buffer().
+        """
+        self._body_pos += nbytes
+        if self._body_pos == self._body_size:
+            self._complete_body()
 
     def pop_frame(self):
         try:
@@ -349,6 +544,9 @@ class AsyncDispatcher(object):
         Returns response frame to be sent
         def peek_message(self)
 
+        Removes the response frame returned by peek_message
+        def pop_message(self)
+
         Returns Ture if there are messages to be sent
         def has_outgoing_messages(self)
 
@@ -365,7 +563,11 @@ class AsyncDispatcher(object):
         self.connection = connection
         self._bufferSize = bufferSize
         self._parser = Parser()
-        self._outbuf = None
+        # Buffers of frames being sent, and [frame, bytes left] of every
+        # frame in the buffers.
+        self._outbufs = deque()
+        self._outframes = deque()
+        self._outsize = 0
         self._incoming_heartbeat_in_milis = 0
         self._outgoing_heartbeat_in_milis = 0
         self._reconnect_interval = 0
@@ -396,7 +598,9 @@ class AsyncDispatcher(object):
 
     def handle_connect(self, dispatcher):
         self.log.debug("managed to connect successfully.")
-        self._outbuf = None
+        self._outbufs.clear()
+        self._outframes.clear()
+        self._outsize = 0
         self._count = 0
         self._on_timeout = False
         self._update_reconnect_time()
@@ -408,17 +612,29 @@ class AsyncDispatcher(object):
         todo = self._bufferSize
 
         while todo:
+            # When the parser is waiting for a large body, receive directly
+            # into the body buffer.
+            body = parser.body_buffer()
             try:
-                data = dispatcher.recv(todo)
+                if body is None:
+                    data = dispatcher.recv(todo)
+                else:
+                    nbytes = dispatcher.recv_into(body)
             except socket.error:
                 dispatcher.handle_error()
                 return
 
             # When a socket is closed data is not available so we do not
             # need to parse it.
-            if not data:
-                return
-            parser.parse(data)
+            if body is None:
+                if not data:
+                    return
+                parser.parse(data)
+            else:
+                body.release()
+                if not nbytes:
+                    return
+                parser.body_received(nbytes)
             todo = pending()
 
         while parser.pending > 0:
@@ -494,36 +710,65 @@ class AsyncDispatcher(object):
 
     def handle_write(self, dispatcher):
         while True:
-            if self._outbuf is None:
-                try:
-                    frame = self._frame_handler.peek_message()
-                except IndexError:
-                    return
-
-                self._outbuf = frame.encode()
+            self._fill_outbufs()
+            if not self._outbufs:
+                return
 
-            data = self._outbuf
-            numSent = dispatcher.send(data)
+            buffers = list(itertools.islice(self._outbufs,
+                                            WRITE_BATCH_BUFFERS))
+            numSent = dispatcher.sendmsg(buffers)
             if numSent == 0:
                 # want to resend
-                resend = self._frame_handler.peek_message()
+                resend = self._outframes[0][0]
                 if resend.command == Command.SEND:
                     self._frame_handler.queue_resend(resend)
                 return
 
             self._update_outgoing_heartbeat()
-            if numSent < len(data):
-                self._outbuf = data[numSent:]
+            self._consume_outbufs(numSent)
+            if numSent < sum(len(buf) for buf in buffers):
                 return
 
-            self._outbuf = None
-            self._frame_handler.pop_message()
+    def _fill_outbufs(self):
+        """
+        Move queued frames to the output buffers, so they can be sent
+        together.
+        """
+        frame_handler = self._frame_handler
+        while (self._outsize < WRITE_BATCH_SIZE and
+               frame_handler.has_outgoing_messages):
+            frame = frame_handler.peek_message()
+            frame_handler.pop_message()
+            size = 0
+            for chunk in frame.encode_chunks():
+                self._outbufs.append(memoryview(chunk))
+                size += len(chunk)
+            self._outframes.append([frame, size])
+            self._outsize += size
+
+    def _consume_outbufs(self, nbytes):
+        self._outsize -= nbytes
+
+        n = nbytes
+        while self._outbufs and n >= len(self._outbufs[0]):
+            n -= len(self._outbufs.popleft())
+        if n:
+            self._outbufs[0] = self._outbufs[0][n:]
+
+        n = nbytes
+        while n:
+            entry = self._outframes[0]
+            if n < entry[1]:
+                entry[1] -= n
+                break
+            n -= entry[1]
+            self._outframes.popleft()
 
     def writable(self, dispatcher):
         if self._frame_handler.has_outgoing_messages:
             return True
 
-        if self._outbuf is not None:
+        if self._outbufs:
             return True
 
         if (self.next_check_interval() == 0):
@@ -545,13 +790,15 @@ class AsyncDispatcher(object):
 
 class Subscription(object):
 
-    def __init__(self, client, destination, subid, ack, message_handler):
+    def __init__(self, client, destination, subid, ack, message_handler,
+                 headers=None):
         self._ack = ack
         self._subid = subid
         self._client = client
         self._valid = True
         self._message_handler = message_handler
         self._destination = destination
+        self._headers = headers or {}
 
     def handle_message(self, frame):
         self._message_handler(self, frame)
@@ -577,6 +824,14 @@ class Subscription(object):
     def client(self):
         return self._client
 
+    @property
+    def headers(self):
+        """
+        The headers of the SUBSCRIBE frame, used by publishers supporting
+        per subscription options.
+        """
+        return self._headers
+
     @property
     def message_handler(self):
         return self._message_handler
@@ -612,7 +867,7 @@ class StompConnection(object):
 
     def send_raw(self, msg):
         self._async_client.queue_frame(msg)
-        self._reactor.wakeup()
+        self._reactor.wakeup(self._dispatcher)
 
     def setTimeout(self, timeout):
         self._dispatcher.socket.settimeout(timeout)
@@ -640,6 +895,10 @@ class StompConnection(object):
     def get_local_address(self):
         return self._dispatcher.socket.getsockname()[0]
 
+    @property
+    def attachment_threshold(self):
+        return getattr(self._async_client, "attachment_threshold", 0)
+
     def set_message_handler(self, msgHandler):
         self._messageHandler = msgHandler
         self._dispatcher.handle_read_event()
@@ -25,6 +25,7 @@ from vdsm import utils
 from vdsm.common import concurrent
 from vdsm.common import pki
 from vdsm.sslutils import SSLSocket, SSLContext
+from yajsonrpc import attachment
 from yajsonrpc.stomp import \
     AckMode, \
     Command, \
@@ -59,6 +60,8 @@ class AsyncClient(object):
         self._requests = deque()
         self._error = None
         self._subscriptions = {}
+        # Attachments received before the message referencing them.
+        self._attachments = {}
         self._commands = {
             Command.CONNECTED: self._process_connected,
             Command.MESSAGE: self._process_message,
@@ -100,6 +103,7 @@ class AsyncClient(object):
 
     def handle_connect(self):
         self._outbox.clear()
+        self._attachments.clear()
         outgoing_heartbeat = \
             int(self._outgoing_heartbeat * (1 + GRACE_PERIOD_FACTOR))
         incoming_heartbeat = \
@@ -111,6 +115,7 @@ class AsyncClient(object):
                 Headers.ACCEPT_VERSION: "1.2",
                 Headers.HEARTBEAT: "%d,%d" % (outgoing_heartbeat,
                                               incoming_heartbeat),
+                Headers.ATTACHMENTS: "true",
             }
         ))
         self.restore_subscriptions()
@@ -155,6 +160,24 @@ class AsyncClient(object):
             )
             return
 
+        att_id = frame.headers.get(Headers.ATTACHMENT_ID)
+        if att_id is not None:
+            self._attachments[att_id] = attachment.value(frame)
+            return
+
+        # The body of a message referencing attachments is replaced with an
+        # attachment.Message, decoded using attachment.decode().
+        att_ids = frame.headers.get(Headers.ATTACHMENTS)
+        if att_ids:
+            attachments = {}
+            for att_id in att_ids.split(","):
+                try:
+                    attachments[att_id] = self._attachments.pop(att_id)
+                except KeyError:
+                    self.log.warning("Got message referencing unknown "
+                                     "attachment '%s'", att_id)
+            frame.body = attachment.Message(frame.body, attachments)
+
         sub.handle_message(frame)
 
     def _process_receipt(self, frame, dispatcher):
@@ -283,7 +306,7 @@ class StompClient(object):
 
     def subscribe(self, *args, **kwargs):
         sub = self._aclient.subscribe(*args, **kwargs)
-        self._reactor.wakeup()
+        self._reactor.wakeup(self._stompConn.dispatcher)
         return sub
 
     def unsubscribe(self, sub):
@@ -301,7 +324,7 @@ class StompClient(object):
             message,
             headers
         )
-        self._reactor.wakeup()
+        self._reactor.wakeup(self._stompConn.dispatcher)
 
     def close(self):
         self._stompConn.close()
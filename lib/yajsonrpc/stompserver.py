@@ -16,12 +16,14 @@
 from __future__ import absolute_import
 from __future__ import division
 import logging
+import threading
 from collections import deque
 import functools
 
 from vdsm.config import config
 from vdsm.common.compat import json
 from . import JsonRpcServer
+from . import attachment
 from . import stomp, stompclient
 from .betterAsyncore import Dispatcher, Reactor
 
@@ -45,6 +47,95 @@ def parseHeartBeatHeader(v):
     return (x, y)
 
 
+class SubscriptionIndex(object):
+    """
+    Route messages to subscriptions.
+
+    A subscription receives the messages sent to its destination, and to the
+    destinations below it. Hierarchy is defined using dot as the separator.
+    A "*" segment in the subscription destination matches any segment, so a
+    subscription to "jms.queue.*" receives messages sent to
+    "jms.queue.events" and "jms.queue.events.vm".
+
+    The subscriptions are kept in sub_map, mapping a subscription destination
+    to a list of subscriptions. The subscriptions matching a destination are
+    cached until a subscription is added or removed. If sub_map is modified
+    directly, invalidate() must be called.
+    """
+
+    # Limit the cache for clients sending to many destinations.
+    MAX_ROUTES = 1024
+
+    def __init__(self, sub_map):
+        self._sub_map = sub_map
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._patterns = None
+
+    @property
+    def sub_map(self):
+        return self._sub_map
+
+    def add(self, subscription):
+        with self._lock:
+            self._sub_map[subscription.destination].append(subscription)
+            self._invalidate()
+
+    def remove(self, subscription):
+        with self._lock:
+            subs = self._sub_map.get(subscription.destination)
+            if subs is None:
+                return
+            if subscription in subs:
+                subs.remove(subscription)
+            if not subs:
+                del self._sub_map[subscription.destination]
+            self._invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._invalidate()
+
+    def find(self, destination):
+        """
+        Return a tuple of the subscriptions receiving messages sent to
+        destination.
+        """
+        with self._lock:
+            try:
+                return self._routes[destination]
+            except KeyError:
+                pass
+            subs = self._match(destination)
+            if len(self._routes) >= self.MAX_ROUTES:
+                self._routes.clear()
+            self._routes[destination] = subs
+            return subs
+
+    def _invalidate(self):
+        self._routes.clear()
+        self._patterns = None
+
+    def _match(self, destination):
+        segments = destination.split(".")
+        subs = []
+        for parts in range(len(segments)):
+            candidate_dest = ".".join(segments[:parts + 1])
+            subs.extend(self._sub_map.get(candidate_dest, ()))
+
+        if self._patterns is None:
+            self._patterns = [(dest, dest.split("."))
+                              for dest in self._sub_map if "*" in dest]
+
+        for dest, pattern in self._patterns:
+            if dest == destination or len(pattern) > len(segments):
+                continue
+            if all(p == "*" or p == s for p, s in zip(pattern, segments)):
+                subs.extend(self._sub_map[dest])
+
+        return tuple(subs)
+
+
 class StompAdapterImpl(object):
     log = logging.getLogger("Broker.StompAdapter")
 
@@ -56,15 +147,22 @@ class StompAdapterImpl(object):
     sub_map - maps a destination id to _Subsctiption object
               representing stomp subscription.
     req_dest - maps a request id to a destination.
+
+    If index is specified, it is the SubscriptionIndex of sub_map shared by
+    all adapters of a server.
     """
-    def __init__(self, reactor, sub_map, req_dest):
+    def __init__(self, reactor, sub_map, req_dest, index=None):
         self._reactor = reactor
         self._outbox = deque()
-        self._sub_dests = sub_map
+        if index is None:
+            index = SubscriptionIndex(sub_map)
+        self._subscriptions = index
         self._req_dest = req_dest
         self._sub_ids = {}
         request_queues = config.get('addresses', 'request_queues')
         self.request_queues = request_queues.split(",")
+        # Set when the client negotiates attachments.
+        self.attachment_threshold = 0
         self._commands = {
             stomp.Command.CONNECT: self._cmd_connect,
             stomp.Command.SEND: self._cmd_send,
@@ -117,6 +215,11 @@ class StompAdapterImpl(object):
             resp.headers[stomp.Headers.HEARTBEAT] = "%d,%d" % (cy, cx)
             dispatcher.setHeartBeat(cy, cx)
 
+            threshold = config.getint('rpc', 'attachment_threshold')
+            if stomp.Headers.ATTACHMENTS in frame.headers and threshold > 0:
+                resp.headers[stomp.Headers.ATTACHMENTS] = str(threshold)
+                self.attachment_threshold = threshold
+
         self.queue_frame(resp)
         self._reactor.wakeup()
 
@@ -137,9 +240,10 @@ class StompAdapterImpl(object):
 
         ack = frame.headers.get("ack", stomp.AckMode.AUTO)
         subscription = stomp.Subscription(dispatcher.connection, destination,
-                                          sub_id, ack, None)
+                                          sub_id, ack, None,
+                                          headers=frame.headers)
 
-        self._sub_dests[destination].append(subscription)
+        self._subscriptions.add(subscription)
         self._sub_ids[sub_id] = subscription
 
     def _send_error(self, msg, connection):
@@ -181,12 +285,7 @@ class StompAdapterImpl(object):
                                                    headers))
 
     def _remove_subscription(self, subscription):
-        subs = self._sub_dests[subscription.destination]
-        if len(subs) == 1:
-            del self._sub_dests[subscription.destination]
-        else:
-            if subscription in subs:
-                subs.remove(subscription)
+        self._subscriptions.remove(subscription)
 
     def _cmd_send(self, dispatcher, frame):
         destination = frame.headers.get(stomp.Headers.DESTINATION, None)
@@ -195,8 +294,8 @@ class StompAdapterImpl(object):
         subs = self.find_subscribers(destination)
 
         # Forward the message to all explicit subscribers.
-        for subscription in subs:
-            self._forward_frame(subscription, frame)
+        if subs:
+            self._forward_frame(subs, frame)
 
         # Is this a command that is meant to be answered
         # by the internal implementation?
@@ -214,19 +313,18 @@ class StompAdapterImpl(object):
             self._send_error("Subscription not available",
                              dispatcher.connection)
 
-    def _forward_frame(self, subscription, frame):
+    def _forward_frame(self, subscriptions, frame):
         """
         This method creates a new frame with the right body
-        and updated headers and forwards it to the subscriber.
+        and updated headers and forwards it to the subscribers.
         """
-        headers = {stomp.Headers.SUBSCRIPTION: subscription.id}
-        headers.update(frame.headers)
-        res = stomp.Frame(
+        res = stomp.FanoutFrame(
             stomp.Command.MESSAGE,
-            headers,
+            frame.headers,
             frame.body
         )
-        subscription.client.send_raw(res)
+        for subscription in subscriptions:
+            subscription.client.send_raw(res.frame(subscription.id))
 
     def _handle_internal(self, dispatcher, req_dest, flow_id, request):
         """
@@ -275,14 +373,7 @@ class StompAdapterImpl(object):
         """Return all subscribers that are interested in the destination
            or its parents. Hierarchy is defined using dot as the separator.
         """
-        destination_segments = destination.split(".")
-        subscriptions = []
-        for parts in range(len(destination_segments)):
-            candidate_dest = ".".join(destination_segments[:parts + 1])
-            if candidate_dest in self._sub_dests:
-                subscriptions.extend(self._sub_dests[candidate_dest])
-
-        return subscriptions
+        return self._subscriptions.find(destination)
 
 
 class StompServer(object):
@@ -292,52 +383,80 @@ class StompServer(object):
         self._reactor = reactor
         self._messageHandler = None
         self._sub_map = subscriptions
+        self._subscriptions = SubscriptionIndex(subscriptions)
         self._req_dest = {}
 
+    @property
+    def subscriptions(self):
+        return self._subscriptions
+
     def add_client(self, sock):
         adapter = StompAdapterImpl(self._reactor, self._sub_map,
-                                   self._req_dest)
+                                   self._req_dest,
+                                   index=self._subscriptions)
         return stomp.StompConnection(self, adapter, sock,
                                      self._reactor)
 
+    def attachment_threshold(self, response_ids):
+        """
+        Return the attachment threshold for a reply with response_ids, or 0
+        if some of the reply receivers do not support attachments.
+        """
+        destination = stomp.SUBSCRIPTION_ID_RESPONSE
+        for response_id in response_ids:
+            destination = self._req_dest.get(response_id, destination)
+
+        connections = self._subscriptions.find(destination)
+        if not connections:
+            return 0
+
+        return min(connection.client.attachment_threshold
+                   for connection in connections)
+
     """
     Sends message to all subscribes that subscribed to destination.
-    """
-    def send(self, message, destination=stomp.SUBSCRIPTION_ID_RESPONSE):
-        resp = json.loads(message)
-        if not isinstance(resp, dict):
-            raise ValueError(
-                'Provided message %s failed parsing to dictionary' % message)
-        # pylint: disable=no-member
-        response_id = resp.get("id")
-
-        try:
-            destination = self._req_dest[response_id]
-            del self._req_dest[response_id]
-        except KeyError:
-            # we could have no reply-to or we could send events (no message id)
-            pass
 
-        try:
-            connections = self._sub_map[destination]
-        except KeyError:
+    When sending a reply, response_ids are the ids of the responses in the
+    message, used to send the reply to the destination of the request.
+    attachments are (id, value) tuples referenced by the reply, sent before
+    the reply. If subscriptions are specified, the message is sent only to
+    these subscriptions to destination.
+    """
+    def send(self, message, destination=stomp.SUBSCRIPTION_ID_RESPONSE,
+             response_ids=(), attachments=(), subscriptions=None):
+        for response_id in response_ids:
+            try:
+                destination = self._req_dest.pop(response_id)
+            except KeyError:
+                # we could have no reply-to
+                pass
+
+        if subscriptions is None:
+            connections = self._subscriptions.find(destination)
+        else:
+            connections = subscriptions
+        if not connections:
             self.log.warn("Attempt to reply to unknown destination %s",
                           destination)
             return
 
+        # The frames are encoded once for all subscribers.
+        headers = {stomp.Headers.DESTINATION: destination}
+        frames = []
+        if attachments:
+            frames.extend(attachment.frames(attachments, headers))
+            headers[stomp.Headers.ATTACHMENTS] = attachment.ids(attachments)
+        headers[stomp.Headers.CONTENT_TYPE] = "application/json"
+        frames.append(stomp.FanoutFrame(stomp.Command.MESSAGE, headers,
+                                        message))
+
         for connection in connections:
-            res = stomp.Frame(
-                stomp.Command.MESSAGE,
-                {
-                    stomp.Headers.DESTINATION: destination,
-                    stomp.Headers.CONTENT_TYPE: "application/json",
-                    stomp.Headers.SUBSCRIPTION: connection.id
-                },
-                message
-            )
             # we need to check whether the channel is not closed
-            if not connection.client.is_closed():
-                connection.client.send_raw(res)
+            if connection.client.is_closed():
+                continue
+
+            for frame in frames:
+                connection.client.send_raw(frame.frame(connection.id))
 
 
 def StompListener(reactor, server, acceptHandler, connected_socket):
@@ -440,7 +559,7 @@ class ServerRpcContextAdapter(object):
     def get_local_address(self, *args, **kwargs):
         return self._address
 
-    def send(self, data):
+    def send(self, data, response_ids=()):
         if self._reply_to:
             self._client.send(
                 self._reply_to,
@@ -21,11 +21,20 @@
 
 from __future__ import absolute_import
 from __future__ import division
+
+import collections
 import socket
-from contextlib import closing
+import threading
+import time
+
+from contextlib import closing, contextmanager
+
+import pytest
 
 from vdsm.common import concurrent
-from yajsonrpc.betterAsyncore import AsyncoreEvent, Reactor
+from yajsonrpc.betterAsyncore import AsyncoreEvent, Dispatcher, Reactor
+from yajsonrpc.stompclient import StompClient
+from yajsonrpc.stompserver import StompReactor
 
 from testlib import VdsmTestCase as TestCaseBase
 
@@ -71,3 +80,152 @@ class TestReactor(TestCaseBase):
 
         self.assertTrue(disp.closing)
         self.assertFalse(reactor._wakeupEvent.closing)
+
+
+class CountingImpl(object):
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.checks = 0
+        self.want_write = False
+        self.written = threading.Event()
+
+    def next_check_interval(self):
+        self.checks += 1
+        return self.interval
+
+    def readable(self, dispatcher):
+        return False
+
+    def writable(self, dispatcher):
+        return self.want_write
+
+    def handle_write(self, dispatcher):
+        self.want_write = False
+        self.written.set()
+
+
+@contextmanager
+def running_reactor():
+    reactor = Reactor()
+    thread = concurrent.thread(reactor.process_requests, name="test reactor")
+    thread.start()
+    try:
+        yield reactor
+    finally:
+        reactor.stop()
+        thread.join()
+
+
+def test_sendmsg():
+    s1, s2 = socket.socketpair()
+    with closing(s1), closing(s2):
+        dispatcher = Dispatcher(sock=s1, map={})
+        assert dispatcher.sendmsg([b"a", memoryview(b"bc"), b"d"]) == 4
+        assert s2.recv(4) == b"abcd"
+
+
+def test_reactor_check_interval():
+    impl = CountingImpl(interval=0.05)
+    s1, s2 = socket.socketpair()
+    with closing(s2), running_reactor() as reactor:
+        reactor.create_dispatcher(s1, impl=impl)
+        time.sleep(0.5)
+
+    # The dispatcher is checked when its check interval expires, without
+    # busy looping.
+    assert 3 < impl.checks < 20
+
+
+def test_reactor_wakeup_dispatcher():
+    impl = CountingImpl()
+    s1, s2 = socket.socketpair()
+    with closing(s2), running_reactor() as reactor:
+        dispatcher = reactor.create_dispatcher(s1, impl=impl)
+        impl.want_write = True
+        reactor.wakeup(dispatcher)
+        assert impl.written.wait(1)
+
+
+def test_reactor_wakeup_coalesced():
+    reactor = Reactor()
+    writes = []
+    reactor._wakeupEvent.set = lambda: writes.append(1)
+    try:
+        # Before the reactor updates the dispatchers, all wakeups are handled
+        # together.
+        for _ in range(10):
+            reactor.wakeup()
+        assert len(writes) == 1
+
+        reactor._wakeup_pending = False
+        reactor.wakeup()
+        assert len(writes) == 2
+    finally:
+        reactor._wakeupEvent.close()
+        reactor._epoll.close()
+
+
+def test_reactor_remove_dispatcher():
+    impl = CountingImpl()
+    s1, s2 = socket.socketpair()
+    with closing(s1), closing(s2), running_reactor() as reactor:
+        dispatcher = reactor.create_dispatcher(s1, impl=impl)
+        impl.want_write = True
+        reactor.wakeup(dispatcher)
+        assert impl.written.wait(1)
+
+        # Removing the dispatcher must not leave the socket in the reactor,
+        # even if the socket is still open.
+        dispatcher.del_channel()
+        assert s1.fileno() not in reactor._events
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("clients", [100, 500])
+def test_stomp_clients_benchmark(clients):
+    messages = 20
+    received = collections.Counter()
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def handle_message(sub, frame):
+        with lock:
+            received[sub.id] += 1
+            if sum(received.values()) == clients * messages:
+                done.set()
+
+    server = StompReactor(collections.defaultdict(list))
+    listener = socket.socket()
+    with closing(listener), running_reactor() as client_reactor:
+        server_thread = concurrent.thread(server.process_requests,
+                                          name="test server")
+        server_thread.start()
+        try:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(clients)
+            stomp_clients = []
+            for i in range(clients):
+                sock = socket.create_connection(listener.getsockname())
+                server_sock, _ = listener.accept()
+                server.createListener(server_sock, lambda conn: None)
+                client = StompClient(sock, client_reactor, owns_reactor=False)
+                client.subscribe("bench.%d" % i, sub_id="sub-%d" % i,
+                                 message_handler=handle_message)
+                stomp_clients.append(client)
+
+            start = time.monotonic()
+            for i, client in enumerate(stomp_clients):
+                for _ in range(messages):
+                    client.send(b"x" * 1024, destination="bench.%d" % i)
+
+            assert done.wait(60)
+            elapsed = time.monotonic() - start
+        finally:
+            server.stop()
+            server_thread.join()
+
+    assert received == {"sub-%d" % i: messages for i in range(clients)}
+    print("clients=%d messages=%d elapsed=%.3f rate=%.0f/s" % (
+        clients, clients * messages, elapsed,
+        clients * messages / elapsed))
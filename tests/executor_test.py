@@ -104,6 +104,21 @@ class ExecutorTests(TestCaseBase):
             for task in tasks:
                 self.executor.dispatch(task)
 
+    def test_collect_stats(self):
+        task = Task()
+        self.executor.dispatch(task)
+        task.executed.wait(1)
+        stats = self.executor.collect_stats()
+        self.assertEqual(stats["started"], 1)
+        self.assertEqual(stats["queued"], 0)
+        self.assertGreaterEqual(stats["queue_time_max"],
+                                stats["queue_time_avg"])
+
+        # Stats are reset after collecting them.
+        stats = self.executor.collect_stats()
+        self.assertEqual(stats["started"], 0)
+        self.assertEqual(stats["queue_time_avg"], 0.0)
+
     @slowtest
     def test_concurrency(self):
         tasks = [Task(wait=0.1) for n in range(20)]
@@ -321,6 +336,15 @@ class ExecutorTaskTests(TestCaseBase):
             time.sleep(STEP)
             self.assertGreaterEqual(task.duration, i * STEP)
 
+    def test_queue_time(self):
+        task = executor.Task(lambda: None, None)
+        time.sleep(0.1)
+        task()
+        queue_time = task.queue_time
+        self.assertGreaterEqual(queue_time, 0.1)
+        time.sleep(0.1)
+        self.assertEqual(task.queue_time, queue_time)
+
     def test_repr_timeout(self):
         # temporaries only for readability
         timeout = None
@@ -208,6 +208,44 @@ class HostStatsThreadTests(TestCaseBase):
             expected
         )
 
+    def testHistoryValues(self):
+        first_sample = FakeHostSample(1.0, user=100, sys=50, load='0.50')
+        last_sample = FakeHostSample(3.0, user=300, sys=150, load='1.50')
+
+        self.assertEqual(
+            hoststats.history_values(first_sample, last_sample),
+            {
+                'cpuUser': 50.0,
+                'cpuSys': 25.0,
+                'cpuIdle': 25.0,
+                'cpuUserVdsmd': 100.0,
+                'cpuSysVdsmd': 50.0,
+                'memUsed': 40,
+                'cpuLoad': 1.5,
+            })
+
+    def testHistoryValuesIntervalTooSmall(self):
+        sample = FakeHostSample(1.0, user=100, sys=50, load='0.50')
+        self.assertEqual(hoststats.history_values(sample, sample), {})
+
+
+class FakeCpuSample(object):
+
+    def __init__(self, user, sys):
+        self.user = user
+        self.sys = sys
+
+
+class FakeHostSample(object):
+
+    def __init__(self, timestamp, user, sys, load):
+        self.timestamp = timestamp
+        self.pidcpu = FakeCpuSample(user, sys)
+        self.totcpu = FakeCpuSample(user, sys)
+        self.ncpus = 2
+        self.memUsed = 40
+        self.cpuLoad = load
+
 
 class HostStatsNetworkTests(TestCaseBase):
 
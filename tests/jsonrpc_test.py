@@ -21,6 +21,7 @@
 from __future__ import absolute_import
 from __future__ import division
 from yajsonrpc import JsonRpcRequest, JsonRpcServer
+from yajsonrpc import rpcstats
 
 from vdsm.common import exception
 from vdsm.common.compat import json
@@ -28,6 +29,12 @@ from vdsm.common.compat import json
 from testlib import VdsmTestCase
 
 
+class FakeBridge(object):
+
+    def dispatch(self, method):
+        return lambda: None
+
+
 class FakeContext(object):
 
     def requestDone(self, res):
@@ -49,7 +56,8 @@ class ServerTests(VdsmTestCase):
         request = JsonRpcRequest.decode(
             '{"jsonrpc":"2.0","method":"Host.stats","params":{},"id":"943"}')
 
-        server = JsonRpcServer(None, 0, None, threadFactory=thread_factory)
+        server = JsonRpcServer(FakeBridge(), 0, None,
+                               threadFactory=thread_factory)
         server._runRequest(ctx, request)
 
         error = ctx.response.toDict().get('error')
@@ -63,3 +71,10 @@ class ServerTests(VdsmTestCase):
         self.assertEqual({"reason": "Too many tasks",
                           "resource": "test",
                           "current_tasks": 0}, reason)
+
+        # Contexts without a client host are recorded as "unknown".
+        info = server.stats.info()
+        self.assertEqual({"unknown": {"requests": 1, "in_flight": 0}},
+                         info["clients"])
+        self.assertEqual(1, info["methods"]["Host.stats"]["errors"])
+        self.assertNotIn(rpcstats.UNKNOWN_METHOD, info["methods"])
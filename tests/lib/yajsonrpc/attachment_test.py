@@ -0,0 +1,214 @@
+#
+# Copyright 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import base64
+import collections
+import time
+
+import pytest
+
+from vdsm.common.compat import json
+
+from yajsonrpc import JsonRpcResponse
+from yajsonrpc import _JsonRpcServeRequestContext
+from yajsonrpc import attachment
+from yajsonrpc import stomp
+from yajsonrpc.stompclient import AsyncClient
+from yajsonrpc.stompserver import StompServer
+
+THRESHOLD = 100
+
+BLOB = bytes(bytearray(range(256))) * 4
+TEXT = u"ą" * 200
+
+
+class FakeConnection(object):
+
+    def __init__(self, threshold):
+        self.attachment_threshold = threshold
+        self.frames = []
+
+    def is_closed(self):
+        return False
+
+    def send_raw(self, frame):
+        self.frames.append(frame)
+
+
+class FakeSubscription(object):
+
+    def __init__(self, sub_id, threshold):
+        self.id = sub_id
+        self.client = FakeConnection(threshold)
+
+
+def test_extract_small():
+    obj = {"a": "x" * (THRESHOLD - 1), "b": [1, None, b"y"]}
+    attachments = []
+    assert attachment.extract(obj, THRESHOLD, attachments) is obj
+    assert attachments == []
+
+
+def test_extract():
+    small = {"c": "small"}
+    obj = {"a": TEXT, "b": [1, BLOB], "small": small}
+    attachments = []
+
+    result = attachment.extract(obj, THRESHOLD, attachments)
+
+    (text_id, text), (blob_id, blob) = sorted(
+        attachments, key=lambda a: not isinstance(a[1], type(TEXT)))
+    assert text is TEXT
+    assert blob is BLOB
+    assert result == {"a": {attachment.REF: text_id},
+                      "b": [1, {attachment.REF: blob_id}],
+                      "small": small}
+    # Containers without attachments are not copied.
+    assert result["small"] is small
+    # The original object is not modified.
+    assert obj == {"a": TEXT, "b": [1, BLOB], "small": small}
+
+
+def test_decode_plain():
+    assert attachment.decode(b'{"a": 1}') == {"a": 1}
+
+
+def test_decode_unknown_reference():
+    data = json.dumps({"a": {attachment.REF: "1"}})
+    message = attachment.Message(data, {})
+    assert attachment.decode(message) == {"a": {attachment.REF: "1"}}
+
+
+@pytest.fixture
+def server():
+    return StompServer(None, collections.defaultdict(list))
+
+
+def subscribe(server, destination, threshold):
+    sub = FakeSubscription("sub-" + destination, threshold)
+    server._sub_map[destination].append(sub)
+    return sub
+
+
+@pytest.mark.parametrize("thresholds,expected", [
+    ([THRESHOLD], THRESHOLD),
+    ([THRESHOLD, 0], 0),
+    ([], 0),
+])
+def test_server_threshold(server, thresholds, expected):
+    for i, threshold in enumerate(thresholds):
+        sub = subscribe(server, "reply-queue", threshold)
+        sub.id = "sub-%d" % i
+    server._req_dest["req-id"] = "reply-queue"
+
+    assert server.attachment_threshold(["req-id"]) == expected
+
+
+def test_reply_without_attachments(server):
+    sub = subscribe(server, "reply-queue", 0)
+    server._req_dest["req-id"] = "reply-queue"
+    ctx = _JsonRpcServeRequestContext(server, None, None)
+
+    ctx.requestDone(JsonRpcResponse({"data": TEXT}, None, "req-id"))
+
+    frame, = sub.client.frames
+    assert stomp.Headers.ATTACHMENTS not in frame.headers
+    assert json.loads(frame.body) == {
+        "jsonrpc": "2.0", "id": "req-id", "result": {"data": TEXT}}
+
+
+def test_reply_with_attachments(server):
+    sub = subscribe(server, "reply-queue", THRESHOLD)
+    server._req_dest["req-id"] = "reply-queue"
+    ctx = _JsonRpcServeRequestContext(server, None, None)
+    result = {"text": TEXT, "blob": BLOB, "small": "small"}
+
+    ctx.requestDone(JsonRpcResponse(result, None, "req-id"))
+
+    # Attachments are sent before the reply.
+    frames = sub.client.frames
+    assert len(frames) == 3
+    for frame in frames[:2]:
+        assert stomp.Headers.ATTACHMENT_ID in frame.headers
+        assert frame.headers[stomp.Headers.SUBSCRIPTION] == sub.id
+    reply = frames[2]
+    assert reply.headers[stomp.Headers.CONTENT_TYPE] == "application/json"
+
+    # Send the frames to a client.
+    client = AsyncClient()
+    received = []
+    client.subscribe("reply-queue", sub_id=sub.id,
+                     message_handler=lambda sub, frame: received.append(
+                         frame.body))
+    parser = stomp.Parser()
+    for frame in frames:
+        parser.parse(frame.encode())
+    while parser.pending:
+        client.handle_frame(None, parser.pop_frame())
+
+    message, = received
+    assert attachment.decode(message) == {
+        "jsonrpc": "2.0", "id": "req-id", "result": result}
+    assert client._attachments == {}
+
+
+def test_reply_encoding_error(server):
+    sub = subscribe(server, "reply-queue", THRESHOLD)
+    server._req_dest["req-id"] = "reply-queue"
+    ctx = _JsonRpcServeRequestContext(server, None, None)
+
+    ctx.requestDone(JsonRpcResponse({"text": TEXT, "bad": object()}, None,
+                                    "req-id"))
+
+    # The attachments of a response that could not be encoded are dropped.
+    frame, = sub.client.frames
+    assert "error" in json.loads(frame.body)
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("threshold", [0, 64 * 1024])
+def test_reply_benchmark(server, threshold):
+    sub = subscribe(server, "reply-queue", threshold)
+    data = base64.b64encode(b"x" * 8 * 1024**2).decode("ascii")
+    runs = 10
+
+    start = time.monotonic()
+    for i in range(runs):
+        server._req_dest[i] = "reply-queue"
+        ctx = _JsonRpcServeRequestContext(server, None, None)
+        ctx.requestDone(JsonRpcResponse({"_X_data": data}, None, i))
+        parser = stomp.Parser()
+        for frame in sub.client.frames:
+            parser.parse(frame.encode())
+        del sub.client.frames[:]
+        client = AsyncClient()
+        received = []
+        client.subscribe("reply-queue", sub_id=sub.id,
+                         message_handler=lambda sub, frame: received.append(
+                             frame.body))
+        while parser.pending:
+            client.handle_frame(None, parser.pop_frame())
+        attachment.decode(received[0])
+    elapsed = (time.monotonic() - start) / runs
+
+    print("threshold=%d size=%d time=%.3f" % (threshold, len(data), elapsed))
@@ -0,0 +1,162 @@
+#
+# Copyright 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import time
+import tracemalloc
+
+import pytest
+
+from vdsm.common.compat import json
+
+from yajsonrpc import JsonRpcResponse
+from yajsonrpc import codec
+from yajsonrpc import exception
+from yajsonrpc.stomp import Command, Frame, Parser
+
+
+def available_codecs():
+    names = []
+    for name in ("json", "ujson", "orjson"):
+        try:
+            codec.create(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+@pytest.fixture(params=available_codecs())
+def jsoncodec(request, monkeypatch):
+    c = codec.create(request.param)
+    monkeypatch.setattr(codec, "_codec", c)
+    return c
+
+
+def vm_stats(vms):
+    stats = {"vmId": "f9a23d3c-6d1a-4c5e-bb2f-2b6a2cd9b7c8",
+             "status": "Up",
+             "elapsedTime": "12345",
+             "disks": {"vd%s" % c: {"readRate": "0.0",
+                                    "writeRate": "0.0",
+                                    "truesize": "1073741824",
+                                    "path": "/rhev/data-center/mnt/ą"}
+                       for c in "abcdefgh"},
+             "network": {"vnet%d" % i: {"rxRate": "0.0", "txRate": "0.0"}
+                         for i in range(4)}}
+    return [dict(stats, vmName="vm-%d" % i) for i in range(vms)]
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        codec.create("no-such-codec")
+
+
+@pytest.mark.parametrize("obj", [
+    None,
+    42,
+    "text",
+    u"ąbć",
+    [],
+    [1, "two", {"three": 3}],
+    {"a": [1, 2], "b": {"c": None}},
+])
+def test_roundtrip(jsoncodec, obj):
+    assert jsoncodec.loads(jsoncodec.dumps(obj)) == obj
+    assert jsoncodec.loads(b"".join(jsoncodec.iterencode(obj))) == obj
+
+
+def test_int_keys(jsoncodec):
+    assert jsoncodec.loads(jsoncodec.dumps({1: "a"})) == {"1": "a"}
+
+
+def test_join_small():
+    assert codec.join([b"a", b"b", b"c"], chunk_size=10) == b"abc"
+
+
+def test_join_chunks():
+    parts = [b"aaaa", b"bbbb", b"cccc", b"d"]
+    assert codec.join(parts, chunk_size=8) == [b"aaaabbbb", b"ccccd"]
+
+
+@pytest.mark.parametrize("result", [
+    True,
+    {"key": "value"},
+    [],
+    vm_stats(1000),
+])
+def test_response_iterencode(jsoncodec, result):
+    response = JsonRpcResponse(result, None, "req-id")
+    data = b"".join(response.iterencode())
+    assert json.loads(data) == json.loads(response.encode())
+
+
+def test_response_iterencode_error(jsoncodec):
+    response = JsonRpcResponse(None, exception.JsonRpcInternalError(), 1)
+    data = b"".join(response.iterencode())
+    assert json.loads(data) == json.loads(response.encode())
+
+
+def test_frame_chunked_body():
+    body = [b"x" * 100, b"y" * 100, b"z"]
+    frame = Frame(Command.MESSAGE, {"destination": "a"}, body)
+
+    chunks = frame.encode_chunks()
+    assert chunks[1:-1] == body
+
+    parser = Parser()
+    parser.parse(frame.encode())
+    parsed = parser.pop_frame()
+    assert parsed.headers["content-length"] == "201"
+    assert parsed.body == b"".join(body)
+
+
+def old_encode(response):
+    data = response.encode().encode("utf-8")
+    return Frame(Command.MESSAGE, {"destination": "a"}, data).encode()
+
+
+def new_encode(response):
+    data = codec.join(response.iterencode())
+    return Frame(Command.MESSAGE, {"destination": "a"}, data).encode_chunks()
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("encode", [old_encode, new_encode])
+def test_encode_reply_benchmark(jsoncodec, encode):
+    response = JsonRpcResponse(vm_stats(3000), None, "req-id")
+    runs = 10
+
+    start = time.monotonic()
+    for _ in range(runs):
+        encode(response)
+    elapsed = (time.monotonic() - start) / runs
+
+    tracemalloc.start()
+    try:
+        encode(response)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    print("codec=%s encoder=%s time=%.3f peak=%.2fMiB" % (
+        jsoncodec.name, encode.__name__, elapsed, peak / 1024**2))
@@ -25,7 +25,7 @@ import pytest
 from collections import OrderedDict
 
 from yajsonrpc.stomp import _heartbeat_frame as heartbeat_frame
-from yajsonrpc.stomp import Command, Frame
+from yajsonrpc.stomp import Command, FanoutFrame, Frame
 
 
 # https://stomp.github.io/stomp-specification-1.2.html#Heart-beating
@@ -120,3 +120,41 @@ def test_frame_should_have_a_copy_method():
     copy.headers["geh"] = "xyz"
 
     assert original.encode() == original_encoded
+
+
+@pytest.mark.parametrize("body", [None, b"zorro", [b"zor", b"ro"]])
+def test_fanout_frame(body):
+    headers = OrderedDict([("abc", "def")])
+    fanout = FanoutFrame(Command.MESSAGE, headers, body)
+
+    for sub_id in ("sub-1", "sub-2"):
+        frame = fanout.frame(sub_id)
+        expected = Frame(Command.MESSAGE,
+                         OrderedDict([("abc", "def")]),
+                         body)
+        expected_data = expected.encode()
+        expected_head, expected_body = expected_data.split(b"\n\n", 1)
+        data = frame.encode()
+        assert data == b"%s\nsubscription:%s\n\n%s" % (
+            expected_head, sub_id.encode("ascii"), expected_body)
+
+        assert frame.command == Command.MESSAGE
+        assert frame.headers["subscription"] == sub_id
+        assert frame.headers["abc"] == "def"
+        assert frame.body == expected.body
+
+
+def test_fanout_frame_shares_body():
+    body = b"x" * 1000
+    fanout = FanoutFrame(Command.MESSAGE, {}, body)
+    chunks1 = fanout.frame("sub-1").encode_chunks()
+    chunks2 = fanout.frame("sub-2").encode_chunks()
+    assert chunks1[0] is chunks2[0]
+    assert chunks1[2] is body
+    assert chunks2[2] is body
+
+
+def test_fanout_frame_does_not_modify_headers():
+    headers = {"content-length": "3"}
+    FanoutFrame(Command.MESSAGE, headers, "6chars")
+    assert headers == {"content-length": "3"}
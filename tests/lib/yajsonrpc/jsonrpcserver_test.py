@@ -27,6 +27,7 @@ from six.moves import queue
 from monkeypatch import MonkeyPatch
 from testValidation import slowtest
 from vdsm import executor
+from vdsm.api import vdsmapi
 from vdsm.common import exception
 
 from testlib import VdsmTestCase as TestCaseBase, \
@@ -71,6 +72,9 @@ class _DummyBridge(object):
         except AttributeError:
             raise JsonRpcMethodNotFoundError(method=method)
 
+    def concurrency(self, method):
+        return vdsmapi.DEFAULT_CONCURRENCY
+
     def echo(self, text):
         self.log.info("ECHO: '%s'", text)
         return text
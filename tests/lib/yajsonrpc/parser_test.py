@@ -19,6 +19,9 @@
 #
 
 from __future__ import absolute_import
+from __future__ import division
+
+import time
 
 import pytest
 
@@ -169,3 +172,141 @@ def test_parser_should_skip_heartbeat_frames():
     decoded_frame = parser.pop_frame()
     assert decoded_frame is not None
     assert decoded_frame.command == Command.CONNECT
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_parser_large_frames_in_chunks(chunk_size):
+    body = b"x" * 100000
+    encoded_frame = Frame(Command.SEND, {"abc": "def"}, body).encode()
+    data = encoded_frame + b"\n" + encoded_frame
+    parser = Parser()
+
+    for i in range(0, len(data), chunk_size):
+        parser.parse(data[i:i + chunk_size])
+
+    assert parser.pending == 2
+    for _ in range(2):
+        frame = parser.pop_frame()
+        assert frame.command == Command.SEND
+        assert frame.headers["abc"] == "def"
+        assert frame.body == body
+
+
+def test_parser_receive_body_into_buffer():
+    body = b"x" * 10000
+    encoded_frame = Frame(Command.SEND, {"abc": "def"}, body).encode()
+    header_size = len(encoded_frame) - len(body) - 1
+    parser = Parser()
+
+    # Parser is not waiting for a body yet.
+    assert parser.body_buffer() is None
+
+    # Receive the headers and the start of the body.
+    parser.parse(encoded_frame[:header_size + 100])
+    assert parser.pending == 0
+
+    # Receive the rest of the body directly into the parser.
+    pos = header_size + 100
+    while pos < len(encoded_frame):
+        buf = parser.body_buffer()
+        assert len(buf) == len(encoded_frame) - pos
+        nbytes = min(len(buf), 4096)
+        buf[:nbytes] = encoded_frame[pos:pos + nbytes]
+        buf.release()
+        parser.body_received(nbytes)
+        pos += nbytes
+
+    assert parser.body_buffer() is None
+    assert parser.pending == 1
+    frame = parser.pop_frame()
+    assert frame.body == body
+
+    # Parser can continue with the next frame.
+    parser.parse(Frame(Command.CONNECT).encode())
+    assert parser.pop_frame().command == Command.CONNECT
+
+
+def test_parser_raise_for_invalid_content_length_in_body_buffer():
+    parser = Parser()
+    parser.parse(b"CONNECT\ncontent-length:3\n\n")
+    buf = parser.body_buffer()
+    buf[:] = b"6cha"
+    buf.release()
+
+    with pytest.raises(RuntimeError) as err:
+        parser.body_received(4)
+
+    assert "Frame doesn't end with NULL byte" in str(err.value)
+
+
+def test_parser_huge_content_length():
+    parser = Parser()
+    parser.parse(b"SEND\ncontent-length:500000000\n\nabc")
+    assert parser.pending == 0
+
+    # The body buffer is not allocated using the peer content-length.
+    buf = parser.body_buffer()
+    assert len(buf) <= Parser._BODY_BUFFER_SIZE
+    buf.release()
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000, 4096])
+def test_parser_grow_body_buffer(monkeypatch, chunk_size):
+    monkeypatch.setattr(Parser, "_BODY_BUFFER_SIZE", 1000)
+    body = b"x" * 100000
+    encoded_frame = Frame(Command.SEND, {"abc": "def"}, body).encode()
+    data = encoded_frame + encoded_frame
+    parser = Parser()
+
+    for i in range(0, len(data), chunk_size):
+        parser.parse(data[i:i + chunk_size])
+        if parser._body is not None:
+            # The buffer grows with the received data.
+            assert len(parser._body) <= max(
+                1000, 2 * (parser._body_pos + chunk_size))
+
+    assert parser.pending == 2
+    for _ in range(2):
+        assert parser.pop_frame().body == body
+
+
+def test_parser_grow_body_buffer_receive_into(monkeypatch):
+    monkeypatch.setattr(Parser, "_BODY_BUFFER_SIZE", 1000)
+    body = b"x" * 10000
+    encoded_frame = Frame(Command.SEND, {"abc": "def"}, body).encode()
+    header_size = len(encoded_frame) - len(body) - 1
+    parser = Parser()
+    parser.parse(encoded_frame[:header_size])
+
+    pos = header_size
+    sizes = []
+    while pos < len(encoded_frame):
+        buf = parser.body_buffer()
+        sizes.append(len(buf))
+        nbytes = min(len(buf), 4096)
+        buf[:nbytes] = encoded_frame[pos:pos + nbytes]
+        buf.release()
+        parser.body_received(nbytes)
+        pos += nbytes
+
+    # Buffer size doubles up to the body size, including the terminator.
+    assert sizes == [1000, 1000, 2000, 4000, 2001]
+    assert parser.pop_frame().body == body
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("size_mb", [1, 8, 32])
+def test_parser_throughput(size_mb):
+    body = b"x" * (size_mb * 1024**2)
+    data = Frame(Command.MESSAGE, {"destination": "a"}, body).encode()
+    chunk_size = 4096
+    parser = Parser()
+
+    start = time.monotonic()
+    for i in range(0, len(data), chunk_size):
+        parser.parse(data[i:i + chunk_size])
+    elapsed = time.monotonic() - start
+
+    assert parser.pop_frame().body == body
+    print("size=%dMiB chunk=%d elapsed=%.3f throughput=%.2fMiB/s" % (
+        size_mb, chunk_size, elapsed, size_mb / elapsed))
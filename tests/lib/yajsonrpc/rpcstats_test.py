@@ -0,0 +1,295 @@
+#
+# Copyright 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import time
+
+from collections import namedtuple
+
+import pytest
+
+from vdsm.common import exception as vdsmexception
+from vdsm.common.compat import json
+
+from yajsonrpc import JsonRpcServer
+from yajsonrpc import exception
+from yajsonrpc import rpcstats
+
+Context = namedtuple("Context", "flow_id, client_host, client_port")
+
+
+@pytest.mark.parametrize("value", [0, 1, 15, 16, 17, 100, 1000, 10**6,
+                                   10**9, 2**40 + 12345])
+def test_bucket_precision(value):
+    index = rpcstats._index(value)
+    upper = rpcstats._upper(index)
+    assert value <= upper
+    assert upper - value <= value // 8
+    # The previous bucket holds smaller values.
+    if index > 0:
+        assert rpcstats._upper(index - 1) < value
+
+
+def test_buckets_contiguous():
+    for value in range(1, 100000):
+        index = rpcstats._index(value)
+        assert index - rpcstats._index(value - 1) in (0, 1)
+
+
+def test_histogram_empty():
+    h = rpcstats.Histogram()
+    assert h.info() == {
+        "count": 0, "avg": 0.0, "max": 0.0, "p50": 0.0, "p90": 0.0,
+        "p99": 0.0}
+
+
+def test_histogram_percentiles():
+    h = rpcstats.Histogram()
+    for value in range(1, 1001):
+        h.record(value)
+    info = h.info()
+    assert info["count"] == 1000
+    assert info["avg"] == 500.5
+    assert info["max"] == 1000
+    for p in rpcstats.PERCENTILES:
+        expected = p * 10
+        assert expected <= info["p%d" % p] <= expected * 1.125
+
+
+def test_histogram_percentile_capped_by_max():
+    h = rpcstats.Histogram()
+    h.record(1000)
+    assert h.percentile(99) == 1000
+
+
+def test_histogram_scale():
+    h = rpcstats.Histogram()
+    h.record(1500000)
+    info = h.info(scale=1000000)
+    assert info["max"] == 1.5
+    assert info["avg"] == 1.5
+
+
+def test_histogram_delta():
+    h = rpcstats.Histogram()
+    for value in range(100):
+        h.record(value)
+    last = h.copy()
+    h.record(5000)
+    h.record(10)
+
+    delta = h - last
+    assert delta.count == 2
+    assert delta.total == 5010
+    assert delta.max == 5000
+    assert delta.percentile(50) == 10
+
+
+def test_stats_request():
+    stats = rpcstats.RpcStats()
+    stats.request_received("Host.getStats", "10.0.0.1")
+    info = stats.info()
+    assert info["in_flight"] == 1
+    assert info["methods"]["Host.getStats"]["in_flight"] == 1
+    assert info["clients"]["10.0.0.1"] == {"requests": 1, "in_flight": 1}
+
+    stats.request_started("Host.getStats", 0.5)
+    stats.request_done("Host.getStats", "10.0.0.1", 2.0)
+    stats.reply_sent("Host.getStats", 4096)
+
+    info = stats.info()
+    assert info["in_flight"] == 0
+    assert info["clients"]["10.0.0.1"] == {"requests": 1, "in_flight": 0}
+    method = info["methods"]["Host.getStats"]
+    assert method["requests"] == 1
+    assert method["errors"] == 0
+    assert method["in_flight"] == 0
+    assert method["queue_time"]["max"] == 0.5
+    assert method["run_time"]["max"] == 2.0
+    assert method["reply_size"]["max"] == 4096
+
+
+def test_stats_request_not_run():
+    stats = rpcstats.RpcStats()
+    stats.request_received("Host.getStats", "10.0.0.1")
+    stats.request_done("Host.getStats", "10.0.0.1", None, error=True)
+
+    method = stats.info()["methods"]["Host.getStats"]
+    assert method["errors"] == 1
+    assert method["in_flight"] == 0
+    assert method["run_time"]["count"] == 0
+
+
+def test_stats_collect():
+    stats = rpcstats.RpcStats()
+    for method in ("Host.getStats", "Host.ping2"):
+        stats.request_received(method, "10.0.0.1")
+        stats.request_started(method, 0.001)
+        stats.request_done(method, "10.0.0.1", 0.01)
+
+    collected = stats.collect()
+    assert sorted(collected["methods"]) == ["Host.getStats", "Host.ping2"]
+
+    stats.request_received("Host.ping2", "10.0.0.1")
+    stats.request_started("Host.ping2", 0.002)
+    stats.request_done("Host.ping2", "10.0.0.1", 0.02, error=True)
+
+    # Only methods called since the last collect are reported.
+    collected = stats.collect()
+    assert list(collected["methods"]) == ["Host.ping2"]
+    method = collected["methods"]["Host.ping2"]
+    assert method["requests"] == 1
+    assert method["errors"] == 1
+    assert method["queue_time"]["count"] == 1
+    assert method["queue_time"]["max"] == 0.002
+
+    # Cumulative stats are not affected.
+    assert stats.info()["methods"]["Host.ping2"]["requests"] == 2
+
+    assert stats.collect()["methods"] == {}
+
+
+class FakeBridge(object):
+
+    def __init__(self):
+        self.methods = {
+            "Host.ping2": lambda: None,
+            "Host.echo": lambda text: text,
+            "Host.fail": self._fail,
+        }
+
+    def dispatch(self, method):
+        try:
+            return self.methods[method]
+        except KeyError:
+            raise exception.JsonRpcMethodNotFoundError(method=method)
+
+    def register_server_address(self, server_address):
+        pass
+
+    def unregister_server_address(self):
+        pass
+
+    def _fail(self):
+        raise vdsmexception.GeneralException()
+
+
+class FakeCif(object):
+    ready = True
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.replies = []
+
+    def send(self, data, response_ids=()):
+        if isinstance(data, list):
+            data = b"".join(data)
+        self.replies.append(data)
+
+
+def serve(server, client, requests):
+    message = json.dumps([
+        {"jsonrpc": "2.0", "id": str(i), "method": method, "params": params}
+        for i, (method, params) in enumerate(requests)])
+    context = Context("flow-id", "10.0.0.1", 54321)
+    server.queueRequest((client, None, context, message))
+    server.stop()
+    server.serve_requests()
+
+
+def test_server_stats():
+    server = JsonRpcServer(FakeBridge(), 60, FakeCif())
+    client = FakeClient()
+    serve(server, client, [
+        ("Host.ping2", {}),
+        ("Host.echo", {"text": "x" * 1000}),
+        ("Host.fail", {}),
+        ("Host.missing", {}),
+    ])
+
+    reply, = client.replies
+    info = server.stats.info()
+
+    assert info["in_flight"] == 0
+    assert info["clients"] == {"10.0.0.1": {"requests": 4, "in_flight": 0}}
+
+    methods = info["methods"]
+    assert sorted(methods) == [
+        "Host.echo", "Host.fail", "Host.ping2", rpcstats.UNKNOWN_METHOD]
+    assert methods["Host.ping2"]["errors"] == 0
+    assert methods["Host.fail"]["errors"] == 1
+    assert methods[rpcstats.UNKNOWN_METHOD]["errors"] == 1
+    for method in methods.values():
+        assert method["requests"] == 1
+        assert method["queue_time"]["count"] == 1
+        assert method["run_time"]["count"] == 1
+        assert method["reply_size"]["count"] == 1
+    assert methods["Host.echo"]["reply_size"]["max"] > 1000
+
+
+def test_server_stats_unknown_methods():
+    server = JsonRpcServer(FakeBridge(), 60, FakeCif())
+    client = FakeClient()
+    requests = [("Host.missing-%d" % i, {}) for i in range(100)]
+    requests.append(("Host.ping2", {}))
+    serve(server, client, requests)
+
+    methods = server.stats.info()["methods"]
+    assert sorted(methods) == ["Host.ping2", rpcstats.UNKNOWN_METHOD]
+    unknown = methods[rpcstats.UNKNOWN_METHOD]
+    assert unknown["requests"] == 100
+    assert unknown["errors"] == 100
+    assert unknown["in_flight"] == 0
+
+    collected = server.stats.collect()["methods"]
+    assert sorted(collected) == ["Host.ping2", rpcstats.UNKNOWN_METHOD]
+
+
+def test_stats_known_method():
+    stats = rpcstats.RpcStats(known_method=lambda name: name == "Host.ping2")
+    for method in ("Host.ping2", "Host.missing", None, ["Host.ping2"]):
+        stats.request_received(method, "10.0.0.1")
+        stats.request_done(method, "10.0.0.1", None, error=True)
+
+    methods = stats.info()["methods"]
+    assert sorted(methods) == ["Host.ping2", rpcstats.UNKNOWN_METHOD]
+    assert methods["Host.ping2"]["requests"] == 1
+    assert methods[rpcstats.UNKNOWN_METHOD]["requests"] == 3
+
+
+@pytest.mark.stress
+def test_stats_benchmark():
+    stats = rpcstats.RpcStats()
+    runs = 100000
+
+    start = time.monotonic()
+    for i in range(runs):
+        stats.request_received("Host.getStats", "10.0.0.1")
+        stats.request_started("Host.getStats", i / 1000000)
+        stats.request_done("Host.getStats", "10.0.0.1", i / 100000)
+        stats.reply_sent("Host.getStats", 4096 + i)
+    elapsed = time.monotonic() - start
+
+    print("%d requests in %.3f seconds (%.2f usec per request)" % (
+        runs, elapsed, elapsed / runs * 1000000))
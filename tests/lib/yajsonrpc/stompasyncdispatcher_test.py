@@ -151,6 +151,57 @@ def test_handle_write():
     assert not frame_handler.has_outgoing_messages
 
 
+def test_handle_write_chunked_body():
+    body = [b"x" * 1000, b"y" * 1000, b"z" * 10]
+    frame = Frame(command=Command.MESSAGE, headers={}, body=body)
+    frame_handler = FakeFrameHandler()
+    frame_handler.handle_frame(None, frame)
+
+    class ShortWriteDispatcher(object):
+
+        def __init__(self):
+            self.sent = []
+
+        def sendmsg(self, buffers):
+            data = b"".join(buffers)[:300]
+            self.sent.append(data)
+            return len(data)
+
+    dispatcher = AsyncDispatcher(FakeConnection(), frame_handler)
+    async_dispatcher = ShortWriteDispatcher()
+    while dispatcher.writable(async_dispatcher):
+        dispatcher.handle_write(async_dispatcher)
+
+    assert not frame_handler.has_outgoing_messages
+    assert b"".join(async_dispatcher.sent) == frame.encode()
+
+
+def test_handle_write_batch():
+    frames = [Frame(command=Command.MESSAGE, headers={}, body=b"%d" % i)
+              for i in range(3)]
+    frame_handler = FakeFrameHandler()
+    for frame in frames:
+        frame_handler.handle_frame(None, frame)
+
+    class RecordingDispatcher(object):
+
+        def __init__(self):
+            self.calls = []
+
+        def sendmsg(self, buffers):
+            data = b"".join(buffers)
+            self.calls.append(data)
+            return len(data)
+
+    dispatcher = AsyncDispatcher(FakeConnection(), frame_handler)
+    async_dispatcher = RecordingDispatcher()
+    dispatcher.handle_write(async_dispatcher)
+
+    # All queued frames are sent using one call.
+    assert async_dispatcher.calls == [b"".join(f.encode() for f in frames)]
+    assert not dispatcher.writable(async_dispatcher)
+
+
 def test_handle_close():
     connection = FakeConnection()
     dispatcher = AsyncDispatcher(connection, FakeFrameHandler())
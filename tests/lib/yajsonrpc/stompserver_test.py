@@ -0,0 +1,291 @@
+#
+# Copyright 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import collections
+import time
+
+import pytest
+
+from vdsm.common.compat import json
+
+from yajsonrpc import JsonRpcResponse
+from yajsonrpc import _JsonRpcServeRequestContext
+from yajsonrpc import stomp
+from yajsonrpc.stompserver import StompServer
+from yajsonrpc.stompserver import SubscriptionIndex
+
+
+class FakeClient(object):
+
+    attachment_threshold = 0
+
+    def __init__(self):
+        self.frames = []
+
+    def is_closed(self):
+        return False
+
+    def send_raw(self, frame):
+        self.frames.append(frame)
+
+
+class FakeSubscription(object):
+
+    def __init__(self, sub_id, destination):
+        self.id = sub_id
+        self.destination = destination
+        self.client = FakeClient()
+
+
+@pytest.fixture
+def server():
+    return StompServer(None, collections.defaultdict(list))
+
+
+def subscribe(server, destination, sub_id=None):
+    sub = FakeSubscription(sub_id or "sub-" + destination, destination)
+    server.subscriptions.add(sub)
+    return sub
+
+
+def test_send_reply_to_request_destination(server):
+    default = subscribe(server, stomp.SUBSCRIPTION_ID_RESPONSE)
+    reply_to = subscribe(server, "reply-queue")
+    server._req_dest["req-id"] = "reply-queue"
+
+    server.send(b'{"id": "req-id"}', response_ids=["req-id"])
+
+    assert default.client.frames == []
+    frame, = reply_to.client.frames
+    assert frame.command == stomp.Command.MESSAGE
+    assert frame.headers[stomp.Headers.DESTINATION] == "reply-queue"
+    assert frame.body == b'{"id": "req-id"}'
+    assert server._req_dest == {}
+
+
+def test_send_batch_reply(server):
+    reply_to = subscribe(server, "reply-queue")
+    server._req_dest["req-1"] = "reply-queue"
+    server._req_dest["req-2"] = "reply-queue"
+
+    server.send(b'[{"id": "req-1"}, {"id": "req-2"}]',
+                response_ids=["req-1", "req-2"])
+
+    assert len(reply_to.client.frames) == 1
+    assert server._req_dest == {}
+
+
+def test_send_reply_unknown_request(server):
+    default = subscribe(server, stomp.SUBSCRIPTION_ID_RESPONSE)
+
+    server.send(b'{"id": "req-id"}', response_ids=["req-id"])
+
+    assert len(default.client.frames) == 1
+
+
+def test_send_event(server):
+    events = subscribe(server, "events")
+    server._req_dest[None] = "reply-queue"
+
+    server.send('{"method": "event"}', "events")
+
+    assert len(events.client.frames) == 1
+    assert server._req_dest == {None: "reply-queue"}
+
+
+def test_send_event_to_many_subscribers(server):
+    subs = [subscribe(server, "events", "sub-%d" % i) for i in range(3)]
+
+    server.send('{"method": "event"}', "events")
+
+    bodies = set()
+    for sub in subs:
+        frame, = sub.client.frames
+        assert frame.headers[stomp.Headers.SUBSCRIPTION] == sub.id
+        assert frame.headers[stomp.Headers.DESTINATION] == "events"
+        assert frame.body == b'{"method": "event"}'
+        bodies.add(id(frame.body))
+
+    # The message is encoded once.
+    assert len(bodies) == 1
+
+
+def test_send_skips_closed_client(server):
+    closed = subscribe(server, "events", "closed")
+    closed.client.is_closed = lambda: True
+    open_sub = subscribe(server, "events", "open")
+
+    server.send('{"method": "event"}', "events")
+
+    assert closed.client.frames == []
+    assert len(open_sub.client.frames) == 1
+
+
+def test_send_to_subscriptions(server):
+    subs = [subscribe(server, "events", "sub-%d" % i) for i in range(3)]
+
+    server.send('{"method": "event"}', "events", subscriptions=subs[1:])
+
+    assert subs[0].client.frames == []
+    for sub in subs[1:]:
+        frame, = sub.client.frames
+        assert frame.headers[stomp.Headers.SUBSCRIPTION] == sub.id
+
+
+@pytest.mark.parametrize("sub_dest, dest, match", [
+    ("events", "events", True),
+    ("events", "events.vm", True),
+    ("events.vm", "events", False),
+    ("events", "events2", False),
+    ("jms.*", "jms.queue", True),
+    ("jms.*", "jms.queue.events", True),
+    ("jms.*", "jms", False),
+    ("jms.*.events", "jms.queue.events", True),
+    ("jms.*.events", "jms.topic.events.vm", True),
+    ("jms.*.events", "jms.queue.other", False),
+    ("*.queue", "jms.queue", True),
+])
+def test_index_find(sub_dest, dest, match):
+    index = SubscriptionIndex(collections.defaultdict(list))
+    sub = FakeSubscription("sub-id", sub_dest)
+    index.add(sub)
+    assert index.find(dest) == ((sub,) if match else ())
+
+
+def test_index_cache_invalidated():
+    sub_map = collections.defaultdict(list)
+    index = SubscriptionIndex(sub_map)
+    sub1 = FakeSubscription("sub-1", "events")
+    index.add(sub1)
+    assert index.find("events") == (sub1,)
+
+    sub2 = FakeSubscription("sub-2", "*")
+    index.add(sub2)
+    assert index.find("events") == (sub1, sub2)
+
+    index.remove(sub1)
+    assert index.find("events") == (sub2,)
+    assert "events" not in sub_map
+
+    # Removing unknown subscription does nothing.
+    index.remove(sub1)
+    assert index.find("events") == (sub2,)
+
+
+def test_index_max_routes(monkeypatch):
+    monkeypatch.setattr(SubscriptionIndex, "MAX_ROUTES", 2)
+    index = SubscriptionIndex(collections.defaultdict(list))
+    sub = FakeSubscription("sub-id", "events")
+    index.add(sub)
+    for i in range(5):
+        assert index.find("events.%d" % i) == (sub,)
+        assert len(index._routes) <= 2
+
+
+def test_context_send_reply(server):
+    reply_to = subscribe(server, "reply-queue")
+    server._req_dest["req-id"] = "reply-queue"
+    ctx = _JsonRpcServeRequestContext(server, None, None)
+
+    ctx.requestDone(JsonRpcResponse({"a": 1}, None, "req-id"))
+
+    frame, = reply_to.client.frames
+    assert json.loads(frame.body) == {
+        "jsonrpc": "2.0", "id": "req-id", "result": {"a": 1}}
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("vms", [10, 100, 300])
+def test_send_reply_latency(server, vms):
+    reply_to = subscribe(server, "reply-queue")
+    vm_stats = {"vmId": "f9a23d3c-6d1a-4c5e-bb2f-2b6a2cd9b7c8",
+                "status": "Up",
+                "cpuUser": "0.50",
+                "disks": {"vd%s" % c: {"readRate": "0.0", "writeRate": "0.0",
+                                       "readLatency": "0.000000",
+                                       "writeLatency": "0.000000",
+                                       "truesize": "1073741824"}
+                          for c in "abcdefgh"},
+                "network": {"vnet%d" % i: {"rxRate": "0.0", "txRate": "0.0",
+                                           "rxErrors": "0", "txErrors": "0"}
+                            for i in range(4)}}
+    result = [dict(vm_stats) for _ in range(vms)]
+    replies = 100
+
+    start = time.monotonic()
+    start_cpu = time.process_time()
+    for i in range(replies):
+        server._req_dest[i] = "reply-queue"
+        ctx = _JsonRpcServeRequestContext(server, None, None)
+        ctx.requestDone(JsonRpcResponse(result, None, i))
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - start_cpu
+
+    assert len(reply_to.client.frames) == replies
+    size = len(reply_to.client.frames[0].body)
+    print("vms=%d size=%d latency=%.6f cpu=%.6f" % (
+        vms, size, elapsed / replies, cpu / replies))
+
+
+def old_send(server, message, destination):
+    for sub in server.subscriptions.find(destination):
+        headers = {
+            stomp.Headers.DESTINATION: destination,
+            stomp.Headers.SUBSCRIPTION: sub.id,
+            stomp.Headers.CONTENT_TYPE: "application/json",
+        }
+        frame = stomp.Frame(stomp.Command.MESSAGE, headers, message)
+        sub.client.send_raw(frame)
+
+
+def new_send(server, message, destination):
+    server.send(message, destination)
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("send", [old_send, new_send])
+@pytest.mark.parametrize("subscribers", [1, 10, 100])
+def test_send_event_benchmark(server, send, subscribers):
+    subs = [subscribe(server, "events", "sub-%d" % i)
+            for i in range(subscribers)]
+    message = json.dumps({
+        "jsonrpc": "2.0",
+        "method": "|virt|VM_status|f9a23d3c-6d1a-4c5e-bb2f-2b6a2cd9b7c8",
+        "params": {"f9a23d3c-6d1a-4c5e-bb2f-2b6a2cd9b7c8": {
+            "status": "Up", "elapsedTime": "12345", "vmName": "vm"},
+            "notify_time": 4295000000}})
+    events = 1000
+
+    start = time.monotonic()
+    for _ in range(events):
+        send(server, message, "events")
+        # Encode the frames like the reactor.
+        for sub in subs:
+            for frame in sub.client.frames:
+                frame.encode_chunks()
+            del sub.client.frames[:]
+    elapsed = time.monotonic() - start
+
+    print("send=%s subscribers=%d events/s=%.0f frames/s=%.0f" % (
+        send.__name__, subscribers, events / elapsed,
+        events * subscribers / elapsed))
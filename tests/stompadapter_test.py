@@ -68,6 +68,28 @@ class ConnectFrameTest(TestCaseBase):
         self.assertEqual(resp_frame.headers['version'], '1.2')
         self.assertEqual(resp_frame.headers[Headers.HEARTBEAT], '1000,0')
 
+    def test_connect_attachments(self):
+        frame = Frame(Command.CONNECT,
+                      {Headers.ACCEPT_VERSION: '1.2',
+                       Headers.ATTACHMENTS: 'true'})
+
+        adapter = StompAdapterImpl(Reactor(), defaultdict(list), {})
+        adapter.handle_frame(FakeAsyncDispatcher(adapter), frame)
+
+        resp_frame = adapter.pop_message()
+        self.assertEqual(resp_frame.headers[Headers.ATTACHMENTS], '65536')
+        self.assertEqual(adapter.attachment_threshold, 65536)
+
+    def test_connect_no_attachments(self):
+        frame = Frame(Command.CONNECT, {Headers.ACCEPT_VERSION: '1.2'})
+
+        adapter = StompAdapterImpl(Reactor(), defaultdict(list), {})
+        adapter.handle_frame(FakeAsyncDispatcher(adapter), frame)
+
+        resp_frame = adapter.pop_message()
+        self.assertNotIn(Headers.ATTACHMENTS, resp_frame.headers)
+        self.assertEqual(adapter.attachment_threshold, 0)
+
     def test_incoming_heartbeat(self):
         frame = Frame(Command.CONNECT,
                       {Headers.ACCEPT_VERSION: '1.2',
@@ -136,6 +158,7 @@ class SubscriptionFrameTest(TestCaseBase):
                          'ad052acb-a934-4e10-8ec3-00c7417ef8d1')
         self.assertEqual(subscription.destination,
                          'jms.queue.events')
+        self.assertEqual(subscription.headers['ack'], 'auto')
 
     def test_no_destination(self):
         frame = Frame(Command.SUBSCRIBE,
@@ -284,6 +284,57 @@ def test_metadata_offset(monkeypatch):
     assert 1867776 == sd_manifest.metadata_offset(100, version=5)
 
 
+@pytest.mark.parametrize("read_size", [
+    # Read all blocks at once.
+    blockSD.METADATA_READ_SIZE,
+    # Read one block per read.
+    sc.METADATA_SIZE,
+    # Read few blocks per read.
+    4 * blockSD.METADATA_SLOT_SIZE_V5,
+])
+def test_read_metadata_blocks(tmpdir, read_size):
+    path = str(tmpdir.join("metadata"))
+    slots = [0, 1, 2, 5, 100, 101]
+    offsets = [blockSD.METADATA_BASE_V5 + slot * blockSD.METADATA_SLOT_SIZE_V5
+               for slot in slots]
+
+    with open(path, "wb") as f:
+        f.truncate(offsets[-1] + blockSD.METADATA_SLOT_SIZE_V5)
+        for slot, offset in zip(slots, offsets):
+            f.seek(offset)
+            f.write(b"SLOT=%d\nEOF\n" % slot)
+
+    blocks = list(blockSD._read_metadata_blocks(path, offsets, read_size))
+
+    assert blocks == [(offset, b"SLOT=%d\nEOF\n" % slot)
+                      for slot, offset in zip(slots, offsets)]
+
+
+def test_read_metadata_blocks_full_block(tmpdir):
+    path = str(tmpdir.join("metadata"))
+    data = b"x" * sc.METADATA_SIZE
+    with open(path, "wb") as f:
+        f.write(data)
+
+    blocks = list(blockSD._read_metadata_blocks(path, [0]))
+
+    assert blocks == [(0, data)]
+
+
+def test_read_metadata_blocks_empty(tmpdir):
+    path = str(tmpdir.join("metadata"))
+    assert list(blockSD._read_metadata_blocks(path, [])) == []
+
+
+def test_read_metadata_blocks_short_file(tmpdir):
+    path = str(tmpdir.join("metadata"))
+    with open(path, "wb") as f:
+        f.truncate(sc.METADATA_SIZE)
+
+    with pytest.raises(se.MiscBlockReadIncomplete):
+        list(blockSD._read_metadata_blocks(path, [0, sc.METADATA_SIZE]))
+
+
 @pytest.mark.parametrize("version,block_size", [
     # Before version 5 only 512 bytes is supported.
     (3, sc.BLOCK_SIZE_4K),
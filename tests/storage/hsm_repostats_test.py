@@ -0,0 +1,90 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import pytest
+
+from vdsm.api import vdsmapi
+from vdsm.storage import hsm
+from vdsm.storage import monitor
+
+_schema = vdsmapi.Schema.vdsm_api(strict_mode=True)
+
+
+class FakeMonitorThread(object):
+
+    def __init__(self, sd_uuid, host_id, interval, event, checker):
+        self.sdUUID = sd_uuid
+        self.checkLatency = None
+
+    def start(self):
+        pass
+
+    def stop(self, shutdown=False):
+        pass
+
+    def join(self):
+        pass
+
+    def getStatus(self):
+        return monitor.Status(
+            monitor.PathStatus(),
+            monitor.DomainStatus())
+
+
+class FakeHSM(hsm.HSM):
+
+    def __init__(self, domain_monitor):
+        self.domainMonitor = domain_monitor
+
+
+@pytest.fixture
+def domain_monitor(monkeypatch):
+    monkeypatch.setattr(monitor, "MonitorThread", FakeMonitorThread)
+    mon = monitor.DomainMonitor(10)
+    yield mon
+    mon.shutdown()
+
+
+def test_check_latency(domain_monitor):
+    domain_monitor.startMonitoring("checked", "host-id")
+    domain_monitor.startMonitoring("not-checked", "host-id")
+    domain_monitor._monitors["checked"].checkLatency = 0.0123
+
+    stats = FakeHSM(domain_monitor).repoStats()
+
+    assert stats["checked"]["checkLatency"] == "0.012"
+    assert "checkLatency" not in stats["not-checked"]
+    _schema.verify_retval(
+        vdsmapi.MethodRep("Host", "getStorageRepoStats"), stats)
+
+
+def test_check_latency_selected_domains(domain_monitor):
+    domain_monitor.startMonitoring("sd-1", "host-id")
+    domain_monitor.startMonitoring("sd-2", "host-id")
+    for sd_uuid in ("sd-1", "sd-2"):
+        domain_monitor._monitors[sd_uuid].checkLatency = 1.5
+
+    stats = FakeHSM(domain_monitor).repoStats(domains=["sd-2"])
+
+    assert list(stats) == ["sd-2"]
+    assert stats["sd-2"]["checkLatency"] == "1.500"
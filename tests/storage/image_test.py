@@ -27,16 +27,24 @@ import pytest
 from storage.storagefakelib import FakeBlockSD
 from storage.storagefakelib import FakeFileSD
 from storage.storagefakelib import FakeStorageDomainCache
+from storage.storagetestlib import fake_block_env
+from storage.storagetestlib import fake_file_env
+from storage.storagetestlib import make_block_volume
 
 from testlib import expandPermutations, permutations
 from testlib import make_config
+from testlib import make_uuid
 from testlib import VdsmTestCase
 
 from vdsm.common.units import GiB
+from vdsm.storage import blockVolume
+from vdsm.storage import chaincache
 from vdsm.storage import constants as sc
 from vdsm.storage import image
 from vdsm.storage import qemuimg
 
+BLANK = sc.BLANK_UUID
+
 CONFIG = make_config([('irs', 'volume_utilization_chunk_mb', '1024')])
 
 
@@ -192,3 +200,246 @@ class TestEstimateQcow2Size:
             storage == "file", format, prealloc, estimate)
 
         assert initial_size == expected
+
+
+class FakeDomainCache(object):
+
+    def __init__(self, sd_manifest):
+        self.sd_manifest = sd_manifest
+
+    def produce(self, sd_id):
+        return self
+
+    def getVolumeClass(self):
+        return self.sd_manifest.getVolumeClass()
+
+
+class TestGetChain:
+
+    @pytest.fixture
+    def env(self, monkeypatch):
+        monkeypatch.setattr(chaincache, "_cache", chaincache.ChainCache())
+        with fake_block_env() as env:
+            monkeypatch.setattr(
+                image, "sdCache", FakeDomainCache(env.sd_manifest))
+            yield env
+
+    @pytest.fixture
+    def file_env(self, monkeypatch):
+        monkeypatch.setattr(chaincache, "_cache", chaincache.ChainCache())
+        with fake_file_env() as env:
+            monkeypatch.setattr(
+                image, "sdCache", FakeDomainCache(env.sd_manifest))
+            yield env
+
+    def make_chain(self, env, img_id, length):
+        vol_ids = [make_uuid() for i in range(length)]
+        parent = sc.BLANK_UUID
+        for i, vol_id in enumerate(vol_ids):
+            vol_type = sc.LEAF_VOL if i == length - 1 else sc.INTERNAL_VOL
+            env.make_volume(
+                GiB, img_id, vol_id, parent_vol_id=parent, vol_type=vol_type)
+            parent = vol_id
+        return vol_ids
+
+    def get_chain(self, env, img_id, vol_id=None):
+        img = image.Image(env.sd_manifest.getRepoPath())
+        chain = img.getChain(env.sd_manifest.sdUUID, img_id, vol_id)
+        return [vol.volUUID for vol in chain]
+
+    def test_cached(self, env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(env, img_id, 3)
+
+        assert self.get_chain(env, img_id) == vol_ids
+        assert chaincache.cache_stats()["hits"] == 0
+
+        assert self.get_chain(env, img_id) == vol_ids
+        assert chaincache.cache_stats()["hits"] == 1
+
+    def test_cached_part_of_chain(self, env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(env, img_id, 3)
+        self.get_chain(env, img_id)
+
+        assert self.get_chain(env, img_id, vol_ids[1]) == vol_ids[:2]
+        assert chaincache.cache_stats()["hits"] == 1
+
+    def test_cached_from_leaf(self, env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(env, img_id, 3)
+
+        # Getting the chain from the leaf volume is the complete chain.
+        assert self.get_chain(env, img_id, vol_ids[2]) == vol_ids
+        assert self.get_chain(env, img_id) == vol_ids
+        assert chaincache.cache_stats()["hits"] == 1
+
+    def test_not_cached_from_internal(self, env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(env, img_id, 3)
+
+        assert self.get_chain(env, img_id, vol_ids[1]) == vol_ids[:2]
+        assert self.get_chain(env, img_id) == vol_ids
+        assert chaincache.cache_stats()["hits"] == 0
+
+    def test_volume_added(self, env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(env, img_id, 2)
+        self.get_chain(env, img_id)
+
+        # Another host added a volume to the image.
+        new_vol_id = make_uuid()
+        leaf = env.sd_manifest.produceVolume(img_id, vol_ids[-1])
+        leaf.setMetaParam(sc.VOLTYPE, sc.type2name(sc.INTERNAL_VOL))
+        make_block_volume(
+            env.lvm, env.sd_manifest, GiB, img_id, new_vol_id,
+            parent_vol_id=vol_ids[-1])
+
+        assert self.get_chain(env, img_id) == vol_ids + [new_vol_id]
+        assert chaincache.cache_stats()["hits"] == 0
+
+    def test_parent_changed(self, env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(env, img_id, 3)
+        self.get_chain(env, img_id)
+
+        # Remove the middle volume from the chain, like merge does.
+        leaf = env.sd_manifest.produceVolume(img_id, vol_ids[2])
+        leaf.setParentMeta(vol_ids[0])
+        leaf.setParentTag(vol_ids[0])
+
+        assert self.get_chain(env, img_id) == [vol_ids[0], vol_ids[2]]
+        assert chaincache.cache_stats()["hits"] == 0
+
+    def test_parent_changed_by_other_host(self, env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(env, img_id, 3)
+        assert self.get_chain(env, img_id) == vol_ids
+
+        # Another host removed the middle volume from the chain, keeping the
+        # volume in the image, like cold merge does before removing it.
+        leaf = env.sd_manifest.produceVolume(img_id, vol_ids[2])
+        leaf.setMetaParam(sc.PUUID, vol_ids[0])
+        env.lvm.changeLVsTags(
+            env.sd_manifest.sdUUID, (vol_ids[2],),
+            delTags=(sc.TAG_PREFIX_PARENT + vol_ids[1],),
+            addTags=(sc.TAG_PREFIX_PARENT + vol_ids[0],))
+
+        assert self.get_chain(env, img_id) == [vol_ids[0], vol_ids[2]]
+        assert chaincache.cache_stats()["hits"] == 0
+
+    def test_shared_volume(self, env, monkeypatch):
+        img_id = make_uuid()
+        vol_id = make_uuid()
+        env.make_volume(GiB, img_id, vol_id, vol_type=sc.SHARED_VOL)
+
+        def fail(cls, sd_id, img_id):
+            raise RuntimeError("Image volumes should not be read")
+
+        # The chain of a template volume is the volume itself.
+        monkeypatch.setattr(
+            blockVolume.BlockVolumeManifest, "getImageVolumeParents",
+            classmethod(fail))
+        assert self.get_chain(env, img_id, vol_id) == [vol_id]
+
+    def test_file_domain_not_cached(self, file_env):
+        img_id = make_uuid()
+        vol_ids = self.make_chain(file_env, img_id, 2)
+
+        assert self.get_chain(file_env, img_id) == vol_ids
+        assert self.get_chain(file_env, img_id) == vol_ids
+        assert chaincache.cache_stats()["hits"] == 0
+        assert chaincache.cache_stats()["chains"] == 0
+
+    def test_domain_invalidated(self, env):
+        img_id = make_uuid()
+        self.make_chain(env, img_id, 2)
+        self.get_chain(env, img_id)
+
+        chaincache.invalidate_domain(env.sd_manifest.sdUUID)
+
+        self.get_chain(env, img_id)
+        assert chaincache.cache_stats()["hits"] == 0
+
+
+class TestChainCache:
+
+    def test_get_missing(self):
+        cache = chaincache.ChainCache()
+        assert cache.get("sd", "img", {"vol": BLANK}) is None
+        assert cache.info()["misses"] == 1
+
+    def test_add_get(self):
+        cache = chaincache.ChainCache()
+        cache.add("sd", "img", {"vol2": "vol1", "vol1": BLANK},
+                  ["vol1", "vol2"], cache.version())
+
+        assert cache.get("sd", "img", {"vol1": BLANK, "vol2": "vol1"}) == (
+            "vol1", "vol2")
+        assert cache.info() == {
+            "hits": 1,
+            "misses": 0,
+            "hit_ratio": 100,
+            "invalidations": 0,
+            "chains": 1,
+        }
+
+    def test_volumes_changed(self):
+        cache = chaincache.ChainCache()
+        cache.add("sd", "img", {"vol1": BLANK}, ["vol1"], cache.version())
+
+        assert cache.get("sd", "img", {"vol1": BLANK, "vol2": "vol1"}) is None
+        assert cache.info()["chains"] == 0
+
+    def test_parents_changed(self):
+        cache = chaincache.ChainCache()
+        cache.add("sd", "img", {"vol1": BLANK, "vol2": "vol1", "vol3": "vol2"},
+                  ["vol1", "vol2", "vol3"], cache.version())
+
+        assert cache.get(
+            "sd", "img", {"vol1": BLANK, "vol2": "vol1", "vol3": "vol1"}
+        ) is None
+        assert cache.info()["chains"] == 0
+
+    def test_invalidate_image(self):
+        cache = chaincache.ChainCache()
+        cache.add("sd", "img1", {"vol1": BLANK}, ["vol1"], cache.version())
+        cache.add("sd", "img2", {"vol2": BLANK}, ["vol2"], cache.version())
+
+        cache.invalidate_image("sd", "img1")
+
+        assert cache.get("sd", "img1", {"vol1": BLANK}) is None
+        assert cache.get("sd", "img2", {"vol2": BLANK}) == ("vol2",)
+
+    def test_invalidate_domain(self):
+        cache = chaincache.ChainCache()
+        cache.add("sd1", "img1", {"vol1": BLANK}, ["vol1"], cache.version())
+        cache.add("sd2", "img2", {"vol2": BLANK}, ["vol2"], cache.version())
+
+        cache.invalidate_domain("sd1")
+
+        assert cache.get("sd1", "img1", {"vol1": BLANK}) is None
+        assert cache.get("sd2", "img2", {"vol2": BLANK}) == ("vol2",)
+
+        # New chains in the domain use the new generation.
+        cache.add("sd1", "img1", {"vol1": BLANK}, ["vol1"], cache.version())
+        assert cache.get("sd1", "img1", {"vol1": BLANK}) == ("vol1",)
+
+    def test_invalidated_while_building(self):
+        cache = chaincache.ChainCache()
+        version = cache.version()
+
+        # The image was modified while building the chain.
+        cache.invalidate_image("sd", "img")
+        cache.add("sd", "img", {"vol1": BLANK}, ["vol1"], version)
+
+        assert cache.get("sd", "img", {"vol1": BLANK}) is None
+
+    def test_clear(self):
+        cache = chaincache.ChainCache()
+        cache.add("sd", "img", {"vol1": BLANK}, ["vol1"], cache.version())
+
+        cache.clear()
+
+        assert cache.get("sd", "img", {"vol1": BLANK}) is None
+        assert cache.info()["invalidations"] == 1
@@ -479,6 +479,42 @@ def test_command_concurrency(fake_devices, no_delay, workers, read_only):
     assert elapsed < fake_runner.delay * count / lc.MAX_COMMANDS + 1.0
 
 
+def test_report_command_coalescing(fake_devices, no_delay, workers):
+    # Concurrent identical reporting commands are coalesced.
+    fake_runner = FakeRunner()
+    lc = lvm.LVMCache(fake_runner)
+
+    fake_runner.delay = 0.2
+    count = 50
+    try:
+        for i in range(count):
+            workers.start_thread(lc.cmd, ["vgs", "vg-name"])
+    finally:
+        workers.join()
+
+    # The first thread runs the command, and all the other threads wait for
+    # the next command, started after the first one has finished. If the
+    # machine is overloaded, some threads may start late and run another
+    # command.
+    assert 2 <= len(fake_runner.calls) < count / 2
+
+
+def test_report_command_no_coalescing(fake_devices, no_delay, workers):
+    # Different reporting commands are not coalesced.
+    fake_runner = FakeRunner()
+    lc = lvm.LVMCache(fake_runner)
+
+    fake_runner.delay = 0.2
+    count = 10
+    try:
+        for i in range(count):
+            workers.start_thread(lc.cmd, ["vgs", "vg-{}".format(i)])
+    finally:
+        workers.join()
+
+    assert len(fake_runner.calls) == count
+
+
 def test_change_read_only_mode(fake_devices, no_delay, workers):
     # Test that changing read only wait for running commands, and new commands
     # wait for the read only change.
@@ -1681,6 +1717,176 @@ def test_lv_reload_for_stale_vg(fake_devices, no_delay):
     assert not lc._lvs_needs_reload("vg")
 
 
+class FakeVGRunner(FakeRunner):
+    """
+    Simulate vgs and lvs commands reporting a single VG.
+
+    Modify the seqno and lvs instance variables to simulate changes in the
+    VG metadata.
+    """
+
+    def __init__(self, vg_name, lv_names):
+        super(FakeVGRunner, self).__init__()
+        self.vg_name = vg_name
+        self.lvs = list(lv_names)
+        self.seqno = 1
+
+    def _run_command(self, cmd):
+        self.calls.append(cmd)
+
+        if cmd[1] == "vgs":
+            line = ("vg-uuid|{}|wz--n-|10737418240|10737418240|134217728|80|"
+                    "80|RHAT_storage_domain|134217728|67108864|{}|1|{}|"
+                    "/dev/mapper/a").format(
+                        self.vg_name, len(self.lvs), self.seqno)
+            return 0, line.encode("utf-8"), b""
+
+        if cmd[1] == "lvs":
+            lines = [
+                "lv-uuid|{}|{}|-wi-------|134217728|0|/dev/mapper/a(0)|"
+                "IU_image-uid,PU_00000000,MD_1".format(lv_name, self.vg_name)
+                for lv_name in self.lvs
+            ]
+            return 0, "\n".join(lines).encode("utf-8"), b""
+
+        return 0, b"", b""
+
+    def commands(self):
+        return [cmd[1] for cmd in self.calls]
+
+
+def test_lv_reload_incremental_unchanged(fake_devices, no_delay):
+    fake_runner = FakeVGRunner("vg", ["lv1", "lv2"])
+    lc = lvm.LVMCache(fake_runner, incremental=True)
+    lc.getVg("vg")
+
+    # First call must reload the lvs.
+    lvs = lc.getLv("vg")
+    assert sorted(lv.name for lv in lvs) == ["lv1", "lv2"]
+    assert fake_runner.commands() == ["vgs", "lvs"]
+
+    # The VG was not modified, so we check the seqno and use the cache.
+    del fake_runner.calls[:]
+    lc.stats.clear()
+    assert sorted(lv.name for lv in lc.getLv("vg")) == ["lv1", "lv2"]
+    assert fake_runner.commands() == ["vgs"]
+    assert lc.stats.info()["hits"] == 1
+    assert lc.stats.info()["misses"] == 0
+    assert lc.stats.info()["reloads"] == 1
+
+
+def test_lv_reload_incremental_changed(fake_devices, no_delay):
+    fake_runner = FakeVGRunner("vg", ["lv1", "lv2"])
+    lc = lvm.LVMCache(fake_runner, incremental=True)
+    lc.getVg("vg")
+    lv1 = lc.getLv("vg", "lv1")
+    lc.getLv("vg")
+
+    # Simulate another host removing lv2 and adding lv3.
+    fake_runner.seqno = 2
+    fake_runner.lvs = ["lv1", "lv3"]
+
+    del fake_runner.calls[:]
+    lc.stats.clear()
+    lvs = lc.getLv("vg")
+    assert sorted(lv.name for lv in lvs) == ["lv1", "lv3"]
+    assert fake_runner.commands() == ["vgs", "lvs"]
+    assert lc.stats.info()["misses"] == 1
+    assert lc.stats.info()["reloads"] == 2
+
+    # Unchanged lvs are kept as is.
+    assert lc._lvs[("vg", "lv1")] is lv1
+    assert ("vg", "lv2") not in lc._lvs
+
+    # The new seqno was recorded.
+    del fake_runner.calls[:]
+    lc.getLv("vg")
+    assert fake_runner.commands() == ["vgs"]
+
+
+def test_lv_reload_incremental_invalidated(fake_devices, no_delay):
+    fake_runner = FakeVGRunner("vg", ["lv1", "lv2"])
+    lc = lvm.LVMCache(fake_runner, incremental=True)
+    lc.getVg("vg")
+    lc.getLv("vg")
+
+    # Invalidating the lvs must reload them even if the seqno did not change,
+    # for example after activating an lv.
+    lc._invalidatelvs("vg", "lv1")
+
+    del fake_runner.calls[:]
+    lc.getLv("vg")
+    assert fake_runner.commands() == ["lvs"]
+
+
+def test_lv_reload_coalescing(fake_devices, no_delay, workers):
+    fake_runner = FakeVGRunner("vg", ["lv-{}".format(i) for i in range(50)])
+    lc = lvm.LVMCache(fake_runner)
+    lc.getVg("vg")
+    del fake_runner.calls[:]
+
+    # Simulate many threads looking up different lvs in the same vg, for
+    # example when preparing many images.
+    fake_runner.delay = 0.2
+    results = {}
+
+    def lookup(lv_name):
+        results[lv_name] = lc.getLv("vg", lv_name)
+
+    try:
+        for lv_name in fake_runner.lvs:
+            workers.start_thread(lookup, lv_name)
+    finally:
+        workers.join()
+
+    for lv_name in fake_runner.lvs:
+        assert results[lv_name].name == lv_name
+
+    assert fake_runner.commands().count("lvs") < len(fake_runner.lvs) / 2
+
+
+def test_lv_reload_not_incremental(fake_devices, no_delay):
+    fake_runner = FakeVGRunner("vg", ["lv1", "lv2"])
+    lc = lvm.LVMCache(fake_runner)
+    lc.getVg("vg")
+    lc.getLv("vg")
+
+    # Without incremental mode, lvs are always reloaded.
+    del fake_runner.calls[:]
+    lc.getLv("vg")
+    assert fake_runner.commands() == ["lvs"]
+
+
+@pytest.fixture
+def local_changes(monkeypatch, fake_devices, no_delay):
+    fake_runner = FakeVGRunner("vg", ["lv1", "lv2"])
+    monkeypatch.setattr(lvm, "_lvminfo", lvm.LVMCache(fake_runner))
+    monkeypatch.setattr(lvm, "_local_changes", lvm.LocalChanges())
+    return fake_runner
+
+
+def test_local_changes(local_changes):
+    assert lvm.local_changes("vg") == lvm.VGChanges(0, 0)
+
+    lvm.changeLVsTags("vg", ("lv1",), addTags=("tag",))
+    assert lvm.local_changes("vg") == lvm.VGChanges(1, 0)
+
+    lvm.removeLVs("vg", ("lv1",))
+    assert lvm.local_changes("vg") == lvm.VGChanges(2, 0)
+
+    # Other VGs are not affected.
+    assert lvm.local_changes("other-vg") == lvm.VGChanges(0, 0)
+
+
+def test_local_changes_failure(local_changes):
+    local_changes._run_command = lambda cmd: (5, b"", b"fake error")
+
+    with pytest.raises(se.LogicalVolumeReplaceTagError):
+        lvm.changeLVsTags("vg", ("lv1",), addTags=("tag",))
+
+    assert lvm.local_changes("vg") == lvm.VGChanges(1, 1)
+
+
 @requires_root
 @pytest.mark.root
 @pytest.mark.parametrize("read_only", [True, False])
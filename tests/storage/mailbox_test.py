@@ -109,6 +109,19 @@ def make_hsm_mailbox(mboxfiles, host_id):
             raise RuntimeError('Timemout waiting for hsm mailbox')
 
 
+def extend_request_mail(host_id):
+    """
+    Return SPM inbox contents with an extend request from host_id.
+    """
+    data = extend_message()
+    data += b"\0" * (sm.MAILBOX_SIZE - len(data) - sm.CHECKSUM_BYTES)
+    mailbox = data + sm.packed_checksum(data)
+    start = host_id * sm.MAILBOX_SIZE
+    mail = bytearray(sm.EMPTYMAILBOX * MAX_HOSTS)
+    mail[start:start + sm.MAILBOX_SIZE] = mailbox
+    return bytes(mail)
+
+
 @contextlib.contextmanager
 def make_spm_mailbox(mboxfiles):
     mailbox = sm.SPM_MailMonitor(
@@ -159,6 +172,197 @@ class FakePool(object):
         }
 
 
+class TestMailboxFile:
+
+    def test_read(self, mboxfiles):
+        data = b"".join(bytes([i]) * sm.MAILBOX_SIZE for i in range(MAX_HOSTS))
+        with io.open(mboxfiles.inbox, "wb") as f:
+            f.write(data)
+        mf = sm.MailboxFile(mboxfiles.inbox, sm.MAILBOX_SIZE * MAX_HOSTS)
+        try:
+            assert mf.read(0, len(data)) == data
+            offset = 3 * sm.MAILBOX_SIZE
+            assert mf.read(offset, sm.MAILBOX_SIZE) == \
+                data[offset:offset + sm.MAILBOX_SIZE]
+        finally:
+            mf.close()
+
+    def test_read_short(self, mboxfiles):
+        mf = sm.MailboxFile(mboxfiles.inbox, sm.MAILBOX_SIZE * MAX_HOSTS)
+        try:
+            offset = (MAX_HOSTS - 1) * sm.MAILBOX_SIZE
+            data = mf.read(offset, 2 * sm.MAILBOX_SIZE)
+            assert data == sm.EMPTYMAILBOX
+        finally:
+            mf.close()
+
+    def test_write(self, mboxfiles):
+        mf = sm.MailboxFile(mboxfiles.outbox, sm.MAILBOX_SIZE * MAX_HOSTS)
+        try:
+            offset = 5 * sm.MAILBOX_SIZE
+            mailbox = b"x" * sm.MAILBOX_SIZE
+            mf.write(offset, mailbox)
+        finally:
+            mf.close()
+
+        with io.open(mboxfiles.outbox, "rb") as f:
+            data = f.read()
+        assert data[:offset] == b"\0" * offset
+        assert data[offset:offset + sm.MAILBOX_SIZE] == mailbox
+        assert data[offset + sm.MAILBOX_SIZE:] == \
+            b"\0" * (len(data) - offset - sm.MAILBOX_SIZE)
+
+    def test_missing_file(self, tmpdir):
+        mf = sm.MailboxFile(str(tmpdir.join("missing")), sm.MAILBOX_SIZE)
+        try:
+            with pytest.raises(OSError):
+                mf.read(0, sm.MAILBOX_SIZE)
+        finally:
+            mf.close()
+
+
+class TestActivePollInterval:
+
+    @pytest.mark.parametrize("monitor_interval, expected_interval", [
+        (2, 0.2),     # production config
+        (0.2, 0.2),   # testing config
+        (0.1, 0.1),   # monitor interval is shorter
+    ])
+    def test_config(self, monitor_interval, expected_interval):
+        actual = sm.active_poll_interval(monitor_interval)
+        assert actual == pytest.approx(expected_interval)
+
+
+class FakeThreadPool(object):
+    """
+    Keep queued tasks until the test runs them.
+    """
+
+    def __init__(self):
+        self.tasks = []
+
+    def queueTask(self, id, task, args=None):
+        self.tasks.append((task, args))
+        return True
+
+    def run_next(self):
+        task, args = self.tasks.pop(0)
+        task(args)
+
+
+class TestRequestScheduler:
+
+    def test_round_robin(self):
+        tp = FakeThreadPool()
+        sched = sm.RequestScheduler(tp, max_running=1, max_per_domain=1)
+        done = []
+
+        # Host 1 sends many requests before other hosts.
+        for i in range(3):
+            sched.schedule(1, b"sd-%d" % i, done.append, (1, i))
+        sched.schedule(2, b"sd-a", done.append, (2, 0))
+        sched.schedule(3, b"sd-b", done.append, (3, 0))
+        sched.schedule(2, b"sd-c", done.append, (2, 1))
+
+        while tp.tasks:
+            tp.run_next()
+
+        # The first request started immediately, the rest are served in
+        # round robin order.
+        assert done == [(1, 0), (1, 1), (2, 0), (3, 0), (1, 2), (2, 1)]
+
+    def test_max_running(self):
+        tp = FakeThreadPool()
+        sched = sm.RequestScheduler(tp, max_running=2, max_per_domain=10)
+        for i in range(5):
+            sched.schedule(i, b"sd-%d" % i, lambda args: None, None)
+
+        assert len(tp.tasks) == 2
+        info = sched.info()
+        assert info["running"] == 2
+        assert info["waiting"] == 3
+
+        tp.run_next()
+        assert len(tp.tasks) == 2
+        assert sched.info()["completed"] == 1
+
+    def test_max_per_domain(self):
+        tp = FakeThreadPool()
+        sched = sm.RequestScheduler(tp, max_running=10, max_per_domain=1)
+        done = []
+
+        sched.schedule(1, b"sd-a", done.append, 1)
+        sched.schedule(2, b"sd-a", done.append, 2)
+        # Must not wait for requests of another domain.
+        sched.schedule(2, b"sd-b", done.append, 3)
+        assert [args.args for task, args in tp.tasks] == [1, 3]
+
+        tp.run_next()
+        assert [args.args for task, args in tp.tasks] == [3, 2]
+
+    def test_failed_request(self):
+        tp = FakeThreadPool()
+        sched = sm.RequestScheduler(tp, max_running=1, max_per_domain=1)
+
+        def fail(args):
+            raise RuntimeError("request failed")
+
+        sched.schedule(1, b"sd-a", fail, None)
+        sched.schedule(2, b"sd-a", fail, None)
+        with pytest.raises(RuntimeError):
+            tp.run_next()
+
+        # Second request was started.
+        assert len(tp.tasks) == 1
+        info = sched.info()
+        assert info["running"] == 1
+        assert info["waiting"] == 0
+        assert info["completed"] == 1
+
+    def test_pending(self):
+        tp = FakeThreadPool()
+        sched = sm.RequestScheduler(tp, max_running=1, max_per_domain=1)
+        assert sched.pending() == 0
+
+        sched.schedule(1, b"sd-a", lambda args: None, None)
+        sched.schedule(2, b"sd-b", lambda args: None, None)
+        assert sched.pending() == 2
+
+        tp.run_next()
+        assert sched.pending() == 1
+        tp.run_next()
+        assert sched.pending() == 0
+
+    def test_info_empty(self):
+        sched = sm.RequestScheduler(FakeThreadPool(), 1, 1)
+        assert sched.info() == {
+            "waiting": 0,
+            "running": 0,
+            "completed": 0,
+            "latency": {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0},
+        }
+
+
+class TestPercentile:
+
+    @pytest.mark.parametrize("p, expected", [
+        (0, 1),
+        (50, 50),
+        (90, 90),
+        (99, 99),
+        (100, 100),
+    ])
+    def test_percentile(self, p, expected):
+        samples = list(range(1, 101))
+        assert sm.percentile(samples, p) == expected
+
+    def test_single(self):
+        assert sm.percentile([7], 99) == 7
+
+    def test_empty(self):
+        assert sm.percentile([], 50) == 0.0
+
+
 class TestSPMMailMonitor:
 
     def test_thread_leak(self, mboxfiles):
@@ -188,6 +392,53 @@ class TestSPMMailMonitor:
         with make_spm_mailbox(mboxfiles) as spm_mm:
             assert not spm_mm._handleRequests(sm.EMPTYMAILBOX * MAX_HOSTS)
 
+    def test_pending_requests(self, mboxfiles):
+        mail = extend_request_mail(host_id=2)
+
+        with make_spm_mailbox(mboxfiles) as spm_mm:
+            tp = FakeThreadPool()
+            spm_mm._scheduler = sm.RequestScheduler(tp, 1, 1)
+            spm_mm.registerMessageType(sm.EXTEND_CODE, lambda *args: None)
+            assert spm_mm._pollInterval() == MONITOR_INTERVAL
+
+            # Check more often until the request is answered.
+            spm_mm._handleRequests(mail)
+            assert spm_mm._scheduler.pending() == 1
+            assert spm_mm._pollInterval() == spm_mm._activeInterval
+
+            tp.run_next()
+            assert spm_mm._scheduler.pending() == 0
+            assert spm_mm._pollInterval() == MONITOR_INTERVAL
+
+    def test_stale_request(self, mboxfiles):
+        # A host crashed before clearing an answered request. The request is
+        # never cleared, but the monitor must not keep checking often.
+        mail = extend_request_mail(host_id=2)
+
+        with make_spm_mailbox(mboxfiles) as spm_mm:
+            tp = FakeThreadPool()
+            spm_mm._scheduler = sm.RequestScheduler(tp, 1, 1)
+            spm_mm.registerMessageType(sm.EXTEND_CODE, lambda *args: None)
+            spm_mm._handleRequests(mail)
+            tp.run_next()
+
+            for _ in range(3):
+                spm_mm._handleRequests(mail)
+                assert not tp.tasks
+                assert spm_mm._pollInterval() == MONITOR_INTERVAL
+
+    def test_changed_mailboxes(self, mboxfiles):
+        mail = bytearray(sm.EMPTYMAILBOX * MAX_HOSTS)
+        # Change first byte of host 1, last byte of host 4, and a byte in the
+        # middle of host 9 mailbox.
+        mail[1 * sm.MAILBOX_SIZE] = 1
+        mail[5 * sm.MAILBOX_SIZE - 1] = 1
+        mail[9 * sm.MAILBOX_SIZE + 100] = 1
+
+        with make_spm_mailbox(mboxfiles) as spm_mm:
+            changed = list(spm_mm._changedMailboxes(bytes(mail)))
+        assert changed == [1, 4, 9]
+
 
 class TestHSMMailbox:
 
@@ -220,6 +471,34 @@ class TestHSMMailbox:
                 data = f.read()
             assert data == dirty_outbox
 
+    def test_wakeup_sends_new_message(self, mboxfiles, monkeypatch):
+        host_id = 7
+        # Use long poll interval, so the second message is sent only if the
+        # monitor thread was woken up.
+        monkeypatch.setattr(
+            sm, "active_poll_interval", lambda interval: MAILER_TIMEOUT)
+        with make_hsm_mailbox(mboxfiles, host_id) as mailbox:
+            start = host_id * sm.MAILBOX_SIZE
+
+            def wait_for_slot(slot):
+                offset = start + slot * sm.MESSAGE_SIZE
+                deadline = time.monotonic() + MAILER_TIMEOUT / 2
+                while True:
+                    with io.open(mboxfiles.inbox, "rb") as f:
+                        f.seek(offset)
+                        if f.read(1) == sm.MESSAGE_VERSION:
+                            return
+                    assert time.monotonic() < deadline, "Message not sent"
+                    time.sleep(0.05)
+
+            # The first message makes the monitor wait for a reply.
+            mailbox.sendExtendMsg(volume_data(make_uuid()), 100)
+            wait_for_slot(0)
+
+            # The second message must wake up the monitor.
+            mailbox.sendExtendMsg(volume_data(make_uuid()), 200)
+            wait_for_slot(1)
+
     def test_skip_empty_response(self, mboxfiles):
         with make_hsm_mailbox(mboxfiles, 1) as hsm_mb:
             hsm_mb._mailman._used_slots_array = [1] * sm.MESSAGES_PER_MAILBOX
@@ -272,18 +551,17 @@ class TestCommunicate:
     def test_fill_slots(self, mboxfiles, monkeypatch):
 
         filled = threading.Event()
-        orig_cmd = sm._mboxExecCmd
+        orig_write = sm.MailboxFile.write
 
-        def mbox_cmd_hook(*args, **kwargs):
-            data = kwargs.get('data')
+        def mbox_write_hook(self, offset, data):
             if data and all(
                 data[i:i + 1] != b"\0"
                 for i in range(0, sm.MESSAGES_PER_MAILBOX, sm.MESSAGE_SIZE)
             ):
                 filled.set()
-            return orig_cmd(*args, **kwargs)
+            return orig_write(self, offset, data)
 
-        monkeypatch.setattr(sm, "_mboxExecCmd", mbox_cmd_hook)
+        monkeypatch.setattr(sm.MailboxFile, "write", mbox_write_hook)
 
         with make_hsm_mailbox(mboxfiles, 1) as hsm_mb:
             for _ in range(sm.MESSAGES_PER_MAILBOX):
@@ -451,6 +729,15 @@ class TestChecksum:
         assert sm.checksum(data) == result
         assert sm.packed_checksum(data) == packed_result
 
+    @pytest.mark.parametrize("size", [0, 1, 255, 256, 257, 4092, 4096])
+    def test_sum(self, size):
+        data = bytes(bytearray((i * 7 + 255) % 256 for i in range(size)))
+        assert sm.checksum(data) == sum(bytearray(data))
+
+    def test_trim(self):
+        data = b"\xff" * (2**24 + 4096)
+        assert sm.checksum(data) == sum(bytearray(data)) & 0xffffffff
+
 
 class TestWaitTimeout:
 
@@ -737,6 +737,123 @@ class SamplingThread(object):
         self.result = self._func()
 
 
+class TestCoalescer(object):
+
+    # Long enough so all threads start while the first call is running.
+    COMPUTE_SECONDS = 0.2
+
+    def test_single_thread(self):
+        coalescer = misc.Coalescer()
+        calls = []
+
+        def func(value):
+            calls.append(value)
+            return value
+
+        assert coalescer.run("key", func, 1) == 1
+        assert coalescer.run("key", func, 2) == 2
+        assert calls == [1, 2]
+
+    def test_many_threads(self):
+        coalescer = misc.Coalescer()
+        started = threading.Event()
+        results = iter(["result-1", "result-2"])
+        single_thread_allowed = AssertingLock()
+
+        def func():
+            with single_thread_allowed:
+                started.set()
+                time.sleep(self.COMPUTE_SECONDS)
+                return next(results)
+
+        first = SamplingThread(lambda: coalescer.run("key", func))
+        first.start()
+        started.wait()
+
+        others = [SamplingThread(lambda: coalescer.run("key", func))
+                  for i in range(3)]
+        for thread in others:
+            thread.start()
+        for thread in others:
+            thread.join()
+        first.join()
+
+        # Threads arriving while the first call was running share the second
+        # call result.
+        assert first.result == "result-1"
+        for thread in others:
+            assert thread.result == "result-2"
+
+    def test_different_keys(self):
+        coalescer = misc.Coalescer()
+        barrier = threading.Barrier(2, timeout=self.COMPUTE_SECONDS * 10)
+
+        def func(value):
+            # Fails unless both calls run concurrently.
+            barrier.wait()
+            return value
+
+        threads = [SamplingThread(partial(coalescer.run, key, func, key))
+                   for key in ("key-1", "key-2")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert [t.result for t in threads] == ["key-1", "key-2"]
+
+    def test_error(self):
+        coalescer = misc.Coalescer()
+
+        def func():
+            raise RuntimeError("call failed")
+
+        with pytest.raises(RuntimeError):
+            coalescer.run("key", func)
+
+        # The entry is removed when the last user exits.
+        assert coalescer._entries == {}
+
+    def test_error_waiters_retry(self):
+        coalescer = misc.Coalescer()
+        started = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            started.set()
+            time.sleep(self.COMPUTE_SECONDS)
+            if len(calls) == 2:
+                raise RuntimeError("second call failed")
+            return "result-{}".format(len(calls))
+
+        def run():
+            try:
+                return coalescer.run("key", func)
+            except RuntimeError:
+                return "error"
+
+        first = SamplingThread(run)
+        first.start()
+        started.wait()
+
+        second = SamplingThread(run)
+        second.start()
+        time.sleep(self.COMPUTE_SECONDS / 2)
+        third = SamplingThread(run)
+        third.start()
+
+        first.join()
+        second.join()
+        third.join()
+
+        # One of the waiters ran the failing second call, and the other
+        # waiter had to retry the call.
+        assert first.result == "result-1"
+        assert sorted([second.result, third.result]) == [
+            "error", "result-3"]
+
+
 class TestDynamicBarrier(VdsmTestCase):
 
     def test_exit_without_enter(self):
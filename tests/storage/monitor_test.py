@@ -87,6 +87,11 @@ class FakeCheckService(object):
         callback = self.checkers[path][0]
         callback(result)
 
+    def call_later(self, delay, callback, *args):
+        timer = threading.Timer(delay, callback, args)
+        timer.daemon = True
+        timer.start()
+
 
 # Domain states
 CREATED = "created"
@@ -240,6 +245,29 @@ def monitor_env(shutdown=False, refresh=300):
                 log.error("Error joining thread: %s", e)
 
 
+@contextmanager
+def pooled_monitor_env(workers=1, shutdown=False):
+    config = make_config([
+        ("irs", "repo_stats_cache_refresh_timeout", "300")
+    ])
+    with MonkeyPatchScope([
+        (monitor, "sdCache", FakeStorageDomainCache()),
+        (monitor, 'config', config),
+    ]):
+        event = FakeEvent()
+        checker = FakeCheckService()
+        pool = monitor.MonitorPool(checker, workers, 0, MONITOR_INTERVAL)
+        pool.start()
+        mon = monitor.PooledMonitor('uuid', 'host_id', MONITOR_INTERVAL,
+                                    event, checker, pool)
+        try:
+            yield MonitorEnv(mon, event, checker)
+        finally:
+            mon.stop(shutdown=shutdown)
+            mon.join()
+            pool.stop()
+
+
 class FakeMonitorThread(object):
 
     def __init__(self, sd_uuid, host_id, interval, event, checker):
@@ -928,3 +956,168 @@ class TestDomainMonitor:
         assert mon.domains == []
         assert mon.poolDomains == []
         assert mon.getDomainsStatus() == []
+
+    def test_pooled_monitors(self, monkeypatch):
+        monkeypatch.setattr(monitor, "config", make_config([
+            ("irs", "monitor_workers", "2"),
+        ]))
+        monkeypatch.setattr(monitor, "sdCache", FakeStorageDomainCache())
+        for i in range(10):
+            sd_uuid = "uuid-%d" % i
+            monitor.sdCache.domains[sd_uuid] = FakeDomain(sd_uuid)
+
+        mon = monitor.DomainMonitor(MONITOR_INTERVAL)
+        try:
+            for i in range(10):
+                mon.startMonitoring("uuid-%d" % i, "host-id")
+
+            # All domains are monitored by the pool workers.
+            monitor_threads = [t for t in threading.enumerate()
+                               if t.name.startswith("monitor/")]
+            assert len(monitor_threads) == 2
+
+            deadline = time.monotonic() + CYCLE_TIMEOUT
+            while None in mon.getCheckLatency().values():
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+        finally:
+            mon.shutdown()
+
+        assert mon.domains == []
+        for domain in monitor.sdCache.domains.values():
+            assert domain.state == TEARDOWN
+
+    def test_pooled_monitors_blocked_domain(self, monkeypatch):
+        monkeypatch.setattr(monitor, "config", make_config([
+            ("irs", "monitor_workers", "1"),
+        ]))
+        monkeypatch.setattr(monitor, "sdCache", FakeStorageDomainCache())
+        for i in range(3):
+            sd_uuid = "uuid-%d" % i
+            monitor.sdCache.domains[sd_uuid] = FakeDomain(sd_uuid)
+
+        # Checking the first domain blocks the only worker.
+        blocked = threading.Event()
+        unblock = threading.Event()
+
+        def block():
+            blocked.set()
+            unblock.wait(CYCLE_TIMEOUT)
+
+        monitor.sdCache.domains["uuid-0"].selftest = block
+
+        mon = monitor.DomainMonitor(MONITOR_INTERVAL)
+        try:
+            mon.startMonitoring("uuid-0", "host-id")
+            assert blocked.wait(CYCLE_TIMEOUT)
+            mon.startMonitoring("uuid-1", "host-id")
+            mon.startMonitoring("uuid-2", "host-id")
+            start = time.time()
+
+            # The other domains are checked by a new worker.
+            deadline = time.monotonic() + CYCLE_TIMEOUT
+            while True:
+                assert time.monotonic() < deadline
+                status = dict(mon.getDomainsStatus())
+                latency = mon.getCheckLatency()
+                if all(status[sd_uuid].checkTime > start + MONITOR_INTERVAL
+                       and latency[sd_uuid] is not None
+                       for sd_uuid in ("uuid-1", "uuid-2")):
+                    break
+                time.sleep(0.05)
+
+            assert latency["uuid-0"] is None
+        finally:
+            unblock.set()
+            mon.shutdown()
+
+        # The blocked worker exits when the check completes.
+        monitor_threads = [t for t in threading.enumerate()
+                           if t.name.startswith("monitor/")]
+        assert monitor_threads == []
+        for domain in monitor.sdCache.domains.values():
+            assert domain.state == TEARDOWN
+
+
+class TestPooledMonitor:
+
+    def test_unknown_to_valid(self):
+        with pooled_monitor_env() as env:
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+
+            # First cycle suceeds, but path status is not avialale yet
+            env.wait_for_cycle()
+            assert not env.thread.getStatus().actual
+            assert env.thread.checkLatency is not None
+
+            # When path succeeds, emit VALID event
+            env.checker.complete(domain.getMonitoringPath(), FakeCheckResult())
+            status = env.thread.getStatus()
+            assert status.actual
+            assert status.valid
+            assert env.event.received == [(('uuid', True), {})]
+
+            # Acquire host id on the next cycle
+            env.wait_for_cycle()
+            assert domain.acquired
+
+    def test_setup_retry(self):
+        with pooled_monitor_env() as env:
+            env.thread.start()
+
+            # Producing the domain fails
+            env.wait_for_cycle()
+            status = env.thread.getStatus()
+            assert not status.valid
+            assert isinstance(status.error, se.StorageDomainDoesNotExist)
+
+            # Succeeds on the next cycle
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.wait_for_cycle()
+            assert domain.state == SETUP
+
+    def test_stop(self):
+        with pooled_monitor_env() as env:
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+            env.wait_for_cycle()
+            env.checker.complete(domain.getMonitoringPath(), FakeCheckResult())
+            env.wait_for_cycle()
+            assert domain.acquired
+
+        assert not domain.acquired
+        assert domain.state == TEARDOWN
+        assert domain.getMonitoringPath() not in env.checker.checkers
+
+    def test_shutdown(self):
+        with pooled_monitor_env(shutdown=True) as env:
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+            env.wait_for_cycle()
+            env.checker.complete(domain.getMonitoringPath(), FakeCheckResult())
+            env.wait_for_cycle()
+
+        assert domain.acquired
+        assert domain.state == TEARDOWN
+
+    def test_stop_while_blocked(self):
+        with pooled_monitor_env() as env:
+            domain = FakeDomain("uuid")
+            blocked = threading.Event()
+
+            def block():
+                blocked.set()
+                time.sleep(MONITOR_INTERVAL)
+
+            domain.selftest = block
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+            assert blocked.wait(CYCLE_TIMEOUT)
+
+        assert not env.thread.getStatus().actual
+        assert domain.state == TEARDOWN
@@ -26,6 +26,7 @@ import uuid
 import pytest
 
 from vdsm.common.units import MiB
+from vdsm.storage import blockSD
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
 from vdsm.storage import clusterlock
@@ -199,6 +200,97 @@ class TestBlockDomainMetadataSlot:
                 acquired = env.sd_manifest._lvTagMetaSlotLock.acquire(False)
                 assert not acquired
 
+    def test_metaslot_bitmap_reused(self, monkeypatch):
+        seeds = []
+        occupied_metadata_slots = blockSD._occupied_metadata_slots
+
+        def counting(sd_uuid):
+            seeds.append(sd_uuid)
+            return occupied_metadata_slots(sd_uuid)
+
+        monkeypatch.setattr(blockSD, "_occupied_metadata_slots", counting)
+
+        with fake_block_env(sd_version=5) as env:
+            slots = [self._create_volume_lv(env) for i in range(3)]
+            assert slots == [1, 2, 3]
+            # Our own tag changes do not require reading the lvs again.
+            assert len(seeds) == 1
+
+    def test_metaslot_external_change(self):
+        with fake_block_env(sd_version=5) as env:
+            assert self._create_volume_lv(env) == 1
+
+            # Another host modified the vg, using the next slot. Changes made
+            # by other hosts are not counted as local changes.
+            sduuid = env.sd_manifest.sdUUID
+            changes = env.lvm.local_changes(sduuid)
+            lv = make_uuid()
+            env.lvm.createLV(sduuid, lv, VOLSIZE // MiB)
+            env.lvm.changeLVsTags(
+                sduuid, (lv,), addTags=(sc.TAG_PREFIX_MD + "2",))
+            env.lvm.changes[sduuid] = changes
+
+            assert self._create_volume_lv(env) == 3
+
+    def test_metaslot_released_slot(self, monkeypatch):
+        seeds = []
+        occupied_metadata_slots = blockSD._occupied_metadata_slots
+
+        def counting(sd_uuid):
+            seeds.append(sd_uuid)
+            return occupied_metadata_slots(sd_uuid)
+
+        monkeypatch.setattr(blockSD, "_occupied_metadata_slots", counting)
+
+        with fake_block_env(sd_version=5) as env:
+            sduuid = env.sd_manifest.sdUUID
+            lv = make_uuid()
+            env.lvm.createLV(sduuid, lv, VOLSIZE // MiB)
+            with env.sd_manifest.acquireVolumeMetadataSlot(None) as slot:
+                env.lvm.changeLVsTags(
+                    sduuid, (lv,), addTags=(sc.TAG_PREFIX_MD + str(slot),))
+            assert self._create_volume_lv(env) == 2
+
+            # Removing the volume on this host releases the slot without
+            # reading the lvs again.
+            env.sd_manifest.removeVolumeLVs((lv,))
+
+            assert self._create_volume_lv(env) == 1
+            assert len(seeds) == 1
+
+    def test_metaslot_release(self):
+        with fake_block_env(sd_version=5) as env:
+            slots = [self._create_volume_lv(env) for i in range(3)]
+            assert slots == [1, 2, 3]
+
+            # Moving volume metadata to another slot releases the old slot
+            # while the volume lv still exists.
+            env.sd_manifest.releaseVolumeMetadataSlot(2)
+
+            assert self._create_volume_lv(env) == 2
+            assert self._create_volume_lv(env) == 4
+
+    def test_metaslot_failure(self):
+        class InjectedFailure(Exception):
+            pass
+
+        with fake_block_env(sd_version=5) as env:
+            with pytest.raises(InjectedFailure):
+                with env.sd_manifest.acquireVolumeMetadataSlot(None) as slot:
+                    assert slot == 1
+                    raise InjectedFailure
+
+            assert self._create_volume_lv(env) == 1
+
+    def _create_volume_lv(self, env):
+        sduuid = env.sd_manifest.sdUUID
+        lv = make_uuid()
+        env.lvm.createLV(sduuid, lv, VOLSIZE // MiB)
+        with env.sd_manifest.acquireVolumeMetadataSlot(None) as slot:
+            tag = sc.TAG_PREFIX_MD + str(slot)
+            env.lvm.changeLVsTags(sduuid, (lv,), addTags=(tag,))
+        return slot
+
 
 class StorageDomainManifest(sd.StorageDomainManifest):
     def __init__(self):
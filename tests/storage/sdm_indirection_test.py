@@ -510,6 +510,16 @@ class FakeVolumeManifest(object):
     def getImageVolumes(cls, sdUUID, imgUUID):
         pass
 
+    @classmethod
+    @recorded
+    def getImageVolumeParents(cls, sdUUID, imgUUID):
+        pass
+
+    @classmethod
+    @recorded
+    def supports_chain_cache(cls):
+        pass
+
     @recorded
     def prepare(self, rw=True, justme=False,
                 chainrw=False, setrw=False, force=False):
@@ -849,6 +859,8 @@ class VolumeTestMixin(object):
         ['newMetadata', 11],
         ['newVolumeLease', 3],
         ['getImageVolumes', 2],
+        ['getImageVolumeParents', 2],
+        ['supports_chain_cache', 0],
         ['teardown', 3],
     ])
     def test_class_methods(self, fn, nargs):
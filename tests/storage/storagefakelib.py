@@ -69,6 +69,7 @@ class FakeLVM(object):
         self.pvmd = {}
         self.vgmd = {}
         self.lvmd = {}
+        self.changes = {}
 
     def createVG(self, vgName, devices, initialTag, metadataSize, force=False):
         # Convert params from MiB to bytes to match other fields
@@ -100,6 +101,7 @@ class FakeLVM(object):
                      vg_mda_free=None,
                      lv_count='0',
                      pv_count=str(len(devices)),
+                     seqno='1',
                      pv_name=pv_name,
                      writeable=True,
                      partial='OK')
@@ -168,9 +170,22 @@ class FakeLVM(object):
 
         self.lvmd[(vgName, lvName)] = lv_md
         self.vgmd[vgName]['lv_count'] = str(lv_count)
+        self._vg_modified(vgName)
 
         self._create_lv_file(vgName, lvName, activate, size)
 
+    def removeLVs(self, vgName, lvNames):
+        for lv in lvNames:
+            try:
+                lv_md = self.lvmd.pop((vgName, lv))
+            except KeyError:
+                raise se.CannotRemoveLogicalVolume(vgName, lv)
+            os.unlink(self._fake_lv_path(vgName, lv, lv_md['active']))
+
+        vg_md = self.vgmd[vgName]
+        vg_md['lv_count'] = str(int(vg_md['lv_count']) - len(lvNames))
+        self._vg_modified(vgName)
+
     def activateLVs(self, vgName, lvNames, refresh=True):
         for lv in lvNames:
             try:
@@ -216,6 +231,8 @@ class FakeLVM(object):
             tags -= set(delTags)
             lv_md['tags'] = tuple(tags)
 
+        self._vg_modified(vg)
+
     def lvsByTag(self, vgName, tag):
         return [lv for lv in self.getLV(vgName) if tag in lv.tags]
 
@@ -250,6 +267,9 @@ class FakeLVM(object):
         vg_md['attr'] = vg_attr
         return real_lvm.VG(**vg_md)
 
+    def getVGs(self, vgNames):
+        return [self.getVG(name) for name in vgNames if name in self.vgmd]
+
     def changeVGTags(self, vgName, delTags=(), addTags=()):
         try:
             vg_md = self.vgmd[vgName]
@@ -262,6 +282,7 @@ class FakeLVM(object):
         tags |= set(addTags)
         tags -= set(delTags)
         vg_md['tags'] = tuple(tags)
+        self._vg_modified(vgName)
 
     def _getLV(self, vgName, lvName):
         try:
@@ -294,6 +315,7 @@ class FakeLVM(object):
             return
         lv['size'] = str(size)
         self._extend_lv_file(vgName, lvName, lv['active'], size)
+        self._vg_modified(vgName)
         # TODO: vg free extent accounting
 
     def fake_lv_symlink_create(self, vg_name, lv_name):
@@ -320,6 +342,16 @@ class FakeLVM(object):
                      mda_used_count='0')
         self.pvmd[pv_name] = pv_md
 
+    def local_changes(self, vgName):
+        return self.changes.get(vgName, real_lvm.VGChanges(0, 0))
+
+    def _vg_modified(self, vg_name):
+        # Like lvm, increase the VG seqno on every metadata change.
+        vg_md = self.vgmd[vg_name]
+        vg_md['seqno'] = str(int(vg_md['seqno']) + 1)
+        c = self.local_changes(vg_name)
+        self.changes[vg_name] = c._replace(modified=c.modified + 1)
+
     def _calc_vg_pe_count(self, vg_name):
         return sum(int(pv["pe_count"]) for pv in self.pvmd.values()
                    if pv["vg_name"] == vg_name)
@@ -0,0 +1,172 @@
+"""
+Benchmark LVMCache refresh cost with a large fake VG.
+
+The benchmark does not run any lvm command. Instead it simulates vgs and lvs
+output for a VG with many LVs, and measures the cost of looking up all the
+LVs in the VG, the way a non-SPM host does during monitoring and image
+preparation. Command latency can be simulated using --cmd-delay.
+
+Usage:
+
+    $ PYTHONPATH=lib python3 tests/storage/stress/lvmcache.py \\
+        --lv-count 3000 --lookups 100
+
+This runs the lookups twice; first with the default LVMCache configuration,
+reloading all LVs on every lookup, and then with incremental refresh, reloading
+LVs only when the VG seqno has changed. Use --change-rate to modify the VG
+seqno in some of the lookups.
+
+Example results:
+
+    mode=full lookups=100 hits=0 misses=100 reloads=100 total=1.564
+    per-lookup=0.015640
+
+    mode=incremental lookups=100 hits=91 misses=9 reloads=109 total=0.186
+    per-lookup=0.001859
+
+Note that in incremental mode every lookup runs vgs to check the VG seqno, so
+the number of reloads is higher, but only the misses run lvs.
+"""
+
+import argparse
+import logging
+import random
+import time
+
+from vdsm.storage import lvm
+
+VG_NAME = "bench-vg"
+
+
+class FakeRunner(lvm.LVMRunner):
+    """
+    Simulate vgs and lvs output for one large VG.
+    """
+
+    def __init__(self, lv_count, cmd_delay):
+        self.cmd_delay = cmd_delay
+        self.seqno = 1
+        self.lvs = ["lv-{:06}".format(i) for i in range(lv_count)]
+
+    def modify(self):
+        self.seqno += 1
+        lv_name = random.choice(self.lvs)
+        self.lvs.remove(lv_name)
+        self.lvs.append(lv_name + "-new")
+
+    def _run_command(self, cmd):
+        if self.cmd_delay:
+            time.sleep(self.cmd_delay)
+
+        if cmd[1] == "vgs":
+            line = (
+                "vg-uuid|{vg}|wz--n-|2199023255552|1099511627776|134217728|"
+                "16384|8192|RHAT_storage_domain|134217728|67108864|{count}|1|"
+                "{seqno}|/dev/mapper/bench"
+            ).format(vg=VG_NAME, count=len(self.lvs), seqno=self.seqno)
+            return 0, line.encode("utf-8"), b""
+
+        if cmd[1] == "lvs":
+            lines = (
+                "lv-uuid-{lv}|{lv}|{vg}|-wi-------|1073741824|0|"
+                "/dev/mapper/bench(0)|IU_image,PU_parent,MD_1".format(
+                    lv=lv_name, vg=VG_NAME)
+                for lv_name in self.lvs
+            )
+            return 0, "\n".join(lines).encode("utf-8"), b""
+
+        return 0, b"", b""
+
+
+class BenchCache(lvm.LVMCache):
+    """
+    Avoid looking up multipath devices for building the filter.
+    """
+
+    def _getCachedFilter(self):
+        return lvm._buildFilter(("/dev/mapper/bench",))
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.ERROR,
+        format="%(asctime)s %(levelname)-7s (%(threadName)s) %(message)s")
+
+    for incremental in (False, True):
+        run(args, incremental)
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+
+    p.add_argument(
+        "--lv-count",
+        type=int,
+        default=3000,
+        help="Number of lvs in the fake vg (default 3000)")
+
+    p.add_argument(
+        "--lookups",
+        type=int,
+        default=100,
+        help="Number of lookups of all lvs in the vg (default 100)")
+
+    p.add_argument(
+        "--change-rate",
+        type=float,
+        default=0.1,
+        help="Probability that the vg was modified before a lookup "
+             "(default 0.1)")
+
+    p.add_argument(
+        "--cmd-delay",
+        type=float,
+        default=0.0,
+        help="Simulated lvm command latency in seconds (default 0)")
+
+    p.add_argument(
+        "--debug",
+        action="store_true",
+        help="Show debug logs")
+
+    return p.parse_args()
+
+
+def run(args, incremental):
+    runner = FakeRunner(args.lv_count, args.cmd_delay)
+    cache = BenchCache(runner, incremental=incremental)
+
+    # Warm up the cache, like a host connecting to the storage domain.
+    cache.getVg(VG_NAME)
+    cache.getLv(VG_NAME)
+    cache.stats.clear()
+
+    # Use the same changes in both modes.
+    random.seed(42)
+
+    start = time.monotonic()
+
+    for i in range(args.lookups):
+        if random.random() < args.change_rate:
+            runner.modify()
+        lvs = cache.getLv(VG_NAME)
+        assert len(lvs) == args.lv_count
+
+    total = time.monotonic() - start
+    info = cache.stats.info()
+
+    print("mode={} lookups={} hits={} misses={} reloads={} total={:.3f} "
+          "per-lookup={:.6f}".format(
+              "incremental" if incremental else "full",
+              args.lookups,
+              info["hits"],
+              info["misses"],
+              info["reloads"],
+              total,
+              total / args.lookups))
+
+
+if __name__ == "__main__":
+    main()
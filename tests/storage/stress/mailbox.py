@@ -0,0 +1,197 @@
+"""
+Benchmark SPM mailbox scanning with synthetic full-pool mailboxes.
+
+The benchmark does not start the mailbox threads and does not perform any
+I/O. It feeds synthetic mail for all hosts directly to
+SPM_MailMonitor._handleRequests(), the way the SPM mail monitor does on every
+check, and reports the time per check.
+
+Usage:
+
+    $ PYTHONPATH=lib python3 tests/storage/stress/mailbox.py \\
+        --hosts 2000 --checks 100
+
+The benchmark runs these scenarios:
+
+- idle: all mailboxes are empty.
+- pending: --active hosts have requests waiting for a reply, the mail does
+  not change between checks.
+- changing: on every check, --changes hosts send a new request.
+
+The checksum of a full mailbox is also measured, comparing checksum() with
+the sum(bytearray(data)) implementation used before.
+
+Example results:
+
+    scenario=idle hosts=2000 checks=100 total=0.084 per-check=0.000843
+    scenario=pending hosts=2000 checks=100 total=0.081 per-check=0.000812
+    scenario=changing hosts=2000 checks=100 total=0.205 per-check=0.002051
+    checksum=legacy mailboxes=10000 total=0.170 per-mailbox=0.000017
+    checksum=current mailboxes=10000 total=0.048 per-mailbox=0.000005
+
+Before comparing whole mailboxes, every scenario took about 0.017 seconds per
+check.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from vdsm.storage import mailbox as sm
+
+VOLUME_DATA = dict(poolID="5d928855-b09b-47a7-b920-bd2d2eb5808c",
+                   domainID="8adbc85e-e554-4ae0-b318-8a5465fe5fe1")
+
+
+class FakeScheduler(object):
+    """
+    Accept requests without running them, so we measure only the scanning.
+    """
+
+    def __init__(self):
+        self.scheduled = 0
+
+    def schedule(self, host, domain, func, args):
+        self.scheduled += 1
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.ERROR,
+        format="%(asctime)s %(levelname)-7s (%(threadName)s) %(message)s")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monitor = create_monitor(tmpdir, args.hosts)
+        for scenario in (idle, pending, changing):
+            run(monitor, args, scenario)
+
+    bench_checksum(args)
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+
+    p.add_argument(
+        "--hosts",
+        type=int,
+        default=2000,
+        help="Number of hosts in the pool (default 2000)")
+
+    p.add_argument(
+        "--checks",
+        type=int,
+        default=100,
+        help="Number of mail checks (default 100)")
+
+    p.add_argument(
+        "--active",
+        type=int,
+        default=50,
+        help="Number of hosts with pending requests (default 50)")
+
+    p.add_argument(
+        "--changes",
+        type=int,
+        default=10,
+        help="Number of hosts sending new request on every check "
+             "(default 10)")
+
+    p.add_argument(
+        "--debug",
+        action="store_true",
+        help="Show debug logs")
+
+    return p.parse_args()
+
+
+def create_monitor(tmpdir, hosts):
+    inbox = os.path.join(tmpdir, "inbox")
+    outbox = os.path.join(tmpdir, "outbox")
+    for path in (inbox, outbox):
+        with open(path, "wb") as f:
+            f.truncate(hosts * sm.MAILBOX_SIZE)
+
+    monitor = sm.SPM_MailMonitor(
+        VOLUME_DATA["poolID"], hosts, inbox, outbox)
+
+    # Replace the real scheduler, we don't want to run extend tasks.
+    monitor.tp.joinAll()
+    monitor._scheduler = FakeScheduler()
+    monitor.registerMessageType(sm.EXTEND_CODE, None)
+
+    return monitor
+
+
+def host_mailbox(seed):
+    volume = dict(VOLUME_DATA, volumeID=str(uuid.UUID(int=seed)))
+    msg = sm.SPM_Extend_Message(volume, seed)
+    data = msg.payload.ljust(sm.MAILBOX_SIZE - sm.CHECKSUM_BYTES, b"\0")
+    return data + sm.packed_checksum(data)
+
+
+def pool_mail(hosts, mailboxes):
+    mail = bytearray(sm.EMPTYMAILBOX * hosts)
+    for host, mailbox in mailboxes.items():
+        start = host * sm.MAILBOX_SIZE
+        mail[start:start + sm.MAILBOX_SIZE] = mailbox
+    return bytes(mail)
+
+
+def idle(args, check):
+    return {}
+
+
+def pending(args, check):
+    return {host: host_mailbox(host) for host in range(args.active)}
+
+
+def changing(args, check):
+    mailboxes = pending(args, check)
+    for i in range(args.changes):
+        host = args.active + (check * args.changes + i) % (
+            args.hosts - args.active)
+        mailboxes[host] = host_mailbox(check * args.changes + i + 1)
+    return mailboxes
+
+
+def run(monitor, args, scenario):
+    # Prepare the mail before the test, so we measure only the scanning.
+    mails = [pool_mail(args.hosts, scenario(args, check))
+             for check in range(args.checks)]
+
+    # Start from the state of the first check.
+    monitor._handleRequests(mails[0])
+
+    start = time.monotonic()
+
+    for mail in mails:
+        monitor._handleRequests(mail)
+
+    total = time.monotonic() - start
+
+    print("scenario={} hosts={} checks={} total={:.3f} per-check={:.6f}"
+          .format(scenario.__name__, args.hosts, args.checks, total,
+                  total / args.checks))
+
+
+def bench_checksum(args):
+    data = host_mailbox(1)[:-sm.CHECKSUM_BYTES]
+    count = 10000
+
+    for name, func in (("legacy", lambda d: sum(bytearray(d))),
+                       ("current", sm.checksum)):
+        start = time.monotonic()
+        for i in range(count):
+            func(data)
+        total = time.monotonic() - start
+        print("checksum={} mailboxes={} total={:.3f} per-mailbox={:.6f}"
+              .format(name, count, total, total / count))
+
+
+if __name__ == "__main__":
+    main()
@@ -85,6 +85,19 @@ To run reload tests run:
 This runs one trial, which takes 80-90 minutes. Check the "Stats" logs to get
 reloads timings and errors stats.
 
+To simulate many threads looking up lvs at the same time (e.g. when preparing
+many images), use multiple lv reloaders:
+
+    # /path/to/reload.py run --lv-reloaders 20 2>run.log
+
+To check how coalescing concurrent reloads of the same vg to a single lvs
+command (like vdsm does) affects the load, run:
+
+    # /path/to/reload.py run --lv-reloaders 20 --coalesce 2>run.log
+
+With --coalesce, lv reloaders reload all lvs in the vg, and the "Stats" logs
+report how many requests were served by a reload started by another reloader.
+
 Here are (reformatted) results from CentOS 7.8 VM:
 
     2020-05-30 01:26:25,346 INFO    (reload/vg) Stats:
@@ -281,6 +294,18 @@ def parse_args():
         help="Use lvm --verbose option for verbose errors and dump errors "
              "to files (e.g. pvs-error-0042.txt)")
 
+    p.add_argument(
+        "--lv-reloaders",
+        type=int,
+        default=1,
+        help="Number of concurrent lv reloaders (default 1)")
+
+    p.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Coalesce concurrent reloads of the same vg to single lvs "
+             "command")
+
     p.add_argument(
         "--read-only",
         dest="read_only",
@@ -420,15 +445,18 @@ def cmd_run(args):
     r.start()
     reloaders.append(r)
 
-    logging.info("Starting lv reloader")
-    r = threading.Thread(
-        target=lv_reloader,
-        args=(reloaders_lvm, args),
-        daemon=True,
-        name="reload/lv",
-    )
-    r.start()
-    reloaders.append(r)
+    coalescer = Coalescer()
+
+    for i in range(args.lv_reloaders):
+        logging.info("Starting lv reloader %d", i)
+        r = threading.Thread(
+            target=lv_reloader,
+            args=(reloaders_lvm, args, coalescer),
+            daemon=True,
+            name="reload/lv/{:02}".format(i),
+        )
+        r.start()
+        reloaders.append(r)
 
     workers_lvm = LVMRunner()
     workers = []
@@ -695,9 +723,60 @@ def perform_io(vg_name, lv_name):
     ])
 
 
+class Coalescer:
+    """
+    Coalesce concurrent calls with the same key to single call, like vdsm
+    LVMCache. Callers arriving while a call is running wait for the next call,
+    so they never get a result older than their request.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._running = set()
+        self._started = {}
+        self._finished = {}
+
+    def run(self, key, func):
+        """
+        Returns tuple (result, coalesced), where coalesced is True if the
+        result was obtained by another caller.
+        """
+        with self._cond:
+            target = self._started.get(key, 0) + 1
+
+            while key in self._running:
+                self._cond.wait()
+                generation, result, error = self._finished[key]
+                if generation >= target:
+                    if error:
+                        raise error
+                    return result, True
+
+            generation = self._started.get(key, 0) + 1
+            self._started[key] = generation
+            self._running.add(key)
+
+        result = error = None
+        try:
+            result = func()
+        except Exception as e:
+            error = e
+
+        with self._cond:
+            self._running.discard(key)
+            self._finished[key] = (generation, result, error)
+            self._cond.notify_all()
+
+        if error:
+            raise error
+        return result, False
+
+
 class ReloaderStats:
 
     def __init__(self):
+        self.requests = 0
+        self.coalesced = 0
         self.reloads = 0
         self.errors = 0
         self.failures = 0
@@ -721,6 +800,7 @@ def pv_reloader(lvm, args):
         else:
             pvs_args.append(pv_name)
 
+        stats.requests += 1
         reload(lvm, "pvs", pvs_args, stats, args)
 
     log_reload_stats(stats)
@@ -743,12 +823,13 @@ def vg_reloader(lvm, args):
         else:
             vgs_args.append(vg_name)
 
+        stats.requests += 1
         reload(lvm, "vgs", vgs_args, stats, args)
 
     log_reload_stats(stats)
 
 
-def lv_reloader(lvm, args):
+def lv_reloader(lvm, args, coalescer):
     logging.info("Reloader started")
     stats = ReloaderStats()
 
@@ -756,6 +837,19 @@ def lv_reloader(lvm, args):
         vg_number = random.randint(0, args.vg_count - 1)
         vg_name = make_vg_name(vg_number)
 
+        if args.coalesce:
+            # Reload all lvs in the vg, sharing the reload with other
+            # reloaders looking up lvs in the same vg.
+            logging.info("Reloading vg %s lvs", vg_name)
+            stats.requests += 1
+            _, coalesced = coalescer.run(
+                vg_name,
+                lambda: reload(
+                    lvm, "lvs", ["--noheadings", vg_name], stats, args))
+            if coalesced:
+                stats.coalesced += 1
+            continue
+
         lv_number = random.randint(0, args.lv_count - 1)
         lv_name = make_lv_name(lv_number)
 
@@ -772,6 +866,7 @@ def lv_reloader(lvm, args):
             lvs_args.extend(("--select", selection))
             lvs_args.append(vg_name)
 
+        stats.requests += 1
         reload(lvm, "lvs", lvs_args, stats, args)
 
     log_reload_stats(stats)
@@ -805,6 +900,13 @@ def reload(lvm, cmd, cmd_args, stats, args):
 
 
 def log_reload_stats(stats):
+    if not stats.times:
+        logging.info(
+            "Stats: requests=%s coalesced=%s reloads=0",
+            stats.requests,
+            stats.coalesced)
+        return
+
     stats.times.sort()
     times = stats.times
 
@@ -820,8 +922,11 @@ def log_reload_stats(stats):
     avg_time = sum(times) / len(times)
 
     logging.info(
-        "Stats: reloads=%s errors=%s error_rate=%.2f%% failures=%s "
-        "avg_time=%.3f med_time=%.3f min_time=%.3f max_time=%.3f",
+        "Stats: requests=%s coalesced=%s reloads=%s errors=%s "
+        "error_rate=%.2f%% failures=%s avg_time=%.3f med_time=%.3f "
+        "min_time=%.3f max_time=%.3f",
+        stats.requests,
+        stats.coalesced,
         stats.reloads,
         stats.errors,
         stats.errors / stats.reloads * 100,
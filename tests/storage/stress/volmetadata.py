@@ -0,0 +1,146 @@
+"""
+Benchmark reading volumes metadata from a block storage domain metadata
+volume.
+
+The benchmark creates a fake metadata volume file in version 5 format with
+--volumes metadata slots, and measures reading and parsing the metadata of
+all the volumes using:
+
+- slots: reading every slot with dd, like reading single volume metadata.
+- dd: reading the entire metadata area with dd, the way dump() did before.
+- direct: reading the entire metadata area using direct I/O in the current
+  process, the way dump() does now.
+
+The file must be created on a file system supporting direct I/O, so tmpfs
+cannot be used.
+
+Usage:
+
+    $ PYTHONPATH=lib python3 tests/storage/stress/volmetadata.py \\
+        --volumes 2000 --dir /var/tmp
+
+Example results:
+
+    mode=slots volumes=2000 total=2.196 per-volume=0.001098 MiB/s=7.11
+    mode=dd volumes=2000 total=0.061 per-volume=0.000030 MiB/s=256.07
+    mode=direct volumes=2000 total=0.027 per-volume=0.000014 MiB/s=576.49
+
+Throughput is computed using the size of the metadata area read.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from vdsm.common.units import MiB
+from vdsm.storage import blockSD
+from vdsm.storage import constants as sc
+from vdsm.storage import misc
+from vdsm.storage.volumemetadata import VolumeMetadata
+
+VERSION = 5
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.ERROR,
+        format="%(asctime)s %(levelname)-7s (%(threadName)s) %(message)s")
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        path = os.path.join(tmpdir, "metadata")
+        offsets = create_metadata(path, args.volumes)
+        for mode in (read_slots, read_dd, read_direct):
+            run(path, offsets, mode)
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+
+    p.add_argument(
+        "--volumes",
+        type=int,
+        default=2000,
+        help="Number of volumes in the domain (default 2000)")
+
+    p.add_argument(
+        "--dir",
+        default="/var/tmp",
+        help="Directory for the fake metadata volume, must support direct "
+             "I/O (default /var/tmp)")
+
+    p.add_argument(
+        "--debug",
+        action="store_true",
+        help="Show debug logs")
+
+    return p.parse_args()
+
+
+def create_metadata(path, volumes):
+    sd_id = str(uuid.uuid4())
+    offsets = []
+
+    with open(path, "wb") as f:
+        for slot in range(volumes):
+            md = VolumeMetadata(
+                domain=sd_id,
+                image=str(uuid.uuid4()),
+                puuid=sc.BLANK_UUID,
+                capacity=10 * 1024**3,
+                format="COW",
+                type="SPARSE",
+                voltype="LEAF",
+                disktype="DATA",
+                description="volume {}".format(slot),
+                legality=sc.LEGAL_VOL)
+            offset = blockSD.METADATA_BASE_V5 + (
+                slot * blockSD.METADATA_SLOT_SIZE_V5)
+            f.seek(offset)
+            f.write(md.storage_format(VERSION).ljust(sc.METADATA_SIZE, b"\0"))
+            offsets.append(offset)
+
+        f.truncate(offsets[-1] + blockSD.METADATA_SLOT_SIZE_V5)
+
+    return offsets
+
+
+def read_slots(path, offsets):
+    for offset in offsets:
+        data = misc.readblock(path, offset, sc.METADATA_SIZE)
+        yield offset, data.rstrip(b"\0")
+
+
+def read_dd(path, offsets):
+    start = offsets[0]
+    end = offsets[-1] + sc.METADATA_SIZE
+    data = misc.readblock(path, start, end - start)
+    for offset in offsets:
+        pos = offset - start
+        yield offset, data[pos:pos + sc.METADATA_SIZE].rstrip(b"\0")
+
+
+def read_direct(path, offsets):
+    return blockSD._read_metadata_blocks(path, offsets)
+
+
+def run(path, offsets, mode):
+    start = time.monotonic()
+
+    for offset, data in mode(path, offsets):
+        VolumeMetadata.from_lines(data.splitlines())
+
+    total = time.monotonic() - start
+    size = offsets[-1] + sc.METADATA_SIZE - offsets[0]
+
+    print("mode={} volumes={} total={:.3f} per-volume={:.6f} MiB/s={:.2f}"
+          .format(mode.__name__.split("_", 1)[1], len(offsets), total,
+                  total / len(offsets), size / MiB / total))
+
+
+if __name__ == "__main__":
+    main()
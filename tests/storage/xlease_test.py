@@ -25,6 +25,7 @@ from __future__ import print_function
 import functools
 import io
 import mmap
+import time
 import timeit
 
 import pytest
@@ -646,6 +647,130 @@ def bench():
         print("%d adds in %.6f seconds (%.6f seconds per add)"
               % (count, elapsed, elapsed / count))
 
+    @pytest.mark.slow
+    def test_time_full_index(self, tmp_vol, fake_sanlock):
+        # Populate 2000 records, the expected number of vm leases per data
+        # center.
+        lease_ids = [make_uuid() for i in range(2000)]
+        index = xlease.VolumeIndex(tmp_vol.alignment, tmp_vol.block_size)
+        with utils.closing(index):
+            index.load(tmp_vol.backend)
+            for recnum, lease_id in enumerate(lease_ids):
+                offset = xlease.lease_offset(recnum, tmp_vol.alignment)
+                index.write_record(recnum, xlease.Record(lease_id, offset))
+            index.dump(tmp_vol.backend)
+
+        start = time.monotonic()
+        vol = xlease.LeasesVolume(
+            tmp_vol.backend,
+            alignment=tmp_vol.alignment,
+            block_size=tmp_vol.block_size)
+        load = time.monotonic() - start
+
+        with utils.closing(vol):
+            start = time.monotonic()
+            for lease_id in lease_ids:
+                vol.lookup(lease_id)
+            lookup = time.monotonic() - start
+
+            start = time.monotonic()
+            leases = vol.leases()
+            dump = time.monotonic() - start
+            assert len(leases) == len(lease_ids)
+
+            # Allocating a new lease needs a free record after the last
+            # lease.
+            start = time.monotonic()
+            vol.add(make_uuid())
+            add = time.monotonic() - start
+
+        print("load %.6f seconds, %d lookups %.6f seconds (%.6f seconds per "
+              "lookup), leases %.6f seconds, add %.6f seconds"
+              % (load, len(lease_ids), lookup, lookup / len(lease_ids), dump,
+                 add))
+
+
+class TestVolumeIndex:
+
+    @pytest.fixture
+    def index(self):
+        index = xlease.VolumeIndex(sc.ALIGNMENT_1M, sc.BLOCK_SIZE_512)
+        for recnum in range(xlease.MAX_RECORDS):
+            index.write_record(recnum, xlease.EMPTY_RECORD)
+        yield index
+        index.close()
+
+    def test_unformatted(self):
+        index = xlease.VolumeIndex(sc.ALIGNMENT_1M, sc.BLOCK_SIZE_512)
+        with utils.closing(index):
+            assert index.find_free_record() == -1
+            assert index.find_record(make_uuid()) == -1
+
+    def test_empty(self, index):
+        assert index.find_free_record() == 0
+        assert index.find_record(make_uuid()) == -1
+        assert index.used_records() == []
+
+    def test_write_record(self, index):
+        lease_id = make_uuid()
+        index.write_record(0, xlease.Record(lease_id, 0))
+        assert index.find_record(lease_id) == 0
+        assert index.find_free_record() == 1
+        assert index.used_records() == [0]
+
+    def test_clear_record(self, index):
+        lease_id = make_uuid()
+        index.write_record(0, xlease.Record(lease_id, 0))
+        index.write_record(0, xlease.EMPTY_RECORD)
+        assert index.find_record(lease_id) == -1
+        assert index.find_free_record() == 0
+        assert index.used_records() == []
+
+    def test_replace_record(self, index):
+        old_id = make_uuid()
+        new_id = make_uuid()
+        index.write_record(3, xlease.Record(old_id, 0))
+        index.write_record(3, xlease.Record(new_id, 0, updating=True))
+        assert index.find_record(old_id) == -1
+        assert index.find_record(new_id) == 3
+
+    def test_first_free_record(self, index):
+        for recnum in range(5):
+            index.write_record(recnum, xlease.Record(make_uuid(), 0))
+        index.write_record(3, xlease.EMPTY_RECORD)
+        assert index.find_free_record() == 3
+
+    def test_no_free_record(self, index):
+        for recnum in range(xlease.MAX_RECORDS):
+            index.write_record(recnum, xlease.Record("%04d" % recnum, 0))
+        assert index.find_free_record() == -1
+        assert index.find_record("%04d" % (xlease.MAX_RECORDS - 1)) == \
+            xlease.MAX_RECORDS - 1
+
+    def test_duplicate_lease_id(self, index):
+        lease_id = make_uuid()
+        index.write_record(7, xlease.Record(lease_id, 0))
+        index.write_record(2, xlease.Record(lease_id, 0))
+        assert index.find_record(lease_id) == 2
+        index.write_record(2, xlease.EMPTY_RECORD)
+        assert index.find_record(lease_id) == 7
+
+    def test_load(self, index):
+        lease_id = make_uuid()
+        index.write_record(5, xlease.Record(lease_id, 0))
+
+        class Reader(object):
+            def pread(self, offset, buf):
+                buf[:] = index._buf[:]
+                return len(buf)
+
+        loaded = xlease.VolumeIndex(sc.ALIGNMENT_1M, sc.BLOCK_SIZE_512)
+        with utils.closing(loaded):
+            loaded.load(Reader())
+            assert loaded.find_record(lease_id) == 5
+            assert loaded.find_free_record() == 0
+            assert loaded.used_records() == [5]
+
 
 @pytest.fixture(params=[
     xlease.DirectFile,
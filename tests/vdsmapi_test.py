@@ -23,16 +23,21 @@ from __future__ import division
 
 import json
 import logging
+import time
 import yaml
 
 from io import StringIO
 from textwrap import dedent
 
+import pytest
+
 from nose.plugins.attrib import attr
 from vdsm.api import vdsmapi
 from vdsm.api.schema_inconsistency_formatter \
     import SchemaInconsistencyFormatter
 from vdsm.common.compat import pickle
+from vdsm.virt import statshistory
+from yajsonrpc import rpcstats
 from yajsonrpc.exception import JsonRpcErrorBase
 
 from testlib import mock
@@ -52,6 +57,152 @@ _schema = vdsmapi.Schema.vdsm_api(strict_mode=True,
                                   with_gluster=_glusterEnabled)
 
 
+def all_vm_stats():
+    return [{'vcpuCount': '1',
+             'displayInfo': [{'tlsPort': u'5900',
+                              'ipAddress': '0',
+                              'type': u'spice',
+                              'port': '-1'}],
+             'hash': '-3472228600028768455',
+             'acpiEnable': u'true',
+             'displayIp': '0',
+             'guestFQDN': '',
+             'vmId': u'f1eb5cc5-d793-46c6-b1e3-719345bfec0c',
+             'pid': '32632',
+             'cpuUsage': '2660000000',
+             'timeOffset': u'0',
+             'session': 'Unknown',
+             'displaySecurePort': u'5900',
+             'displayPort': '-1',
+             'memUsage': '0',
+             'guestIPs': '',
+             'pauseCode': 'NOERR',
+             'vcpuQuota': '-1',
+             'username': 'Unknown',
+             'kvmEnable': u'true',
+             'network': {u'vnet0': {'macAddr': u'00:1a:4a:16:01:51',
+                                    'rxDropped': '1572',
+                                    'tx': '0',
+                                    'rxErrors': '0',
+                                    'txDropped': '0',
+                                    'rx': '90',
+                                    'txErrors': '0',
+                                    'state': 'unknown',
+                                    'sampleTime': 4319358.22,
+                                    'speed': '1000',
+                                    'name': u'vnet0'}},
+             'displayType': 'qxl',
+             'cpuUser': '0.57',
+             'vmJobs': {},
+             'disks': {
+                 u'vdq': {'readLatency': '0',
+                          'writtenBytes': '0',
+                          'writeOps': '0',
+                          'apparentsize': '1073741824',
+                          'readOps': '0',
+                          'writeLatency': '0',
+                          'imageID': u'95c06337-8c23-4dfb-b0bf-a5f30bc9d33',
+                          'readBytes': '0',
+                          'flushLatency': '0',
+                          'readRate': '0.0',
+                          'truesize': '0',
+                          'writeRate': '0.0'},
+                 u'vdp': {'readLatency': '0',
+                          'writtenBytes': '0',
+                          'writeOps': '0',
+                          'apparentsize': '1073741824',
+                          'readOps': '0',
+                          'writeLatency': '0',
+                          'imageID': u'702df0bd-fff6-41eb-817b-103b23e5bd9',
+                          'readBytes': '0',
+                          'flushLatency': '0',
+                          'readRate': '0.0',
+                          'truesize': '0',
+                          'writeRate': '0.0'}},
+             'monitorResponse': '0',
+             'elapsedTime': '2560',
+             'vmType': u'kvm',
+             'cpuSys': '0.20',
+             'status': 'Up',
+             'guestCPUCount': -1,
+             'appsList': (),
+             'clientIp': '',
+             'statusTime': '4319358220',
+             'vmName': u'vm1',
+             'vcpuPeriod': 100000},
+            {'vcpuCount': '1',
+             'displayInfo': [{'tlsPort': u'5901',
+                              'ipAddress': '0',
+                              'type': u'spice',
+                              'port': '-1'}],
+             'hash': '8478318448907411309',
+             'acpiEnable': u'true',
+             'displayIp': '0',
+             'guestFQDN': '',
+             'vmId': u'7d3efc8f-405e-40cc-b512-1f8de3d6d587',
+             'pid': '32734',
+             'cpuUsage': '1220000000',
+             'timeOffset': u'0',
+             'session': 'Unknown',
+             'displaySecurePort': u'5901',
+             'displayPort': '-1',
+             'memUsage': '0',
+             'guestIPs': '',
+             'pauseCode': 'NOERR',
+             'vcpuQuota': '-1',
+             'username': 'Unknown',
+             'kvmEnable': u'true',
+             'network': {u'vnet1': {'macAddr': u'00:1a:4a:16:01:52',
+                                    'rxDropped': '0',
+                                    'tx': '7478',
+                                    'rxErrors': '0',
+                                    'txDropped': '0',
+                                    'rx': '331023',
+                                    'txErrors': '0',
+                                    'state': 'unknown',
+                                    'sampleTime': 4319358.22,
+                                    'speed': '1000',
+                                    'name': u'vnet1'}},
+             'displayType': 'qxl',
+             'cpuUser': '0.34',
+             'vmJobs': {},
+             'disks': {
+                 u'vda': {'readLatency': '0',
+                          'writtenBytes': '219136',
+                          'writeOps': '81',
+                          'apparentsize': '2621440',
+                          'readOps': '791',
+                          'writeLatency': '0',
+                          'imageID': u'e2461e60-ee91-4500-bebf-f50f2a2f644',
+                          'readBytes': '15910400',
+                          'flushLatency': '0',
+                          'readRate': '0.0',
+                          'truesize': '2564096',
+                          'writeRate': '0.0'},
+                 u'hdc': {'readLatency': '0',
+                          'writtenBytes': '0',
+                          'writeOps': '0',
+                          'apparentsize': '0',
+                          'readOps': '1',
+                          'writeLatency': '0',
+                          'readBytes': '30',
+                          'flushLatency': '0',
+                          'readRate': '0.0',
+                          'truesize': '0',
+                          'writeRate': '0.0'}},
+             'monitorResponse': '0',
+             'elapsedTime': '2541',
+             'vmType': u'kvm',
+             'cpuSys': '0.07',
+             'status': 'Up',
+             'guestCPUCount': -1,
+             'appsList': (),
+             'clientIp': '',
+             'statusTime': '4319358220',
+             'vmName': u'vm2',
+             'vcpuPeriod': 100000}]
+
+
 class FakeSchema(object):
 
     METHOD_NAME = "Namespace.Method"
@@ -110,6 +261,16 @@ class DataVerificationTests(TestCaseBase):
 
         _schema.verify_retval(vdsmapi.MethodRep('Host', 'fenceNode'), ret)
 
+    def test_rpc_stats_response(self):
+        stats = rpcstats.RpcStats()
+        stats.request_received("Host.ping2", "10.0.0.1")
+        stats.request_started("Host.ping2", 0.001)
+        stats.request_done("Host.ping2", "10.0.0.1", 0.002)
+        stats.reply_sent("Host.ping2", 60)
+
+        _schema.verify_retval(
+            vdsmapi.MethodRep('Host', 'getRpcStats'), stats.info())
+
     def test_unknown_response_type(self):
         with self.assertRaises(JsonRpcErrorBase) as e:
             ret = {u'My caps': u'My capabilites'}
@@ -297,157 +458,43 @@ class DataVerificationTests(TestCaseBase):
         _schema.verify_retval(vdsmapi.MethodRep('Host', 'getStats'), ret)
 
     def test_allvmstats(self):
-        ret = [{'vcpuCount': '1',
-                'displayInfo': [{'tlsPort': u'5900',
-                                 'ipAddress': '0',
-                                 'type': u'spice',
-                                 'port': '-1'}],
-                'hash': '-3472228600028768455',
-                'acpiEnable': u'true',
-                'displayIp': '0',
-                'guestFQDN': '',
-                'vmId': u'f1eb5cc5-d793-46c6-b1e3-719345bfec0c',
-                'pid': '32632',
-                'cpuUsage': '2660000000',
-                'timeOffset': u'0',
-                'session': 'Unknown',
-                'displaySecurePort': u'5900',
-                'displayPort': '-1',
-                'memUsage': '0',
-                'guestIPs': '',
-                'pauseCode': 'NOERR',
-                'vcpuQuota': '-1',
-                'username': 'Unknown',
-                'kvmEnable': u'true',
-                'network': {u'vnet0': {'macAddr': u'00:1a:4a:16:01:51',
-                                       'rxDropped': '1572',
-                                       'tx': '0',
-                                       'rxErrors': '0',
-                                       'txDropped': '0',
-                                       'rx': '90',
-                                       'txErrors': '0',
-                                       'state': 'unknown',
-                                       'sampleTime': 4319358.22,
-                                       'speed': '1000',
-                                       'name': u'vnet0'}},
-                'displayType': 'qxl',
-                'cpuUser': '0.57',
-                'vmJobs': {},
-                'disks': {
-                    u'vdq': {'readLatency': '0',
-                             'writtenBytes': '0',
-                             'writeOps': '0',
-                             'apparentsize': '1073741824',
-                             'readOps': '0',
-                             'writeLatency': '0',
-                             'imageID': u'95c06337-8c23-4dfb-b0bf-a5f30bc9d33',
-                             'readBytes': '0',
-                             'flushLatency': '0',
-                             'readRate': '0.0',
-                             'truesize': '0',
-                             'writeRate': '0.0'},
-                    u'vdp': {'readLatency': '0',
-                             'writtenBytes': '0',
-                             'writeOps': '0',
-                             'apparentsize': '1073741824',
-                             'readOps': '0',
-                             'writeLatency': '0',
-                             'imageID': u'702df0bd-fff6-41eb-817b-103b23e5bd9',
-                             'readBytes': '0',
-                             'flushLatency': '0',
-                             'readRate': '0.0',
-                             'truesize': '0',
-                             'writeRate': '0.0'}},
-                'monitorResponse': '0',
-                'elapsedTime': '2560',
-                'vmType': u'kvm',
-                'cpuSys': '0.20',
-                'status': 'Up',
-                'guestCPUCount': -1,
-                'appsList': (),
-                'clientIp': '',
-                'statusTime': '4319358220',
-                'vmName': u'vm1',
-                'vcpuPeriod': 100000},
-               {'vcpuCount': '1',
-                'displayInfo': [{'tlsPort': u'5901',
-                                 'ipAddress': '0',
-                                 'type': u'spice',
-                                 'port': '-1'}],
-                'hash': '8478318448907411309',
-                'acpiEnable': u'true',
-                'displayIp': '0',
-                'guestFQDN': '',
-                'vmId': u'7d3efc8f-405e-40cc-b512-1f8de3d6d587',
-                'pid': '32734',
-                'cpuUsage': '1220000000',
-                'timeOffset': u'0',
-                'session': 'Unknown',
-                'displaySecurePort': u'5901',
-                'displayPort': '-1',
-                'memUsage': '0',
-                'guestIPs': '',
-                'pauseCode': 'NOERR',
-                'vcpuQuota': '-1',
-                'username': 'Unknown',
-                'kvmEnable': u'true',
-                'network': {u'vnet1': {'macAddr': u'00:1a:4a:16:01:52',
-                                       'rxDropped': '0',
-                                       'tx': '7478',
-                                       'rxErrors': '0',
-                                       'txDropped': '0',
-                                       'rx': '331023',
-                                       'txErrors': '0',
-                                       'state': 'unknown',
-                                       'sampleTime': 4319358.22,
-                                       'speed': '1000',
-                                       'name': u'vnet1'}},
-                'displayType': 'qxl',
-                'cpuUser': '0.34',
-                'vmJobs': {},
-                'disks': {
-                    u'vda': {'readLatency': '0',
-                             'writtenBytes': '219136',
-                             'writeOps': '81',
-                             'apparentsize': '2621440',
-                             'readOps': '791',
-                             'writeLatency': '0',
-                             'imageID': u'e2461e60-ee91-4500-bebf-f50f2a2f644',
-                             'readBytes': '15910400',
-                             'flushLatency': '0',
-                             'readRate': '0.0',
-                             'truesize': '2564096',
-                             'writeRate': '0.0'},
-                    u'hdc': {'readLatency': '0',
-                             'writtenBytes': '0',
-                             'writeOps': '0',
-                             'apparentsize': '0',
-                             'readOps': '1',
-                             'writeLatency': '0',
-                             'readBytes': '30',
-                             'flushLatency': '0',
-                             'readRate': '0.0',
-                             'truesize': '0',
-                             'writeRate': '0.0'}},
-                'monitorResponse': '0',
-                'elapsedTime': '2541',
-                'vmType': u'kvm',
-                'cpuSys': '0.07',
-                'status': 'Up',
-                'guestCPUCount': -1,
-                'appsList': (),
-                'clientIp': '',
-                'statusTime': '4319358220',
-                'vmName': u'vm2',
-                'vcpuPeriod': 100000}]
-
+        ret = all_vm_stats()
         _schema.verify_retval(vdsmapi.MethodRep('Host', 'getAllVmStats'), ret)
 
+    def test_changed_vm_stats(self):
+        ret = {'cursor': 'ab12cd34:42',
+               'full': False,
+               'statsList': all_vm_stats(),
+               'removed': ['3c8e4a3a-6a2f-4d5e-9c3f-0c1e1b2a3d4e']}
+        _schema.verify_retval(
+            vdsmapi.MethodRep('Host', 'getChangedVmStats'), ret)
+
+    def test_stats_history(self):
+        host = statshistory.History(('cpuUser', 'memUsed'), 10)
+        host.append({'cpuUser': 10.5, 'memUsed': 20})
+        vms = statshistory.HistoryMap(('cpuUser', 'netRxRate'), 10)
+        vms.append('3c8e4a3a-6a2f-4d5e-9c3f-0c1e1b2a3d4e', {'cpuUser': 1.0})
+        ret = {'host': host.aggregate(), 'vms': vms.aggregate()}
+        _schema.verify_retval(
+            vdsmapi.MethodRep('Host', 'getStatsHistory'), ret)
+
     def test_missing_method(self):
         with self.assertRaises(vdsmapi.MethodNotFound):
             _schema.get_method(
                 vdsmapi.MethodRep('missing_class', 'missing_method'))
 
+    def test_concurrency(self):
+        self.assertEqual(
+            _schema.get_concurrency(vdsmapi.MethodRep('Host', 'getStats')),
+            'fast')
+        self.assertEqual(
+            _schema.get_concurrency(vdsmapi.MethodRep('StoragePool',
+                                                      'connect')),
+            'storage')
+        self.assertEqual(
+            _schema.get_concurrency(vdsmapi.MethodRep('VM', 'create')),
+            vdsmapi.DEFAULT_CONCURRENCY)
+
     def test_missing_type(self):
         with self.assertRaises(vdsmapi.TypeNotFound):
             _schema.get_type('Missing_type')
@@ -1076,3 +1123,52 @@ class SchemaInconsistencyFormatterTest(TestCaseBase):
         self.assertIn(u'call_arg_keys":[', log_entries)
         self.assertIn(u'\t"a",', log_entries)
         self.assertIn(u'\t"b"', log_entries)
+
+
+class LazySchemaTest(TestCaseBase):
+
+    def lazy_schema(self):
+        return vdsmapi.Schema.vdsm_api(strict_mode=True,
+                                       with_gluster=_glusterEnabled,
+                                       lazy=True)
+
+    def test_get_method(self):
+        rep = vdsmapi.MethodRep('Host', 'getStats')
+        self.assertEqual(self.lazy_schema().get_method(rep),
+                         _schema.get_method(rep))
+
+    def test_get_type(self):
+        schema = vdsmapi.Schema.vdsm_api(strict_mode=True)
+        self.assertEqual(self.lazy_schema().get_type('VmStats'),
+                         schema.get_type('VmStats'))
+
+    def test_get_methods(self):
+        self.assertEqual(sorted(self.lazy_schema().get_methods),
+                         sorted(_schema.get_methods))
+
+    def test_missing_method(self):
+        with self.assertRaises(vdsmapi.MethodNotFound):
+            self.lazy_schema().get_method(
+                vdsmapi.MethodRep('missing_class', 'missing_method'))
+
+    def test_verify_args(self):
+        schema = self.lazy_schema()
+        with self.assertRaises(JsonRpcErrorBase):
+            schema.verify_args(vdsmapi.MethodRep('Host', 'fenceNode'),
+                               {'addr': 1})
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("vms", [100, 1000])
+def test_verify_allvmstats_benchmark(vms):
+    vm_stats = all_vm_stats()[0]
+    ret = [dict(vm_stats, vmName="vm-%d" % i) for i in range(vms)]
+    rep = vdsmapi.MethodRep('Host', 'getAllVmStats')
+    runs = 20
+
+    start = time.monotonic()
+    for _ in range(runs):
+        _schema.verify_retval(rep, ret)
+    elapsed = (time.monotonic() - start) / runs
+
+    print("vms=%d verify=%.6f" % (vms, elapsed))
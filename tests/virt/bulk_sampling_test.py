@@ -160,6 +160,35 @@ class TestVMBulkSampling(TestCaseBase):
 
         self.assertCallSequence(conn.__calls__, expected)
 
+    def test_publish_after_sampling(self):
+        vms = make_vms(num=3)
+        conn = FakeConnection(vms=vms)
+        cache = FakeStatsCache()
+        published = []
+
+        def publisher(get_vms, stats_cache):
+            published.append((get_vms(), stats_cache))
+
+        sampler = sampling.VMBulkstatsMonitor(
+            conn, conn.getVMs, cache, publisher=publisher)
+        sampler()
+
+        assert published == [(vms, cache)]
+
+    def test_publish_skipped_if_sampling_failed(self):
+        vms = make_vms(num=3)
+        conn = FakeConnection(vms=vms)
+        conn.getAllDomainStats = None  # Calling it will fail.
+        cache = FakeStatsCache()
+        published = []
+
+        sampler = sampling.VMBulkstatsMonitor(
+            conn, conn.getVMs, cache,
+            publisher=lambda *args: published.append(args))
+        sampler()
+
+        assert published == []
+
     def assertCallSequence(self, actual_calls, expected_calls):
         for actual, expected in zip(actual_calls, expected_calls):
             # we don't care about the arguments
@@ -0,0 +1,311 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import time
+import tracemalloc
+
+import pytest
+
+from vdsm.virt import bulkstats
+from vdsm.virt import vmstats
+
+DISKS = ("vda", "vdb", "vdc", "sda")
+NICS = ("vnet0", "vnet1")
+
+
+def domain_stats(n=1, disks=DISKS, nics=NICS):
+    """
+    Return synthetic bulk stats of a domain, like
+    virConnect.getAllDomainStats. Counters grow with n.
+    """
+    stats = {
+        "state.state": 1,
+        "state.reason": 1,
+        "cpu.time": 10**10 * n,
+        "cpu.user": 3 * 10**9 * n,
+        "cpu.system": 6 * 10**9 * n,
+        "balloon.current": 4194304,
+        "balloon.maximum": 4194304,
+        "vcpu.current": 2,
+        "vcpu.maximum": 16,
+        "vcpu.0.state": 1,
+        "vcpu.0.time": 5 * 10**9 * n,
+        "vcpu.1.state": 1,
+        "vcpu.1.time": 4 * 10**9 * n,
+        "net.count": len(nics),
+    }
+    for i, name in enumerate(nics):
+        stats["net.%d.name" % i] = name
+        for direction in ("rx", "tx"):
+            for field in ("bytes", "pkts", "errs", "drop"):
+                stats["net.%d.%s.%s" % (i, direction, field)] = n * 1000
+    stats["block.count"] = len(disks)
+    for i, name in enumerate(disks):
+        stats["block.%d.name" % i] = name
+        stats["block.%d.path" % i] = "/rhev/data-center/mnt/images/" + name
+        for mode in ("rd", "wr", "fl"):
+            stats["block.%d.%s.reqs" % (i, mode)] = n * 100 * (i + 1)
+            stats["block.%d.%s.times" % (i, mode)] = n * 10**6 * (i + 1)
+            if mode != "fl":
+                stats["block.%d.%s.bytes" % (i, mode)] = n * 4096 * (i + 1)
+        stats["block.%d.allocation" % i] = 2**30
+        stats["block.%d.capacity" % i] = 2**34
+        stats["block.%d.physical" % i] = 2**30
+    return stats
+
+
+def test_sample_mapping():
+    stats = domain_stats()
+    sample = bulkstats.Packer().pack(stats)
+    assert sample == stats
+    assert stats == sample
+    assert list(sample) == list(stats)
+    assert len(sample) == len(stats)
+    assert sample["block.1.name"] == "vdb"
+    assert sample["cpu.time"] == 10**10
+    assert "net.1.rx.bytes" in sample
+    assert "net.2.rx.bytes" not in sample
+    assert sample.get("net.2.rx.bytes", 0) == 0
+    with pytest.raises(KeyError):
+        sample["net.2.rx.bytes"]
+
+
+def test_layout_shared():
+    packer = bulkstats.Packer()
+    s1 = packer.pack(domain_stats(1))
+    s2 = packer.pack(domain_stats(2))
+    s3 = packer.pack(domain_stats(1, disks=("vda",)))
+    assert s1.layout is s2.layout
+    assert s3.layout is not s1.layout
+    assert len(packer) == 2
+
+
+def test_layout_limit():
+    packer = bulkstats.Packer(max_layouts=2)
+    for disks in (("vda",), ("vda", "vdb"), ("vda", "vdb", "vdc")):
+        packer.pack(domain_stats(disks=disks))
+    assert len(packer) == 1
+
+
+@pytest.mark.parametrize("value", [
+    2**64 - 1,
+    1.5,
+    "string",
+])
+def test_changed_value_type(value):
+    packer = bulkstats.Packer()
+    packer.pack(domain_stats())
+    stats = domain_stats()
+    stats["cpu.time"] = value
+    sample = packer.pack(stats)
+    assert sample["cpu.time"] == value
+    assert type(sample["cpu.time"]) is type(value)
+
+
+def test_non_counter_values():
+    stats = {"big": 2**64 - 1, "flag": False, "ratio": 0.5, "count": 1}
+    sample = bulkstats.Packer().pack(stats)
+    assert sample == stats
+    assert sample["flag"] is False
+
+
+def test_link():
+    packer = bulkstats.Packer()
+    first = packer.pack_batch({"vm1": domain_stats(1)})
+    last = packer.pack_batch({"vm1": domain_stats(3)})
+    bulkstats.link_batch(last, first)
+
+    base, sample = first["vm1"], last["vm1"]
+    assert sample.delta(base, "cpu.time") == 2 * 10**10
+    assert sample.delta(base, "block.2.wr.bytes") == 2 * 4096 * 3
+    # Same devices, values are shared.
+    assert sample.values is base.values
+    with pytest.raises(KeyError):
+        sample.delta(base, "block.9.wr.bytes")
+
+
+def test_link_changed_layout():
+    packer = bulkstats.Packer()
+    first = packer.pack_batch({"vm1": domain_stats(1)})
+    last = packer.pack_batch({"vm1": domain_stats(3, disks=("vdb", "vda"))})
+    bulkstats.link_batch(last, first)
+
+    base, sample = first["vm1"], last["vm1"]
+    assert sample.delta(base, "cpu.time") == 2 * 10**10
+    assert sample.values is not base.values
+    assert sample.reverse_map("block") == {"vdb": 0, "vda": 1}
+
+
+def test_link_drops_older_samples():
+    packer = bulkstats.Packer()
+    batches = [packer.pack_batch({"vm1": domain_stats(n)})
+               for n in range(3)]
+    bulkstats.link_batch(batches[1], batches[0])
+    bulkstats.link_batch(batches[2], batches[1])
+
+    # batches[1] does not keep batches[0] alive.
+    assert batches[1]["vm1"].delta(batches[0]["vm1"], "cpu.time") == 10**10
+    assert batches[2]["vm1"].delta(batches[1]["vm1"], "cpu.time") == 10**10
+
+
+def test_pack_batch_keeps_other_values():
+    batch = bulkstats.Packer().pack_batch({"vm1": "foo", "vm2": {"a": 1}})
+    assert batch["vm1"] == "foo"
+    assert isinstance(batch["vm2"], bulkstats.Sample)
+
+
+def test_reverse_map_cached():
+    sample = bulkstats.Packer().pack(domain_stats())
+    block = sample.reverse_map("block")
+    assert block == {name: i for i, name in enumerate(DISKS)}
+    assert sample.reverse_map("block") is block
+    assert sample.reverse_map("net") == {"vnet0": 0, "vnet1": 1}
+
+
+def test_group_deltas():
+    packer = bulkstats.Packer()
+    first = packer.pack_batch({"vm1": domain_stats(1)})
+    last = packer.pack_batch({"vm1": domain_stats(2)})
+    base, sample = first["vm1"], last["vm1"]
+    fields = ("rd.bytes", "wr.reqs")
+
+    # Not linked yet.
+    assert sample.group_deltas(base, "block.1", fields) is None
+
+    bulkstats.link_batch(last, first)
+    assert sample.group_deltas(base, "block.1", fields) == (8192, 200)
+    assert sample.group_values("block.1", fields) == (16384, 400)
+
+    # Missing counters.
+    assert sample.group_deltas(base, "block.1", ("fl.bytes",)) is None
+    assert sample.group_deltas(base, "block.1", ("name",)) is None
+    assert sample.group_values("block.9", fields) is None
+
+
+class FakeDrive(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.apparentsize = 2**30
+        self.truesize = 2**30
+        self.GUID = "guid-" + name
+
+    def __contains__(self, item):
+        return hasattr(self, item)
+
+
+class FakeNic(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.nicModel = "virtio"
+        self.macAddr = "00:1a:4a:16:01:51"
+        self.is_hostdevice = False
+
+
+class FakeVM(object):
+
+    def __init__(self, vm_id):
+        self.id = vm_id
+        self.drives = [FakeDrive(name) for name in DISKS]
+        self.nics = [FakeNic(name) for name in NICS]
+
+    def getDiskDevices(self):
+        return self.drives
+
+    def getNicDevices(self):
+        return self.nics
+
+
+def rates(vm, first, last, interval):
+    stats = {}
+    vmstats.cpu(stats, first, last, interval)
+    vmstats.disks(vm, stats, first, last, interval)
+    vmstats.networks(vm, stats, first, last, interval)
+    for nic in stats["network"].values():
+        del nic["sampleTime"]
+    return stats
+
+
+@pytest.mark.parametrize("last_disks", [
+    DISKS,
+    # Indexes changed after hot plug.
+    ("sda", "vdc", "vdb", "vda"),
+])
+def test_rates_same_as_dicts(last_disks):
+    vm = FakeVM("vm1")
+    first_stats = domain_stats(1)
+    last_stats = domain_stats(5, disks=last_disks)
+
+    packer = bulkstats.Packer()
+    first = packer.pack_batch({vm.id: first_stats})
+    last = packer.pack_batch({vm.id: last_stats})
+    bulkstats.link_batch(last, first)
+
+    expected = rates(vm, first_stats, last_stats, 15)
+    assert expected["cpuSys"] > 0
+    assert expected["disks"]["vdb"]["readRate"] != "0.0"
+    assert rates(vm, first[vm.id], last[vm.id], 15) == expected
+
+
+@pytest.mark.stress
+def test_benchmark():
+    vms = [FakeVM("vm-%03d" % i) for i in range(500)]
+    samples = [{vm.id: domain_stats(n) for vm in vms} for n in range(2)]
+    runs = 10
+
+    # Like libvirt, create new keys and values for every sample.
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    dicts = [{vm.id: domain_stats(n) for vm in vms} for n in range(2)]
+    dict_size = tracemalloc.get_traced_memory()[0] - start
+    del dicts
+
+    packer = bulkstats.Packer()
+    packer.pack_batch(samples[0])
+    start = tracemalloc.get_traced_memory()[0]
+    packed = [packer.pack_batch({vm.id: domain_stats(n) for vm in vms})
+              for n in range(2)]
+    bulkstats.link_batch(packed[1], packed[0])
+    packed_size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    start = time.monotonic()
+    for _ in range(runs):
+        first = packer.pack_batch(samples[0])
+        last = packer.pack_batch(samples[1])
+        bulkstats.link_batch(last, first)
+    put_elapsed = (time.monotonic() - start) / runs
+
+    results = {}
+    for name, (first, last) in (("dict", samples), ("packed", packed)):
+        start = time.monotonic()
+        for _ in range(runs):
+            for vm in vms:
+                rates(vm, first[vm.id], last[vm.id], 15)
+        results[name] = (time.monotonic() - start) / runs
+
+    print("vms=%d memory per sample: dict %d bytes, packed %d bytes"
+          % (len(vms), dict_size / len(vms) / 2, packed_size / len(vms) / 2))
+    print("rates for all vms: dict %.6f s, packed %.6f s, packing %.6f s"
+          % (results["dict"], results["packed"], put_elapsed))
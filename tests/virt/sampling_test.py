@@ -25,6 +25,8 @@ import itertools
 import threading
 
 from vdsm.virt import sampling
+from vdsm.virt import statshistory
+from vdsm.virt import vmstats
 from vdsm import numa
 
 from monkeypatch import MonkeyPatchScope
@@ -206,6 +208,27 @@ class StatsCacheTests(TestCaseBase):
         assert res.is_empty()
         assert res.stats_age == 100
 
+    def test_history(self):
+        history = statshistory.HistoryMap(
+            vmstats.HISTORY_METRICS, 10, clock=self.fake_monotonic_time)
+        self.cache = sampling.StatsCache(
+            clock=self.fake_monotonic_time, history=history)
+        self.cache.add('a')
+        self.cache.add('b')
+        stats = {'balloon.available': 100, 'balloon.unused': 25}
+        self._feed_cache((
+            ({'a': stats, 'b': stats}, 1),
+            ({'a': stats, 'b': stats}, 2),
+            ({'a': stats}, 3),
+        ))
+        info = history.aggregate(metrics=['memUsage'])
+        assert info['a']['memUsage']['count'] == 2
+        assert info['a']['memUsage']['avg'] == 75.0
+        assert info['b']['memUsage']['count'] == 1
+
+        self.cache.remove('a')
+        assert list(history.aggregate()) == ['b']
+
     def _feed_cache(self, samples):
         for sample in samples:
             self.cache.put(*sample)
@@ -0,0 +1,255 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import time
+
+import pytest
+
+from vdsm.common.compat import json
+from vdsm.virt import statsdelta
+from vdsm.virt import vmstats
+
+
+def vm_stats(vm_id, cpu="0.5", elapsed="100"):
+    return {
+        "vmId": vm_id,
+        "status": "Up",
+        "cpuUser": cpu,
+        "elapsedTime": elapsed,
+        "statusTime": str(int(time.time() * 1000)),
+    }
+
+
+class FakeNic(object):
+
+    macAddr = "00:1a:4a:16:01:51"
+    name = "vnet0"
+    nicModel = "virtio"
+
+
+def nic_stats(rx=0):
+    sample = {
+        "net.0.rx.errs": 0,
+        "net.0.rx.drop": 0,
+        "net.0.tx.errs": 0,
+        "net.0.tx.drop": 0,
+        "net.0.rx.bytes": rx,
+        "net.0.tx.bytes": 0,
+    }
+    return vmstats._nic_traffic(None, FakeNic(), sample, 0, sample, 0)
+
+
+def ids(changes):
+    return sorted(stats["vmId"] for stats in changes["statsList"])
+
+
+def test_no_cursor():
+    tracker = statsdelta.Tracker()
+    changes = tracker.update([vm_stats("vm1"), vm_stats("vm2")])
+    assert changes["full"]
+    assert ids(changes) == ["vm1", "vm2"]
+    assert changes["removed"] == []
+
+
+def test_no_changes():
+    tracker = statsdelta.Tracker()
+    cursor = tracker.update([vm_stats("vm1"), vm_stats("vm2")])["cursor"]
+
+    changes = tracker.update([vm_stats("vm1"), vm_stats("vm2")], cursor)
+    assert not changes["full"]
+    assert changes["statsList"] == []
+    assert changes["removed"] == []
+    assert changes["cursor"] == cursor
+
+
+def test_volatile_fields_ignored():
+    tracker = statsdelta.Tracker()
+    cursor = tracker.update([vm_stats("vm1", elapsed="100")])["cursor"]
+
+    changes = tracker.update([vm_stats("vm1", elapsed="105")], cursor)
+    assert changes["statsList"] == []
+
+
+def test_nic_sample_time_ignored():
+    tracker = statsdelta.Tracker()
+    stats = dict(vm_stats("vm1"), network={"vnet0": nic_stats()})
+    cursor = tracker.update([stats])["cursor"]
+
+    # Every call reports a new nic sampleTime.
+    stats = dict(vm_stats("vm1"), network={"vnet0": nic_stats()})
+    changes = tracker.update([stats], cursor)
+    assert changes["statsList"] == []
+
+
+def test_changed_nic():
+    tracker = statsdelta.Tracker()
+    stats = dict(vm_stats("vm1"), network={"vnet0": nic_stats()})
+    cursor = tracker.update([stats])["cursor"]
+
+    stats = dict(vm_stats("vm1"), network={"vnet0": nic_stats(rx=4096)})
+    changes = tracker.update([stats], cursor)
+    assert changes["statsList"] == [stats]
+
+
+def test_changed_vm():
+    tracker = statsdelta.Tracker()
+    cursor = tracker.update([vm_stats("vm1"), vm_stats("vm2")])["cursor"]
+
+    new_stats = vm_stats("vm2", cpu="10.0", elapsed="105")
+    changes = tracker.update([vm_stats("vm1"), new_stats], cursor)
+    assert not changes["full"]
+    assert changes["statsList"] == [new_stats]
+    assert changes["cursor"] != cursor
+
+
+def test_added_and_removed_vm():
+    tracker = statsdelta.Tracker()
+    cursor = tracker.update([vm_stats("vm1"), vm_stats("vm2")])["cursor"]
+
+    changes = tracker.update([vm_stats("vm1"), vm_stats("vm3")], cursor)
+    assert ids(changes) == ["vm3"]
+    assert changes["removed"] == ["vm2"]
+
+    # Reported once.
+    changes = tracker.update([vm_stats("vm1"), vm_stats("vm3")],
+                             changes["cursor"])
+    assert changes["statsList"] == []
+    assert changes["removed"] == []
+
+
+def test_removed_vm_added_again():
+    tracker = statsdelta.Tracker()
+    cursor1 = tracker.update([vm_stats("vm1")])["cursor"]
+    cursor2 = tracker.update([], cursor1)["cursor"]
+
+    changes = tracker.update([vm_stats("vm1")], cursor2)
+    assert ids(changes) == ["vm1"]
+    assert changes["removed"] == []
+
+    # A client that missed the removal sees the vm as changed.
+    changes = tracker.update([vm_stats("vm1")], cursor1)
+    assert ids(changes) == ["vm1"]
+    assert changes["removed"] == []
+
+
+def test_multiple_clients():
+    tracker = statsdelta.Tracker()
+    stats = [vm_stats("vm1"), vm_stats("vm2")]
+    cursor_a = tracker.update(stats)["cursor"]
+    cursor_b = tracker.update(stats)["cursor"]
+
+    stats = [vm_stats("vm1", cpu="2.0"), vm_stats("vm2")]
+    cursor_a = tracker.update(stats, cursor_a)["cursor"]
+
+    stats = [vm_stats("vm1", cpu="2.0"), vm_stats("vm2", cpu="3.0")]
+    changes = tracker.update(stats, cursor_b)
+    assert ids(changes) == ["vm1", "vm2"]
+
+    changes = tracker.update(stats, cursor_a)
+    assert ids(changes) == ["vm2"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "invalid",
+    "other:0",
+    "other:invalid",
+    42,
+])
+def test_invalid_cursor(cursor):
+    tracker = statsdelta.Tracker()
+    tracker.update([vm_stats("vm1")])
+    changes = tracker.update([vm_stats("vm1")], cursor)
+    assert changes["full"]
+    assert ids(changes) == ["vm1"]
+
+
+def test_cursor_from_another_tracker():
+    cursor = statsdelta.Tracker().update([vm_stats("vm1")])["cursor"]
+    changes = statsdelta.Tracker().update([vm_stats("vm1")], cursor)
+    assert changes["full"]
+
+
+def test_cursor_from_the_future():
+    tracker = statsdelta.Tracker()
+    cursor = tracker.update([vm_stats("vm1")])["cursor"]
+    tracker_id, generation = cursor.split(":")
+    future = "%s:%d" % (tracker_id, int(generation) + 1)
+    changes = tracker.update([vm_stats("vm1")], future)
+    assert changes["full"]
+
+
+def test_removed_history_limit():
+    tracker = statsdelta.Tracker(max_removed=2)
+    old_cursor = tracker.update(
+        [vm_stats("vm1"), vm_stats("vm2"), vm_stats("vm3")])["cursor"]
+    cursor = tracker.update([vm_stats("vm2"), vm_stats("vm3")],
+                            old_cursor)["cursor"]
+    cursor = tracker.update([vm_stats("vm3")], cursor)["cursor"]
+
+    # Remembering vm1 and vm2.
+    changes = tracker.update([vm_stats("vm3")], old_cursor)
+    assert not changes["full"]
+    assert sorted(changes["removed"]) == ["vm1", "vm2"]
+
+    # Forgetting vm1.
+    tracker.update([], cursor)
+    changes = tracker.update([], old_cursor)
+    assert changes["full"]
+
+    # Newer cursor is still valid.
+    changes = tracker.update([], cursor)
+    assert not changes["full"]
+    assert changes["removed"] == ["vm3"]
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("changed", [0, 10, 300])
+def test_changes_benchmark(changed):
+    vms = 300
+    stats = [dict(vm_stats("vm-%03d" % i),
+                  disks={"vd%s" % c: {"readRate": "0.0", "writeRate": "0.0",
+                                      "truesize": "1073741824"}
+                         for c in "abcd"},
+                  network={"vnet%d" % i: {"rxRate": "0.0", "txRate": "0.0"}
+                           for i in range(2)})
+             for i in range(vms)]
+    tracker = statsdelta.Tracker()
+    cursor = tracker.update(stats)["cursor"]
+    polls = 20
+
+    start = time.monotonic()
+    for n in range(polls):
+        for i in range(changed):
+            stats[i] = dict(stats[i], cpuUser=str(n))
+        changes = tracker.update(stats, cursor)
+        cursor = changes["cursor"]
+        size = len(json.dumps(changes))
+    elapsed = (time.monotonic() - start) / polls
+
+    start = time.monotonic()
+    for _ in range(polls):
+        full_size = len(json.dumps(stats))
+    full_elapsed = (time.monotonic() - start) / polls
+
+    print("vms=%d changed=%d delta: %.6f s %d bytes, full: %.6f s %d bytes"
+          % (vms, changed, elapsed, size, full_elapsed, full_size))
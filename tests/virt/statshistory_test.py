@@ -0,0 +1,207 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import time
+
+import pytest
+
+from vdsm.virt import statshistory
+from vdsm.virt import vmstats
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def append(history, clock, values, step=15):
+    for value in values:
+        clock.now += step
+        history.append({"cpu": value, "mem": value * 2})
+
+
+def test_empty():
+    history = statshistory.History(("cpu",), 10)
+    assert history.aggregate() == {
+        "cpu": {"count": 0, "min": 0.0, "avg": 0.0, "max": 0.0,
+                "p50": 0.0, "p90": 0.0, "p99": 0.0}}
+
+
+def test_aggregate():
+    clock = FakeClock()
+    history = statshistory.History(("cpu", "mem"), 100, clock=clock)
+    append(history, clock, range(1, 11))
+
+    info = history.aggregate()
+    assert info["cpu"] == {"count": 10, "min": 1, "avg": 5.5, "max": 10,
+                           "p50": 5, "p90": 9, "p99": 10}
+    assert info["mem"]["max"] == 20
+
+
+def test_ring_keeps_last_samples():
+    clock = FakeClock()
+    history = statshistory.History(("cpu", "mem"), 4, clock=clock)
+    append(history, clock, range(1, 11))
+
+    info = history.aggregate()["cpu"]
+    assert info["count"] == 4
+    assert info["min"] == 7
+    assert info["max"] == 10
+
+
+def test_window():
+    clock = FakeClock()
+    history = statshistory.History(("cpu", "mem"), 100, clock=clock)
+    append(history, clock, range(1, 11))
+
+    # Last 3 samples, taken 0, 15 and 30 seconds ago.
+    info = history.aggregate(window=30)["cpu"]
+    assert info["count"] == 3
+    assert info["min"] == 8
+
+    clock.now += 3600
+    assert history.aggregate(window=60)["cpu"]["count"] == 0
+
+
+def test_select_metrics():
+    clock = FakeClock()
+    history = statshistory.History(("cpu", "mem"), 10, clock=clock)
+    append(history, clock, [1])
+    assert list(history.aggregate(metrics=["mem", "missing"])) == ["mem"]
+
+
+def test_missing_values():
+    history = statshistory.History(("cpu", "mem"), 10)
+    history.append({"cpu": 1.0})
+    history.append({"cpu": 3.0, "mem": 5.0})
+    info = history.aggregate()
+    assert info["cpu"]["count"] == 2
+    assert info["mem"]["count"] == 1
+    assert info["mem"]["avg"] == 5.0
+
+
+def test_disabled():
+    history = statshistory.History(("cpu",), 0)
+    history.append({"cpu": 1.0})
+    assert history.aggregate()["cpu"]["count"] == 0
+
+    history_map = statshistory.HistoryMap(("cpu",), 0)
+    history_map.append("vm1", {"cpu": 1.0})
+    assert history_map.aggregate() == {}
+
+
+def test_history_map():
+    clock = FakeClock()
+    history_map = statshistory.HistoryMap(("cpu", "mem"), 10, clock=clock)
+    for vm_id in ("vm1", "vm2", "vm3"):
+        history_map.append(vm_id, {"cpu": 1.0})
+    history_map.remove("vm3")
+    history_map.remove("missing")
+
+    assert sorted(history_map.aggregate()) == ["vm1", "vm2"]
+    info = history_map.aggregate(keys=["vm2", "vm3"], metrics=["cpu"])
+    assert info == {"vm2": {"cpu": statshistory.summary([1.0])}}
+
+
+@pytest.mark.parametrize("values,p50,p90,p99", [
+    ([7], 7, 7, 7),
+    ([1, 2], 1, 2, 2),
+    (list(range(100, 0, -1)), 50, 90, 99),
+])
+def test_summary_percentiles(values, p50, p90, p99):
+    info = statshistory.summary(values)
+    assert (info["p50"], info["p90"], info["p99"]) == (p50, p90, p99)
+
+
+def vm_sample(n, unused=1024):
+    return {
+        "cpu.time": 10**10 * n,
+        "cpu.user": 3 * 10**9 * n,
+        "cpu.system": 6 * 10**9 * n,
+        "balloon.available": 4096,
+        "balloon.unused": unused,
+        "block.count": 2,
+        "block.0.name": "vda",
+        "block.0.rd.bytes": 4096 * n,
+        "block.0.wr.bytes": 8192 * n,
+        "block.0.rd.reqs": 10 * n,
+        "block.0.wr.reqs": 20 * n,
+        "block.1.name": "hdc",
+        "block.1.rd.bytes": 1024 * n,
+        "block.1.rd.reqs": n,
+        "net.count": 1,
+        "net.0.name": "vnet0",
+        "net.0.rx.bytes": 1000 * n,
+        "net.0.tx.bytes": 500 * n,
+    }
+
+
+def test_vm_history_values():
+    values = vmstats.history_values(vm_sample(1), vm_sample(3), 2)
+    assert values == {
+        "cpuUser": 100 * (2 * 10**10 - 18 * 10**9) / 2 / 10**9,
+        "cpuSys": 100 * 18 * 10**9 / 2 / 10**9,
+        "memUsage": 75.0,
+        "diskReadRate": (4096 + 1024) * 2 / 2,
+        "diskWriteRate": 8192 * 2 / 2,
+        "diskReadOps": 11 * 2 / 2,
+        "diskWriteOps": 20 * 2 / 2,
+        "netRxRate": 1000 * 2 / 2,
+        "netTxRate": 500 * 2 / 2,
+    }
+
+
+def test_vm_history_values_bad_interval():
+    assert vmstats.history_values(vm_sample(1), vm_sample(3), 0) == {}
+
+
+def test_vm_history_values_missing_stats():
+    first = {"cpu.time": 1, "cpu.user": 1, "cpu.system": 1}
+    last = {"cpu.time": 2, "cpu.user": 1, "cpu.system": 1}
+    assert sorted(vmstats.history_values(first, last, 2)) == [
+        "cpuSys", "cpuUser"]
+
+
+@pytest.mark.stress
+def test_benchmark():
+    vms = 500
+    samples = 240
+    history_map = statshistory.HistoryMap(vmstats.HISTORY_METRICS, samples)
+    values = dict.fromkeys(vmstats.HISTORY_METRICS, 1.5)
+
+    start = time.monotonic()
+    for _ in range(samples):
+        for i in range(vms):
+            history_map.append(i, values)
+    append_elapsed = (time.monotonic() - start) / samples
+
+    start = time.monotonic()
+    history_map.aggregate(window=3600)
+    aggregate_elapsed = time.monotonic() - start
+
+    print("vms=%d samples=%d append all vms: %.6f s, aggregate: %.6f s"
+          % (vms, samples, append_elapsed, aggregate_elapsed))
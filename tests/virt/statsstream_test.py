@@ -0,0 +1,275 @@
+#
+# Copyright 2020 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import collections
+
+import pytest
+
+from vdsm.api import vdsmapi
+from vdsm.common.compat import json
+from vdsm.virt import sampling
+from vdsm.virt import statsstream
+from vdsm.virt import vmstats
+
+from yajsonrpc import stomp
+from yajsonrpc.stompserver import StompServer
+
+DESTINATION = "jms.queue.vmstats"
+SAMPLE_INTERVAL = 15
+
+VMS = {
+    "0b4b8c84-0a5d-4c1b-8d2a-3d2e4c8a8d01": object(),
+    "0b4b8c84-0a5d-4c1b-8d2a-3d2e4c8a8d02": object(),
+}
+
+_events_schema = vdsmapi.Schema.vdsm_events(strict_mode=True)
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    def send_raw(self, frame):
+        self.frames.append(frame)
+
+    def events(self):
+        return [json.loads(frame.body) for frame in self.frames]
+
+
+class FakeSubscription(object):
+
+    def __init__(self, sub_id, headers=None):
+        self.id = sub_id
+        self.destination = DESTINATION
+        self.headers = headers or {}
+        self.client = FakeClient()
+
+
+class FakeReactor(object):
+
+    def __init__(self):
+        self.server = StompServer(None, collections.defaultdict(list))
+
+
+class FakeBridge(object):
+
+    event_schema = _events_schema
+
+
+class FakeBinding(object):
+
+    def __init__(self):
+        self.reactor = FakeReactor()
+        self.bridge = FakeBridge()
+
+
+class FakeClientIF(object):
+
+    def __init__(self):
+        self.ready = True
+        self.servers = {"jsonrpc": FakeBinding()}
+
+    @property
+    def server(self):
+        return self.servers["jsonrpc"].reactor.server
+
+    def subscribe(self, sub_id, **headers):
+        sub = FakeSubscription(sub_id, headers)
+        self.server.subscriptions.add(sub)
+        return sub
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStatsCache(object):
+
+    def __init__(self):
+        self.batches = 0
+
+    def get_batch(self):
+        self.batches += 1
+        return {vm_id: sampling.StatsSample(vm_id, vm_id, SAMPLE_INTERVAL, 0)
+                for vm_id in VMS}
+
+
+@pytest.fixture
+def produced(monkeypatch):
+    calls = []
+
+    def produce(vm, first, last, interval):
+        calls.append(first)
+        return {"cpuUser": 1.5, "cpuSys": 0.5,
+                "disks": {"vda": {"readRate": "0.0"}}}
+
+    monkeypatch.setattr(vmstats, "produce", produce)
+    return calls
+
+
+@pytest.fixture
+def cif():
+    return FakeClientIF()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def publisher(cif, clock):
+    return statsstream.Publisher(
+        cif, SAMPLE_INTERVAL, destination=DESTINATION, clock=clock)
+
+
+def publish(publisher, cache, clock, samples=1):
+    for _ in range(samples):
+        publisher(lambda: VMS, cache)
+        clock.now += SAMPLE_INTERVAL
+
+
+def test_no_subscriptions(publisher, clock, produced):
+    cache = FakeStatsCache()
+    publish(publisher, cache, clock)
+    assert cache.batches == 0
+    assert produced == []
+
+
+def test_not_ready(publisher, cif, clock, produced):
+    sub = cif.subscribe("sub")
+    cif.ready = False
+    publish(publisher, FakeStatsCache(), clock)
+    assert sub.client.frames == []
+
+
+def test_event(publisher, cif, clock, produced):
+    sub = cif.subscribe("sub")
+    publish(publisher, FakeStatsCache(), clock)
+
+    event, = sub.client.events()
+    assert event["method"] == statsstream.EVENT_ID
+    stats_list = sorted(event["params"]["statsList"],
+                        key=lambda s: s["vmId"])
+    assert [s["vmId"] for s in stats_list] == sorted(VMS)
+    assert stats_list[0] == {
+        "vmId": sorted(VMS)[0],
+        "cpuUser": "1.50",
+        "cpuSys": "0.50",
+        "disks": {"vda": {"readRate": "0.0"}},
+    }
+
+
+def test_stats_produced_once(publisher, cif, clock, produced):
+    subs = [cif.subscribe("sub-%d" % i) for i in range(3)]
+    subs.append(cif.subscribe("fields", **{
+        stomp.Headers.STATS_FIELDS: "cpuUser"}))
+    publish(publisher, FakeStatsCache(), clock)
+
+    assert sorted(produced) == sorted(VMS)
+    bodies = set(id(sub.client.frames[0].body) for sub in subs)
+    # One message for every field set.
+    assert len(bodies) == 2
+
+
+def test_fields(publisher, cif, clock, produced):
+    sub = cif.subscribe("sub", **{
+        stomp.Headers.STATS_FIELDS: "cpuUser, disks,unknown"})
+    publish(publisher, FakeStatsCache(), clock)
+
+    event, = sub.client.events()
+    for stats in event["params"]["statsList"]:
+        assert sorted(stats) == ["cpuUser", "disks", "vmId"]
+
+
+@pytest.mark.parametrize("interval, events", [
+    (None, 8),
+    ("0", 8),
+    ("15", 8),
+    ("30", 4),
+    ("40", 3),
+    ("60", 2),
+    ("invalid", 8),
+])
+def test_interval(publisher, cif, clock, produced, interval, events):
+    headers = {}
+    if interval is not None:
+        headers[stomp.Headers.STATS_INTERVAL] = interval
+    sub = cif.subscribe("sub", **headers)
+    publish(publisher, FakeStatsCache(), clock, samples=8)
+    assert len(sub.client.frames) == events
+
+
+def test_interval_sampling_jitter(publisher, cif, clock, produced):
+    sub = cif.subscribe("sub", **{stomp.Headers.STATS_INTERVAL: "30"})
+    cache = FakeStatsCache()
+    for now in (0, 14.5, 29.5, 45, 59.8, 75):
+        clock.now = now
+        publisher(lambda: VMS, cache)
+    assert len(sub.client.frames) == 3
+
+
+def test_only_due_subscriptions_get_events(publisher, cif, clock, produced):
+    fast = cif.subscribe("fast")
+    slow = cif.subscribe("slow", **{stomp.Headers.STATS_INTERVAL: "60"})
+    cache = FakeStatsCache()
+    publish(publisher, cache, clock, samples=4)
+    assert len(fast.client.frames) == 4
+    assert len(slow.client.frames) == 1
+    # Stats are produced only when some subscriptions are due.
+    assert cache.batches == 4
+
+
+def test_skip_closed_clients(publisher, cif, clock, produced):
+    sub = cif.subscribe("sub")
+    sub.client.closed = True
+    cache = FakeStatsCache()
+    publish(publisher, cache, clock)
+    assert cache.batches == 0
+
+
+def test_removed_subscription(publisher, cif, clock, produced):
+    sub = cif.subscribe("sub")
+    publish(publisher, FakeStatsCache(), clock)
+    cif.server.subscriptions.remove(sub)
+    publish(publisher, FakeStatsCache(), clock)
+    assert len(sub.client.frames) == 1
+
+
+def test_skip_missing_vms(publisher, cif, clock, produced):
+    sub = cif.subscribe("sub")
+    vm_id = sorted(VMS)[0]
+    publisher(lambda: {vm_id: VMS[vm_id]}, FakeStatsCache())
+
+    event, = sub.client.events()
+    assert [s["vmId"] for s in event["params"]["statsList"]] == [vm_id]
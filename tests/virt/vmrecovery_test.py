@@ -21,15 +21,19 @@
 from __future__ import absolute_import
 from __future__ import division
 
+import threading
+
 import libvirt
 
 from vdsm.common import libvirtconnection
 from vdsm.common import response
+from vdsm.common.time import Clock
 from vdsm.virt import recovery
 
 
 from monkeypatch import MonkeyPatchScope
 from monkeypatch import Patch
+from testlib import make_config
 from testlib import VdsmTestCase as TestCaseBase
 from testlib import permutations, expandPermutations
 
@@ -204,6 +208,50 @@ class TestAllDomains(TestCaseBase):
             expect_destroy = not vm_is_ext
             assert vm_obj.destroyed == expect_destroy
 
+    def test_recover_concurrently(self):
+        workers = 4
+        self.conn.domains = _make_domains_collection(
+            [("vm-%d" % i, False) for i in range(workers * 3)])
+        # Fails if fewer than workers domains are recovered concurrently.
+        barrier = threading.Barrier(workers, timeout=5)
+        create_vm = self.cif.createVm
+
+        def create(params, vmRecover=False):
+            barrier.wait()
+            return create_vm(params, vmRecover)
+
+        with MonkeyPatchScope([
+            (recovery, 'config', make_config(
+                [('vars', 'recovery_workers', str(workers))])),
+            (self.cif, 'createVm', create),
+        ]):
+            recovery.all_domains(self.cif)
+        assert set(self.cif.vmRequests) == set(self.conn.domains)
+        assert not any(vm.destroyed for vm in self.conn.domains.values())
+
+    def test_phases_timing(self):
+        clock = Clock()
+        recovery.all_domains(self.cif, clock)
+        assert repr(clock).startswith("<Clock(list=")
+        assert "recover=" in repr(clock)
+        assert "*" not in repr(clock)
+
+    @permutations([
+        # recovery_workers, expected
+        ('3', 3),
+        ('0', None),
+    ])
+    def test_max_workers(self, recovery_workers, expected):
+        with MonkeyPatchScope([
+            (recovery, 'config', make_config(
+                [('vars', 'recovery_workers', recovery_workers)])),
+        ]):
+            workers = recovery.max_workers()
+        if expected is None:
+            assert workers >= 1
+        else:
+            assert workers == expected
+
     def test_lookup_external_vms(self):
         vm_ext = [True] * len(self.vm_uuids)
         self.conn.domains = _make_domains_collection(